@@ -1,13 +1,124 @@
 `timescale 10ps/10ps
 
+// 再生する VGM パターン（iverilog -DVGM_VH=\"tests/xxx.vh\" で差し替え可）
+`ifndef VGM_VH
+`define VGM_VH "tests/ym2413_scale_chromatic.vh"
+`endif
+
+// DUT のパラメータ（iverilog -DIKAOPLL_FULLY_SYNCHRONOUS=0 などで差し替え可;
+// tools/config_lockstep.py が構成ごとに指定する）
+`ifndef IKAOPLL_FULLY_SYNCHRONOUS
+`define IKAOPLL_FULLY_SYNCHRONOUS 1
+`endif
+`ifndef IKAOPLL_FAST_RESET
+`define IKAOPLL_FAST_RESET 1
+`endif
+`ifndef IKAOPLL_USE_PIPELINED_MULTIPLIER
+`define IKAOPLL_USE_PIPELINED_MULTIPLIER 0
+`endif
+
+// 複数テストを 1 回のエラボレーションで連続再生する場合は
+// -DVGM_SUITE_VH=\"tests/xxx.suite.vh\"（tools/make_tb_suite.py で生成）。
+// 各テストは begin_test("<name>") ... end_test; で囲まれ、テストごとに
+// IC_n リセットを入れ、ログを <name>/samples_*.txt, <name>/durations.txt
+// に切り替える（ディレクトリは事前に作っておくこと; run_tb.py --suite が作る）。
+
 module IKAOPLL_vgm_tb;
 
     // ------------------------------------------------------------
-    // VCD
+    // Waveform dump (off by default; enabled by any +DUMP* plusarg)
+    //
+    //   +DUMP                       dump everything to ikaopll_vgm_tb.vcd
+    //   +DUMPFILE=<file>            output file (.fst: run "vvp ... -fst")
+    //   +DUMP_SCOPE=<a,b,...>       tb | dut | u_TIMINGGEN | u_REG | u_LFO |
+    //                               u_PG | u_EG | u_OP | u_DAC | outputs
+    //                               ("dut." prefix accepted; default: tb)
+    //   +DUMP_DEPTH=<n>             $dumpvars depth (default 0 = all levels)
+    //   +DUMP_START_SMP=<n>         start / stop, in VGM samples (44.1 kHz)
+    //   +DUMP_STOP_SMP=<n>            counted from the start of the pattern
+    //   +DUMP_START_S=<sec>         same, in seconds
+    //   +DUMP_STOP_S=<sec>
     // ------------------------------------------------------------
-    initial begin
-        $dumpfile("ikaopll_vgm_tb.vcd");
-        $dumpvars(0, IKAOPLL_vgm_tb);
+    // vgm_csv_to_vh.py の TICKS_PER_SAMPLE と一致させること
+    localparam longint TICKS_PER_VGM_SAMPLE = 64'd2267532;
+    localparam real    TICKS_PER_SECOND     = 1.0e11;   // 10ps/tick
+
+    event vgm_started;
+
+    task automatic dump_scope_by_name(input string name, input integer depth);
+        if (name.len() > 4 && name.substr(0, 3) == "dut.")
+            name = name.substr(4, name.len() - 1);
+        case (name)
+            "tb", "IKAOPLL_vgm_tb": $dumpvars(depth, IKAOPLL_vgm_tb);
+            "dut":                  $dumpvars(depth, dut);
+            "u_TIMINGGEN":          $dumpvars(depth, dut.u_TIMINGGEN);
+            "u_REG":                $dumpvars(depth, dut.u_REG);
+            "u_LFO":                $dumpvars(depth, dut.u_LFO);
+            "u_PG":                 $dumpvars(depth, dut.u_PG);
+            "u_EG":                 $dumpvars(depth, dut.u_EG);
+            "u_OP":                 $dumpvars(depth, dut.u_OP);
+            "u_DAC":                $dumpvars(depth, dut.u_DAC);
+            "outputs":              $dumpvars(1, ACC_STRB, ACC_SIGNED,
+                                                 DAC_EN_MO, DAC_EN_RO,
+                                                 IMP_FLUC_MO, IMP_FLUC_RO);
+            default: $display("[TB] WARNING: unknown +DUMP_SCOPE entry '%s' ignored", name);
+        endcase
+    endtask
+
+    initial begin : dump_ctrl
+        string  dump_file;
+        string  scope_list;
+        string  item;
+        integer dump_depth;
+        integer smp;
+        real    sec;
+        longint start_ticks;
+        longint stop_ticks;
+        integer i;
+
+        if (!$test$plusargs("DUMP"))
+            disable dump_ctrl;
+
+        dump_file   = "ikaopll_vgm_tb.vcd";
+        scope_list  = "tb";
+        dump_depth  = 0;
+        start_ticks = -1;
+        stop_ticks  = -1;
+        void'($value$plusargs("DUMPFILE=%s", dump_file));
+        void'($value$plusargs("DUMP_SCOPE=%s", scope_list));
+        void'($value$plusargs("DUMP_DEPTH=%d", dump_depth));
+        if ($value$plusargs("DUMP_START_SMP=%d", smp)) start_ticks = smp * TICKS_PER_VGM_SAMPLE;
+        if ($value$plusargs("DUMP_STOP_SMP=%d",  smp)) stop_ticks  = smp * TICKS_PER_VGM_SAMPLE;
+        if ($value$plusargs("DUMP_START_S=%f",   sec)) start_ticks = longint'(sec * TICKS_PER_SECOND);
+        if ($value$plusargs("DUMP_STOP_S=%f",    sec)) stop_ticks  = longint'(sec * TICKS_PER_SECOND);
+
+        // 開始時刻の指定があれば、VGM パターン開始からの相対時刻まで待つ
+        if (start_ticks >= 0 || stop_ticks >= 0) begin
+            @(vgm_started);
+            if (start_ticks > 0)
+                #(start_ticks);
+        end
+
+        $display("[TB] Dump to %s: scope=%s depth=%0d at %0t", dump_file, scope_list, dump_depth, $time);
+        $dumpfile(dump_file);
+        item = "";
+        for (i = 0; i <= scope_list.len(); i = i + 1) begin
+            if (i == scope_list.len() || scope_list.getc(i) == ",") begin
+                if (item.len() > 0)
+                    dump_scope_by_name(item, dump_depth);
+                item = "";
+            end else begin
+                item = {item, scope_list.substr(i, i)};
+            end
+        end
+
+        if (stop_ticks >= 0) begin
+            if (stop_ticks > start_ticks)
+                #(stop_ticks - ((start_ticks > 0) ? start_ticks : 0));
+            $dumpoff;
+            $dumpflush;
+            $display("[TB] Dump stopped at %0t", $time);
+        end
     end
 
     // ------------------------------------------------------------
@@ -33,15 +144,16 @@ module IKAOPLL_vgm_tb;
     wire phiM_PCEN_n = 1'b0;
 
     // ------------------------------------------------------------
-    // Reset
+    // Reset (begin_test() から、テストごとに掛け直す)
     // ------------------------------------------------------------
     reg IC_n = 1'b0;
-    initial begin
+
+    task automatic apply_reset;
         IC_n = 1'b0;
         repeat (64) @(posedge EMUCLK);
         IC_n = 1'b1;
         $display("[TB] Reset deasserted at %0t", $time);
-    end
+    endtask
 
     // ------------------------------------------------------------
     // Bus / I/O
@@ -67,10 +179,10 @@ module IKAOPLL_vgm_tb;
     // DUT
     // ------------------------------------------------------------
     IKAOPLL #(
-        .FULLY_SYNCHRONOUS        (1),
-        .FAST_RESET               (1),
+        .FULLY_SYNCHRONOUS        (`IKAOPLL_FULLY_SYNCHRONOUS),
+        .FAST_RESET               (`IKAOPLL_FAST_RESET),
         .ALTPATCH_CONFIG_MODE     (0),
-        .USE_PIPELINED_MULTIPLIER (0)
+        .USE_PIPELINED_MULTIPLIER (`IKAOPLL_USE_PIPELINED_MULTIPLIER)
     ) dut (
         .i_XIN_EMUCLK             (EMUCLK),
         .o_XOUT                   ( /* unused */ ),
@@ -126,6 +238,78 @@ module IKAOPLL_vgm_tb;
     localparam integer MIN_WAIT_ADDR = 12;
     localparam integer MIN_WAIT_DATA = 84;
 
+    // 進捗レコード用カウンタ
+    longint csv_row         = 0;   // 開始した CSV 行（= IKAOPLL_write 呼び出し）数
+    longint n_bus_writes    = 0;   // 完了したバス書き込み数
+    longint n_wait_enforced = 0;   // ウェイトを挿入した回数
+    longint n_mo_rec        = 0;
+    longint n_ro_rec        = 0;
+    longint n_acc_rec       = 0;
+    longint n_dur_rec       = 0;
+
+    // ------------------------------------------------------------
+    // Silence detection, early tail end, gap skipping
+    //
+    //   +TAIL_SMP=<n> / +TAIL_S=<sec>  maximum tail after each pattern
+    //                                  (default 1 s)
+    //   +FULL_TAIL                     always run the whole tail
+    //   +SILENCE_DUR=<n>               consecutive silent durations needed
+    //                                  (default 32, ~0.64 ms)
+    //
+    // tail は release が鳴り終わるまでの上限で、通常は無音検出で打ち切られる:
+    // 最後の key-off から release 完了 + SILENCE_DUR duration で終わる。
+    // tail が SILENCE_DUR より短いと打ち切りは起きない。key-on のまま
+    // 終わるパターンや sustain 付きの遅い release では tail を全部走らせる。
+    //   +SKIP_GAPS[=<smp>]             shorten waits of at least <smp> VGM
+    //                                  samples (default 4410 = 100 ms) that
+    //                                  start in silence; see gaps.txt
+    //
+    // 1 duration が「無音」: レジスタのシャドウで key-on が無く
+    // (0x20-0x28 bit4, リズム 0x0E)、その duration の全スロットで EG が
+    // 最大減衰 (u_EG.o_OP_ATTNLV_MAX)、かつ ACC_SIGNED が前の duration と同じ。
+    //
+    // 飛ばすのは duration の整数倍だけ（ACC_STRB の位相は保たれる）。
+    // 飛ばした区間は gaps.txt に "dur_idx acc_idx n_dur n_acc skipped_ps
+    // time_ps" で記録し、tools/gap_log.py が同じ長さの無音を挿入し直す。
+    // LFO / ノイズの位相は飛ばさずに走らせた場合と一致しない。
+    // ------------------------------------------------------------
+    localparam longint DUR_TICKS = 64'd72 * 64'd27936;  // 1 duration = 72 EMUCLK
+
+    reg [7:0] shadow_addr = 8'h00;
+    reg [8:0] shadow_key  = 9'd0;     // 0x20-0x28 bit4
+    reg [5:0] shadow_rhy  = 6'd0;     // 0x0E[5:0]
+    wire      keys_on     = (|shadow_key) | (shadow_rhy[5] & (|shadow_rhy[4:0]));
+
+    integer silence_min    = 32;
+    integer silent_durs    = 0;       // 連続した無音 duration 数
+    longint tail_ticks     = 64'd100_000_000_000;   // 1 s
+    reg     tail_early     = 1'b1;
+    reg     skip_gaps      = 1'b0;
+    longint skip_min_ticks = 64'd4410 * TICKS_PER_VGM_SAMPLE;
+    longint skipped_ticks  = 0;       // 現在のテストで飛ばした合計 [tick]
+    longint n_gaps         = 0;
+
+    task automatic read_silence_options;
+        integer smp;
+        real    sec;
+        void'($value$plusargs("SILENCE_DUR=%d", silence_min));
+        if ($value$plusargs("TAIL_SMP=%d", smp)) tail_ticks = smp * TICKS_PER_VGM_SAMPLE;
+        if ($value$plusargs("TAIL_S=%f",   sec)) tail_ticks = longint'(sec * TICKS_PER_SECOND);
+        if ($test$plusargs("FULL_TAIL"))
+            tail_early = 1'b0;
+        if ($test$plusargs("SKIP_GAPS")) begin
+            skip_gaps = 1'b1;
+            if ($value$plusargs("SKIP_GAPS=%d", smp) && smp > 0)
+                skip_min_ticks = smp * TICKS_PER_VGM_SAMPLE;
+            $display("[TB] Skipping silent gaps >= %0d ticks (silence: %0d durations)",
+                     skip_min_ticks, silence_min);
+        end
+    endtask
+
+    function automatic bit is_silent;
+        is_silent = (silent_durs >= silence_min);
+    endfunction
+
     task automatic wait_phiM_cycles(input integer n);
         integer i;
         begin
@@ -149,6 +333,7 @@ module IKAOPLL_vgm_tb;
         integer need_wait;
         integer now_phiM;
 
+        csv_row  = csv_row + 1;
         now_phiM = phiM_cnt;
 
         case (last_op_kind)
@@ -165,6 +350,7 @@ module IKAOPLL_vgm_tb;
                 remain = need_wait - diff;
                 $display("[TB] enforcing wait: last_op=%0d, diff=%0d, need=%0d -> wait %0d phiM cycles at %0t",
                          last_op_kind, diff, need_wait, remain, $time);
+                n_wait_enforced = n_wait_enforced + 1;
                 wait_phiM_cycles(remain);
                 now_phiM = phiM_cnt;
             end
@@ -190,6 +376,15 @@ module IKAOPLL_vgm_tb;
         else
             last_op_kind = LAST_DATA;
         last_op_phiM = phiM_cnt;
+        n_bus_writes = n_bus_writes + 1;
+
+        // 無音判定用のレジスタシャドウ
+        if (i_TARGET_ADDR == 1'b0)
+            shadow_addr = i_WRITE_DATA;
+        else if (shadow_addr >= 8'h20 && shadow_addr <= 8'h28)
+            shadow_key[shadow_addr - 8'h20] = i_WRITE_DATA[4];
+        else if (shadow_addr == 8'h0E)
+            shadow_rhy = i_WRITE_DATA[5:0];
     end
     endtask
 
@@ -199,6 +394,11 @@ module IKAOPLL_vgm_tb;
     integer fh_mo;
     integer fh_dur;
     integer fh_acc;
+    integer fh_gap;
+    reg     logs_open = 1'b0;
+    longint n_acc_file = 0;    // 現在の samples_acc.txt のレコード数
+    integer acc_in_dur  = 0;   // 現在の duration の ACC レコード数
+    integer acc_per_dur = 1;   // 直前の duration の ACC レコード数
 
     integer cyc_cnt;
     integer dur_idx;
@@ -208,22 +408,25 @@ module IKAOPLL_vgm_tb;
     reg     dur_inited;
     reg     ACC_STRB_q;
 
-    initial begin
-        fh_mo = $fopen("samples_mo.txt", "w");
-        if (fh_mo == 0) begin
-            $display("[TB] ERROR: cannot open samples_mo.txt");
-            $finish;
-        end
-        fh_dur = $fopen("durations.txt", "w");
-        if (fh_dur == 0) begin
-            $display("[TB] ERROR: cannot open durations.txt");
-            $finish;
-        end
-        fh_acc = $fopen("samples_acc.txt", "w");
-        if (fh_acc == 0) begin
-            $display("[TB] ERROR: cannot open samples_acc.txt");
+    function automatic integer open_log(input string dir, input string name);
+        string path;
+        path = (dir.len() > 0) ? {dir, "/", name} : name;
+        open_log = $fopen(path, "w");
+        if (open_log == 0) begin
+            $display("[TB] ERROR: cannot open %s", path);
             $finish;
         end
+    endfunction
+
+    // dir = "" ならカレントディレクトリ（単一テスト時の従来のファイル名）
+    task automatic open_logs(input string dir);
+        fh_mo  = open_log(dir, "samples_mo.txt");
+        fh_dur = open_log(dir, "durations.txt");
+        fh_acc = open_log(dir, "samples_acc.txt");
+        // 飛ばした区間が無くても毎回作り直す（古い gaps.txt を残さない）
+        fh_gap = open_log(dir, "gaps.txt");
+        $fwrite(fh_gap, "# dur_idx acc_idx n_dur n_acc skipped_ps time_ps\n");
+        n_acc_file = 0;
 
         cyc_cnt      = 0;
         dur_idx      = 0;
@@ -231,9 +434,18 @@ module IKAOPLL_vgm_tb;
         dur_end_ps   = 0;
         dur_inited   = 0;
         ACC_STRB_q   = 1'b0;
+        logs_open    = 1'b1;
 
-        $display("[TB] Logging initialized.");
-    end
+        $display("[TB] Logging initialized%s%s.", (dir.len() > 0) ? " in " : "", dir);
+    endtask
+
+    task automatic close_logs;
+        logs_open = 1'b0;
+        $fclose(fh_mo);
+        $fclose(fh_dur);
+        $fclose(fh_acc);
+        $fclose(fh_gap);
+    endtask
 
     // EMUCLK カウンタ
     always @(posedge EMUCLK or negedge IC_n) begin
@@ -256,12 +468,13 @@ module IKAOPLL_vgm_tb;
 
             if (!ACC_STRB_q && ACC_STRB) begin
                 longint now_ps;
-                now_ps = cyc_cnt * 10;
+                now_ps = $time * 10;   // timescale 10ps → ps
 
-                if (dur_inited) begin
+                if (dur_inited && logs_open) begin
                     dur_end_ps = now_ps;
                     $fwrite(fh_dur, "%0d %0d %0d\n",
                             dur_idx, dur_start_ps, dur_end_ps);
+                    n_dur_rec = n_dur_rec + 1;
                     dur_idx <= dur_idx + 1;
                 end
 
@@ -271,47 +484,204 @@ module IKAOPLL_vgm_tb;
         end
     end
 
-    // MO ログ
+    // MO / RO ログ（"dur_idx value time_ps path", path: 0 = MO, 1 = RO）
     always @(posedge EMUCLK) begin
-        if (DAC_EN_MO) begin
+        if (logs_open && (DAC_EN_MO || DAC_EN_RO)) begin
             longint time_ps;
-            time_ps = cyc_cnt * 10;
-            $fwrite(fh_mo, "%0d %0d %0d\n",
-                    dur_idx,
-                    $signed(IMP_FLUC_MO),
-                    time_ps);
+            time_ps = $time * 10;
+            if (DAC_EN_MO) begin
+                $fwrite(fh_mo, "%0d %0d %0d 0\n",
+                        dur_idx,
+                        $signed(IMP_FLUC_MO),
+                        time_ps);
+                n_mo_rec = n_mo_rec + 1;
+            end
+            if (DAC_EN_RO) begin
+                $fwrite(fh_mo, "%0d %0d %0d 1\n",
+                        dur_idx,
+                        $signed(IMP_FLUC_RO),
+                        time_ps);
+                n_ro_rec = n_ro_rec + 1;
+            end
         end
     end
 
     // ACC ログ（値 + 時刻[ps]）
     always @(posedge EMUCLK) begin
-        if (ACC_STRB) begin
+        if (logs_open && ACC_STRB) begin
             longint time_ps;
-            time_ps = cyc_cnt * 10;
+            time_ps = $time * 10;
             $fwrite(fh_acc, "%0d %0d\n",
                     $signed(ACC_SIGNED),
                     time_ps);
+            n_acc_rec  = n_acc_rec + 1;
+            n_acc_file = n_acc_file + 1;
+        end
+    end
+
+    // ------------------------------------------------------------
+    // VGM wait (vgm_csv_to_vh.py: "vgm_wait(<ticks>); IKAOPLL_write(...);")
+    // ------------------------------------------------------------
+    task automatic vgm_wait(input longint ticks);
+        longint n_skip;
+        n_skip = 0;
+        if (skip_gaps && ticks >= skip_min_ticks && is_silent())
+            n_skip = ticks / DUR_TICKS - 1;   // 最後の 1 duration 分は実際に待つ
+        if (n_skip > 0) begin
+            $fwrite(fh_gap, "%0d %0d %0d %0d %0d %0d\n",
+                    dur_idx, n_acc_file, n_skip, n_skip * acc_per_dur,
+                    n_skip * DUR_TICKS * 10, $time * 10);
+            $display("[TB] Skipping %0d silent durations (%0d ticks) at %0t",
+                     n_skip, n_skip * DUR_TICKS, $time);
+            skipped_ticks = skipped_ticks + n_skip * DUR_TICKS;
+            n_gaps        = n_gaps + 1;
+        end
+        #(ticks - n_skip * DUR_TICKS);
+    endtask
+
+    // 無音 duration の判定（duration 境界 = ACC_STRB の立ち上がり）
+    reg               dur_all_max  = 1'b1;
+    reg signed [15:0] acc_prev_dur = 16'sd0;
+
+    always @(posedge EMUCLK or negedge IC_n) begin
+        if (!IC_n) begin
+            dur_all_max <= 1'b1;
+            silent_durs <= 0;
+            acc_in_dur  <= 0;
+        end else if (!ACC_STRB_q && ACC_STRB) begin
+            if (dur_all_max && !keys_on && ACC_SIGNED == acc_prev_dur)
+                silent_durs <= silent_durs + 1;
+            else
+                silent_durs <= 0;
+            acc_prev_dur <= ACC_SIGNED;
+            acc_per_dur  <= acc_in_dur;
+            acc_in_dur   <= 1;
+            dur_all_max  <= dut.u_EG.o_OP_ATTNLV_MAX;
+        end else begin
+            if (ACC_STRB)
+                acc_in_dur <= acc_in_dur + 1;
+            dur_all_max <= dur_all_max & dut.u_EG.o_OP_ATTNLV_MAX;
+        end
+    end
+
+    // ------------------------------------------------------------
+    // Progress records (read by tools/run_tb.py)
+    //
+    //   [PROG] <tag> t_ps=.. vgm_smp=.. row=.. writes=.. waits=..
+    //          mo=.. ro=.. acc=.. dur=.. test=..
+    //
+    //   vgm_smp は現在のテストの開始からの VGM サンプル数、test は
+    //   0 始まりのテスト番号（begin_test ごとに test_start を出す）
+    //
+    //   +PROGRESS_SMP=<n>   interval in VGM samples (default 441 = 10 ms,
+    //                       0 = off)
+    // ------------------------------------------------------------
+    longint vgm_t0      = -1;      // VGM パターン開始時刻 [tick]
+    reg     progress_on = 1'b0;
+    integer test_idx    = -1;
+    string  test_name   = "";
+
+    task automatic emit_progress(input string tag);
+        longint smp;
+        if (progress_on) begin
+            // 飛ばした無音区間も VGM 上の位置には含める
+            smp = (vgm_t0 < 0) ? 0 : ($time - vgm_t0 + skipped_ticks) / TICKS_PER_VGM_SAMPLE;
+            $display("[PROG] %s t_ps=%0d vgm_smp=%0d row=%0d writes=%0d waits=%0d mo=%0d ro=%0d acc=%0d dur=%0d test=%0d",
+                     tag, $time * 10, smp, csv_row, n_bus_writes, n_wait_enforced,
+                     n_mo_rec, n_ro_rec, n_acc_rec, n_dur_rec, test_idx);
+            // パイプ越しでも壁時計と対応が取れるよう即座に吐き出す
+            $fflush;
+        end
+    endtask
+
+    initial begin : progress_ctrl
+        integer interval;
+
+        interval = 441;
+        void'($value$plusargs("PROGRESS_SMP=%d", interval));
+        if (interval <= 0)
+            disable progress_ctrl;
+        progress_on = 1'b1;
+
+        @(vgm_started);
+        emit_progress("start");
+        forever begin
+            #(interval * TICKS_PER_VGM_SAMPLE);
+            emit_progress("tick");
         end
     end
 
     // ------------------------------------------------------------
     // Stimulus
+    //
+    //   begin_test: ログを開く → IC_n リセット → 100 サイクル待ち → 再生開始
+    //   end_test  : テール → ログを閉じる
     // ------------------------------------------------------------
-    initial begin
-        @(posedge IC_n);
+    task automatic begin_test(input string name);
+        test_idx  = test_idx + 1;
+        test_name = name;
+        open_logs(name);
+        apply_reset;
         repeat (100) @(posedge EMUCLK);
 
-        $display("[TB] Starting VGM pattern from tests/ym2413_scale_chromatic.vh at %0t", $time);
+        // バス状態もテストごとに初期化（phiM_cnt は IC_n でクリア済み）
+        last_op_kind  = LAST_NONE;
+        last_op_phiM  = 0;
+        shadow_addr   = 8'h00;
+        shadow_key    = 9'd0;
+        shadow_rhy    = 6'd0;
+        skipped_ticks = 0;
+
+        if (name.len() > 0)
+            $display("[TB] Starting test %0d '%s' at %0t", test_idx, name, $time);
+        else
+            $display("[TB] Starting VGM pattern from %s at %0t", `VGM_VH, $time);
+        vgm_t0 = $time;
+        -> vgm_started;
+        emit_progress("test_start");
+    endtask
 
-        `include "tests/ym2413_scale_chromatic.vh"
+    // 最大 tail_ticks。無音になった時点で打ち切る（+FULL_TAIL で無効）
+    task automatic run_tail;
+        longint waited;
+        longint step;
+        waited = 0;
+        while (waited < tail_ticks && !(tail_early && is_silent())) begin
+            step = (tail_ticks - waited < DUR_TICKS) ? (tail_ticks - waited) : DUR_TICKS;
+            #(step);
+            waited = waited + step;
+        end
+        if (waited < tail_ticks)
+            $display("[TB] Silent for %0d durations, tail ended after %0d of %0d ticks at %0t",
+                     silent_durs, waited, tail_ticks, $time);
+    endtask
 
+    task automatic end_test;
         $display("[TB] VGM pattern completed, waiting tail at %0t", $time);
-        #10_000_000;
+        emit_progress("vgm_done");
+        run_tail;
+
+        emit_progress("test_end");
+        close_logs;
+        if (n_gaps > 0)
+            $display("[TB] Skipped %0d silent gaps, %0d ticks in total", n_gaps, skipped_ticks);
+        n_gaps = 0;
+        if (test_name.len() > 0)
+            $display("[TB] Finished test %0d '%s' at %0t", test_idx, test_name, $time);
+    endtask
+
+    initial begin
+        read_silence_options;
+`ifdef VGM_SUITE_VH
+        `include `VGM_SUITE_VH
+`else
+        begin_test("");
+        `include `VGM_VH
+        end_test;
+`endif
 
         $display("[TB] Finishing simulation at %0t", $time);
-        $fclose(fh_mo);
-        $fclose(fh_dur);
-        $fclose(fh_acc);
+        emit_progress("end");
         $finish;
     end
 
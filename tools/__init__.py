@@ -0,0 +1,48 @@
+"""
+IKAOPLL testbench / post-processing tools.
+
+The modules in this directory are plain scripts that import each other
+by their flat names (``import metrics``, ``from wav_writer import ...``),
+so ``python3 tools/acc_to_wav.py ...`` keeps working.  Importing the
+package puts the directory on sys.path and exposes every module lazily:
+nothing (in particular NumPy) is imported until a module is first used.
+
+    from tools import make_ref_wav
+    make_ref_wav.make_mo_ref_wav("samples_mo.txt")
+
+Command line (one process for many input files, see cli.py):
+
+    python3 -m tools <subcommand> [args ...]
+    python3 -m tools batch <subcommand> [-j N] INPUT ... [-- extra args]
+"""
+
+import importlib
+import os
+import sys
+
+_DIR = os.path.dirname(os.path.abspath(__file__))
+if _DIR not in sys.path:
+    sys.path.insert(0, _DIR)
+
+MODULES = (
+    "acc_decimate_to_wav", "acc_log", "acc_resample_to_wav", "acc_to_wav",
+    "analyze_duration", "analyze_mo_range", "avg_mo_by_duration",
+    "avg_mo_to_wav", "bench_tools", "box_filter", "cic_decimator", "cli",
+    "clock_recovery", "config_lockstep", "env_check", "gap_log",
+    "log_index", "make_ref_wav", "make_tb_suite", "metrics", "mo_ro_log",
+    "parallel_filter", "pitch_check", "reg_coverage", "reg_dedup",
+    "reg_events", "run_tb", "solo_render", "stim_reduce", "stress_stimulus",
+    "synth_logs", "txt_to_wav", "vcd_extract", "vgm_catalog",
+    "vgm_csv_to_vh", "vgm_to_ym2413_csv", "wav_writer",
+)
+
+
+def __getattr__(name):
+    # PEP 562: 初回アクセス時にだけフラットなモジュールを import する
+    if name in MODULES:
+        return importlib.import_module(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(MODULES))
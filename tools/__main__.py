@@ -0,0 +1,13 @@
+"""python3 -m tools <subcommand> ... (also: python3 tools <subcommand> ...)"""
+
+import os
+import sys
+
+_DIR = os.path.dirname(os.path.abspath(__file__))
+if _DIR not in sys.path:
+    sys.path.insert(0, _DIR)
+
+from cli import main  # noqa: E402
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,39 +1,29 @@
 #!/usr/bin/env python3
 import sys
-import wave
-import struct
 import math
 
-def load_acc_values(path):
-    """samples_acc.txt から ACC 値だけを読み込む。
-    - 行が 1 列: その値だけを読む
-    - 行が 2 列以上: 先頭の列を値として読む
-    - 'x' など非数値はスキップ
-    """
-    vals = []
-    with open(path) as f:
-        for lineno, line in enumerate(f, 1):
-            s = line.strip()
-            if not s:
-                continue
-            parts = s.split()
-            if not parts:
-                continue
-            try:
-                v = int(parts[0])
-            except ValueError:
-                print(f"[WARN] skip line {lineno}: {s}")
-                continue
-            vals.append(float(v))
-    return vals
+import log_index
+import metrics
+from acc_log import load_acc_values
+from wav_writer import normalize_to_int16, write_wav
 
-def fir_lowpass(samples, fs, cutoff_hz=15000.0, taps=129):
-    """簡易 Hamming 窓 FIR LPF"""
-    if not samples:
-        return []
+try:
+    import parallel_filter
+except ImportError:  # NumPy が無い環境では従来の単一プロセス FIR を使う
+    parallel_filter = None
+
+try:
+    import clock_recovery
+except ImportError:  # NumPy が無い環境では固定の Fs_int を使う
+    clock_recovery = None
+
+DEFAULT_FS_INT = 1_600_000.0  # 時刻列から復元できないときの Fs_int
+
+def hamming_lowpass_taps(fs, cutoff_hz=15000.0, taps=129):
+    """Hamming 窓 FIR LPF の係数（DC ゲイン 1 に正規化）。fc >= 1 なら None。"""
     fc = cutoff_hz / (fs / 2.0)  # 正規化カットオフ 0..1
     if fc >= 1.0:
-        return samples[:]
+        return None
 
     M = taps - 1
     h = []
@@ -47,7 +37,15 @@ def fir_lowpass(samples, fs, cutoff_hz=15000.0, taps=129):
         h.append(hn * w)
     # 正規化
     s = sum(h)
-    h = [x / s for x in h]
+    return [x / s for x in h]
+
+def fir_lowpass(samples, fs, cutoff_hz=15000.0, taps=129):
+    """簡易 Hamming 窓 FIR LPF"""
+    if not samples:
+        return []
+    h = hamming_lowpass_taps(fs, cutoff_hz, taps)
+    if h is None:
+        return samples[:]
 
     out = [0.0] * len(samples)
     for n in range(len(samples)):
@@ -63,43 +61,44 @@ def decimate(samples, factor):
     """単純な間引き（LPF 済み前提）"""
     return samples[::factor]
 
-def normalize_to_int16(samples):
-    if not samples:
-        return []
-    peak = max(abs(float(v)) for v in samples)
-    if peak == 0:
-        return [0] * len(samples)
-    scale = 0.9 * 32767.0 / peak
-    print(f"[INFO] peak={peak}, scale={scale}")
-    return [int(round(v * scale)) for v in samples]
-
-def write_wav(path, samples, fs):
-    with wave.open(path, "wb") as w:
-        w.setnchannels(1)
-        w.setsampwidth(2)
-        w.setframerate(int(fs))
-        data = b"".join(struct.pack("<h", max(-32768, min(32767, int(s))))
-                        for s in samples)
-        w.writeframes(data)
-
-def main():
-    if len(sys.argv) < 2:
-        print(f"Usage: {sys.argv[0]} samples_acc.txt [out.wav] [Fs_int] [Fs_out]")
-        print("  Fs_int: internal sample rate (default 1_600_000 Hz)")
+def main(argv=None):
+    argv = sys.argv if argv is None else argv
+    try:
+        argv, window = log_index.pop_window_args(argv)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    if len(argv) < 2:
+        print(f"Usage: {argv[0]} samples_acc.txt [out.wav] [Fs_int] [Fs_out] [jobs]")
+        print("  Fs_int: internal sample rate (default 0 = recovered from time_ps,")
+        print("          else 1_600_000 Hz)")
         print("  Fs_out: output sample rate  (default 44_100 Hz)")
+        print("  jobs  : worker processes for the FIR (default 0 = all cores)")
+        print("  --start/--end: window in seconds (12.5) or duration indices (600000d)")
         sys.exit(1)
 
-    in_txt = sys.argv[1]
-    out_wav = sys.argv[2] if len(sys.argv) >= 3 else "acc_decim_44k1.wav"
-    Fs_int  = float(sys.argv[3]) if len(sys.argv) >= 4 else 1_600_000.0
-    Fs_out  = float(sys.argv[4]) if len(sys.argv) >= 5 else 44_100.0
+    in_txt = argv[1]
+    out_wav = argv[2] if len(argv) >= 3 else "acc_decim_44k1.wav"
+    Fs_int  = float(argv[3]) if len(argv) >= 4 else 0.0
+    Fs_out  = float(argv[4]) if len(argv) >= 5 else 44_100.0
+    jobs    = int(argv[5]) if len(argv) >= 6 else 0
 
-    vals = load_acc_values(in_txt)
+    with metrics.stage("parse") as st:
+        vals = load_acc_values(in_txt, as_float=True, window=window)
+        st.count(len(vals), "samples")
     print(f"[INFO] loaded {len(vals)} ACC samples")
     if not vals:
         print("[ERROR] no samples")
         sys.exit(1)
 
+    clock = None
+    if Fs_int <= 0:
+        if clock_recovery is not None:
+            with metrics.stage("recover_clock"):
+                clock = clock_recovery.recover_from_log(in_txt, col=1, window=window)
+            clock_recovery.print_clock(clock)
+        Fs_int = clock["fs_hz"] if clock else DEFAULT_FS_INT
+
     decim = int(round(Fs_int / Fs_out))
     if decim < 1:
         decim = 1
@@ -108,12 +107,26 @@ def main():
     print(f"[INFO] decimation factor={decim}, effective Fs_out={eff_Fs_out} Hz")
 
     # LPF → 間引き
-    lp = fir_lowpass(vals, Fs_int, cutoff_hz=min(18000.0, eff_Fs_out/2.5), taps=129)
-    dec = decimate(lp, decim)
+    cutoff_hz = min(18000.0, eff_Fs_out/2.5)
+    h = hamming_lowpass_taps(Fs_int, cutoff_hz, taps=129)
+    with metrics.stage("filter") as st:
+        if parallel_filter is not None and h is not None:
+            # 残すサンプルだけを共有メモリ上で並列に計算（結果は単一プロセスと同一）
+            dec = parallel_filter.fir_decimate(vals, h, decim, jobs=jobs).tolist()
+        else:
+            lp = fir_lowpass(vals, Fs_int, cutoff_hz=cutoff_hz, taps=129)
+            dec = decimate(lp, decim)
+        st.count(len(vals), "samples")
+        st.note(decimation=decim, jobs=jobs)
     print(f"[INFO] decimated samples: {len(dec)}")
 
-    int16_samples = normalize_to_int16(dec)
+    with metrics.stage("normalize") as st:
+        int16_samples = normalize_to_int16(dec)
+        st.count(len(dec), "samples")
     write_wav(out_wav, int16_samples, eff_Fs_out)
+    if clock:
+        clock_recovery.write_clock_metadata(out_wav, clock, wav_fs_hz=int(eff_Fs_out),
+                                            decimation=decim)
     print(f"[INFO] wrote WAV: {out_wav} (Fs={eff_Fs_out} Hz)")
 
 if __name__ == "__main__":
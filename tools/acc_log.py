@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+acc_log.py
+
+Readers for the testbench accumulator log (samples_acc.txt):
+
+    "value time_ps"
+
+Older logs have only the value column.  Non-numeric lines (e.g. "x 0"
+before reset) are skipped with a warning.  Silent gaps skipped by the TB
+(+SKIP_GAPS, gaps.txt next to the log) are filled back in, see
+gap_log.py.  Shared by acc_to_wav.py, acc_decimate_to_wav.py,
+acc_resample_to_wav.py and make_ref_wav.py.
+
+window (log_index.Window) restricts the read to --start/--end through
+the sidecar index.
+"""
+
+import gap_log
+import log_index
+
+
+def load_acc_values(path, as_float=False, tag="", window=None):
+    """samples_acc.txt から ACC 値だけを読み込む。
+    - 行が 1 列: その値だけを読む
+    - 行が 2 列以上: 先頭の列を値として読む
+    - 'x' など非数値はスキップ
+    """
+    conv = float if as_float else int
+    vals = []
+    for lineno, line in log_index.iter_lines(path, window):
+        s = line.strip()
+        if not s:
+            continue
+        parts = s.split()
+        try:
+            v = int(parts[0])
+        except ValueError:
+            # 先頭列が数値でなければスキップ（例: "x 0"）
+            print(f"[WARN] {tag}skip line {lineno}: {s}")
+            continue
+        vals.append(conv(v))
+    return gap_log.fill_acc(vals, log_index.load_gaps(path, window))
+
+
+def load_acc_with_time(path, raw_ps=False, window=None):
+    """(vals, times)。times は秒、raw_ps=True なら time_ps 列の int のまま。"""
+    vals = []
+    times = []
+    for lineno, line in log_index.iter_lines(path, window):
+        s = line.strip()
+        if not s:
+            continue
+        parts = s.split()
+        if len(parts) < 2:
+            print(f"[WARN] skip line {lineno}: {s}")
+            continue
+        try:
+            v = int(parts[0])
+            t_ps = int(parts[1])  # ps
+        except ValueError:
+            print(f"[WARN] skip line {lineno}: {s}")
+            continue
+        vals.append(v)
+        times.append(t_ps)
+    # 飛ばした区間を ps のまま挿入してから秒に直す
+    vals, times = gap_log.fill_acc_times(vals, times, log_index.load_gaps(path, window))
+    if not raw_ps:
+        times = [t * 1e-12 for t in times]  # ps -> s
+    return vals, times
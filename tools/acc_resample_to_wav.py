@@ -1,29 +1,17 @@
 #!/usr/bin/env python3
 import sys
-import wave
-import struct
 
-def load_acc_with_time(path):
-    vals = []
-    times = []
-    with open(path) as f:
-        for lineno, line in enumerate(f, 1):
-            s = line.strip()
-            if not s:
-                continue
-            parts = s.split()
-            if len(parts) < 2:
-                print(f"[WARN] skip line {lineno}: {s}")
-                continue
-            try:
-                v = int(parts[0])
-                t_ps = int(parts[1])  # ps
-            except ValueError:
-                print(f"[WARN] skip line {lineno}: {s}")
-                continue
-            vals.append(v)
-            times.append(t_ps * 1e-12)  # ps -> s
-    return vals, times
+import log_index
+import metrics
+from acc_log import load_acc_with_time
+from wav_writer import normalize_to_int16, write_wav
+
+try:
+    import numpy as np
+    import clock_recovery
+except ImportError:  # NumPy が無い環境では生の時刻で補間する
+    np = None
+    clock_recovery = None
 
 def estimate_internal_fs(times):
     if len(times) < 2:
@@ -63,6 +51,17 @@ def resample_linear(vals, times, fs_out):
             out.append(v0 + alpha * (v1 - v0))
     return out
 
+def resample_linear_np(vals, times, fs_out):
+    """resample_linear() の NumPy 版（np.interp で一括補間）"""
+    if len(vals) == 0:
+        return []
+    t_start = times[0]
+    n_out = int((times[-1] - t_start) * fs_out)
+    if n_out <= 0:
+        return []
+    t = t_start + np.arange(n_out) / fs_out
+    return np.interp(t, times, np.asarray(vals, dtype=np.float64)).tolist()
+
 def fir_lowpass(samples, fs, cutoff_hz=12000.0, taps=101):
     """簡易 Hamming 窓 FIR LPF"""
     import math
@@ -96,48 +95,62 @@ def fir_lowpass(samples, fs, cutoff_hz=12000.0, taps=101):
         out[n] = acc
     return out
 
-def normalize_to_int16(samples):
-    if not samples:
-        return []
-    peak = max(abs(float(v)) for v in samples)
-    if peak == 0:
-        return [0] * len(samples)
-    scale = 0.9 * 32767.0 / peak
-    print(f"[INFO] peak={peak}, scale={scale}")
-    return [int(round(v * scale)) for v in samples]
-
-def write_wav(path, samples, fs):
-    with wave.open(path, "wb") as w:
-        w.setnchannels(1)
-        w.setsampwidth(2)
-        w.setframerate(int(fs))
-        data = b"".join(struct.pack("<h", max(-32768, min(32767, int(s))))
-                        for s in samples)
-        w.writeframes(data)
-
-def main():
-    if len(sys.argv) < 2:
-        print(f"Usage: {sys.argv[0]} samples_acc.txt [out.wav] [Fs_out]")
+def main(argv=None):
+    argv = sys.argv if argv is None else argv
+    try:
+        argv, window = log_index.pop_window_args(argv)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
         sys.exit(1)
-
-    in_txt = sys.argv[1]
-    out_wav = sys.argv[2] if len(sys.argv) >= 3 else "acc_resampled_44k1.wav"
-    fs_out  = float(sys.argv[3]) if len(sys.argv) >= 4 else 44100.0
-
-    vals, times = load_acc_with_time(in_txt)
-    print(f"[INFO] loaded {len(vals)} ACC samples")
-    fs_int = estimate_internal_fs(times)
-    if fs_int is None:
-        print("[ERROR] failed to estimate internal Fs")
+    if len(argv) < 2:
+        print(f"Usage: {argv[0]} samples_acc.txt [out.wav] [Fs_out] [--start T] [--end T]")
         sys.exit(1)
-    print(f"[INFO] estimated internal Fs ≈ {fs_int:.3f} Hz")
 
-    pcm = resample_linear(vals, times, fs_out)
+    in_txt = argv[1]
+    out_wav = argv[2] if len(argv) >= 3 else "acc_resampled_44k1.wav"
+    fs_out  = float(argv[3]) if len(argv) >= 4 else 44100.0
+
+    clock = None
+    if clock_recovery is not None:
+        with metrics.stage("parse") as st:
+            vals, times_ps = load_acc_with_time(in_txt, raw_ps=True, window=window)
+            st.count(len(vals), "samples")
+        print(f"[INFO] loaded {len(vals)} ACC samples")
+        # 復元したクロックの等間隔グリッドを補間の時間軸に使う
+        with metrics.stage("recover_clock"):
+            times, clock = clock_recovery.regular_time_grid(times_ps)
+        if clock is None:
+            print("[ERROR] failed to recover internal Fs")
+            sys.exit(1)
+        clock_recovery.print_clock(clock)
+        with metrics.stage("resample") as st:
+            pcm = resample_linear_np(vals, times, fs_out)
+            st.count(len(pcm), "samples")
+    else:
+        with metrics.stage("parse") as st:
+            vals, times = load_acc_with_time(in_txt, window=window)
+            st.count(len(vals), "samples")
+        print(f"[INFO] loaded {len(vals)} ACC samples")
+        with metrics.stage("recover_clock"):
+            fs_int = estimate_internal_fs(times)
+        if fs_int is None:
+            print("[ERROR] failed to estimate internal Fs")
+            sys.exit(1)
+        print(f"[INFO] estimated internal Fs ≈ {fs_int:.3f} Hz")
+        with metrics.stage("resample") as st:
+            pcm = resample_linear(vals, times, fs_out)
+            st.count(len(pcm), "samples")
     print(f"[INFO] resampled to {len(pcm)} samples at {fs_out} Hz")
 
-    pcm_lp = fir_lowpass(pcm, fs_out, cutoff_hz=12000.0, taps=101)
-    int16_samples = normalize_to_int16(pcm_lp)
+    with metrics.stage("filter") as st:
+        pcm_lp = fir_lowpass(pcm, fs_out, cutoff_hz=12000.0, taps=101)
+        st.count(len(pcm), "samples")
+    with metrics.stage("normalize") as st:
+        int16_samples = normalize_to_int16(pcm_lp)
+        st.count(len(pcm_lp), "samples")
     write_wav(out_wav, int16_samples, fs_out)
+    if clock:
+        clock_recovery.write_clock_metadata(out_wav, clock, wav_fs_hz=int(fs_out))
     print(f"[INFO] wrote WAV: {out_wav} (Fs={fs_out} Hz)")
 
 if __name__ == "__main__":
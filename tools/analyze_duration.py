@@ -3,7 +3,10 @@ import sys
 import statistics as stats
 from pathlib import Path
 
-def analyze_durations(path: str):
+import log_index
+import metrics
+
+def analyze_durations(path: str, window=None):
     p = Path(path)
     if not p.is_file():
         print(f"[ERROR] durations file not found: {p}")
@@ -13,37 +16,38 @@ def analyze_durations(path: str):
     start0 = None
     end_last = None
 
-    with p.open() as f:
-        for lineno, line in enumerate(f, 1):
-            line = line.strip()
-            if not line:
-                continue
+    for lineno, line in log_index.iter_lines(p, window):
+        line = line.strip()
+        if not line:
+            continue
 
-            parts = line.split()
-            if len(parts) < 3:
-                # 2列しか無い・ゴミ行などはスキップしつつ警告
-                print(f"[WARN] skip line {lineno}: expected 3 cols, got {len(parts)} -> {line}")
-                continue
+        parts = line.split()
+        if len(parts) < 3:
+            # 2列しか無い・ゴミ行などはスキップしつつ警告
+            print(f"[WARN] skip line {lineno}: expected 3 cols, got {len(parts)} -> {line}")
+            continue
 
-            idx_str, s_str, e_str = parts[:3]
-            try:
-                idx = int(idx_str)
-                s   = int(s_str)
-                e   = int(e_str)
-            except ValueError:
-                print(f"[WARN] skip line {lineno}: non-integer field -> {line}")
-                continue
+        idx_str, s_str, e_str = parts[:3]
+        try:
+            idx = int(idx_str)
+            s   = int(s_str)
+            e   = int(e_str)
+        except ValueError:
+            print(f"[WARN] skip line {lineno}: non-integer field -> {line}")
+            continue
 
-            if start0 is None:
-                start0 = s
-            end_last = e
-            durations.append(e - s)
+        if start0 is None:
+            start0 = s
+        end_last = e
+        durations.append(e - s)
 
     if not durations:
         print("[ERROR] no valid duration entries found.")
         return
 
     print(f"# file      : {p}")
+    if window is not None:
+        print(f"# window    : {log_index.describe(window)}")
     print(f"# intervals : {len(durations)}")
     print(f"min Δt [ps]: {min(durations)}")
     print(f"max Δt [ps]: {max(durations)}")
@@ -63,13 +67,20 @@ def analyze_durations(path: str):
             fs = N / total_time_s
             print(f"effective Fs if 1 sample/Duration: {fs:.3f} Hz")
 
-def main():
+def main(argv=None):
+    argv = sys.argv if argv is None else argv
+    try:
+        argv, window = log_index.pop_window_args(argv)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return 1
     # 引数があればそれを使う。無ければデフォルト "durations.txt"
-    if len(sys.argv) >= 2:
-        path = sys.argv[1]
+    if len(argv) >= 2:
+        path = argv[1]
     else:
         path = "durations.txt"
-    analyze_durations(path)
+    with metrics.stage("parse"):
+        analyze_durations(path, window)
 
 if __name__ == "__main__":
     main()
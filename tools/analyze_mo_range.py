@@ -1,46 +1,59 @@
 #!/usr/bin/env python3
 import sys
 
-def analyze_mo(path: str):
+import log_index
+import metrics
+
+def analyze_mo(path: str, window=None):
     mn = None
     mx = None
     cnt = 0
 
-    with open(path) as f:
-        for lineno, line in enumerate(f, 1):
-            s = line.strip()
-            if not s:
-                continue
-            parts = s.split()
-            if len(parts) < 2:
-                print(f"[WARN] skip line {lineno}: {s}")
-                continue
-            try:
-                v = int(parts[1])
-            except ValueError:
-                print(f"[WARN] skip line {lineno}: non-int -> {s}")
-                continue
-            cnt += 1
-            if mn is None or v < mn:
-                mn = v
-            if mx is None or v > mx:
-                mx = v
+    for lineno, line in log_index.iter_lines(path, window):
+        s = line.strip()
+        if not s:
+            continue
+        parts = s.split()
+        if len(parts) < 2:
+            print(f"[WARN] skip line {lineno}: {s}")
+            continue
+        if len(parts) >= 4 and parts[3] != "0":
+            continue  # RO レコード
+        try:
+            v = int(parts[1])
+        except ValueError:
+            print(f"[WARN] skip line {lineno}: non-int -> {s}")
+            continue
+        cnt += 1
+        if mn is None or v < mn:
+            mn = v
+        if mx is None or v > mx:
+            mx = v
 
     if cnt == 0:
         print("[ERROR] no valid samples")
         return
 
     print(f"# file   : {path}")
+    if window is not None:
+        print(f"# window : {log_index.describe(window)}")
     print(f"# count  : {cnt}")
     print(f"min MO   : {mn}")
     print(f"max MO   : {mx}")
 
-def main():
-    if len(sys.argv) >= 2:
-        path = sys.argv[1]
+def main(argv=None):
+    argv = sys.argv if argv is None else argv
+    try:
+        argv, window = log_index.pop_window_args(argv)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return 1
+    if len(argv) >= 2:
+        path = argv[1]
     else:
         path = "samples_mo.txt"
-    analyze_mo(path)
+    with metrics.stage("parse"):
+        analyze_mo(path, window)
 
 if __name__ == "__main__":
     main()
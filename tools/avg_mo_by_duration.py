@@ -1,70 +1,83 @@
 #!/usr/bin/env python3
 import sys
-from collections import defaultdict
 
-def load_and_average(path: str):
-    # dur_idx ごとに sum と count を蓄積
-    acc = defaultdict(lambda: {"sum": 0.0, "count": 0})
+import gap_log
+import log_index
+import metrics
+from mo_ro_log import average_by_duration, has_rhythm_path, load_dac_log, mix_paths
 
-    with open(path) as f:
-        for lineno, line in enumerate(f, 1):
-            s = line.strip()
-            if not s:
-                continue
-            parts = s.split()
-            if len(parts) < 2:
-                print(f"[WARN] skip line {lineno}: {s}")
-                continue
+try:
+    import clock_recovery
+except ImportError:  # NumPy が無ければ Fs メタデータは出さない
+    clock_recovery = None
 
-            dur_str = parts[0]
-            val_str = parts[1]
+def load_and_average(path: str, window=None):
+    """samples_mo.txt を 1 回だけ読み、MO / RO を dur_idx ごとに平均する。
 
-            try:
-                d = int(dur_str)
-                v = int(val_str)
-            except ValueError:
-                print(f"[WARN] skip line {lineno}: non-int -> {s}")
-                continue
-
-            acc[d]["sum"] += v
-            acc[d]["count"] += 1
-
-    # dur_idx 昇順で平均値のリストを作る
-    if not acc:
+    Returns (avg_mo, avg_ro, has_ro, clock).  clock は同じ列から復元した
+    1 duration = 1 サンプルのレート（NumPy が無ければ None）。
+    window を与えると --start/--end の範囲だけを読む（dur_idx は窓の先頭が 0）。
+    """
+    with metrics.stage("parse") as st:
+        dur, val, tps, pth = load_dac_log(path, window)
+        st.count(len(dur), "rows")
+    if len(dur) == 0:
         print("[ERROR] no valid samples")
-        return []
+        return [], [], False, None
 
-    keys = sorted(acc.keys())
-    avg_vals = []
-    for d in keys:
-        c = acc[d]["count"]
-        if c == 0:
-            avg_vals.append(0.0)
-        else:
-            avg_vals.append(acc[d]["sum"] / c)
+    with metrics.stage("average") as st:
+        keys, avg = average_by_duration(dur, val, pth, dense=False)
+        has_ro = has_rhythm_path(pth)
+        st.count(len(dur), "rows")
+    gaps = log_index.load_gaps(path, window)
+    if gaps:
+        avg = {name: gap_log.fill_per_duration(v, gaps, keys) for name, v in avg.items()}
 
     print(f"[INFO] durations with samples : {len(keys)}")
     print(f"[INFO] first dur_idx: {keys[0]}, last dur_idx: {keys[-1]}")
-    return avg_vals
+    if has_ro:
+        print("[INFO] RO (rhythm) records found: writing MO / RO / mix")
+
+    clock = None
+    if clock_recovery is not None and len(tps) and tps[0] >= 0:
+        with metrics.stage("recover_clock"):
+            clock = clock_recovery.recover_duration_rate_from_columns(dur, tps, source=path)
+        clock_recovery.print_clock(clock)
+    return avg["MO"], avg["RO"], has_ro, clock
+
+def write_avg(out_txt, vals, clock):
+    with metrics.stage("write") as st, open(out_txt, "w") as f:
+        for x in vals:
+            f.write(f"{x}\n")
+        st.count(len(vals), "samples")
+    metrics.add_output(out_txt)
+    print(f"[INFO] wrote {len(vals)} averaged samples to {out_txt}")
+    if clock is not None:
+        meta = clock_recovery.write_clock_metadata(out_txt, clock)
+        print(f"[INFO] wrote {meta}")
 
-def main():
-    if len(sys.argv) >= 2:
-        in_path = sys.argv[1]
+def main(argv=None):
+    argv = sys.argv if argv is None else argv
+    try:
+        argv, window = log_index.pop_window_args(argv)
+    except ValueError as e:
+        print(f"[ERROR] {e}")
+        return 1
+    if len(argv) >= 2:
+        in_path = argv[1]
     else:
         in_path = "samples_mo.txt"
 
-    avg_vals = load_and_average(in_path)
-    if not avg_vals:
+    # 1 duration = 1 サンプルのレートも復元し、avg_mo_to_wav 用に残す
+    avg_mo, avg_ro, has_ro, clock = load_and_average(in_path, window)
+    if not avg_mo:
         return
 
-    # 生の平均値をテキストでダンプ（デバッグ用途）
-    out_txt = "avg_mo_by_duration.txt"
-    with open(out_txt, "w") as f:
-        for x in avg_vals:
-            f.write(f"{x}\n")
-
-    print(f"[INFO] wrote {len(avg_vals)} averaged samples to {out_txt}")
+    # 生の平均値をテキストでダンプ（avg_mo_to_wav.py の入力）
+    write_avg("avg_mo_by_duration.txt", avg_mo, clock)
+    if has_ro:
+        write_avg("avg_ro_by_duration.txt", avg_ro, clock)
+        write_avg("avg_mix_by_duration.txt", mix_paths(avg_mo, avg_ro), clock)
 
 if __name__ == "__main__":
     main()
-
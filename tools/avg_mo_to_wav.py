@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
 import sys
-import wave
-import struct
+
+import metrics
+from box_filter import moving_average
+from wav_writer import normalize_to_int16, write_wav
+
+try:
+    import clock_recovery
+except ImportError:  # NumPy が無ければ固定の既定 Fs
+    clock_recovery = None
 
 def load_avg_samples(path: str):
     vals = []
@@ -18,74 +25,56 @@ def load_avg_samples(path: str):
             vals.append(v)
     return vals
 
-def moving_average(vals, win):
-    """単純移動平均。win は奇数推奨（3,5,7,...）。"""
-    if win <= 1:
-        return vals
-    half = win // 2
-    n = len(vals)
-    out = []
-    for i in range(n):
-        s = max(0, i - half)
-        e = min(n, i + half + 1)
-        out.append(sum(vals[s:e]) / (e - s))
-    return out
-
-def normalize_to_int16(vals):
-    if not vals:
-        return []
-
-    peak = max(abs(v) for v in vals)
-    if peak == 0:
-        return [0] * len(vals)
-
-    scale = 0.9 * 32767.0 / peak
-    print(f"[INFO] peak={peak}, scale={scale}")
-    return [int(round(v * scale)) for v in vals]
-
-def write_wav(path: str, samples, fs: int):
-    with wave.open(path, "wb") as w:
-        nch = 1
-        sampwidth = 2  # int16
-        w.setnchannels(nch)
-        w.setsampwidth(sampwidth)
-        w.setframerate(fs)
-
-        data = b"".join(struct.pack("<h", int(s)) for s in samples)
-        w.writeframes(data)
-
-def main():
-    if len(sys.argv) < 2:
-        print(f"Usage: {sys.argv[0]} avg_mo_by_duration.txt [out.wav] [Fs] [win]")
+def main(argv=None):
+    argv = sys.argv if argv is None else argv
+    if len(argv) < 2:
+        print(f"Usage: {argv[0]} avg_mo_by_duration.txt [out.wav] [Fs] [win]")
+        print("  Fs: 0 or omitted = recovered rate from <in>.clock.json, else 48000")
         sys.exit(1)
 
-    in_txt = sys.argv[1]
-    if len(sys.argv) >= 3:
-        out_wav = sys.argv[2]
+    in_txt = argv[1]
+    if len(argv) >= 3:
+        out_wav = argv[2]
     else:
         out_wav = "mo_avg_48k_ma5.wav"
 
-    if len(sys.argv) >= 4:
-        Fs = float(sys.argv[3])
+    clock = None
+    if len(argv) >= 4 and float(argv[3]) > 0:
+        Fs = float(argv[3])
     else:
-        Fs = 48000.0  # デフォルト 48kHz
-
-    if len(sys.argv) >= 5:
-        win = int(sys.argv[4])
+        # avg_mo_by_duration.py が残した復元 Fs（1 duration = 1 サンプル）を使う
+        if clock_recovery is not None:
+            clock = clock_recovery.read_clock_metadata(in_txt)
+        if clock is not None:
+            Fs = float(round(clock["fs_hz"]))
+            print(f"[INFO] using recovered Fs={Fs} Hz from {in_txt}.clock.json")
+        else:
+            Fs = 48000.0  # デフォルト 48kHz
+
+    if len(argv) >= 5:
+        win = int(argv[4])
     else:
         win = 5  # デフォルト窓長
 
-    vals = load_avg_samples(in_txt)
+    with metrics.stage("parse") as st:
+        vals = load_avg_samples(in_txt)
+        st.count(len(vals), "samples")
     if not vals:
         print("[ERROR] no samples loaded")
         sys.exit(1)
 
     print(f"[INFO] loaded {len(vals)} averaged samples")
     print(f"[INFO] moving average window = {win}")
-    smooth = moving_average(vals, win)
+    with metrics.stage("filter") as st:
+        smooth = moving_average(vals, win)
+        st.count(len(vals), "samples")
 
-    int16_vals = normalize_to_int16(smooth)
+    with metrics.stage("normalize") as st:
+        int16_vals = normalize_to_int16(smooth)
+        st.count(len(smooth), "samples")
     write_wav(out_wav, int16_vals, int(Fs))
+    if clock is not None:
+        clock_recovery.write_clock_metadata(out_wav, clock, wav_fs_hz=int(Fs))
     print(f"[INFO] wrote WAV: {out_wav} (Fs={Fs} Hz)")
 
 if __name__ == "__main__":
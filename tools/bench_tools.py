@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""
+bench_tools.py
+
+Benchmark suite for the tools/ post-processing pipeline.
+
+For every scale (seconds of audio) a deterministic synthetic data set is
+generated with synth_logs.py (samples_mo.txt / samples_acc.txt /
+durations.txt / song.vgm), then every pipeline stage is run as its own
+process, exactly as from the command line.  Per stage the suite records
+wall time, user / system CPU time and peak RSS (from wait4() of that
+process only), and writes everything to a JSON file that can be compared
+across commits:
+
+  python3 tools/bench_tools.py -o bench_new.json
+  python3 tools/bench_tools.py -o bench_new.json --compare bench_old.json
+
+--compare prints the per-stage ratio and exits with 1 if any stage got
+slower (or used more memory) than --threshold.
+
+Scales: 1s, 1min and 10min by default.  10min generates about 30 GB of
+text logs (samples_acc.txt holds 36 records per duration, as from the
+TB); use --scales 1s,1min for a quick run.  Generated data sets
+are cached in --work-dir and reused while the generator parameters stay
+the same.
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+TOOLS_DIR = Path(__file__).resolve().parent
+
+SCALES = {
+    "1s": 1.0,
+    "1min": 60.0,
+    "10min": 600.0,
+}
+DEFAULT_SCALES = ("1s", "1min", "10min")
+
+# (stage name, script, arguments); run with cwd = data set directory
+STAGES = [
+    ("vgm_to_csv", "vgm_to_ym2413_csv.py", ["song.vgm", "-o", "song.vgm.csv"]),
+    ("csv_to_vh", "vgm_csv_to_vh.py", ["song.vgm.csv", "song.vh"]),
+    ("clock_recovery", "clock_recovery.py", ["samples_acc.txt"]),
+    ("analyze_duration", "analyze_duration.py", ["durations.txt"]),
+    ("avg_mo_by_duration", "avg_mo_by_duration.py", ["samples_mo.txt"]),
+    ("avg_mo_to_wav", "avg_mo_to_wav.py", ["avg_mo_by_duration.txt", "mo_avg.wav", "0", "15"]),
+    ("txt_to_wav", "txt_to_wav.py", ["samples_mo.txt", "mo_raw.wav"]),
+    ("acc_to_wav", "acc_to_wav.py", ["samples_acc.txt", "acc.wav"]),
+    ("acc_decimate_to_wav", "acc_decimate_to_wav.py",
+     ["samples_acc.txt", "acc_decim.wav", "0", "44100", "1"]),
+    ("acc_resample_to_wav", "acc_resample_to_wav.py", ["samples_acc.txt", "acc_resampled.wav"]),
+    ("make_ref_wav", "make_ref_wav.py", ["samples_mo.txt", "samples_acc.txt"]),
+    ("make_ref_wav_cic", "make_ref_wav.py",
+     ["samples_mo.txt", "samples_acc.txt", "--acc-mode", "cic"]),
+]
+
+# 比較時にこれ以上遅く（大きく）なったら回帰とみなす
+DEFAULT_THRESHOLD = 1.15
+# これより短いステージは揺らぎが大きいので回帰判定しない
+MIN_COMPARE_WALL_S = 0.05
+
+
+# ---------------------------------------------------------------------------
+# Data sets
+# ---------------------------------------------------------------------------
+def prepare_dataset(work_dir, scale, seconds, seed):
+    """Generate (or reuse) the synthetic data set for one scale.
+
+    The generator runs in its own process so that its memory does not
+    count towards the parent (and thus the forked stage processes).
+    """
+    gen = TOOLS_DIR / "synth_logs.py"
+    d = Path(work_dir) / scale
+    stamp = d / "dataset.json"
+    want = {"seconds": seconds, "seed": seed,
+            "generator_sha1": hashlib.sha1(gen.read_bytes()).hexdigest()}
+    if stamp.is_file():
+        try:
+            if json.loads(stamp.read_text()).get("params") == want:
+                return d, None
+        except ValueError:
+            pass
+    if d.exists():
+        shutil.rmtree(d)
+    t0 = time.perf_counter()
+    subprocess.check_call([sys.executable, str(gen), str(d),
+                           "--seconds", str(seconds), "--seed", str(seed)],
+                          stdout=subprocess.DEVNULL)
+    gen_s = time.perf_counter() - t0
+    sizes = {p.name: p.stat().st_size for p in sorted(d.iterdir())}
+    stamp.write_text(json.dumps({"params": want, "generate_s": gen_s, "bytes": sizes},
+                                indent=2) + "\n")
+    return d, gen_s
+
+
+def dataset_info(d):
+    try:
+        return json.loads((Path(d) / "dataset.json").read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+# ---------------------------------------------------------------------------
+# Measurement
+# ---------------------------------------------------------------------------
+def _maxrss_mb(ru):
+    # Linux は KiB、macOS は byte
+    if sys.platform == "darwin":
+        return ru.ru_maxrss / (1024 * 1024)
+    return ru.ru_maxrss / 1024
+
+
+def run_stage(script, args, cwd, log):
+    """Run one tool process; returns wall / CPU / peak RSS of that process."""
+    cmd = [sys.executable, str(TOOLS_DIR / script)] + list(args)
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+    _, status, ru = os.wait4(proc.pid, 0)
+    wall = time.perf_counter() - t0
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return {
+        "wall_s": wall,
+        "user_s": ru.ru_utime,
+        "sys_s": ru.ru_stime,
+        "peak_rss_mb": _maxrss_mb(ru),
+        "exit_code": proc.returncode,
+    }
+
+
+def bench_scale(d, stages, repeat):
+    results = {}
+    with open(Path(d) / "bench.log", "w") as log:
+        for name, script, args in stages:
+            runs = []
+            for _ in range(repeat):
+                log.write(f"### {name}\n")
+                log.flush()
+                runs.append(run_stage(script, args, d, log))
+            ok = all(r["exit_code"] == 0 for r in runs)
+            walls = [r["wall_s"] for r in runs]
+            results[name] = {
+                "wall_s": walls,
+                "wall_s_min": min(walls),
+                "wall_s_median": statistics.median(walls),
+                "user_s": min(r["user_s"] for r in runs),
+                "sys_s": min(r["sys_s"] for r in runs),
+                "peak_rss_mb": max(r["peak_rss_mb"] for r in runs),
+                "exit_code": 0 if ok else next(r["exit_code"] for r in runs if r["exit_code"]),
+            }
+            flag = "" if ok else "  [FAILED, see bench.log]"
+            print(f"  {name:22s} {min(walls):8.3f} s  "
+                  f"{results[name]['peak_rss_mb']:8.1f} MB{flag}")
+    return results
+
+
+def machine_info():
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+    try:
+        import numpy
+        info["numpy"] = numpy.__version__
+    except ImportError:
+        info["numpy"] = None
+    try:
+        info["git_commit"] = subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=TOOLS_DIR,
+            stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        info["git_commit"] = None
+    return info
+
+
+# ---------------------------------------------------------------------------
+# Comparison
+# ---------------------------------------------------------------------------
+def compare(new, old, threshold=DEFAULT_THRESHOLD):
+    """Print per-stage ratios new/old; returns the list of regressions."""
+    regressions = []
+    for scale, sc in new["scales"].items():
+        old_sc = old.get("scales", {}).get(scale)
+        if old_sc is None:
+            continue
+        print(f"[INFO] {scale}: stage, time new/old, peak RSS new/old")
+        for name, st in sc["stages"].items():
+            o = old_sc["stages"].get(name)
+            if o is None or o["exit_code"] or st["exit_code"]:
+                continue
+            rt = st["wall_s_min"] / o["wall_s_min"] if o["wall_s_min"] > 0 else 1.0
+            rm = st["peak_rss_mb"] / o["peak_rss_mb"] if o["peak_rss_mb"] > 0 else 1.0
+            mark = ""
+            if rt > threshold and o["wall_s_min"] >= MIN_COMPARE_WALL_S:
+                mark += "  SLOWER"
+                regressions.append((scale, name, "time", rt))
+            if rm > threshold:
+                mark += "  MORE MEMORY"
+                regressions.append((scale, name, "rss", rm))
+            print(f"  {name:22s} x{rt:5.2f}  x{rm:5.2f}{mark}")
+    return regressions
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Benchmark the tools/ pipeline on synthetic data sets."
+    )
+    ap.add_argument("-o", "--output", default="bench_results.json",
+                    help="results JSON (default: bench_results.json)")
+    ap.add_argument("--scales", default=",".join(DEFAULT_SCALES),
+                    help=f"comma list of {', '.join(SCALES)} (default: all)")
+    ap.add_argument("--stages", default=None,
+                    help="comma list of stage names (default: all)")
+    ap.add_argument("--repeat", type=int, default=3,
+                    help="runs per stage, the minimum is reported (default: 3)")
+    ap.add_argument("--seed", type=int, default=1, help="generator seed (default: 1)")
+    ap.add_argument("--work-dir", default="bench_data",
+                    help="where data sets are generated / cached (default: bench_data)")
+    ap.add_argument("--compare", metavar="OLD_JSON", default=None,
+                    help="compare against an earlier results file")
+    ap.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                    help=f"regression ratio for --compare (default: {DEFAULT_THRESHOLD})")
+    ap.add_argument("--list", action="store_true", help="list stages and exit")
+    args = ap.parse_args(argv)
+
+    if args.list:
+        for name, script, sargs in STAGES:
+            print(f"{name:22s} {script} {' '.join(sargs)}")
+        return 0
+
+    scales = [s.strip() for s in args.scales.split(",") if s.strip()]
+    for s in scales:
+        if s not in SCALES:
+            print(f"[ERROR] unknown scale: {s}", file=sys.stderr)
+            return 1
+    stages = STAGES
+    if args.stages:
+        wanted = {s.strip() for s in args.stages.split(",")}
+        stages = [st for st in STAGES if st[0] in wanted]
+        unknown = wanted - {st[0] for st in stages}
+        if unknown:
+            print(f"[ERROR] unknown stage(s): {', '.join(sorted(unknown))}", file=sys.stderr)
+            return 1
+
+    out = {"machine": machine_info(), "repeat": args.repeat, "seed": args.seed,
+           "created": time.strftime("%Y-%m-%dT%H:%M:%S"), "scales": {}}
+    for scale in scales:
+        seconds = SCALES[scale]
+        print(f"[INFO] scale {scale} ({seconds:g} s of audio)")
+        d, gen_s = prepare_dataset(args.work_dir, scale, seconds, args.seed)
+        info = dataset_info(d)
+        if gen_s is None:
+            print(f"[INFO] reusing data set in {d}")
+        else:
+            print(f"[INFO] generated data set in {gen_s:.2f} s")
+        out["scales"][scale] = {
+            "seconds": seconds,
+            "dataset_bytes": info.get("bytes"),
+            "generate_s": info.get("generate_s"),
+            "stages": bench_scale(d, stages, max(1, args.repeat)),
+        }
+
+    Path(args.output).write_text(json.dumps(out, indent=2) + "\n")
+    print(f"[INFO] wrote {args.output}")
+
+    if args.compare:
+        old = json.loads(Path(args.compare).read_text())
+        regs = compare(out, old, args.threshold)
+        if regs:
+            print(f"[WARN] {len(regs)} regression(s) over x{args.threshold}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+box_filter.py
+
+O(N) centred moving-average (box) filter shared by the WAV tools.
+
+Edge handling is the same as the original per-sample loops in
+make_ref_wav.py / avg_mo_to_wav.py: output i is the mean of
+samples[max(0, i-half) .. min(n-1, i+half)] with half = window // 2, i.e.
+the window shrinks at both ends (and spans 2*half+1 taps for even window).
+
+Instead of re-summing the window for each output, every mean is the
+difference of two prefix sums, so the cost per sample is constant
+regardless of the window length.
+
+- moving_average()            : whole-array version (NumPy if available)
+- cascaded_moving_average()   : k stages of the above (sinc^k response,
+                                better stopband than a single box)
+- MovingAverage / CascadedMovingAverage
+                              : streaming versions; feed blocks with
+                                process() and call flush() at the end.
+                                The concatenated output equals the
+                                whole-array result.
+"""
+
+from itertools import accumulate
+
+try:
+    import numpy as np
+except ImportError:  # NumPy は任意。無ければ itertools.accumulate で累積和を取る
+    np = None
+
+
+# ----------------------------------------------------------------------
+# Core: window means from prefix sums
+# ----------------------------------------------------------------------
+def _window_means(buf, buf_start, i0, i1, half, total, step=1):
+    """Means for output indices i0, i0+step, ... < i1.
+
+    buf holds input samples [buf_start, buf_start + len(buf)); it must cover
+    every window touched.  total is the signal length used for clipping the
+    right edge (pass a huge value while the end is not known yet).
+    """
+    if i1 <= i0:
+        return [] if np is None else np.empty(0)
+
+    if np is not None:
+        x = np.asarray(buf)
+        # 整数入力は整数のまま累積して誤差ゼロにする
+        acc_dtype = np.int64 if x.dtype.kind in "iub" else np.float64
+        c = np.zeros(len(x) + 1, dtype=acc_dtype)
+        np.cumsum(x, dtype=acc_dtype, out=c[1:])
+        i = np.arange(i0, i1, step, dtype=np.int64)
+        s = np.maximum(i - half, 0)
+        e = np.minimum(i + half, total - 1)
+        return (c[e + 1 - buf_start] - c[s - buf_start]) / (e - s + 1)
+
+    c = [0]
+    c.extend(accumulate(buf))
+    out = []
+    for i in range(i0, i1, step):
+        s = max(0, i - half)
+        e = min(total - 1, i + half)
+        out.append((c[e + 1 - buf_start] - c[s - buf_start]) / (e - s + 1))
+    return out
+
+
+def _as_input_type(out, samples):
+    # list を渡された呼び出し側には list を返す（既存ツールとの互換）
+    if np is not None and isinstance(samples, list):
+        return out.tolist()
+    return out
+
+
+# ----------------------------------------------------------------------
+# Whole-array API
+# ----------------------------------------------------------------------
+def moving_average(samples, window, step=1):
+    """Centred moving average with shrinking edges, O(N).
+
+    step > 1 returns only every step-th output (same as [::step] on the
+    full result) without computing the others — used for decimation.
+    """
+    n = len(samples)
+    if window <= 1 or n == 0:
+        return samples[::step] if step > 1 else samples[:]
+    half = int(window) // 2
+    out = _window_means(samples, 0, 0, n, half, n, step)
+    return _as_input_type(out, samples)
+
+
+def cascaded_moving_average(samples, window, stages=2, step=1):
+    """Apply moving_average() ``stages`` times; decimate on the last stage."""
+    if stages < 1:
+        raise ValueError(f"stages must be >= 1: {stages}")
+    out = samples
+    for k in range(stages):
+        out = moving_average(out, window, step if k == stages - 1 else 1)
+    return out
+
+
+# ----------------------------------------------------------------------
+# Streaming API
+# ----------------------------------------------------------------------
+class MovingAverage:
+    """Streaming centred moving average.
+
+    Output i needs inputs up to i+half, so each process() call returns the
+    outputs that became complete; flush() emits the right-edge tail.
+    """
+
+    def __init__(self, window):
+        self.window = int(window)
+        self.half = self.window // 2 if self.window > 1 else 0
+        self._buf = []       # 入力のうち、まだ窓に入りうる部分
+        self._buf_start = 0  # _buf[0] の全体インデックス
+        self._total = 0      # これまでに受け取った入力数
+        self._n_out = 0      # これまでに出力した数
+
+    def _concat(self, block):
+        if np is not None:
+            if len(self._buf) == 0:
+                return np.asarray(block)
+            return np.concatenate((self._buf, np.asarray(block)))
+        return list(self._buf) + list(block)
+
+    def _emit(self, i1, total):
+        out = _window_means(self._buf, self._buf_start,
+                            self._n_out, i1, self.half, total)
+        self._n_out = max(self._n_out, i1)
+        # 次の出力 (n_out) の窓の左端より前は不要
+        keep_from = max(0, self._n_out - self.half)
+        drop = keep_from - self._buf_start
+        if drop > 0:
+            self._buf = self._buf[drop:]
+            self._buf_start = keep_from
+        return out
+
+    def process(self, block):
+        """Feed a block; return the outputs that are now final."""
+        self._buf = self._concat(block)
+        self._total += len(block)
+        # total は未確定なので右端のクリップが効かない大きな値を渡す
+        return self._emit(self._total - self.half, self._total + self.half + 1)
+
+    def flush(self):
+        """Emit the remaining outputs (right edge with shrinking window)."""
+        return self._emit(self._total, self._total)
+
+
+class CascadedMovingAverage:
+    """Streaming version of cascaded_moving_average() (without step)."""
+
+    def __init__(self, window, stages=2):
+        if stages < 1:
+            raise ValueError(f"stages must be >= 1: {stages}")
+        self.stages = [MovingAverage(window) for _ in range(stages)]
+
+    def process(self, block):
+        for st in self.stages:
+            block = st.process(block)
+        return block
+
+    def flush(self):
+        out = None
+        for st in self.stages:
+            if out is None:
+                out = st.flush()
+            else:
+                head = st.process(out)
+                tail = st.flush()
+                out = (np.concatenate((head, tail)) if np is not None
+                       else list(head) + list(tail))
+        return out
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+cic_decimator.py
+
+Integer-only CIC (cascaded integrator-comb) decimator for ACC_SIGNED logs.
+
+Everything here is integer arithmetic, so the output is bit-identical on
+every machine / Python / NumPy version and golden WAV hashes are
+reproducible:
+
+  ACC_SIGNED (int) --> N integrators --> keep every R-th --> N combs
+                   --> 3-tap integer compensation FIR (Q5)
+                   --> integer peak normalisation to int16
+
+- Integrators and combs run in modular (two's complement) arithmetic of
+  REG_BITS = in_bits + N * ceil(log2(R * M)) bits (Hogenauer), so the
+  unbounded integrator growth over long streams wraps harmlessly.
+- The compensation FIR [-a, 32 + 2a, -a] / 32 flattens the sinc^N droop;
+  a is taken from a fixed table (no libm at run time) and equalises the
+  response at 0.2 * Fs_out.
+- Cost per input sample is N integer adds (+ the wrap), plus N subtracts
+  and 3 multiplies per output sample.
+
+CicDecimator.process() accepts blocks of any length (list or NumPy
+array); the concatenated output does not depend on how the input was
+split.
+"""
+
+try:
+    import numpy as np
+except ImportError:  # NumPy は任意。無ければ Python の int で同じ計算をする
+    np = None
+
+
+# N -> a (Q5)。fp = 0.2 * Fs_out で sinc^N の落ち込みを補正する値
+COMP_TAPS_Q5 = {
+    1: 2,
+    2: 3,
+    3: 5,
+    4: 7,
+    5: 9,
+}
+COMP_SHIFT = 5
+
+ACC_BITS = 16  # ACC_SIGNED[15:0]
+
+# NumPy で 1 回に累積するサンプル数（int64 をはみ出さない上限）
+_NP_BLOCK = 1 << 16
+
+
+def _ceil_log2(x):
+    return (int(x) - 1).bit_length()
+
+
+class CicDecimator:
+    """Streaming integer CIC decimator with compensation FIR.
+
+    R: decimation factor, N: number of stages (1..5), M: differential delay.
+    """
+
+    def __init__(self, R, N=4, M=1, in_bits=ACC_BITS, compensate=True):
+        if R < 1:
+            raise ValueError(f"R must be >= 1: {R}")
+        if N not in COMP_TAPS_Q5:
+            raise ValueError(f"N must be 1..{max(COMP_TAPS_Q5)}: {N}")
+        if M < 1:
+            raise ValueError(f"M must be >= 1: {M}")
+
+        self.R = int(R)
+        self.N = int(N)
+        self.M = int(M)
+        self.reg_bits = int(in_bits) + self.N * _ceil_log2(self.R * self.M)
+        if self.reg_bits > 46:
+            raise ValueError(f"register width {self.reg_bits} bits too large")
+        self._mod = 1 << self.reg_bits
+        self._half = 1 << (self.reg_bits - 1)
+        self.gain = (self.R * self.M) ** self.N
+
+        a = COMP_TAPS_Q5[self.N]
+        self.comp_taps = (-a, (1 << COMP_SHIFT) + 2 * a, -a) if compensate else None
+
+        self._integ = [0] * self.N              # 積分器の状態
+        self._comb = [[0] * self.M for _ in range(self.N)]  # 各段の遅延線
+        self._phase = 0                         # 次の間引き位置までのカウンタ
+        self._comp_hist = [0, 0]                # 補償 FIR の過去 2 サンプル
+
+    def _wrap(self, x):
+        return ((x + self._half) & (self._mod - 1)) - self._half
+
+    # -- integrators + decimation -----------------------------------------
+    def _integrate_py(self, block):
+        out = []
+        integ = self._integ
+        R = self.R
+        phase = self._phase
+        for v in block:
+            acc = int(v)
+            for k in range(self.N):
+                acc = self._wrap(integ[k] + acc)
+                integ[k] = acc
+            phase += 1
+            if phase == R:
+                phase = 0
+                out.append(acc)
+        self._phase = phase
+        return out
+
+    def _integrate_np(self, block):
+        x = np.asarray(block, dtype=np.int64)
+        outs = []
+        for start in range(0, len(x), _NP_BLOCK):
+            y = x[start:start + _NP_BLOCK]
+            for k in range(self.N):
+                y = np.cumsum(y, dtype=np.int64)
+                y += self._integ[k]
+                y = ((y + self._half) & (self._mod - 1)) - self._half
+                self._integ[k] = int(y[-1])
+            # phase 個だけ前のブロックから持ち越している
+            first = self.R - 1 - self._phase
+            outs.append(y[first::self.R])
+            self._phase = (self._phase + len(y)) % self.R
+        if not outs:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(outs)
+
+    # -- combs --------------------------------------------------------------
+    def _comb_py(self, vals):
+        out = []
+        for acc in vals:
+            for k in range(self.N):
+                line = self._comb[k]
+                prev = line.pop(0)
+                line.append(acc)
+                acc = self._wrap(acc - prev)
+            out.append(acc)
+        return out
+
+    def _comb_np(self, vals):
+        y = vals
+        M = self.M
+        for k in range(self.N):
+            ext = np.concatenate((np.asarray(self._comb[k], dtype=np.int64), y))
+            self._comb[k] = [int(v) for v in ext[-M:]]
+            y = ext[M:] - ext[:-M]
+            y = ((y + self._half) & (self._mod - 1)) - self._half
+        return y
+
+    # -- compensation -------------------------------------------------------
+    def _compensate(self, vals):
+        if self.comp_taps is None:
+            return vals
+        h0, h1, h2 = self.comp_taps
+        rnd = 1 << (COMP_SHIFT - 1)
+        if np is not None:
+            ext = np.concatenate((np.asarray(self._comp_hist, dtype=np.int64),
+                                  np.asarray(vals, dtype=np.int64)))
+            self._comp_hist = [int(v) for v in ext[-2:]]
+            acc = h2 * ext[:-2] + h1 * ext[1:-1] + h0 * ext[2:]
+            return (acc + rnd) >> COMP_SHIFT
+        out = []
+        x2, x1 = self._comp_hist
+        for x0 in vals:
+            out.append((h0 * x0 + h1 * x1 + h2 * x2 + rnd) >> COMP_SHIFT)
+            x2, x1 = x1, x0
+        self._comp_hist = [x2, x1]
+        return out
+
+    # -- public ---------------------------------------------------------------
+    def process(self, block):
+        """Feed raw integer samples; return decimated integer samples.
+
+        The returned values carry the CIC gain (R*M)**N.
+        """
+        if np is not None:
+            dec = self._comb_np(self._integrate_np(block))
+        else:
+            dec = self._comb_py(self._integrate_py(block))
+        return self._compensate(dec)
+
+
+def normalize_int(samples, full_scale=32767, headroom_num=9, headroom_den=10):
+    """Integer-only peak normalisation (default 0.9 * full scale, rounded).
+
+    Replaces the float ``0.9 * 32767 / peak`` scaling so the PCM values are
+    reproducible bit for bit.
+    """
+    vals = [int(v) for v in samples]
+    if not vals:
+        return []
+    peak = max(abs(v) for v in vals)
+    if peak == 0:
+        return [0] * len(vals)
+    target = full_scale * headroom_num // headroom_den
+    den = 2 * peak
+    # round half away from zero
+    return [(2 * v * target + peak) // den if v >= 0
+            else -((-2 * v * target + peak) // den) for v in vals]
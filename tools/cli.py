@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+cli.py
+
+Single entry point for the tools/ scripts:
+
+    python3 -m tools                                 # list subcommands
+    python3 -m tools acc_to_wav samples_acc.txt a.wav
+    python3 -m tools batch make_ref_wav runs/*/ -j 8
+    python3 -m tools batch acc_decimate_to_wav runs/*/samples_acc.txt -- 0 44100 1
+
+A subcommand is the script name (``acc-to-wav`` works as well) and takes
+exactly the arguments of ``python3 tools/<script>.py``.  Only the module
+of the selected subcommand is imported, so NumPy etc. are loaded only
+when that tool needs them.
+
+``batch`` runs one subcommand over many inputs inside one process (or a
+pool of -j worker processes), so interpreter start-up and imports are
+paid once per worker instead of once per file.  Each input is either a
+file or a capture directory (then the tool's default input file in it,
+e.g. samples_acc.txt, is used).  Every job runs with the input's
+directory as working directory, so outputs land next to their inputs
+exactly as in a per-directory shell loop.  Arguments after ``--`` are
+appended to every job.  With TOOLS_METRICS=1 every job writes its own
+metrics JSON.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import importlib
+import io
+import os
+import sys
+import time
+import traceback
+from pathlib import Path
+
+# main(argv) の引数の渡し方
+ARGV0 = "argv0"        # argv[0] にプログラム名を含む（旧来の sys.argv 形式）
+ARGPARSE = "argparse"  # argparse 形式（プログラム名なし）
+
+
+class Command:
+    """One subcommand: module name, argv convention and batch template."""
+
+    __slots__ = ("module", "style", "batch_args", "default_input", "help")
+
+    def __init__(self, module, style, batch_args=None, default_input=None, help=""):
+        self.module = module
+        self.style = style
+        self.batch_args = batch_args          # None: batch 非対応
+        self.default_input = default_input    # ディレクトリ入力時のファイル名
+        self.help = help
+
+
+# batch_args: {in} = input file name, {stem} = name without its last suffix
+COMMANDS = {c.module: c for c in (
+    Command("vgm_to_ym2413_csv", ARGPARSE, ["{in}"], None,
+            "VGM -> YM2413 register CSV"),
+    Command("vgm_catalog", ARGPARSE, None, None,
+            "SQLite catalogue of a VGM corpus (scan / query)"),
+    Command("reg_events", ARGPARSE, None, None,
+            "register CSV <-> binary .ymev events"),
+    Command("vgm_csv_to_vh", ARGV0, ["{in}", "{stem}.vh"], None,
+            "register CSV -> testbench include (.vh)"),
+    Command("clock_recovery", ARGV0, ["{in}"], "samples_acc.txt",
+            "recover the sample clock from a TB log"),
+    Command("analyze_duration", ARGV0, ["{in}"], "durations.txt",
+            "statistics of durations.txt"),
+    Command("analyze_mo_range", ARGV0, ["{in}"], "samples_mo.txt",
+            "min/max of the MO DAC log"),
+    Command("avg_mo_by_duration", ARGV0, ["{in}"], "samples_mo.txt",
+            "per-duration MO/RO averages"),
+    Command("avg_mo_to_wav", ARGV0, ["{in}", "{stem}.wav"], "avg_mo_by_duration.txt",
+            "averaged MO series -> WAV"),
+    Command("txt_to_wav", ARGV0, ["{in}", "{stem}.wav"], "samples_mo.txt",
+            "raw MO log -> WAV (no decimation)"),
+    Command("acc_to_wav", ARGV0, ["{in}", "{stem}.wav"], "samples_acc.txt",
+            "raw ACC log -> WAV"),
+    Command("acc_decimate_to_wav", ARGV0, ["{in}", "{stem}_decim.wav"], "samples_acc.txt",
+            "ACC log -> FIR + decimation -> WAV"),
+    Command("acc_resample_to_wav", ARGV0, ["{in}", "{stem}_resampled.wav"], "samples_acc.txt",
+            "ACC log -> linear resampling -> WAV"),
+    Command("make_ref_wav", ARGPARSE, ["{in}", "samples_acc.txt"], "samples_mo.txt",
+            "Mo/RO/mix + ACC reference WAVs"),
+    Command("vcd_extract", ARGPARSE, ["{in}"], "ikaopll_vgm_tb.vcd",
+            "selected VCD signals -> .npz"),
+    Command("pitch_check", ARGPARSE, None, None,
+            "pitch of a rendered WAV vs. the register timeline"),
+    Command("env_check", ARGPARSE, None, None,
+            "envelope timing / levels of a rendered WAV vs. the register timeline"),
+    Command("solo_render", ARGPARSE, None, None,
+            "per-channel / per-drum solo renders vs. golden WAVs"),
+    Command("stim_reduce", ARGPARSE, None, None,
+            "delta-debugging reduction of a failing stimulus"),
+    Command("config_lockstep", ARGPARSE, None, None,
+            "lock-step equivalence check of IKAOPLL parameter configurations"),
+    Command("log_index", ARGPARSE, None, None,
+            "sidecar time index for TB logs (--start/--end windows)"),
+    Command("synth_logs", ARGPARSE, None, None,
+            "synthetic TB logs + VGM"),
+    Command("stress_stimulus", ARGPARSE, None, None,
+            "worst-case register traffic CSV / VGM / .vh"),
+    Command("reg_coverage", ARGPARSE, None, None,
+            "feature coverage of stimuli, minimal covering test list"),
+    Command("reg_dedup", ARGPARSE, None, None,
+            "duplicate / near-duplicate register streams"),
+    Command("make_tb_suite", ARGPARSE, None, None,
+            "several register CSVs -> one multi-test TB include"),
+    Command("run_tb", ARGPARSE, None, None,
+            "run the VGM testbench and profile it"),
+    Command("bench_tools", ARGPARSE, None, None,
+            "benchmark the tools pipeline"),
+)}
+
+
+def find_command(name):
+    return COMMANDS.get(name.replace("-", "_").removesuffix(".py"))
+
+
+def print_commands(file=sys.stdout):
+    print("usage: python3 -m tools <subcommand> [args ...]", file=file)
+    print("       python3 -m tools batch <subcommand> [-j N] INPUT ... [-- extra args]", file=file)
+    print("\nsubcommands:", file=file)
+    for name, c in COMMANDS.items():
+        mark = " " if c.batch_args is not None else "*"
+        print(f"  {name:22s}{mark} {c.help}", file=file)
+    print("\n  * not available in batch mode", file=file)
+
+
+# ---------------------------------------------------------------------------
+# Running one tool in-process
+# ---------------------------------------------------------------------------
+def _exit_code(code):
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)  # sys.exit("message")
+    return 1
+
+
+def run_command(cmd, args):
+    """Call <module>.main() with ``args``; returns the exit code."""
+    mod = importlib.import_module(cmd.module)
+    argv = ([f"{cmd.module}.py"] + list(args)) if cmd.style == ARGV0 else list(args)
+    try:
+        return _exit_code(mod.main(argv))
+    except SystemExit as e:
+        return _exit_code(e.code)
+
+
+# ---------------------------------------------------------------------------
+# Batch
+# ---------------------------------------------------------------------------
+def batch_jobs(cmd, inputs, extra):
+    """(label, cwd, args) for every input; raises ValueError on bad input."""
+    jobs = []
+    for item in inputs:
+        p = Path(item)
+        if p.is_dir():
+            if cmd.default_input is None:
+                raise ValueError(f"{cmd.module} needs input files, got directory {p}")
+            p = p / cmd.default_input
+        if not p.is_file():
+            raise ValueError(f"No such file: {p}")
+        subst = {"in": p.name, "stem": p.stem}
+        args = [a.format(**subst) for a in cmd.batch_args] + list(extra)
+        jobs.append((str(p), str(p.parent.resolve()), args))
+    return jobs
+
+
+def _run_job(name, label, cwd, args, capture):
+    """Worker: run one job in ``cwd``; returns (label, rc, wall_s, output)."""
+    import metrics
+
+    cmd = COMMANDS[name]
+    buf = io.StringIO() if capture else None
+    old_cwd = os.getcwd()
+    t0 = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if capture:
+            stack.enter_context(contextlib.redirect_stdout(buf))
+            stack.enter_context(contextlib.redirect_stderr(buf))
+        try:
+            os.chdir(cwd)
+            metrics.begin(f"{cmd.module}.py", args)
+            rc = run_command(cmd, args)
+        except Exception:
+            traceback.print_exc()
+            rc = 1
+        finally:
+            metrics.end()
+            os.chdir(old_cwd)
+    return label, rc, time.perf_counter() - t0, buf.getvalue() if capture else ""
+
+
+def run_batch(cmd, jobs, n_workers=1, keep_going=True):
+    """Run the jobs serially or on a process pool; returns failed labels."""
+    failed = []
+    t0 = time.perf_counter()
+
+    def report(label, rc, wall):
+        status = "ok" if rc == 0 else f"FAILED (exit {rc})"
+        print(f"[INFO] [{cmd.module}] {label}: {status}, {wall:.2f} s", flush=True)
+        if rc != 0:
+            failed.append(label)
+
+    if n_workers <= 1:
+        for label, cwd, args in jobs:
+            print(f"### {label}", flush=True)
+            _, rc, wall, _ = _run_job(cmd.module, label, cwd, args, capture=False)
+            report(label, rc, wall)
+            if rc != 0 and not keep_going:
+                break
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        with ProcessPoolExecutor(max_workers=n_workers) as ex:
+            futs = [ex.submit(_run_job, cmd.module, label, cwd, args, True)
+                    for label, cwd, args in jobs]
+            for fut in as_completed(futs):
+                label, rc, wall, out = fut.result()
+                # ジョブごとの出力をまとめて表示（並列でも混ざらない）
+                print(f"### {label}\n{out}", end="" if out.endswith("\n") else "\n")
+                report(label, rc, wall)
+                if rc != 0 and not keep_going:
+                    for f in futs:
+                        f.cancel()
+                    break
+
+    print(f"[INFO] batch {cmd.module}: {len(jobs) - len(failed)}/{len(jobs)} ok "
+          f"in {time.perf_counter() - t0:.2f} s ({n_workers} worker(s))")
+    return failed
+
+
+def batch_main(argv):
+    extra = []
+    if "--" in argv:
+        i = argv.index("--")
+        argv, extra = argv[:i], argv[i + 1:]
+    ap = argparse.ArgumentParser(
+        prog="python3 -m tools batch",
+        description="Run one tool over many inputs in a single process / worker pool.",
+        epilog="Arguments after -- are appended to every job.",
+    )
+    ap.add_argument("command", help="subcommand (see python3 -m tools)")
+    ap.add_argument("inputs", nargs="+",
+                    help="input files or capture directories")
+    ap.add_argument("-j", "--jobs", type=int, default=1,
+                    help="worker processes (0 = all cores; default: 1)")
+    ap.add_argument("--stop-on-error", action="store_true",
+                    help="stop at the first failing input")
+    args = ap.parse_args(argv)
+
+    cmd = find_command(args.command)
+    if cmd is None:
+        print(f"[ERROR] unknown subcommand: {args.command}", file=sys.stderr)
+        return 2
+    if cmd.batch_args is None:
+        print(f"[ERROR] {cmd.module} is not available in batch mode", file=sys.stderr)
+        return 2
+    try:
+        jobs = batch_jobs(cmd, args.inputs, extra)
+    except ValueError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 1
+
+    n_workers = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    n_workers = min(n_workers, len(jobs))
+    failed = run_batch(cmd, jobs, n_workers, keep_going=not args.stop_on_error)
+    for label in failed:
+        print(f"[ERROR] failed: {label}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+def main(argv: list[str] | None = None) -> int:
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if not argv or argv[0] in ("-h", "--help", "help", "list"):
+        print_commands()
+        return 0
+    if argv[0] == "batch":
+        return batch_main(argv[1:])
+    cmd = find_command(argv[0])
+    if cmd is None:
+        print(f"[ERROR] unknown subcommand: {argv[0]}", file=sys.stderr)
+        print_commands(sys.stderr)
+        return 2
+    return run_command(cmd, argv[1:])
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+clock_recovery.py
+
+Recover the true sample rate of a testbench log from its timestamps,
+instead of assuming 49_720 / 1_000_000 / 1_600_000 Hz.
+
+Inputs (any of the IKAOPLL_vgm_tb.sv logs):
+  - samples_mo.txt  : "dur_idx value time_ps [path]" (time column 2;
+                      RO records, path 1, are ignored)
+  - samples_acc.txt : "value time_ps"           (time column 1)
+  - durations.txt   : "dur_idx start_ps end_ps" (time column 1)
+
+Method (vectorised, NumPy):
+  - dt = diff(t); the median dt is the nominal spacing.  Each sample gets
+    an index n = cumsum(round(dt / median)), so dropped strobes / gaps do
+    not bias the estimate.
+  - A least-squares fit t = t0 + n * T gives the sample period T; the fit
+    residuals are the timing jitter (EMUCLK edge rounding of the strobe).
+  - The TB writes one samples_acc.txt record per EMUCLK while ACC_STRB is
+    high: a burst of 36 records one EMUCLK apart once per 72-EMUCLK
+    duration.  The grid fit then gives the spacing inside a burst, not
+    the record rate.  Whenever the steps show gaps (bursts or dropped
+    strobes) fs_hz is the mean record rate, records / time between the
+    first and the last record that follows a gap (so partial bursts at
+    either end do not bias it); that is the rate a WAV of consecutive
+    records must play at.  The burst spacing is kept as grid_fs_hz.
+  - The simulated EMUCLK is #13968 x 2 x 10 ps = 279_360 ps, i.e. about
+    +18 ppm against the real 3.579545 MHz; both the simulated and the
+    nominal-clock rates are reported.  fs_hz (simulated time base) keeps
+    the VGM timeline exact and is what the WAV tools use.
+
+Older testbench builds wrote ``EMUCLK cycles * 10`` into the time_ps
+columns; such logs are detected (spacing < one EMUCLK period) and scaled
+to picoseconds.
+
+Usage:
+  python3 clock_recovery.py samples_acc.txt [more logs ...]
+  → prints the recovered clock and writes <log>.clock.json
+  python3 clock_recovery.py samples_acc.txt --start 10 --end 20
+  → the same for a window of the log only (see log_index.py)
+  python3 clock_recovery.py --self-test
+  → checks the recovery on synthetic TB-shaped (bursty) timestamps
+"""
+
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+import log_index
+import metrics
+
+# ---------------------------------------------------------------------------
+# Clock parameters (must match IKAOPLL_vgm_tb.sv / vgm_csv_to_vh.py)
+# ---------------------------------------------------------------------------
+EMUCLK_HZ_NOMINAL = 3_579_545.0
+EMUCLK_PERIOD_PS = 2 * 13_968 * 10     # always #13968 at 10ps/tick
+LEGACY_PS_PER_CYCLE = 10               # 旧 TB: time_ps = cyc_cnt * 10
+CYCLES_PER_DURATION = 72
+DURATION_PS = CYCLES_PER_DURATION * EMUCLK_PERIOD_PS
+# ACC_STRB は dac_acc_outcyc 1..10（9 phi1 サイクル = 36 EMUCLK）の間 high
+ACC_RECORDS_PER_DURATION = 36
+ACC_FS_HZ = 1e12 * ACC_RECORDS_PER_DURATION / DURATION_PS   # ≈ 1_789_805.2 Hz
+ACC_FS_HZ_INT = int(round(ACC_FS_HZ))                        # 固定整数レート（CIC 用）
+
+# ログ種別ごとのタイムスタンプ列
+TIME_COLUMN = {
+    "mo": 2,
+    "acc": 1,
+    "dur": 1,
+}
+
+
+def guess_kind(path):
+    name = Path(path).name.lower()
+    if "dur" in name:
+        return "dur"
+    if "mo" in name:
+        return "mo"
+    return "acc"
+
+
+def load_times(path, col=None, window=None):
+    """Return the timestamp column of a log as int64 (non-numeric rows skipped)."""
+    if col is None:
+        col = TIME_COLUMN[guess_kind(path)]
+    times = []
+    for _, line in log_index.iter_lines(path, window):
+        parts = line.split()
+        if len(parts) <= col:
+            continue
+        if len(parts) >= 4 and parts[3] != "0":
+            continue  # samples_mo.txt の RO レコード
+        try:
+            times.append(int(parts[col]))
+        except ValueError:
+            continue
+    return np.asarray(times, dtype=np.int64)
+
+
+def to_picoseconds(times):
+    """Convert legacy ``cycles * 10`` timestamps to ps; returns (ps, unit)."""
+    t = np.asarray(times, dtype=np.int64)
+    dt = np.diff(t)
+    dt = dt[dt > 0]
+    if len(dt) and np.median(dt) < EMUCLK_PERIOD_PS:
+        scale = EMUCLK_PERIOD_PS // LEGACY_PS_PER_CYCLE
+        return t * scale, "emuclk_cycles*10"
+    return t, "ps"
+
+
+def _fit_grid(t_ps, dt, pos):
+    """Sample indices and least-squares grid t0 + n*T (relative to t_ps[0])."""
+    med = float(np.median(pos))
+    # 欠落・重複したストローブを考慮したサンプル番号
+    steps = np.rint(dt / med).astype(np.int64)
+    n = np.concatenate(([0], np.cumsum(steps)))
+
+    # 最小二乗: t = t0 + n * T（原点をずらして精度を確保）
+    nf = n.astype(np.float64)
+    tf = (t_ps - t_ps[0]).astype(np.float64)
+    n_mean = nf.mean()
+    t_mean = tf.mean()
+    var_n = float(np.dot(nf - n_mean, nf - n_mean))
+    if var_n == 0.0:
+        return med, steps, n, None, None
+    period = float(np.dot(nf - n_mean, tf - t_mean)) / var_n
+    return med, steps, n, period, t_mean + (nf - n_mean) * period
+
+
+def recover_clock(times, source=None):
+    """Estimate sample period / rate / jitter from a timestamp array.
+
+    Returns a JSON-serialisable dict, or None with fewer than 2 distinct
+    timestamps.
+    """
+    t_ps, unit = to_picoseconds(times)
+    if len(t_ps) < 2:
+        return None
+    dt = np.diff(t_ps)
+    pos = dt[dt > 0]
+    if len(pos) == 0:
+        return None
+
+    med, steps, n, grid_period, t_fit = _fit_grid(t_ps, dt, pos)
+    if grid_period is None:
+        return None
+    resid = (t_ps - t_ps[0]).astype(np.float64) - t_fit
+    starts = np.flatnonzero(steps > 1) + 1      # ギャップ直後のレコード
+    gaps = len(starts)
+    # バースト（または欠落）があるときは格子間隔ではなく平均レコードレート
+    if gaps >= 2:
+        period = int(t_ps[starts[-1]] - t_ps[starts[0]]) / int(starts[-1] - starts[0])
+    elif gaps:
+        period = int(t_ps[-1] - t_ps[0]) / (len(t_ps) - 1)
+    else:
+        period = grid_period
+
+    cycles = period / EMUCLK_PERIOD_PS
+    vals, counts = np.unique(pos, return_counts=True)
+    top = np.argsort(counts)[::-1][:4]
+
+    return {
+        "source": str(source) if source is not None else None,
+        "count": int(len(t_ps)),
+        "time_unit": unit,
+        "start_ps": int(t_ps[0]),
+        "end_ps": int(t_ps[-1]),
+        "period_ps": period,
+        "fs_hz": 1e12 / period,
+        "dt_median_ps": med,
+        "dt_min_ps": int(pos.min()),
+        "dt_max_ps": int(pos.max()),
+        "dt_common_ps": {str(int(vals[i])): int(counts[i]) for i in top},
+        "gaps": gaps,
+        "grid_period_ps": grid_period,
+        "grid_fs_hz": 1e12 / grid_period,
+        "jitter_rms_ps": float(np.sqrt(np.mean(resid * resid))),
+        "jitter_pp_ps": float(resid.max() - resid.min()),
+        "emuclk_period_ps": EMUCLK_PERIOD_PS,
+        "emuclk_cycles_per_sample": cycles,
+        "emuclk_ppm_vs_nominal": (1e12 / EMUCLK_PERIOD_PS / EMUCLK_HZ_NOMINAL - 1.0) * 1e6,
+        "fs_hz_nominal_clock": EMUCLK_HZ_NOMINAL / cycles,
+    }
+
+
+def regular_time_grid(times):
+    """Jitter-free sample times in seconds (fitted grid) plus the clock info.
+
+    Used to feed the resampler with the recovered clock instead of the raw,
+    EMUCLK-rounded (or legacy-unit) timestamps.  Bursty logs keep their
+    bursts: every record sits on the fitted strobe grid at its own time.
+    """
+    t_ps, _ = to_picoseconds(times)
+    info = recover_clock(times)
+    if info is None:
+        return None, None
+    dt = np.diff(t_ps)
+    _, _, _, _, t_fit = _fit_grid(t_ps, dt, dt[dt > 0])
+    return (t_ps[0] + t_fit) * 1e-12, info
+
+
+def recover_from_log(path, col=None, window=None):
+    return recover_clock(load_times(path, col, window), source=path)
+
+
+def recover_duration_rate(path):
+    """Rate of one sample per duration, from durations.txt start times."""
+    return recover_clock(load_times(path, 1), source=path)
+
+
+def recover_mo_duration_rate(path, window=None):
+    """Rate of one sample per duration, from samples_mo.txt.
+
+    Uses the first Mo timestamp of every dur_idx, so the per-duration
+    series of avg_mo_by_duration / make_ref_wav gets its true rate.
+    """
+    idx = []
+    times = []
+    for _, line in log_index.iter_lines(path, window):
+        parts = line.split()
+        if len(parts) < 3:
+            continue
+        try:
+            d = int(parts[0])
+            t = int(parts[2])
+        except ValueError:
+            continue
+        idx.append(d)
+        times.append(t)
+    if not times:
+        return None
+    return recover_duration_rate_from_columns(idx, times, source=path)
+
+
+def recover_duration_rate_from_columns(dur_idx, times, source=None):
+    """recover_mo_duration_rate() on already-loaded dur_idx / time_ps columns."""
+    d = np.asarray(dur_idx, dtype=np.int64)
+    t = np.asarray(times, dtype=np.int64)
+    if len(d) == 0:
+        return None
+    first = np.concatenate(([True], d[1:] != d[:-1]))
+    return recover_clock(t[first], source=source)
+
+
+def print_clock(info, tag=""):
+    if info is None:
+        print(f"[WARN] {tag}clock recovery failed (not enough timestamps)")
+        return
+    print(f"[INFO] {tag}recovered Fs = {info['fs_hz']:.4f} Hz "
+          f"(T = {info['period_ps']:.3f} ps, "
+          f"{info['emuclk_cycles_per_sample']:.4f} EMUCLK cycles/sample, "
+          f"unit={info['time_unit']})")
+    print(f"[INFO] {tag}jitter rms={info['jitter_rms_ps']:.1f} ps, "
+          f"pp={info['jitter_pp_ps']:.1f} ps, gaps={info['gaps']}, "
+          f"Fs@{EMUCLK_HZ_NOMINAL / 1e6:.6f}MHz = {info['fs_hz_nominal_clock']:.4f} Hz")
+    if info["gaps"]:
+        print(f"[INFO] {tag}records are not evenly spaced (strobe grid "
+              f"{info['grid_fs_hz']:.1f} Hz); Fs is the mean record rate")
+
+
+def write_clock_metadata(out_path, info, **extra):
+    """Write recovered-clock metadata as JSON next to an output file."""
+    meta = {"clock": info}
+    meta.update(extra)
+    p = Path(str(out_path) + ".clock.json")
+    p.write_text(json.dumps(meta, indent=2) + "\n")
+    return p
+
+
+def read_clock_metadata(path):
+    """Load ``<path>.clock.json`` written by write_clock_metadata(), if any."""
+    p = Path(str(path) + ".clock.json")
+    if not p.is_file():
+        return None
+    try:
+        return json.loads(p.read_text()).get("clock")
+    except (OSError, ValueError):
+        return None
+
+
+def self_test():
+    """Recover the clock of synthetic TB-shaped timestamps; returns failures."""
+    t0 = 100 * EMUCLK_PERIOD_PS
+    n_dur = 5000
+    # samples_acc.txt: 36 レコード（1 EMUCLK 間隔）/ 72 EMUCLK
+    burst = np.arange(ACC_RECORDS_PER_DURATION, dtype=np.int64) * EMUCLK_PERIOD_PS
+    acc = (t0 + np.arange(n_dur, dtype=np.int64)[:, None] * DURATION_PS + burst).ravel()
+    # durations.txt: 1 レコード / duration
+    dur = t0 + np.arange(n_dur, dtype=np.int64) * DURATION_PS
+    cases = [
+        ("acc burst", acc, ACC_FS_HZ),
+        ("acc burst, legacy units", acc // (EMUCLK_PERIOD_PS // LEGACY_PS_PER_CYCLE), ACC_FS_HZ),
+        ("acc burst, cut mid-burst", acc[10:-5], ACC_FS_HZ),
+        ("duration", dur, 1e12 / DURATION_PS),
+    ]
+    failures = 0
+    for name, t, want in cases:
+        info = recover_clock(t)
+        got = info["fs_hz"] if info else float("nan")
+        ok = info is not None and abs(got / want - 1.0) < 1e-6
+        print(f"[{'INFO' if ok else 'ERROR'}] self-test {name}: "
+              f"fs_hz={got:.3f}, expected {want:.3f}")
+        failures += not ok
+    return failures
+
+
+def main(argv):
+    if argv[1:] == ["--self-test"]:
+        return 1 if self_test() else 0
+    try:
+        argv, window = log_index.pop_window_args(argv)
+    except ValueError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 1
+    if len(argv) < 2:
+        print(f"Usage: {argv[0]} <log.txt> [more logs ...] [--start T] [--end T]",
+              file=sys.stderr)
+        return 1
+    for path in argv[1:]:
+        with metrics.stage("recover_clock"):
+            info = recover_from_log(path, window=window)
+        print(f"# file: {path}")
+        print_clock(info)
+        if info is not None:
+            print(f"[INFO] wrote {write_clock_metadata(path, info)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
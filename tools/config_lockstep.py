@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+config_lockstep.py
+
+Check that IKAOPLL parameter configurations are output-equivalent, in
+lock-step, stopping at the first divergence.
+
+Every configuration (FULLY_SYNCHRONOUS, FAST_RESET,
+USE_PIPELINED_MULTIPLIER; passed to the TB as IKAOPLL_* macros) is
+built from the same stimulus and all simulators run at the same time.
+Each one writes its samples_acc.txt into a named pipe that this script
+reads; samples_mo.txt and durations.txt go to /dev/null unless
+--keep-logs.  The pipes give back-pressure: a simulator that runs ahead
+blocks until the comparator has caught up.
+
+The first configuration is the reference.  A fixed latency of every
+other configuration (reset length, pipeline stages) is detected from
+the first non-zero ACC record and verified over the next --align
+records; a search of +-max-lag records is made if the simple guess
+does not match.  Then the aligned streams are compared record by
+record.  At the first differing value all simulators are killed and the
+ACC record index, both values and both log times (ps) are reported
+(exit code 1).
+
+Configurations are given as NAME=V[,NAME=V] with full or short names
+(FS, FR, PM); unspecified parameters keep the TB defaults (FS=1, FR=1,
+PM=0).  Default: all 8 combinations, the TB default first.
+
+Usage:
+  python3 config_lockstep.py tests/ym2413_chords_mix.vgm.csv -o lockstep
+  python3 config_lockstep.py song.vgm --config FS=1 --config PM=1 --config FS=0,PM=1
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+import metrics
+import reg_events
+from make_tb_suite import test_name, write_suite
+from run_tb import build
+
+# パラメータ名 -> (短縮名, TB の既定値)
+PARAMS = {
+    "FULLY_SYNCHRONOUS": ("FS", 1),
+    "FAST_RESET": ("FR", 1),
+    "USE_PIPELINED_MULTIPLIER": ("PM", 0),
+}
+_SHORT = {short: name for name, (short, _) in PARAMS.items()}
+
+CHUNK_BYTES = 1 << 16
+QUEUE_CHUNKS = 64
+DROP_RECORDS = 1 << 16          # 比較済みのレコードはこの数を超えたら捨てる
+
+
+# ----------------------------------------------------------------------
+# Configurations
+# ----------------------------------------------------------------------
+def parse_config(s):
+    """'FS=0,PM=1' -> {FULLY_SYNCHRONOUS: 0, FAST_RESET: 1, ...}"""
+    cfg = {name: default for name, (_, default) in PARAMS.items()}
+    for item in filter(None, (x.strip() for x in s.split(","))):
+        k, sep, v = item.partition("=")
+        k = k.strip().upper()
+        k = _SHORT.get(k, k)
+        if not sep or k not in PARAMS or v.strip() not in ("0", "1"):
+            raise argparse.ArgumentTypeError(
+                f"bad configuration item {item!r} (NAME=0/1, NAME in "
+                f"{', '.join(_SHORT)} or the full parameter names)")
+        cfg[k] = int(v)
+    return cfg
+
+
+def all_configs():
+    default = tuple(d for _, d in PARAMS.values())
+    combos = sorted(itertools.product((0, 1), repeat=len(PARAMS)),
+                    key=lambda c: c != default)
+    return [dict(zip(PARAMS, c)) for c in combos]
+
+
+def label(cfg):
+    return ".".join(f"{short}{cfg[name]}" for name, (short, _) in PARAMS.items())
+
+
+def defines(cfg):
+    return {f"IKAOPLL_{name}": v for name, v in cfg.items()}
+
+
+# ----------------------------------------------------------------------
+# ACC streams
+# ----------------------------------------------------------------------
+def parse_acc_chunk(data):
+    """b'value time_ps\\n...' (complete lines) -> (values, times) int64 arrays."""
+    try:
+        a = np.array(data.split(), dtype=np.int64)
+        if len(a) % 2 == 0:
+            return a[0::2], a[1::2]
+    except ValueError:
+        pass
+    # 'x 0' などリセット前の行や 1 列の行は飛ばす
+    vals, times = [], []
+    for line in data.splitlines():
+        parts = line.split()
+        if len(parts) < 2:
+            continue
+        try:
+            v, t = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue
+        vals.append(v)
+        times.append(t)
+    return np.array(vals, dtype=np.int64), np.array(times, dtype=np.int64)
+
+
+class AccStream:
+    """samples_acc.txt of one running simulator, read from a named pipe."""
+
+    def __init__(self, name, fifo, proc):
+        self.name = name
+        self.fifo = Path(fifo)
+        self.proc = proc
+        self.q = queue.Queue(QUEUE_CHUNKS)
+        self.opened = threading.Event()
+        self.eof = False
+        self.base = 0                               # 先頭レコードの通し番号
+        self.v = np.zeros(0, dtype=np.int64)
+        self.t = np.zeros(0, dtype=np.int64)
+        self.thread = threading.Thread(target=self._reader, daemon=True)
+        self.thread.start()
+
+    def _reader(self):
+        rest = b""
+        with open(self.fifo, "rb") as f:
+            self.opened.set()
+            while True:
+                data = f.read(CHUNK_BYTES)
+                if not data:
+                    break
+                data = rest + data
+                cut = data.rfind(b"\n") + 1
+                rest = data[cut:]
+                if cut:
+                    self.q.put(parse_acc_chunk(data[:cut]))
+        if rest.strip():
+            self.q.put(parse_acc_chunk(rest))
+        self.q.put(None)
+
+    def unblock(self):
+        """Let the reader see EOF if the simulator never opened the pipe."""
+        if not self.opened.is_set():
+            try:
+                os.close(os.open(self.fifo, os.O_WRONLY | os.O_NONBLOCK))
+            except OSError:
+                pass
+
+    @property
+    def end(self):
+        return self.base + len(self.v)
+
+    def pull(self, timeout=1.0):
+        """Append the next chunk; False on timeout or at EOF."""
+        if self.eof:
+            return False
+        try:
+            item = self.q.get(timeout=timeout)
+        except queue.Empty:
+            if self.proc.poll() is not None:
+                self.unblock()
+            return False
+        if item is None:
+            self.eof = True
+            return False
+        v, t = item
+        self.v = np.concatenate((self.v, v))
+        self.t = np.concatenate((self.t, t))
+        return True
+
+    def need(self, index, timeout=1.0):
+        """Pull until record `index` is buffered; False if the stream ends first."""
+        while self.end <= index:
+            if self.eof:
+                return False
+            self.pull(timeout)
+        return True
+
+    def drop_before(self, index):
+        k = index - self.base
+        if k > DROP_RECORDS:
+            self.v = self.v[k:]
+            self.t = self.t[k:]
+            self.base = index
+
+    def first_nonzero(self, timeout=1.0):
+        k = 0
+        while True:
+            nz = np.flatnonzero(self.v[k:])
+            if len(nz):
+                return self.base + k + int(nz[0])
+            k = len(self.v)
+            if not self.pull(timeout) and self.eof:
+                return None
+
+    def slice(self, i0, i1):
+        return self.v[i0 - self.base:i1 - self.base]
+
+    def time_at(self, index):
+        return int(self.t[index - self.base])
+
+
+def detect_lag(ref, other, n_align, max_lag):
+    """Record offset of `other` against `ref`; (lag, exact match?)."""
+    r0 = ref.first_nonzero()
+    o0 = other.first_nonzero()
+    if r0 is None or o0 is None:
+        return 0, r0 is None and o0 is None
+    guess = o0 - r0
+    ref.need(r0 + n_align)
+    n = min(n_align, ref.end - r0)
+    want = ref.slice(r0, r0 + n)
+    for d in sorted(range(-max_lag, max_lag + 1), key=abs):
+        lag = guess + d
+        if r0 + lag < other.base:
+            continue
+        other.need(r0 + lag + n)
+        got = other.slice(r0 + lag, r0 + lag + n)
+        if len(got) == n and np.array_equal(got, want):
+            return lag, True
+    return guess, False
+
+
+def compare_streams(ref, others, lags, timeout=1.0):
+    """Lock-step comparison; returns (n_compared, divergence or None).
+
+    divergence = (stream, ref index, ref value, other value)."""
+    i = max([0] + [-lag for lag in lags])           # 全ストリームに存在する最初の番号
+    while True:
+        ref.need(i + 1, timeout)
+        n = ref.end - i
+        for s, lag in zip(others, lags):
+            s.need(i + lag + 1, timeout)
+            n = min(n, s.end - (i + lag))
+        if n <= 0:
+            if ref.eof or any(s.eof for s in others):
+                return i, None
+            continue
+        want = ref.slice(i, i + n)
+        for s, lag in zip(others, lags):
+            got = s.slice(i + lag, i + lag + n)
+            bad = np.flatnonzero(got != want)
+            if len(bad):
+                k = int(bad[0])
+                return i + k, (s, i + k, int(want[k]), int(got[k]))
+        i += n
+        ref.drop_before(i)
+        for s, lag in zip(others, lags):
+            s.drop_before(i + lag)
+
+
+# ----------------------------------------------------------------------
+# Runs
+# ----------------------------------------------------------------------
+def prepare_run(run_dir, csv, keep_logs):
+    """Log directory with samples_acc.txt as a named pipe."""
+    log = run_dir / test_name(csv)
+    log.mkdir(parents=True, exist_ok=True)
+    for name in ("samples_acc.txt", "samples_mo.txt", "durations.txt"):
+        p = log / name
+        if p.is_symlink() or p.exists():
+            p.unlink()
+    os.mkfifo(log / "samples_acc.txt")
+    if not keep_logs:
+        for name in ("samples_mo.txt", "durations.txt"):
+            (log / name).symlink_to(os.devnull)
+    return log
+
+
+def start_run(run_dir, vvp, log, plusargs):
+    out = open(run_dir / "sim.log", "w")
+    proc = subprocess.Popen(["vvp", str(vvp)] + plusargs, cwd=run_dir,
+                            stdout=out, stderr=subprocess.STDOUT)
+    out.close()
+    return AccStream(run_dir.name, log / "samples_acc.txt", proc)
+
+
+def stop_all(streams):
+    for s in streams:
+        if s.proc.poll() is None:
+            s.proc.kill()
+    for s in streams:
+        s.proc.wait()
+        s.unblock()
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Run IKAOPLL parameter configurations in lock-step and stop at the "
+                    "first ACC output divergence."
+    )
+    ap.add_argument("stimulus", help="register CSV, .ymev or VGM")
+    ap.add_argument("plusargs", nargs="*", help="extra simulator arguments (e.g. +TAIL_S=0.1)")
+    ap.add_argument("--config", action="append", type=parse_config, default=[],
+                    help="NAME=V[,NAME=V] (FS, FR, PM); repeat; the first one is the "
+                         "reference (default: all 8 combinations)")
+    ap.add_argument("-o", "--out-dir", default="lockstep",
+                    help="build / run directories (default: lockstep)")
+    ap.add_argument("--align", type=int, default=4096,
+                    help="ACC records checked when detecting the latency (default: 4096)")
+    ap.add_argument("--max-lag", type=int, default=256,
+                    help="latency search around the first-non-zero guess, in ACC "
+                         "records (default: 256)")
+    ap.add_argument("--keep-logs", action="store_true",
+                    help="write samples_mo.txt / durations.txt instead of discarding them")
+    ap.add_argument("--iverilog", default="iverilog", help="iverilog binary (default: iverilog)")
+    args = ap.parse_args(argv)
+
+    configs = args.config or all_configs()
+    labels = [label(c) for c in configs]
+    dup = sorted({x for x in labels if labels.count(x) > 1})
+    if dup:
+        print(f"[ERROR] configuration given twice: {', '.join(dup)}", file=sys.stderr)
+        return 1
+    if len(configs) < 2:
+        print("[ERROR] need at least two configurations", file=sys.stderr)
+        return 1
+
+    out_dir = Path(args.out_dir).resolve()
+    out_dir.mkdir(parents=True, exist_ok=True)
+    with metrics.stage("parse") as st:
+        try:
+            events = reg_events.load_stimulus_events(args.stimulus)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] {args.stimulus}: {e}", file=sys.stderr)
+            return 1
+        st.count(len(events), "writes")
+    base = test_name(args.stimulus)
+    if base.endswith((".vgm", ".vgz")):
+        base = base[:-4]
+    csv = out_dir / f"{base}.csv"
+    reg_events.write_csv(csv, events)
+
+    suite = out_dir / "suite.vh"
+    write_suite(suite, [csv])
+    run_dirs = [out_dir / lb for lb in labels]
+    with metrics.stage("build") as st:
+        def _build(k):
+            run_dirs[k].mkdir(parents=True, exist_ok=True)
+            return build(run_dirs[k] / "ikaopll_vgm_tb.vvp", suite=suite,
+                         iverilog=args.iverilog, defines=defines(configs[k]))
+        with ThreadPoolExecutor(len(configs)) as ex:
+            rcs = list(ex.map(_build, range(len(configs))))
+        st.count(len(configs), "configs")
+    failed = [lb for lb, rc in zip(labels, rcs) if rc != 0]
+    if failed:
+        print(f"[ERROR] build failed: {', '.join(failed)}", file=sys.stderr)
+        return 1
+
+    print(f"[INFO] {len(configs)} configurations, reference {labels[0]}: "
+          f"{', '.join(labels[1:])}")
+    t0 = time.monotonic()
+    with metrics.stage("simulate") as st:
+        streams = []
+        for rd in run_dirs:
+            log = prepare_run(rd, csv, args.keep_logs)
+            streams.append(start_run(rd, rd / "ikaopll_vgm_tb.vvp", log, args.plusargs))
+        ref, others = streams[0], streams[1:]
+        try:
+            lags = []
+            for s in others:
+                lag, exact = detect_lag(ref, s, args.align, args.max_lag)
+                lags.append(lag)
+                if not exact:
+                    print(f"[WARN] {s.name}: no latency within +-{args.max_lag} records "
+                          f"matches the reference; comparing at the first-non-zero offset "
+                          f"{lag:+d}")
+            n, div = compare_streams(ref, others, lags)
+        except BaseException:
+            stop_all(streams)
+            raise
+        if div is not None:
+            stop_all(streams)
+        st.count(n, "records")
+    wall = time.monotonic() - t0
+
+    if div is not None:
+        s, i, want, got = div
+        lag = lags[others.index(s)]
+        t_ref = ref.time_at(i)
+        t_oth = s.time_at(i + lag)
+        print(f"[ERROR] {s.name} diverges from {labels[0]} at ACC record {i} "
+              f"(t = {t_ref} ps = {t_ref * 1e-12:.9f} s): {labels[0]}={want}, "
+              f"{s.name}={got} (its record {i + lag}, t = {t_oth} ps)")
+        print(f"[INFO] all simulators stopped after {wall:.1f} s wall")
+        return 1
+
+    rcs = [s.proc.wait() for s in streams]
+    bad = [(s.name, rc) for s, rc in zip(streams, rcs) if rc != 0]
+    for name, rc in bad:
+        print(f"[ERROR] {name}: simulator exit {rc} (see {out_dir / name / 'sim.log'})",
+              file=sys.stderr)
+    if bad:
+        return 1
+    ends = [(s.name, s.end) for s in streams]
+    for s, lag in zip(others, lags):
+        extra = s.end - lag - ref.end
+        print(f"[INFO] {s.name}: latency {lag:+d} records"
+              + (f", {extra:+d} records at the end" if extra else ""))
+    print(f"[INFO] {len(configs)} configurations equivalent over {n} ACC records "
+          f"({wall:.1f} s wall; records per run: "
+          f"{', '.join(f'{nm} {e}' for nm, e in ends)})")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
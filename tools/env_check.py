@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+"""
+env_check.py
+
+Envelope timing check of rendered audio against the register timeline
+(e.g. ym2413_release_retrigger, ym2413_short_pulses, ym2413_volume_sweep).
+
+Oracle: the stimulus (register CSV, .ymev or VGM) is replayed and every
+melodic key-on becomes a note with its carrier EG parameters (AR, DR,
+SL, RR, EGT, KSR from the user patch or the instrument ROM of
+IKAOPLL_reg.v), volume, block/F-number and sustain bit.  The expected
+envelope follows the rate logic of IKAOPLL_eg.v:
+
+  - EG rate R' = min(15, R + KSR factor >> 2), lo = KSR factor & 3
+    (KSR factor = block:fnum[8] with KSR, block >> 1 without)
+  - decay / release: 2^(R'-14) * (4 + lo) / 4 steps of 0.375 dB per
+    sample (49716 Hz), 2 steps per sample at R' = 15, none at R = 0
+  - attack: att -= (att >> 4) + 1 every 2^(12-R') * 4 / (4 + lo) samples
+    below R' = 12, every sample with shift 4..1 above, instant at 15;
+    a key-on during release first damps at rate 12 to -46.5 dB
+  - key-on: decay at DR down to SL (3 dB steps), then hold (EGT = 1) or
+    continue at RR (EGT = 0); key-off: rate 5 with the sustain bit,
+    otherwise RR (EGT = 1) or 7 (EGT = 0)
+  - volume: 3 dB per step
+
+Measurement: one RMS envelope follower over the whole signal (centred
+--win window, cumulative sums), in dB.  Per note, from the key-on/off
+times of the stimulus:
+
+  attack   key-on to the envelope reaching peak - 1 dB (ms)
+  decay    slope from peak - 1.5 dB down to SL + 1.5 dB (dB/s)
+  sustain  hold level below the peak, EGT = 1 notes only (dB)
+  release  slope after the key-off, down to 30 dB or the noise floor (dB/s)
+  level    peak relative to the first note with the same instrument,
+           block and F-number (dB; volume steps)
+
+Rates and times fail beyond --tol (relative; attack also needs to be off
+by more than one --win), levels beyond --tol-db.  Quantities the
+signal cannot show (span under 3 dB, fewer than two windows, another
+channel sounding) are printed as "-".  Channels 6-8 are skipped while
+rhythm mode is on.  The exit code is 1 on any FAIL and 2 on unusable
+input (missing or unreadable files, no melodic key-on).  NumPy is
+required.
+
+The audio is a WAV (e.g. mo_ref_44k1.wav from make_ref_wav.py) or an
+ACC log (samples_acc.txt, "value time_ps"; VGM time = log time - offset).
+ACC records come in bursts (36 one EMUCLK apart per duration); they are
+taken as evenly spaced at the mean record rate from clock_recovery.py.
+
+Usage:
+  python3 env_check.py tests/ym2413_volume_sweep.vgm.csv mo_ref_44k1.wav
+  python3 env_check.py tests/ym2413_release_retrigger.vgm.csv samples_acc.txt \\
+      --offset 0.0123 --report env.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import math
+import sys
+from pathlib import Path
+
+import numpy as np
+
+import clock_recovery
+import metrics
+from acc_log import load_acc_with_time
+from reg_coverage import stimulus_writes
+from wav_writer import read_wav
+
+VGM_RATE = 44_100
+EMUCLK_HZ = 3_579_545.0
+CHIP_FS = EMUCLK_HZ / 72                 # EG は 1 サンプル（1 duration）ごとに更新
+N_CH = 9
+
+DB_PER_STEP = 0.375                      # EG 減衰 1 ステップ（7 bit）
+ATT_MAX = 127
+ATT_QUIET = 124                          # attnlv[6:2] == 5'b11111
+DAMP_RATE = 12
+SUS_RATE = 5
+PERC_RELEASE_RATE = 7
+
+SETTLE = VGM_RATE // 1000                # key-on 直後 1 ms の書き込みはそのノートの設定
+
+# IKAOPLL_reg.v の音色 ROM（1-15）のキャリア: (AR, DR, SL, RR, EGT, KSR)
+ROM_CARRIER = (
+    None,
+    (7, 8, 1, 7, 1, 0), (15, 7, 1, 3, 0, 0), (12, 4, 2, 3, 0, 0),
+    (6, 4, 2, 7, 1, 0), (7, 6, 2, 8, 1, 0), (7, 1, 1, 8, 1, 0),
+    (8, 1, 0, 7, 1, 0), (7, 2, 0, 7, 1, 0), (6, 5, 1, 7, 1, 0),
+    (15, 7, 0, 7, 1, 0), (14, 4, 0, 4, 0, 0), (15, 8, 1, 2, 0, 0),
+    (15, 5, 4, 2, 0, 1), (9, 5, 0, 2, 0, 0), (14, 4, 1, 3, 0, 0),
+)
+
+# R' = 12..14 のアタック: intensity 0/1 のときのシフト量
+_FAST_ATTACK_SHIFT = {12: (4, 3), 13: (3, 2), 14: (2, 1)}
+
+
+# ----------------------------------------------------------------------
+# EG model
+# ----------------------------------------------------------------------
+def ksr_factor(ksr, block, fnum):
+    return ((block << 1) | (fnum >> 8)) if ksr else block >> 1
+
+
+def _scaled(rate, kf):
+    return min(15, rate + (kf >> 2)), kf & 3
+
+
+def decay_steps_per_s(rate, kf):
+    """EG steps (0.375 dB) per second of a decay / release rate."""
+    if rate == 0:
+        return 0.0
+    rp, lo = _scaled(rate, kf)
+    if rp == 15:
+        return 2.0 * CHIP_FS
+    return CHIP_FS * 2.0 ** (rp - 14) * (4 + lo) / 4
+
+
+def attack_seconds(rate, kf, start=ATT_MAX, until=2):
+    """Time of the attack from attenuation `start` down to `until`."""
+    if rate == 0:
+        return math.inf
+    rp, lo = _scaled(rate, kf)
+    if rp == 15:
+        return 0.0
+    a = start
+    n = 0
+    if rp < 12:
+        while a > until:
+            a -= (a >> 4) + 1
+            n += 1
+        return n * (1 << (12 - rp)) * 4 / (4 + lo) / CHIP_FS
+    shift = _FAST_ATTACK_SHIFT[rp]
+    while a > until:
+        a -= (a >> shift[(n % 4) < lo]) + 1
+        n += 1
+    return n / CHIP_FS
+
+
+class Note:
+    """One key-on of a channel and its modelled carrier envelope."""
+
+    def __init__(self, ch, t_on, params, att_prev=ATT_MAX):
+        self.ch = ch
+        self.t_on = t_on
+        self.t_off = None
+        self.t_next = math.inf
+        self.att_prev = att_prev          # 前のノートの key-on 時点の減衰量
+        self.set_params(params)
+
+    def set_params(self, params):
+        """(inst, vol, block, fnum, carrier tuple, sus) → derived rates."""
+        self.inst, self.vol, self.block, self.fnum, car, self.sus = params
+        self.ar, self.dr, self.sl, self.rr, self.egt, self.ksr = car
+        self.sus_off = self.sus
+        self.kf = ksr_factor(self.ksr, self.block, self.fnum)
+        self.t_damp = 0.0
+        if self.att_prev < ATT_QUIET:
+            self.t_damp = (ATT_QUIET - self.att_prev) / decay_steps_per_s(DAMP_RATE, self.kf)
+        self.t_attack = attack_seconds(self.ar, self.kf)
+        self.dr_steps = decay_steps_per_s(self.dr, self.kf)
+        self.hold_steps = 0.0 if self.egt else decay_steps_per_s(self.rr, self.kf)
+
+    # 以下の時刻はすべて key-on からの相対秒
+    @property
+    def sl_att(self):
+        return self.sl * 8
+
+    @property
+    def t_peak(self):
+        return self.t_damp + self.t_attack
+
+    @property
+    def t_sustain(self):
+        """Time from the peak to SL (inf if DR = 0)."""
+        if self.sl_att == 0:
+            return 0.0
+        return self.sl_att / self.dr_steps if self.dr_steps else math.inf
+
+    @property
+    def release_rate(self):
+        if self.sus_off:
+            return SUS_RATE
+        return self.rr if self.egt else PERC_RELEASE_RATE
+
+    @property
+    def rel_steps(self):
+        return decay_steps_per_s(self.release_rate, self.kf)
+
+    def _att_on(self, dt):
+        if dt < self.t_peak:
+            return ATT_MAX
+        d = dt - self.t_peak
+        if d < self.t_sustain:
+            return min(ATT_MAX, d * self.dr_steps)
+        return min(ATT_MAX, self.sl_att + (d - self.t_sustain) * self.hold_steps)
+
+    def att(self, dt):
+        """Modelled attenuation (EG steps) dt seconds after the key-on."""
+        if self.t_off is None or dt < self.t_off - self.t_on:
+            return self._att_on(dt)
+        d_off = self.t_off - self.t_on
+        return min(ATT_MAX, self._att_on(d_off) + (dt - d_off) * self.rel_steps)
+
+    def t_quiet(self):
+        """Absolute time the modelled envelope reaches ATT_QUIET (capped)."""
+        lo, hi = min(self.t_peak, 3600.0), min(self.t_next, 3600.0) - self.t_on
+        if hi <= lo or self.att(hi) < ATT_QUIET:
+            return self.t_on + hi
+        for _ in range(40):
+            mid = (lo + hi) / 2
+            if self.att(mid) >= ATT_QUIET:
+                hi = mid
+            else:
+                lo = mid
+        return self.t_on + hi
+
+
+# ----------------------------------------------------------------------
+# Oracle
+# ----------------------------------------------------------------------
+def carrier_params(regs, inst):
+    if inst == 0:
+        return (regs[0x05] >> 4, regs[0x05] & 0x0F, regs[0x07] >> 4, regs[0x07] & 0x0F,
+                (regs[0x01] >> 5) & 1, (regs[0x01] >> 4) & 1)
+    return ROM_CARRIER[inst]
+
+
+def note_params(regs, ch):
+    hi = regs[0x20 + ch]
+    inst = regs[0x30 + ch] >> 4
+    return (inst, regs[0x30 + ch] & 0x0F, (hi >> 1) & 7, ((hi & 1) << 8) | regs[0x10 + ch],
+            carrier_params(regs, inst), bool(hi & 0x20))
+
+
+def expected_notes(writes, t_end=None):
+    """Notes in key-on order (with key-off, next key-on and damp time).
+
+    Channel registers written less than SETTLE VGM samples after the
+    key-on (F-number, volume after the 0x2n write) still belong to it.
+    """
+    regs = [0] * 0x40
+    t = 0
+    cur = [None] * N_CH
+    t_key = [0] * N_CH
+    notes = []
+    for delta, reg, val in writes:
+        t += delta
+        reg &= 0x3F
+        old = regs[reg]
+        regs[reg] = val
+        if not (0x10 <= reg <= 0x38) or (reg & 0x0F) >= N_CH:
+            continue
+        ch = reg & 0x0F
+        n = cur[ch]
+        if not (0x20 <= reg <= 0x28) or not (old ^ val) & 0x10:
+            if n is not None and n.t_off is None and t - t_key[ch] < SETTLE:
+                n.set_params(note_params(regs, ch))
+            continue
+        ts = t / VGM_RATE
+        if not val & 0x10:
+            if n is not None and n.t_off is None:
+                n.t_off = ts
+                n.sus_off = bool(val & 0x20)
+            continue
+        if ch >= 6 and regs[0x0E] & 0x20:
+            continue
+        att_prev = ATT_MAX
+        if n is not None:
+            n.t_next = ts
+            att_prev = n.att(ts - n.t_on)
+        cur[ch] = Note(ch, ts, note_params(regs, ch), att_prev)
+        t_key[ch] = t
+        notes.append(cur[ch])
+    if t_end is not None:
+        for n in notes:
+            n.t_next = min(n.t_next, t_end)
+    return notes
+
+
+# 以下のタプルの並び: (exp, meas, status)
+NOT_MEASURED = (None, None, "-")
+
+
+# ----------------------------------------------------------------------
+# Measurement
+# ----------------------------------------------------------------------
+def envelope_db(x, fs, win_s):
+    """Centred moving RMS of x in dB (one pass over cumulative sums)."""
+    n = max(1, int(round(win_s * fs)))
+    c = np.concatenate(([0.0], np.cumsum(np.square(x, dtype=np.float64))))
+    k = np.arange(len(x))
+    lo = np.clip(k - n // 2, 0, len(x))
+    hi = np.clip(k - n // 2 + n, 0, len(x))
+    ms = (c[hi] - c[lo]) / np.maximum(hi - lo, 1)
+    return 10.0 * np.log10(np.maximum(ms, 0.0) + 1e-20)
+
+
+def _slope(env, fs, k0, k1):
+    t = np.arange(k1 - k0) / fs
+    return float(np.polyfit(t, env[k0:k1], 1)[0])
+
+
+def _first(mask):
+    """Index of the first True (len(mask) if none)."""
+    i = int(np.argmax(mask)) if len(mask) else 0
+    return i if len(mask) and mask[i] else len(mask)
+
+
+def _check_rel(exp, meas, tol, floor=0.0):
+    if exp is None or meas is None:
+        return NOT_MEASURED
+    err = abs(meas - exp)
+    ok = err <= tol * abs(exp) or err <= floor
+    return exp, meas, "ok" if ok else "FAIL"
+
+
+def measure_note(n, env, fs, t_first, win_s, floor_db, busy, tol, tol_db):
+    """{quantity: (expected, measured, status)} of one note."""
+    half = max(1, int(round(win_s * fs / 2)))
+    min_len = 2 * half * 2
+
+    def idx(t):
+        return int(round((t - t_first) * fs))
+
+    k_on = max(0, idx(n.t_on))
+    k_off = idx(n.t_off if n.t_off is not None else n.t_next)
+    k_off = min(k_off, idx(n.t_next), len(env))
+    out = {q: NOT_MEASURED for q in ("attack", "decay", "sustain", "release")}
+    out["peak"] = None
+    if busy(n, n.t_on, n.t_next) or k_off - k_on < min_len:
+        return out, "overlap" if busy(n, n.t_on, n.t_next) else "short"
+
+    seg = env[k_on:k_off]
+    k_pk = int(np.argmax(seg))
+    l_pk = float(seg[k_pk])
+    if l_pk < floor_db + 10:
+        return out, "weak"
+    # 前のノートの余韻の方が大きい（ダンプ中）ならピークは測れない
+    masked = seg[0] >= l_pk - 1.0 and n.t_peak > win_s
+    if not masked:
+        out["peak"] = l_pk
+
+    # アタック: ピーク -1 dB に最初に届くまで
+    if math.isfinite(n.t_peak) and not masked:
+        k_att = _first(seg[:k_pk + 1] >= l_pk - 1.0)
+        out["attack"] = _check_rel(n.t_peak * 1e3, k_att / fs * 1e3, tol, floor=win_s * 1e3)
+
+    # ディケイ: ピーク -1.5 dB から SL +1.5 dB まで
+    sl_db = n.sl_att * DB_PER_STEP
+    span = min(sl_db, ATT_MAX * DB_PER_STEP) - 3.0
+    if span >= 3.0 and n.dr_steps:
+        k0 = k_pk + _first(seg[k_pk:] <= l_pk - 1.5)
+        k1 = k0 + _first(seg[k0:] <= l_pk - sl_db + 1.5)
+        k1 = min(k1, len(seg) - half)
+        if k1 - k0 >= min_len:
+            meas = _slope(seg, fs, k0, k1)
+            out["decay"] = _check_rel(-n.dr_steps * DB_PER_STEP, meas, tol)
+
+    # サステイン: 持続音だけ、SL に着いた後のホールドレベル
+    if n.egt:
+        t_hold = n.t_peak + n.t_sustain + win_s
+        k0 = idx(n.t_on + t_hold) - k_on
+        if 0 <= k0 and len(seg) - half - k0 >= min_len:
+            meas = float(np.median(seg[k0:len(seg) - half])) - l_pk
+            exp = -sl_db
+            if meas > floor_db - l_pk + 6:
+                out["sustain"] = (exp, meas, "ok" if abs(meas - exp) <= tol_db else "FAIL")
+
+    # リリース: キーオフ後、-30 dB かノイズフロアまで
+    if n.t_off is not None and n.t_off < n.t_next and n.rel_steps:
+        k0 = idx(n.t_off) + half
+        k_end = min(idx(n.t_next), len(env)) - half
+        if not busy(n, n.t_off, n.t_next) and k_end - k0 >= min_len:
+            l_off = float(env[k0])
+            stop = max(l_off - 30.0, floor_db + 6.0)
+            if l_off - stop >= 3.0:
+                k1 = k0 + _first(env[k0:k_end] <= stop)
+                if k1 - k0 >= min_len:
+                    meas = _slope(env, fs, k0, k1)
+                    out["release"] = _check_rel(-n.rel_steps * DB_PER_STEP, meas, tol)
+    return out, "ok"
+
+
+def overlap_test(notes):
+    """busy(note, t0, t1): does another channel sound between t0 and t1?"""
+    spans = [(n, n.t_on, n.t_quiet()) for n in notes]
+
+    def busy(note, t0, t1):
+        return any(m.ch != note.ch and a < t1 and t0 < b for m, a, b in spans)
+    return busy
+
+
+def level_checks(notes, results, tol_db):
+    """Peak level vs. the first note with the same instrument / block / F-number."""
+    ref = {}
+    for n, (res, _) in zip(notes, results):
+        if res["peak"] is None:
+            res["level"] = NOT_MEASURED
+            continue
+        key = (n.inst, n.block, n.fnum)
+        if key not in ref:
+            ref[key] = (n, res["peak"])
+            res["level"] = (0.0, 0.0, "ref")
+            continue
+        r, l_ref = ref[key]
+        exp = -3.0 * (n.vol - r.vol)
+        meas = res["peak"] - l_ref
+        res["level"] = (exp, meas, "ok" if abs(meas - exp) <= tol_db else "FAIL")
+
+
+def load_audio(path):
+    """(samples, fs, time of sample 0 on the log clock in seconds)."""
+    if Path(path).suffix.lower() == ".wav":
+        x, fs = read_wav(path)
+        return x, fs, 0.0
+    vals, times = load_acc_with_time(path, raw_ps=True)
+    # 中央値間隔はバースト内の EMUCLK 間隔になるので、平均レコードレートを使う
+    clock = clock_recovery.recover_clock(times) if len(vals) >= 2 else None
+    if clock is None:
+        raise ValueError(f"{path}: no timed ACC records")
+    return np.asarray(vals, dtype=np.float64), clock["fs_hz"], clock["start_ps"] * 1e-12
+
+
+QUANTITIES = ("attack", "decay", "sustain", "release", "level")
+UNITS = {"attack": "ms", "decay": "dB/s", "sustain": "dB", "release": "dB/s", "level": "dB"}
+
+
+def _fmt(q):
+    exp, meas, status = q
+    if exp is None:
+        return f"{'-':>17}"
+    mark = "!" if status == "FAIL" else " "
+    return f"{exp:8.1f}/{meas:8.1f}{mark}"
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Check envelope timing and levels of rendered audio against the register timeline."
+    )
+    ap.add_argument("stimulus", help="register CSV, .ymev or VGM")
+    ap.add_argument("audio", help="rendered WAV, or samples_acc.txt")
+    ap.add_argument("--win", type=float, default=0.01,
+                    help="envelope follower window in seconds (default: 0.01)")
+    ap.add_argument("--tol", type=float, default=0.25,
+                    help="allowed relative error of times and rates (default: 0.25)")
+    ap.add_argument("--tol-db", type=float, default=1.5,
+                    help="allowed error of levels in dB (default: 1.5)")
+    ap.add_argument("--offset", type=float, default=0.0,
+                    help="audio / log time of the first VGM sample in seconds (default: 0)")
+    ap.add_argument("--report", default=None, help="write the per-note table as CSV")
+    ap.add_argument("-q", "--quiet", action="store_true", help="print failures and the summary only")
+    args = ap.parse_args(argv)
+
+    with metrics.stage("parse") as st:
+        try:
+            writes, _ = stimulus_writes(args.stimulus)
+            x, fs, t0 = load_audio(args.audio)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] {e}", file=sys.stderr)
+            return 2
+        st.count(len(x), "samples")
+    t_first = t0 - args.offset
+    notes = expected_notes(writes, t_end=t_first + len(x) / fs)
+    if not notes:
+        print("[ERROR] no melodic key-on in the stimulus", file=sys.stderr)
+        return 2
+    print(f"[INFO] {len(notes)} notes, audio {len(x) / fs:.3f} s at {fs:.1f} Hz")
+
+    with metrics.stage("filter") as st:
+        env = envelope_db(x, fs, args.win)
+        st.count(len(x), "samples")
+        st.note(notes=len(notes), win_s=args.win)
+    floor_db = float(np.percentile(env, 1))
+    busy = overlap_test(notes)
+    results = [measure_note(n, env, fs, t_first, args.win, floor_db, busy, args.tol, args.tol_db)
+               for n in notes]
+    level_checks(notes, results, args.tol_db)
+
+    n_fail = 0
+    checked = {q: 0 for q in QUANTITIES}
+    failed = {q: 0 for q in QUANTITIES}
+    if not args.quiet:
+        print(f"[INFO] {'time':>8} ch ins vol  " +
+              "  ".join(f"{q + ' ' + UNITS[q]:>18}" for q in QUANTITIES) + "  (expected/measured)")
+    for n, (res, status) in zip(notes, results):
+        bad = [q for q in QUANTITIES if res[q][2] == "FAIL"]
+        for q in QUANTITIES:
+            if res[q][2] in ("ok", "FAIL"):
+                checked[q] += 1
+            if res[q][2] == "FAIL":
+                failed[q] += 1
+        if bad:
+            n_fail += 1
+            status = "FAIL"
+        if args.quiet and not bad:
+            continue
+        print(f"{n.t_on:15.3f} {n.ch:2d} {n.inst:3d} {n.vol:3d}  " +
+              "  ".join(f"{_fmt(res[q]):>18}" for q in QUANTITIES) + f"  {status}")
+
+    if args.report:
+        with open(args.report, "w", newline="") as f_out:
+            w = csv.writer(f_out)
+            w.writerow(["t_on", "t_off", "ch", "inst", "vol", "block", "fnum", "ar", "dr", "sl", "rr", "egt"] +
+                       [f"{q}_{s}" for q in QUANTITIES for s in ("expected", "measured", "status")])
+            for n, (res, _) in zip(notes, results):
+                row = [f"{n.t_on:.6f}", "" if n.t_off is None else f"{n.t_off:.6f}", n.ch, n.inst, n.vol,
+                       n.block, n.fnum, n.ar, n.dr, n.sl, n.rr, n.egt]
+                for q in QUANTITIES:
+                    exp, meas, status = res[q]
+                    row += ["" if exp is None else f"{exp:.3f}", "" if meas is None else f"{meas:.3f}", status]
+                w.writerow(row)
+        metrics.add_output(args.report)
+        print(f"[INFO] Wrote report: {args.report}")
+
+    print("[INFO] checked: " + ", ".join(f"{q} {checked[q]} ({failed[q]} failed)" for q in QUANTITIES))
+    print(f"[INFO] {n_fail} of {len(notes)} notes outside tolerance "
+          f"(±{args.tol:.0%}, ±{args.tol_db:g} dB)")
+    return 1 if n_fail else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+gap_log.py
+
+Reader for gaps.txt, written by IKAOPLL_vgm_tb.sv when it runs with
++SKIP_GAPS, and helpers that put the skipped silence back into the logs
+so that WAVs keep the song's timing.
+
+    # dur_idx acc_idx n_dur n_acc skipped_ps time_ps
+    1234 87654 2449 2449 4926000000 123456789000
+
+  dur_idx    : duration in progress when the wait was shortened
+  acc_idx    : number of samples_acc.txt records written before the skip
+  n_dur      : skipped durations
+  n_acc      : skipped ACC records (n_dur * ACC records per duration)
+  skipped_ps : skipped simulated time
+  time_ps    : simulation time of the skip (without earlier skips)
+
+Indices refer to the logs as written, i.e. without earlier gaps.  The TB
+only skips when the output has been constant for +SILENCE_DUR durations,
+so the value just before a gap is repeated for its whole length.
+gaps.txt is looked up next to the log; if it is missing, nothing changes.
+"""
+
+from bisect import bisect_right
+from collections import namedtuple
+from pathlib import Path
+
+Gap = namedtuple("Gap", "dur_idx acc_idx n_dur n_acc skipped_ps time_ps")
+
+GAPS_NAME = "gaps.txt"
+
+
+def gaps_path(log_path):
+    return Path(log_path).parent / GAPS_NAME
+
+
+def load_gaps(log_path):
+    """gaps.txt next to log_path → [Gap, ...] in log order ([] if none)."""
+    path = gaps_path(log_path)
+    if not path.is_file():
+        return []
+    gaps = []
+    with open(path) as f:
+        for lineno, line in enumerate(f, 1):
+            s = line.strip()
+            if not s or s.startswith("#"):
+                continue
+            try:
+                gap = Gap(*(int(x) for x in s.split()[:6]))
+            except (TypeError, ValueError):
+                print(f"[WARN] {path}: skip line {lineno}: {s}")
+                continue
+            gaps.append(gap)
+    if gaps:
+        n_dur = sum(g.n_dur for g in gaps)
+        ms = sum(g.skipped_ps for g in gaps) * 1e-9
+        print(f"[INFO] {path}: reinserting {len(gaps)} skipped gaps "
+              f"({n_dur} durations, {ms:.3f} ms)")
+    return gaps
+
+
+def shift_gaps(gaps, acc0=None, acc1=None, dur0=None, dur1=None):
+    """Gaps inside a window of the log, indices relative to the window.
+
+    acc0/acc1: ACC record range of a samples_acc.txt window,
+    dur0/dur1: dur_idx range of a samples_mo.txt window (end exclusive).
+    """
+    out = []
+    for g in gaps:
+        if acc0 is not None and not acc0 < g.acc_idx <= acc1:
+            continue
+        if dur0 is not None and not dur0 <= g.dur_idx < dur1:
+            continue
+        out.append(g._replace(acc_idx=g.acc_idx - (acc0 or 0),
+                              dur_idx=g.dur_idx - (dur0 or 0)))
+    return out
+
+
+def _insert(vals, cuts):
+    """cuts: [(position, count)] ascending → vals with vals[pos-1] repeated.
+
+    A gap before the first entry has nothing to repeat and is dropped.
+    """
+    out = []
+    prev = 0
+    for pos, n in cuts:
+        pos = min(pos, len(vals))
+        out.extend(vals[prev:pos])
+        if pos > 0:
+            out.extend([vals[pos - 1]] * n)
+        prev = pos
+    out.extend(vals[prev:])
+    return out
+
+
+def fill_per_duration(vals, gaps, keys=None):
+    """Per-duration series (e.g. averaged MO) with the skipped durations.
+
+    keys=None : vals[i] belongs to dur_idx i (dense)
+    keys=[..] : dur_idx of every entry (sparse, ascending)
+    """
+    if not gaps:
+        return vals
+    if keys is None:
+        cuts = [(g.dur_idx + 1, g.n_dur) for g in gaps]
+    else:
+        cuts = [(bisect_right(keys, g.dur_idx), g.n_dur) for g in gaps]
+    return _insert(vals, cuts)
+
+
+def fill_acc(vals, gaps):
+    """samples_acc.txt values with the skipped ACC records."""
+    if not gaps:
+        return vals
+    return _insert(vals, [(g.acc_idx, g.n_acc) for g in gaps])
+
+
+def fill_acc_times(vals, times_ps, gaps):
+    """(vals, times_ps) with the skipped records.
+
+    Inserted records are spaced skipped_ps / n_acc apart; every later
+    record is shifted by the time skipped so far.
+    """
+    if not gaps:
+        return vals, times_ps
+    out_v = []
+    out_t = []
+    prev = 0
+    shift = 0
+    for g in gaps:
+        pos = min(g.acc_idx, len(vals))
+        out_v.extend(vals[prev:pos])
+        out_t.extend(t + shift for t in times_ps[prev:pos])
+        if pos > 0 and g.n_acc > 0:
+            v0 = vals[pos - 1]
+            t0 = times_ps[pos - 1] + shift
+            step = g.skipped_ps / g.n_acc
+            out_v.extend([v0] * g.n_acc)
+            out_t.extend(t0 + int(round(k * step)) for k in range(1, g.n_acc + 1))
+        shift += g.skipped_ps
+        prev = pos
+    out_v.extend(vals[prev:])
+    out_t.extend(t + shift for t in times_ps[prev:])
+    return out_v, out_t
+
+
+def fill_acc_blocks(blocks, gaps):
+    """Streaming fill_acc() for block iterators (make_ref_wav CIC path)."""
+    pending = sorted(gaps, key=lambda g: g.acc_idx)
+    i = 0
+    seen = 0
+    last = None
+    for block in blocks:
+        end = seen + len(block)
+        if i < len(pending) and pending[i].acc_idx <= end:
+            out = []
+            prev = 0
+            while i < len(pending) and pending[i].acc_idx <= end:
+                g = pending[i]
+                pos = g.acc_idx - seen
+                out.extend(block[prev:pos])
+                fill = block[pos - 1] if pos > 0 else last
+                if fill is not None:
+                    out.extend([fill] * g.n_acc)
+                prev = pos
+                i += 1
+            out.extend(block[prev:])
+            block = out
+        if block:
+            last = block[-1]
+        seen = end
+        yield block
+    # ログが途中で切れていても fill_acc() と同じく末尾に足す
+    tail = sum(g.n_acc for g in pending[i:])
+    if tail and last is not None:
+        yield [last] * tail
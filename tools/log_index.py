@@ -0,0 +1,464 @@
+#!/usr/bin/env python3
+"""
+log_index.py
+
+Sidecar time index for the testbench text logs, and windowed reads.
+
+    samples_acc.txt  "value time_ps"
+    samples_mo.txt   "dur_idx value time_ps [path]"
+    durations.txt    "dur_idx start_ps end_ps"
+
+<log>.idx records, for every --every-th line (default 4096), the line
+number, its byte offset, time_ps and (MO / durations logs) dur_idx.  It
+is written once, in a single streaming pass, and rebuilt automatically
+when the log's size or mtime changes.
+
+A window --start/--end is given in seconds of log time ("12.5" or
+"12.5s") or in duration indices ("600000d").  ACC logs have no dur_idx
+column; for them a duration index is converted through durations.txt
+next to the log (indexed as well).  The window is located by a binary
+search in the index and a scan of at most --every lines from the
+preceding entry, on an mmap of the log, so only the window itself is
+read and parsed.
+
+Log time is the time_ps column as written.  With +SKIP_GAPS the skipped
+silence is not part of it; gaps inside the window are re-inserted
+(gaps.txt indices are shifted to the window), gaps before it are not.
+Windowed MO reads start dur_idx at 0 at the window start.
+
+Index file layout (little endian): magic b"IKLI", u32 version, u32 kind,
+u32 every, u64 n_records, u64 log size, u64 log mtime_ns, u64 n_entries,
+then n_entries x int64 for each of line, offset, time_ps, dur_idx.
+
+Usage:
+  python3 log_index.py samples_acc.txt samples_mo.txt durations.txt
+  python3 make_ref_wav.py samples_mo.txt samples_acc.txt --start 12.0 --end 22.0
+  python3 acc_to_wav.py samples_acc.txt win.wav --start 600000d --end 1097000d
+"""
+
+from __future__ import annotations
+
+import argparse
+import bisect
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from pathlib import Path
+
+import gap_log
+import metrics
+
+try:
+    import numpy as np
+except ImportError:  # NumPy は任意（索引作成が遅くなるだけ）
+    np = None
+
+INDEX_SUFFIX = ".idx"
+MAGIC = b"IKLI"
+VERSION = 1
+DEFAULT_EVERY = 4096
+READ_BLOCK = 1 << 24
+END = 1 << 62                   # 「ログの終わりまで」を表す番兵
+
+KINDS = ("acc", "mo", "dur")
+# 種別ごとの (time_ps 列, dur_idx 列)
+COLUMNS = {
+    "acc": (1, None),
+    "mo": (2, 0),
+    "dur": (1, 0),
+}
+_HEADER = struct.Struct("<4sIIIQQQQ")
+
+Index = namedtuple("Index", "kind every n_records size mtime_ns line offset time_ps dur_idx")
+Span = namedtuple("Span", "off0 off1 line0 line1 dur0 dur1")
+
+# 1 回の実行で同じ窓を何度も解決しないためのキャッシュ
+_spans = {}
+
+
+def guess_kind(path):
+    """Same rule as clock_recovery.guess_kind()."""
+    name = Path(path).name.lower()
+    if "dur" in name:
+        return "dur"
+    if "mo" in name:
+        return "mo"
+    return "acc"
+
+
+def index_path(log_path):
+    return Path(str(log_path) + INDEX_SUFFIX)
+
+
+# ----------------------------------------------------------------------
+# Window arguments
+# ----------------------------------------------------------------------
+Window = namedtuple("Window", "start end")      # 各端は (値, "s" | "d") または None
+
+
+def parse_bound(s):
+    """'12.5' / '12.5s' -> (12.5, 's'); '600000d' -> (600000, 'd')."""
+    s = s.strip().lower()
+    try:
+        if s.endswith("d"):
+            return int(s[:-1]), "d"
+        return float(s[:-1] if s.endswith("s") else s), "s"
+    except ValueError:
+        raise ValueError(f"bad window bound {s!r} (seconds, e.g. 12.5, or "
+                         "a duration index, e.g. 600000d)") from None
+
+
+def make_window(start=None, end=None):
+    if start is None and end is None:
+        return None
+    return Window(parse_bound(start) if start is not None else None,
+                  parse_bound(end) if end is not None else None)
+
+
+def add_window_args(ap):
+    ap.add_argument("--start", default=None,
+                    help="window start: seconds of log time (12.5) or duration index (600000d)")
+    ap.add_argument("--end", default=None,
+                    help="window end (exclusive), same units as --start")
+
+
+def window_from_args(args):
+    return make_window(args.start, args.end)
+
+
+def pop_window_args(argv):
+    """For sys.argv-style tools: remove --start/--end from argv.
+
+    Returns (remaining argv, Window or None); raises ValueError on a bad
+    bound.
+    """
+    rest = []
+    vals = {}
+    it = iter(argv)
+    for a in it:
+        name, eq, v = a.partition("=")
+        if name in ("--start", "--end"):
+            if not eq:
+                v = next(it, None)
+                if v is None:
+                    raise ValueError(f"{name} needs a value")
+            vals[name[2:]] = v
+        else:
+            rest.append(a)
+    return rest, make_window(vals.get("start"), vals.get("end"))
+
+
+# ----------------------------------------------------------------------
+# Index
+# ----------------------------------------------------------------------
+def _int_field(parts, col):
+    if col is None or len(parts) <= col:
+        return -1
+    try:
+        return int(parts[col])
+    except ValueError:
+        return -1
+
+
+def _newlines_np(buf):
+    """Offsets (in buf) of the newline characters."""
+    return np.flatnonzero(np.frombuffer(buf, dtype=np.uint8) == 10).tolist()
+
+
+def _newlines_py(buf):
+    out = []
+    p = buf.find(b"\n")
+    while p >= 0:
+        out.append(p)
+        p = buf.find(b"\n", p + 1)
+    return out
+
+
+def build_index(path, every=DEFAULT_EVERY):
+    """Scan the log once and write <log>.idx; returns the Index."""
+    kind = guess_kind(path)
+    tcol, dcol = COLUMNS[kind]
+    st = os.stat(path)
+    line = array("q")
+    offset = array("q")
+    tps = array("q")
+    dur = array("q")
+    newlines = _newlines_np if np is not None else _newlines_py
+
+    def add(n, off, text):
+        parts = text.split()
+        line.append(n)
+        offset.append(off)
+        tps.append(_int_field(parts, tcol))
+        dur.append(_int_field(parts, dcol))
+
+    n = 0           # 読み終えた行数
+    pos = 0         # carry の先頭のファイル内オフセット
+    carry = b""
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(READ_BLOCK)
+            if not block:
+                break
+            buf = carry + block
+            nl = newlines(buf)
+            k = (-n) % every
+            while k < len(nl):
+                s = nl[k - 1] + 1 if k > 0 else 0
+                add(n + k, pos + s, buf[s:nl[k]])
+                k += every
+            if nl:
+                n += len(nl)
+                carry = buf[nl[-1] + 1:]
+                pos += nl[-1] + 1
+            else:
+                carry = buf
+    if carry.strip():
+        if n % every == 0:
+            add(n, pos, carry)
+        n += 1
+
+    # 'x' などで読めなかった時刻は直前の値で埋める（単調非減少を保つ）
+    for col in (tps, dur):
+        prev = 0
+        for i, v in enumerate(col):
+            if v < 0:
+                col[i] = prev
+            else:
+                prev = v
+
+    idx = Index(kind, every, n, st.st_size, st.st_mtime_ns, line, offset, tps, dur)
+    tmp = index_path(path).with_suffix(".idx.tmp")
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, KINDS.index(kind), every, n,
+                             st.st_size, st.st_mtime_ns, len(line)))
+        for col in (line, offset, tps, dur):
+            if sys.byteorder != "little":
+                col = array("q", col)
+                col.byteswap()
+            col.tofile(f)
+    os.replace(tmp, index_path(path))
+    metrics.add_output(index_path(path))
+    return idx
+
+
+def load_index(path):
+    """The Index of `path`, or None if it is missing or stale."""
+    p = index_path(path)
+    if not p.is_file():
+        return None
+    try:
+        st = os.stat(path)
+        with open(p, "rb") as f:
+            head = f.read(_HEADER.size)
+            magic, ver, kind, every, n, size, mtime, n_ent = _HEADER.unpack(head)
+            if magic != MAGIC or ver != VERSION or size != st.st_size or mtime != st.st_mtime_ns:
+                return None
+            cols = []
+            for _ in range(4):
+                a = array("q")
+                a.fromfile(f, n_ent)
+                if sys.byteorder != "little":
+                    a.byteswap()
+                cols.append(a)
+    except (OSError, struct.error, EOFError):
+        return None
+    return Index(KINDS[kind], every, n, size, mtime, *cols)
+
+
+def get_index(path, every=DEFAULT_EVERY):
+    idx = load_index(path)
+    if idx is None:
+        with metrics.stage("index") as st:
+            idx = build_index(path, every)
+            st.count(idx.n_records, "records")
+        print(f"[INFO] indexed {path}: {idx.n_records} records, "
+              f"{len(idx.line)} entries -> {index_path(path)}")
+    return idx
+
+
+# ----------------------------------------------------------------------
+# Window lookup
+# ----------------------------------------------------------------------
+def _scan(mm, idx, col, target):
+    """(offset, line number) of the first line whose `col` >= target."""
+    keys = idx.time_ps if col == COLUMNS[idx.kind][0] else idx.dur_idx
+    i = bisect.bisect_left(keys, target) - 1
+    if i < 0:
+        return 0, 0
+    off, n = idx.offset[i], idx.line[i]
+    size = len(mm)
+    while off < size:
+        end = mm.find(b"\n", off)
+        if end < 0:
+            end = size
+        v = _int_field(mm[off:end].split(), col)
+        if v >= target:
+            return off, n
+        off, n = end + 1, n + 1
+    return size, idx.n_records
+
+
+def _field_at(mm, off, col):
+    end = mm.find(b"\n", off)
+    return _int_field(mm[off:end if end >= 0 else len(mm)].split(), col)
+
+
+def _bound_to_target(path, idx, bound):
+    """(column, value) for one window bound on this log."""
+    value, unit = bound
+    tcol, dcol = COLUMNS[idx.kind]
+    if unit == "s":
+        return tcol, int(round(value * 1e12))
+    if dcol is not None:
+        return dcol, int(value)
+    # ACC ログは durations.txt で duration 番号を時刻に直す
+    dur_log = Path(path).parent / "durations.txt"
+    if not dur_log.is_file() or dur_log.stat().st_size == 0:
+        raise ValueError(f"{path}: duration indices need {dur_log}")
+    didx = get_index(dur_log)
+    with open(dur_log, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            off, _ = _scan(mm, didx, 0, int(value))
+            if off >= len(mm):
+                return tcol, END
+            return tcol, _field_at(mm, off, 1)
+
+
+def resolve_window(path, window):
+    """Span (byte range, line range, dur_idx range) of `window` in the log."""
+    key = (str(Path(path).resolve()), window)
+    if key in _spans:
+        return _spans[key]
+    idx = get_index(path)
+    dcol = COLUMNS[idx.kind][1]
+    with open(path, "rb") as f:
+        if idx.size == 0:
+            span = Span(0, 0, 0, 0, 0, 0)
+        else:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                off0, n0 = (0, 0) if window.start is None else _scan(
+                    mm, idx, *_bound_to_target(path, idx, window.start))
+                off1, n1 = (len(mm), idx.n_records) if window.end is None else _scan(
+                    mm, idx, *_bound_to_target(path, idx, window.end))
+                off1, n1 = max(off0, off1), max(n0, n1)
+                d0, d1 = 0, END
+                if dcol is not None:
+                    if off0 < len(mm):
+                        d0 = max(0, _field_at(mm, off0, dcol))
+                    if off1 < len(mm):
+                        d1 = _field_at(mm, off1, dcol)
+                span = Span(off0, off1, n0, n1, d0, d1)
+    _spans[key] = span
+    return span
+
+
+def iter_blocks(path, window=None, size=None):
+    """(line number of the first line, bytes) of about `size` bytes each.
+
+    Every block ends at a line boundary, so it can be parsed on its own;
+    the whole log (or window) is never held in memory at once.
+    """
+    if window is None:
+        off, end, line = 0, None, 0
+    else:
+        span = resolve_window(path, window)
+        off, end, line = span.off0, span.off1, span.line0
+    size = size or READ_BLOCK
+    carry = b""
+    with open(path, "rb") as f:
+        f.seek(off)
+        while True:
+            n = size if end is None else min(size, end - off)
+            chunk = f.read(n) if n > 0 else b""
+            off += len(chunk)
+            if not chunk:
+                break
+            buf = carry + chunk
+            cut = buf.rfind(b"\n") + 1
+            if cut == 0:
+                carry = buf
+                continue
+            yield line, buf[:cut]
+            line += buf.count(b"\n", 0, cut)
+            carry = buf[cut:]
+    if carry:
+        yield line, carry
+
+
+def iter_lines(path, window=None):
+    """(line number, text) of the log, or of the window only."""
+    if window is None:
+        with open(path) as f:
+            yield from enumerate(f, 1)
+        return
+    for line0, block in iter_blocks(path, window):
+        yield from enumerate(block.decode().splitlines(), line0 + 1)
+
+
+def load_gaps(path, window=None):
+    """gap_log.load_gaps(), restricted and shifted to the window."""
+    gaps = gap_log.load_gaps(path)
+    if window is None or not gaps:
+        return gaps
+    span = resolve_window(path, window)
+    if guess_kind(path) == "acc":
+        return gap_log.shift_gaps(gaps, acc0=span.line0, acc1=span.line1)
+    return gap_log.shift_gaps(gaps, dur0=span.dur0, dur1=span.dur1)
+
+
+def describe(window):
+    def one(b):
+        return "-" if b is None else (f"{b[0]}d" if b[1] == "d" else f"{b[0]:g} s")
+    return f"{one(window.start)} .. {one(window.end)}"
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Build sidecar time indexes (<log>.idx) for TB text logs."
+    )
+    ap.add_argument("logs", nargs="+", help="samples_acc.txt / samples_mo.txt / durations.txt")
+    ap.add_argument("--every", type=int, default=DEFAULT_EVERY,
+                    help=f"lines per index entry (default: {DEFAULT_EVERY})")
+    ap.add_argument("--force", action="store_true", help="rebuild even if up to date")
+    add_window_args(ap)
+    args = ap.parse_args(argv)
+    try:
+        window = window_from_args(args)
+    except ValueError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 1
+
+    for p in args.logs:
+        if not Path(p).is_file():
+            print(f"[ERROR] No such file: {p}", file=sys.stderr)
+            return 1
+        idx = None if args.force else load_index(p)
+        if idx is None or idx.every != args.every:
+            with metrics.stage("index") as st:
+                idx = build_index(p, args.every)
+                st.count(idx.n_records, "records")
+            print(f"[INFO] indexed {p}: {idx.n_records} records, {len(idx.line)} entries")
+        else:
+            print(f"[INFO] {p}: index up to date ({idx.n_records} records)")
+        if len(idx.time_ps):
+            print(f"[INFO]   time {idx.time_ps[0] * 1e-12:.6f} .. "
+                  f"{idx.time_ps[-1] * 1e-12:.6f} s"
+                  + (f", dur_idx {idx.dur_idx[0]} .. {idx.dur_idx[-1]}"
+                     if COLUMNS[idx.kind][1] is not None else ""))
+        if window is not None:
+            try:
+                span = resolve_window(p, window)
+            except ValueError as e:
+                print(f"[ERROR] {e}", file=sys.stderr)
+                return 1
+            print(f"[INFO]   window {describe(window)}: lines {span.line0 + 1}..{span.line1}, "
+                  f"bytes {span.off0}..{span.off1}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
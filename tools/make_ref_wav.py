@@ -5,188 +5,200 @@ make_ref_wav.py
 Generate reference WAV files from IKAOPLL_vgm_tb.sv logs.
 
 Inputs (produced by the testbench):
-  - samples_mo.txt   : "dur_idx value time_ps"
+  - samples_mo.txt   : "dur_idx value time_ps [path]" (path 0 = MO, 1 = RO)
   - samples_acc.txt  : "value" or "value time_ps" (leading 'x' lines ignored)
 
 Outputs (by default):
   - mo_ref_44k1.wav      : Mo-based reference (duration-averaged, smoothed)
-  - acc_ref_44k1.wav     : ACC-based reference (decimated from internal Fs)
+  - ro_ref_44k1.wav,
+    mix_ref_44k1.wav     : same for the rhythm (RO) path and the MO+RO mix,
+                           written when the log has RO records
+  - acc_ref_44k1.wav     : ACC-based reference (decimated from internal Fs;
+                           --acc-mode cic gives a bit-exact integer CIC path)
+
+--start/--end restrict both paths to a window of the logs (seconds or
+duration indices, see log_index.py); only the window is read.
 """
 
-import sys
-import wave
-import struct
-import math
-from pathlib import Path
+import argparse
+
+import acc_log
+import gap_log
+import log_index
+import metrics
+from box_filter import cascaded_moving_average, moving_average
+from cic_decimator import CicDecimator, normalize_int
+from mo_ro_log import average_by_duration, load_dac_log, mix_paths, path_counts
+from wav_writer import SAMPLE_FORMATS, full_scale, normalize_to_format, write_wav
+
+try:
+    import parallel_filter
+except ImportError:  # NumPy が無ければ単一プロセスのみ
+    parallel_filter = None
+
+try:
+    import clock_recovery
+except ImportError:  # NumPy が無ければ固定レート
+    clock_recovery = None
+
+# 時刻列から Fs を復元できないときの既定値
+DEFAULT_FS_MO = 44_100.0
+DEFAULT_FS_INT = 1_600_000.0
+# --acc-mode cic の固定 Fs_int: TB の ACC レコードレート（36 レコード / 72 EMUCLK
+# = EMUCLK / 2、clock_recovery.ACC_FS_HZ_INT と同じ値）。ログから復元した値は
+# 使わないので、WAV ヘッダもハッシュも入力だけで決まる
+ACC_FS_CIC = 1_789_805
+
+
+def resolve_fs(fs, path, kind, default, tag, window=None):
+    """fs が None ならログの時刻列から復元する。(fs, clock_info) を返す。"""
+    if fs is not None or clock_recovery is None:
+        return (default if fs is None else fs), None
+    with metrics.stage("recover_clock"):
+        if kind == "mo":
+            clock = clock_recovery.recover_mo_duration_rate(path, window)
+        else:
+            clock = clock_recovery.recover_from_log(path, col=1, window=window)
+    clock_recovery.print_clock(clock, tag)
+    if clock is None:
+        return default, None
+    return clock["fs_hz"], clock
 
 
-# ----------------------------------------------------------------------
-# Helper: write int16 mono WAV
-# ----------------------------------------------------------------------
-def write_wav(path, samples, fs):
-    path = Path(path)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    with wave.open(str(path), "wb") as w:
-        w.setnchannels(1)
-        w.setsampwidth(2)
-        w.setframerate(int(fs))
-        data = b"".join(
-            struct.pack("<h", max(-32768, min(32767, int(s))))
-            for s in samples
-        )
-        w.writeframes(data)
-
-
-def normalize_to_int16(samples):
-    if not samples:
-        return []
-    peak = max(abs(float(v)) for v in samples)
-    if peak == 0:
-        return [0] * len(samples)
-    scale = 0.9 * 32767.0 / peak
-    print(f"[INFO] peak={peak}, scale={scale}")
-    return [int(round(v * scale)) for v in samples]
+def write_clock_sidecar(out_wav, clock, **extra):
+    if clock is not None:
+        clock_recovery.write_clock_metadata(out_wav, clock, **extra)
 
 
 # ----------------------------------------------------------------------
-# Mo path: avg_mo_by_duration + avg_mo_to_wav 相当
+# Mo path: avg_mo_by_duration + avg_mo_to_wav 相当（MO / RO / mix）
 # ----------------------------------------------------------------------
-def load_avg_mo_by_duration_from_samples_mo(path):
+def load_avg_by_duration_from_samples_mo(path, window=None):
     """
-    samples_mo.txt: "dur_idx value time_ps"
-    → duration idx ごとに value を平均する
+    samples_mo.txt: "dur_idx value time_ps [path]"
+    → 1 回の読み込みで MO / RO を duration idx ごとに平均する
+
+    Returns ({"MO": [...], "RO": [...]}, has_ro, (dur_idx, time_ps) columns).
     """
-    per_dur = {}
-    with open(path) as f:
-        for lineno, line in enumerate(f, 1):
-            s = line.strip()
-            if not s:
-                continue
-            parts = s.split()
-            if len(parts) < 2:
-                print(f"[WARN] [Mo] skip line {lineno}: {s}")
-                continue
-            try:
-                dur_idx = int(parts[0])
-                mo_val  = int(parts[1])
-            except ValueError:
-                print(f"[WARN] [Mo] skip line {lineno}: {s}")
-                continue
-            if dur_idx not in per_dur:
-                per_dur[dur_idx] = [0, 0]  # sum, cnt
-            per_dur[dur_idx][0] += mo_val
-            per_dur[dur_idx][1] += 1
-
-    if not per_dur:
-        return []
-
-    max_idx = max(per_dur.keys())
-    avg = []
-    for i in range(max_idx + 1):
-        if i in per_dur and per_dur[i][1] > 0:
-            avg.append(per_dur[i][0] / per_dur[i][1])
-        else:
-            avg.append(0.0)
-    print(f"[INFO] [Mo] durations with samples : {len(per_dur)}")
-    print(f"[INFO] [Mo] first dur_idx: 0, last dur_idx: {max_idx}")
-    return avg
-
-
-def moving_average(samples, window):
-    if window <= 1 or not samples:
-        return samples[:]
-    n = len(samples)
-    out = [0.0] * n
-    w = int(window)
-    half = w // 2
-    for i in range(n):
-        start = max(0, i - half)
-        end   = min(n - 1, i + half)
-        length = end - start + 1
-        acc = 0.0
-        for j in range(start, end + 1):
-            acc += samples[j]
-        out[i] = acc / length
-    return out
+    with metrics.stage("parse") as st:
+        dur, val, tps, pth = load_dac_log(path, window)
+        st.count(len(dur), "records")
+    if len(dur) == 0:
+        return {}, False, None
+    with metrics.stage("average") as st:
+        keys, avg = average_by_duration(dur, val, pth, dense=True)
+        st.count(len(keys), "durations")
+    gaps = log_index.load_gaps(path, window)
+    if gaps:
+        avg = {name: gap_log.fill_per_duration(v, gaps) for name, v in avg.items()}
+    n_mo, n_ro = path_counts(pth)
+    has_ro = n_ro > 0
+    print(f"[INFO] [Mo] records: {len(dur)} (MO {n_mo}, RO {n_ro})")
+    print(f"[INFO] [Mo] first dur_idx: 0, last dur_idx: {keys[-1]}")
+    return avg, has_ro, (dur, tps)
+
+
+def load_avg_mo_by_duration_from_samples_mo(path):
+    """MO だけの duration 平均（従来の API）。"""
+    avg, _, _ = load_avg_by_duration_from_samples_mo(path)
+    return avg.get("MO", [])
+
+
+def resolve_mo_fs(fs, cols, path):
+    """resolve_fs() の Mo 版。読み込み済みの列から復元する（ログを読み直さない）。"""
+    if fs is not None or clock_recovery is None or cols is None or cols[1][0] < 0:
+        return (DEFAULT_FS_MO if fs is None else fs), None
+    with metrics.stage("recover_clock"):
+        clock = clock_recovery.recover_duration_rate_from_columns(*cols, source=path)
+    clock_recovery.print_clock(clock, "[Mo] ")
+    if clock is None:
+        return DEFAULT_FS_MO, None
+    return clock["fs_hz"], clock
 
 
 def make_mo_ref_wav(samples_mo_txt, out_wav="mo_ref_44k1.wav",
-                    fs_out=44100.0, ma_window=15):
-    avg = load_avg_mo_by_duration_from_samples_mo(samples_mo_txt)
+                    fs_out=None, ma_window=15, sample_format="int16",
+                    ro_wav="ro_ref_44k1.wav", mix_wav="mix_ref_44k1.wav",
+                    window=None):
+    """fs_out=None: one sample per duration, rate recovered from time_ps.
+
+    If the log has RO (rhythm) records, ro_wav and mix_wav are written as
+    well (pass None to skip either).  All three come from a single read.
+    """
+    avg, has_ro, cols = load_avg_by_duration_from_samples_mo(samples_mo_txt, window)
     if not avg:
         print("[WARN] [Mo] no data, skip WAV generation")
         return
-    print(f"[INFO] [Mo] loaded {len(avg)} averaged Mo samples")
-
+    fs_out, clock = resolve_mo_fs(fs_out, cols, samples_mo_txt)
+    print(f"[INFO] [Mo] loaded {len(avg['MO'])} averaged samples per path")
     print(f"[INFO] [Mo] moving average window = {ma_window}")
-    smoothed = moving_average(avg, ma_window)
 
-    int16_samples = normalize_to_int16(smoothed)
-    write_wav(out_wav, int16_samples, fs_out)
-    print(f"[INFO] [Mo] wrote WAV: {out_wav} (Fs={fs_out} Hz)")
+    outputs = [("MO", avg["MO"], out_wav)]
+    if has_ro:
+        outputs.append(("RO", avg["RO"], ro_wav))
+        outputs.append(("mix", mix_paths(avg["MO"], avg["RO"]), mix_wav))
+    for name, series, path in outputs:
+        if path is None:
+            continue
+        with metrics.stage("filter") as st:
+            smoothed = moving_average(series, ma_window)
+            st.count(len(series), "samples")
+            st.note(dac_path=name)
+        with metrics.stage("normalize"):
+            pcm = normalize_to_format(smoothed, sample_format)
+        write_wav(path, pcm, fs_out, sample_format)
+        write_clock_sidecar(path, clock, wav_fs_hz=int(fs_out), dac_path=name)
+        print(f"[INFO] [Mo] wrote {name} WAV: {path} (Fs={fs_out} Hz)")
 
 
 # ----------------------------------------------------------------------
 # ACC path: acc_decimate_to_wav 相当
 # ----------------------------------------------------------------------
-def load_acc_values(path):
-    """
-    samples_acc.txt から ACC 値だけを読み込む。
-    - 行が 1 列: その値だけを読む
-    - 行が 2 列以上: 先頭の列を値として読む
-    - 'x' など非数値はスキップ
-    """
-    vals = []
-    with open(path) as f:
-        for lineno, line in enumerate(f, 1):
-            s = line.strip()
-            if not s:
-                continue
-            parts = s.split()
-            if not parts:
-                continue
-            try:
-                v = int(parts[0])
-            except ValueError:
-                print(f"[WARN] [ACC] skip line {lineno}: {s}")
-                continue
-            vals.append(float(v))
-    return vals
-
-
-def moving_average_lpf(samples, window):
-    """ACC 用の簡易 LPF（移動平均的）。"""
-    if window <= 1 or not samples:
-        return samples[:]
-    n = len(samples)
-    out = [0.0] * n
-    w = int(window)
-    half = w // 2
-
-    for i in range(n):
-        start = max(0, i - half)
-        end   = min(n - 1, i + half)
-        length = end - start + 1
-        acc = 0.0
-        for j in range(start, end + 1):
-            acc += samples[j]
-        out[i] = acc / length
-    return out
-
-
-def decimate(samples, factor):
-    return samples[::factor]
+def load_acc_values(path, window=None):
+    return acc_log.load_acc_values(path, as_float=True, tag="[ACC] ", window=window)
+
+
+def iter_acc_blocks(path, block_size=1 << 16, window=None):
+    """samples_acc.txt を先頭列の int のまま block_size 個ずつ返す（CIC 用）。"""
+    block = []
+    for lineno, line in log_index.iter_lines(path, window):
+        parts = line.split()
+        if not parts:
+            continue
+        try:
+            block.append(int(parts[0]))
+        except ValueError:
+            print(f"[WARN] [ACC] skip line {lineno}: {line.strip()}")
+            continue
+        if len(block) >= block_size:
+            yield block
+            block = []
+    if block:
+        yield block
+
+
+def moving_average_lpf(samples, window, stages=1, step=1):
+    """ACC 用の簡易 LPF（移動平均、stages 段カスケード）。step で間引きも兼ねる。"""
+    return cascaded_moving_average(samples, window, stages, step)
 
 
 def make_acc_ref_wav(samples_acc_txt,
                      out_wav="acc_ref_44k1.wav",
-                     fs_int=1_600_000.0,
-                     fs_out_target=44_100.0):
-    vals = load_acc_values(samples_acc_txt)
+                     fs_int=None,
+                     fs_out_target=44_100.0,
+                     sample_format="int16",
+                     ma_stages=1,
+                     jobs=1,
+                     window=None):
+    with metrics.stage("parse") as st:
+        vals = load_acc_values(samples_acc_txt, window)
+        st.count(len(vals), "samples")
     if not vals:
         print("[WARN] [ACC] no data, skip WAV generation")
         return
     print(f"[INFO] [ACC] loaded {len(vals)} ACC samples")
+    fs_int, clock = resolve_fs(fs_int, samples_acc_txt, "acc", DEFAULT_FS_INT, "[ACC] ",
+                               window)
 
     decim = int(round(fs_int / fs_out_target))
     if decim < 1:
@@ -195,50 +207,151 @@ def make_acc_ref_wav(samples_acc_txt,
     print(f"[INFO] [ACC] Fs_int={fs_int} Hz, target Fs_out={fs_out_target} Hz")
     print(f"[INFO] [ACC] decimation factor={decim}, effective Fs_out={eff_fs_out} Hz")
 
-    window = decim * 3
-    print(f"[INFO] [ACC] moving-average window={window}")
-    lp = moving_average_lpf(vals, window)
-
-    dec = decimate(lp, decim)
+    ma_len = decim * 3
+    print(f"[INFO] [ACC] moving-average window={ma_len}, stages={ma_stages}")
+    # 間引き後に残るサンプルだけを計算する（最終段で step=decim）
+    with metrics.stage("filter") as st:
+        if parallel_filter is not None and ma_stages == 1 and jobs != 1:
+            # 共有メモリ上でチャンク分割して並列処理（単一プロセスと同一結果）
+            dec = parallel_filter.box_decimate(vals, ma_len, decim, jobs).tolist()
+        else:
+            dec = moving_average_lpf(vals, ma_len, stages=ma_stages, step=decim)
+        st.count(len(vals), "samples")
+        st.note(decimation=decim, stages=ma_stages, jobs=jobs)
     print(f"[INFO] [ACC] decimated samples: {len(dec)}")
 
-    int16_samples = normalize_to_int16(dec)
-    write_wav(out_wav, int16_samples, eff_fs_out)
+    with metrics.stage("normalize"):
+        pcm = normalize_to_format(dec, sample_format)
+    write_wav(out_wav, pcm, eff_fs_out, sample_format)
+    write_clock_sidecar(out_wav, clock, wav_fs_hz=int(eff_fs_out), decimation=decim)
     print(f"[INFO] [ACC] wrote WAV: {out_wav} (Fs={eff_fs_out} Hz)")
 
 
+def make_acc_cic_ref_wav(samples_acc_txt,
+                         out_wav="acc_ref_44k1.wav",
+                         fs_int=None,
+                         fs_out_target=44_100.0,
+                         sample_format="int16",
+                         cic_stages=4,
+                         window=None):
+    """ACC path, bit-exact variant: integer CIC + integer normalisation.
+
+    The input is streamed in blocks and never converted to float, so the
+    resulting WAV is identical on every machine (usable as a golden hash).
+    fs_int=None uses the fixed integer TB record rate ACC_FS_CIC, not the
+    recovered clock; the recovered clock only goes into the sidecar (and
+    a warning if the log does not match the TB rate).
+    """
+    clock = None
+    if fs_int is None:
+        fs_int = ACC_FS_CIC
+        _, clock = resolve_fs(None, samples_acc_txt, "acc", DEFAULT_FS_INT, "[ACC] ", window)
+        if clock is not None and abs(clock["fs_hz"] / fs_int - 1.0) > 1e-3:
+            print(f"[WARN] [ACC] recovered Fs {clock['fs_hz']:.1f} Hz differs from "
+                  f"the fixed CIC rate {fs_int} Hz; pass --fs-int to override")
+    decim = max(1, int(round(fs_int / fs_out_target)))
+    eff_fs_out = fs_int / decim
+    print(f"[INFO] [ACC] Fs_int={fs_int} Hz, target Fs_out={fs_out_target} Hz")
+    print(f"[INFO] [ACC] CIC R={decim}, N={cic_stages}, effective Fs_out={eff_fs_out} Hz")
+
+    cic = CicDecimator(decim, cic_stages)
+    dec = []
+    n_in = 0
+    # ブロック単位で読み込みと CIC が交互に進むので 1 ステージとして計測
+    with metrics.stage("filter") as st:
+        blocks = gap_log.fill_acc_blocks(iter_acc_blocks(samples_acc_txt, window=window),
+                                         log_index.load_gaps(samples_acc_txt, window))
+        for block in blocks:
+            n_in += len(block)
+            dec.extend(int(v) for v in cic.process(block))
+        st.count(n_in, "samples")
+        st.note(decimation=decim, stages=cic_stages, mode="cic")
+    if not dec:
+        print("[WARN] [ACC] no data, skip WAV generation")
+        return
+    print(f"[INFO] [ACC] loaded {n_in} ACC samples, decimated samples: {len(dec)}")
+
+    with metrics.stage("normalize"):
+        if sample_format == "float32":
+            scale = int(full_scale("int24"))
+            pcm = [v / scale for v in normalize_int(dec, scale)]
+        else:
+            pcm = normalize_int(dec, int(full_scale(sample_format)))
+    write_wav(out_wav, pcm, eff_fs_out, sample_format)
+    write_clock_sidecar(out_wav, clock, wav_fs_hz=int(eff_fs_out), decimation=decim)
+    print(f"[INFO] [ACC] wrote WAV: {out_wav} (Fs={eff_fs_out} Hz, CIC)")
+
+
 # ----------------------------------------------------------------------
 # Main
 # ----------------------------------------------------------------------
-def main():
-    # デフォルトのパス
-    samples_mo = "samples_mo.txt"
-    samples_acc = "samples_acc.txt"
+def main(argv=None):
+    ap = argparse.ArgumentParser(
+        description="Generate Mo/ACC reference WAVs from IKAOPLL_vgm_tb.sv logs."
+    )
+    ap.add_argument("samples_mo", nargs="?", default="samples_mo.txt",
+                    help="Mo log (default: samples_mo.txt)")
+    ap.add_argument("samples_acc", nargs="?", default="samples_acc.txt",
+                    help="ACC log (default: samples_acc.txt)")
+    ap.add_argument("--format", dest="sample_format", default="int16",
+                    choices=sorted(SAMPLE_FORMATS),
+                    help="WAV sample format (default: int16)")
+    ap.add_argument("--mo-fs", type=float, default=None,
+                    help="Mo WAV rate (default: recovered duration rate, "
+                         f"else {DEFAULT_FS_MO:.0f})")
+    ap.add_argument("--fs-int", type=float, default=None,
+                    help="ACC internal rate (default: recovered from time_ps, "
+                         f"else {DEFAULT_FS_INT:.0f}; --acc-mode cic: fixed "
+                         f"{ACC_FS_CIC})")
+    ap.add_argument("--acc-ma-stages", type=int, default=1,
+                    help="cascaded moving-average stages for the ACC path "
+                         "(default: 1)")
+    ap.add_argument("--jobs", type=int, default=1,
+                    help="worker processes for the ACC moving average "
+                         "(0 = all cores; default: 1)")
+    ap.add_argument("--acc-mode", choices=("ma", "cic"), default="ma",
+                    help="ACC decimation: 'ma' = moving average (float), "
+                         "'cic' = bit-exact integer CIC (default: ma)")
+    ap.add_argument("--cic-stages", type=int, default=4,
+                    help="CIC stages N for --acc-mode cic (default: 4)")
+    log_index.add_window_args(ap)
+    args = ap.parse_args(argv)
+    try:
+        window = log_index.window_from_args(args)
+    except ValueError as e:
+        ap.error(str(e))
+
+    samples_mo = args.samples_mo
+    samples_acc = args.samples_acc
     mo_wav = "mo_ref_44k1.wav"
     acc_wav = "acc_ref_44k1.wav"
 
-    if len(sys.argv) >= 2 and sys.argv[1] in ("-h", "--help"):
-        print("Usage: make_ref_wav.py [samples_mo.txt] [samples_acc.txt]")
-        print("  Defaults: samples_mo.txt, samples_acc.txt in current dir.")
-        sys.exit(0)
-
-    if len(sys.argv) >= 2:
-        samples_mo = sys.argv[1]
-    if len(sys.argv) >= 3:
-        samples_acc = sys.argv[2]
-
     print(f"[INFO] using samples_mo:  {samples_mo}")
     print(f"[INFO] using samples_acc: {samples_acc}")
+    if window is not None:
+        print(f"[INFO] window: {log_index.describe(window)}")
 
     # Mo-based ref WAV
-    make_mo_ref_wav(samples_mo, mo_wav, fs_out=44100.0, ma_window=15)
+    make_mo_ref_wav(samples_mo, mo_wav, fs_out=args.mo_fs, ma_window=15,
+                    sample_format=args.sample_format, window=window)
 
     # ACC-based ref WAV
-    make_acc_ref_wav(samples_acc, acc_wav,
-                     fs_int=1_600_000.0,
-                     fs_out_target=44_100.0)
+    if args.acc_mode == "cic":
+        make_acc_cic_ref_wav(samples_acc, acc_wav,
+                             fs_int=args.fs_int,
+                             fs_out_target=44_100.0,
+                             sample_format=args.sample_format,
+                             cic_stages=args.cic_stages,
+                             window=window)
+    else:
+        make_acc_ref_wav(samples_acc, acc_wav,
+                         fs_int=args.fs_int,
+                         fs_out_target=44_100.0,
+                         sample_format=args.sample_format,
+                         ma_stages=args.acc_ma_stages,
+                         jobs=args.jobs,
+                         window=window)
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+make_tb_suite.py
+
+Combine several register CSVs (delay,reg,data) into one testbench include
+that IKAOPLL_vgm_tb.sv plays back to back in a single simulation:
+
+    begin_test("ym2413_chords_mix");
+    vgm_wait(2267532); IKAOPLL_write(1'b0, 8'h0E, phiMref, CS_n, WR_n, A0, DIN);
+    ...
+    end_test;
+    begin_test("ym2413_retrigger");
+    ...
+
+Build the TB with -DVGM_SUITE_VH="<suite.vh>" instead of -DVGM_VH.  Every
+test gets an IC_n reset, the usual settle time and tail, and its own
+logs in <name>/samples_mo.txt, <name>/samples_acc.txt and
+<name>/durations.txt (relative to the simulator's working directory;
+run_tb.py --suite creates the directories).  So the suite is compiled
+and the simulator started only once for the whole list.
+
+Binary .ymev event files (reg_events.py) can be mixed with CSVs.  The
+test name is the file name without ".vgm.csv" / ".csv" / ".ymev".
+
+Usage:
+  python3 tools/make_tb_suite.py tests/regress.suite.vh tests/ym2413_*.vgm.csv
+  python3 tools/make_tb_suite.py tests/regress.suite.vh -l tests/regress.list
+  python3 tools/run_tb.py --build --suite tests/regress.suite.vh
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import re
+import sys
+from pathlib import Path
+
+import reg_events
+from vgm_csv_to_vh import print_totals, write_event_pattern, write_pattern
+
+_BEGIN_RE = re.compile(r'^\s*begin_test\("([^"]*)"\);')
+_NAME_OK_RE = re.compile(r"^[A-Za-z0-9_.+-]+$")
+
+
+def test_name(csv_path):
+    name = Path(csv_path).name
+    for suffix in (".vgm.csv", ".csv", reg_events.SUFFIX):
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+def read_suite_tests(suite_vh):
+    """Test names of a suite include, in playback order."""
+    names = []
+    with open(suite_vh) as f:
+        for line in f:
+            m = _BEGIN_RE.match(line)
+            if m:
+                names.append(m.group(1))
+    return names
+
+
+def read_list_file(path):
+    """One CSV path per line; blank lines and '#' comments are skipped.
+
+    Relative paths are taken relative to the list file.
+    """
+    base = Path(path).parent
+    out = []
+    for line in Path(path).read_text().splitlines():
+        line = line.split("#", 1)[0].strip()
+        if line:
+            p = Path(line)
+            out.append(p if p.is_absolute() else base / p)
+    return out
+
+
+def _write_test_pattern(path, name, f_out):
+    if Path(path).suffix == reg_events.SUFFIX:
+        events = reg_events.read_events(path)
+        if len(events) == 0:
+            print(f"[WARN] {path}: no events, test '{name}' has no writes", file=sys.stderr)
+        return write_event_pattern(events, f_out)
+    with open(path, newline="") as f_in:
+        reader = csv.reader(f_in)
+        if next(reader, None) is None:
+            print(f"[WARN] {path}: empty CSV, test '{name}' has no writes", file=sys.stderr)
+        return write_pattern(reader, f_out)
+
+
+def write_suite(out_path, csv_paths):
+    names = [test_name(p) for p in csv_paths]
+    for n in names:
+        if not _NAME_OK_RE.match(n):
+            raise ValueError(f"test name {n!r} is not usable as a directory name")
+    dup = sorted({n for n in names if names.count(n) > 1})
+    if dup:
+        raise ValueError(f"duplicate test name(s): {', '.join(dup)}")
+
+    total_delay = 0
+    total_ticks = 0
+    with open(out_path, "w") as f_out:
+        f_out.write(f"// Auto-generated test suite ({len(names)} tests)\n")
+        f_out.write("// timescale: 10ps; EMUCLK ~= 3.579545MHz\n")
+        for name, p in zip(names, csv_paths):
+            f_out.write(f"//   {name} <- {Path(p).name}\n")
+        f_out.write("\n")
+
+        for name, p in zip(names, csv_paths):
+            f_out.write(f'begin_test("{name}");\n')
+            n_rows, delay, ticks = _write_test_pattern(p, name, f_out)
+            f_out.write("end_test;\n\n")
+            total_delay += delay
+            total_ticks += ticks
+            print(f"[INFO] {name}: {n_rows} writes, {delay / 44_100:.3f} s")
+    return names, total_delay, total_ticks
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Build a multi-test include for IKAOPLL_vgm_tb.sv (-DVGM_SUITE_VH)."
+    )
+    ap.add_argument("output", help="output suite include (.vh)")
+    ap.add_argument("csv", nargs="*", help="register CSVs, played in this order")
+    ap.add_argument("-l", "--list", default=None,
+                    help="text file with one CSV per line (appended after csv)")
+    args = ap.parse_args(argv)
+
+    paths = [Path(p) for p in args.csv]
+    if args.list:
+        paths += read_list_file(args.list)
+    if not paths:
+        print("[ERROR] no input CSVs", file=sys.stderr)
+        return 1
+    missing = [str(p) for p in paths if not p.is_file()]
+    if missing:
+        print(f"[ERROR] No such file: {', '.join(missing)}", file=sys.stderr)
+        return 1
+
+    try:
+        names, total_delay, total_ticks = write_suite(args.output, paths)
+    except ValueError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 1
+    print(f"[INFO] Wrote suite: {args.output} ({len(names)} tests)")
+    print_totals(total_delay, total_ticks)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
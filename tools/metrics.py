@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+metrics.py
+
+Per-stage instrumentation shared by the tools/*.py scripts.
+
+    import metrics
+
+    with metrics.stage("parse") as st:
+        vals = load_acc_values(path)
+        st.count(len(vals), "samples")
+
+Every stage records wall time, CPU time, the number of items processed
+and the process peak RSS after the stage.  Output files are registered
+with metrics.add_output() (write_wav() does this automatically), and the
+metrics are written at exit next to the first output as
+``<output>.metrics.json``.
+
+Nothing is written unless enabled from the environment, so production
+runs can be profiled without editing code:
+
+  TOOLS_METRICS=1           write <first output>.metrics.json
+                            (<tool>.metrics.json in the cwd if no output)
+  TOOLS_METRICS=<path>      write the metrics JSON to <path>
+  TOOLS_PROFILE=<stage>     run cProfile around every stage of that name;
+                            saves <metrics json>.<stage>.prof and prints
+                            the top TOOLS_PROFILE_TOP (default 25) entries
+  TOOLS_TRACEMALLOC=1       also record the Python heap peak per stage
+                            (tracemalloc; slows the run down)
+
+Stage names used across the tools: parse, recover_clock, filter,
+resample, decimate, average, normalize, write, convert.
+"""
+
+import atexit
+import io
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_ENV_METRICS = "TOOLS_METRICS"
+_ENV_PROFILE = "TOOLS_PROFILE"
+_ENV_PROFILE_TOP = "TOOLS_PROFILE_TOP"
+_ENV_TRACEMALLOC = "TOOLS_TRACEMALLOC"
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KiB、macOS は byte
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+class Stage:
+    __slots__ = ("name", "items", "unit", "wall_s", "cpu_s",
+                 "rss_peak_mb", "rss_growth_mb", "py_heap_peak_mb", "extra")
+
+    def __init__(self, name):
+        self.name = name
+        self.items = None
+        self.unit = None
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.rss_peak_mb = None
+        self.rss_growth_mb = None
+        self.py_heap_peak_mb = None
+        self.extra = {}
+
+    def count(self, n, unit="items"):
+        """Add n processed items (samples, rows, ...)."""
+        self.items = (self.items or 0) + int(n)
+        self.unit = unit
+
+    def note(self, **kv):
+        """Attach extra JSON-serialisable values (e.g. decimation factor)."""
+        self.extra.update(kv)
+
+    def as_dict(self):
+        d = {"name": self.name, "wall_s": self.wall_s, "cpu_s": self.cpu_s}
+        if self.items is not None:
+            d["items"] = self.items
+            d["unit"] = self.unit
+            if self.wall_s > 0:
+                d["items_per_s"] = self.items / self.wall_s
+        d["rss_peak_mb"] = self.rss_peak_mb
+        d["rss_growth_mb"] = self.rss_growth_mb
+        if self.py_heap_peak_mb is not None:
+            d["py_heap_peak_mb"] = self.py_heap_peak_mb
+        d.update(self.extra)
+        return d
+
+
+class _Recorder:
+    def __init__(self):
+        self.enabled = bool(os.environ.get(_ENV_METRICS))
+        self.profile_stage = os.environ.get(_ENV_PROFILE) or None
+        self.tracemalloc = bool(os.environ.get(_ENV_TRACEMALLOC))
+        self.reset()
+        if self.enabled or self.profile_stage:
+            atexit.register(self.flush)
+
+    def reset(self, tool=None, argv=None):
+        self.tool = tool or Path(sys.argv[0]).name
+        self.argv = list(sys.argv[1:] if argv is None else argv)
+        self.stages = []
+        self.outputs = []
+        self.t0 = time.perf_counter()
+        self.cpu0 = time.process_time()
+        self.profiles = {}
+
+    def json_path(self):
+        target = os.environ.get(_ENV_METRICS, "")
+        if target and target not in ("1", "true", "yes", "on"):
+            return Path(target)
+        if self.outputs:
+            return Path(str(self.outputs[0]) + ".metrics.json")
+        return Path(Path(self.tool).stem + ".metrics.json")
+
+    def flush(self):
+        if not self.stages and not self.profiles:
+            return
+        path = self.json_path()
+        for name, prof in self.profiles.items():
+            prof_path = Path(f"{path}.{name}.prof")
+            prof.dump_stats(prof_path)
+            self._print_profile(prof, name, prof_path)
+        if not self.enabled:
+            return
+        data = {
+            "tool": self.tool,
+            "argv": self.argv,
+            "total_wall_s": time.perf_counter() - self.t0,
+            "total_cpu_s": time.process_time() - self.cpu0,
+            "peak_rss_mb": _peak_rss_mb(),
+            "outputs": [str(p) for p in self.outputs],
+            "stages": [st.as_dict() for st in self.stages],
+        }
+        try:
+            path.write_text(json.dumps(data, indent=2) + "\n")
+            print(f"[INFO] wrote metrics: {path}", file=sys.stderr)
+        except OSError as e:
+            print(f"[WARN] cannot write metrics {path}: {e}", file=sys.stderr)
+
+    @staticmethod
+    def _print_profile(prof, name, prof_path):
+        import pstats
+        buf = io.StringIO()
+        top = int(os.environ.get(_ENV_PROFILE_TOP, "25"))
+        pstats.Stats(prof, stream=buf).sort_stats("cumulative").print_stats(top)
+        print(f"[INFO] cProfile of stage '{name}' -> {prof_path}", file=sys.stderr)
+        print(buf.getvalue(), file=sys.stderr)
+
+
+_rec = _Recorder()
+
+
+def enabled():
+    return _rec.enabled
+
+
+def begin(tool, argv):
+    """Start a new run inside the same process (tools CLI batch mode).
+
+    Metrics of the previous run are written first, so every input file
+    gets its own metrics JSON.
+    """
+    _rec.flush()
+    _rec.reset(tool, argv)
+
+
+def end():
+    """Write the metrics of the current run and clear them."""
+    _rec.flush()
+    _rec.reset()
+
+
+def add_output(path):
+    """Register an output file; the metrics JSON goes next to the first one."""
+    _rec.outputs.append(Path(path))
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage (see module docstring)."""
+    st = Stage(name)
+    prof = None
+    if _rec.profile_stage == name:
+        import cProfile
+        prof = _rec.profiles.get(name)
+        if prof is None:
+            prof = _rec.profiles[name] = cProfile.Profile()
+    tm = None
+    if _rec.tracemalloc:
+        import tracemalloc
+        tm = tracemalloc
+        if not tm.is_tracing():
+            tm.start()
+        tm.reset_peak()
+    rss0 = _peak_rss_mb()
+    t0 = time.perf_counter()
+    c0 = time.process_time()
+    if prof is not None:
+        prof.enable()
+    try:
+        yield st
+    finally:
+        if prof is not None:
+            prof.disable()
+        st.wall_s = time.perf_counter() - t0
+        st.cpu_s = time.process_time() - c0
+        st.rss_peak_mb = _peak_rss_mb()
+        if rss0 is not None:
+            st.rss_growth_mb = st.rss_peak_mb - rss0
+        if tm is not None:
+            st.py_heap_peak_mb = tm.get_traced_memory()[1] / (1024 * 1024)
+        _rec.stages.append(st)
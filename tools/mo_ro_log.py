@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+mo_ro_log.py
+
+Reader and per-duration aggregation for the testbench DAC log
+(samples_mo.txt), which carries both DAC paths of the YM2413:
+
+    "dur_idx value time_ps path"     path: 0 = MO (FM), 1 = RO (rhythm)
+
+Logs from older testbench builds have no path column ("dur_idx value
+time_ps"); every record is MO then.
+
+The log is read once, in line-aligned blocks (log_index.iter_blocks); with
+NumPy each block is parsed by np.fromstring when all of its lines have
+the same column count, otherwise line by line.  The MO and RO
+per-duration means are then computed
+together in one vectorised pass (np.bincount over dur_idx * 2 + path).
+Without NumPy the same sums are accumulated in a dict, with identical
+results.  A log_index.Window restricts the read to --start/--end.
+"""
+
+import warnings
+from array import array
+
+import log_index
+
+try:
+    import numpy as np
+except ImportError:  # NumPy は任意
+    np = None
+
+PATH_MO = 0
+PATH_RO = 1
+PATH_NAMES = ("MO", "RO")
+
+# mix = (MO * 2 + RO * 3) / 5
+# IKAOPLL_vgm_tb.sv の i_ACC_SIGNED_MOVOL / i_ACC_SIGNED_ROVOL と同じ比率
+MIX_WEIGHTS = (2, 3)
+
+
+def _parse_lines(block, line0, dur, val, tps, pth):
+    """Append the records of one block (bytes) to the array.array columns."""
+    for lineno, line in enumerate(block.decode().splitlines(), line0 + 1):
+        parts = line.split()
+        if not parts:
+            continue
+        if len(parts) < 2:
+            print(f"[WARN] skip line {lineno}: {line.strip()}")
+            continue
+        try:
+            d = int(parts[0])
+            v = int(parts[1])
+            t = int(parts[2]) if len(parts) >= 3 else -1
+            p = int(parts[3]) if len(parts) >= 4 else PATH_MO
+        except ValueError:
+            print(f"[WARN] skip line {lineno}: non-int -> {line.strip()}")
+            continue
+        dur.append(d)
+        val.append(v)
+        tps.append(t)
+        pth.append(p)
+
+
+def _parse_block_np(block):
+    """Columns of one block via np.fromstring, or None if the block needs the
+    line-by-line parser (mixed column counts, blank lines, 'x' values)."""
+    n = block.count(b"\n") + (not block.endswith(b"\n"))
+    ncols = len(block[:block.find(b"\n")].split())
+    if not 2 <= ncols <= 4:
+        return None
+    buf = np.frombuffer(block, dtype=np.uint8)
+    starts = np.concatenate(([0], np.flatnonzero(buf == 10)[:n - 1] + 1))
+    # 行ごとの区切り数が全行で ncols - 1 であることを確かめる
+    seps = np.add.reduceat((buf == 32).view(np.uint8), starts, dtype=np.int64)
+    if np.any(seps != ncols - 1):
+        return None
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", DeprecationWarning)  # 古い NumPy は途中で止まる
+            flat = np.fromstring(block, dtype=np.int64, sep=" ")
+    except (ValueError, DeprecationWarning):
+        return None
+    if len(flat) != n * ncols:
+        return None
+    cols = flat.reshape(n, ncols)
+    tps = cols[:, 2] if ncols >= 3 else np.full(n, -1, dtype=np.int64)
+    pth = (cols[:, 3] if ncols >= 4 else np.zeros(n, dtype=np.int64)).astype(np.int8)
+    return cols[:, 0], cols[:, 1], tps, pth
+
+
+def load_dac_log(path, window=None):
+    """Read samples_mo.txt once; returns (dur_idx, value, time_ps, path).
+
+    With NumPy the columns are int64 / int8 arrays, otherwise array.array.
+    time_ps is -1 for 2-column logs.  With a window, dur_idx counts from
+    the first duration of the window.
+    """
+    dur, val, tps, pth = _load_columns(path, window)
+    if window is not None and len(dur):
+        d0 = log_index.resolve_window(path, window).dur0
+        if np is not None:
+            dur = dur - d0
+        else:
+            dur = array("q", (d - d0 for d in dur))
+    return dur, val, tps, pth
+
+
+def _load_columns(path, window):
+    if np is None:
+        cols = (array("q"), array("q"), array("q"), array("b"))
+        for line0, block in log_index.iter_blocks(path, window):
+            _parse_lines(block, line0, *cols)
+        return cols
+    parts = []
+    for line0, block in log_index.iter_blocks(path, window):
+        cols = _parse_block_np(block)
+        if cols is None:
+            # 'x' や列数の混在を含むブロックだけ行ごとに読む
+            slow = (array("q"), array("q"), array("q"), array("b"))
+            _parse_lines(block, line0, *slow)
+            cols = tuple(np.frombuffer(a, dtype=np.int8 if a.typecode == "b" else np.int64)
+                         for a in slow)
+        parts.append(cols)
+    if not parts:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int8))
+    return tuple(np.concatenate([p[k] for p in parts]) for k in range(4))
+
+
+def path_counts(pth):
+    """Number of (MO, RO) records."""
+    if np is not None:
+        n_ro = int(np.count_nonzero(np.asarray(pth) == PATH_RO))
+    else:
+        n_ro = sum(1 for p in pth if p == PATH_RO)
+    return len(pth) - n_ro, n_ro
+
+
+def has_rhythm_path(pth):
+    """True if the log contains any RO record."""
+    return path_counts(pth)[1] > 0
+
+
+def average_by_duration(dur, val, pth, dense=True):
+    """Per-duration mean of MO and RO in one pass.
+
+    dense=True : durations 0..max(dur_idx); durations without samples of a
+                 path give 0.0 (make_ref_wav behaviour)
+    dense=False: only durations that have at least one record of either
+                 path, in ascending order (avg_mo_by_duration behaviour)
+
+    Returns (dur_indices, {"MO": [...], "RO": [...]}) as Python lists.
+    """
+    if len(dur) == 0:
+        return [], {name: [] for name in PATH_NAMES}
+
+    if np is not None:
+        d = np.asarray(dur, dtype=np.int64)
+        if d.min() < 0:
+            raise ValueError("negative dur_idx in log")
+        p = np.asarray(pth, dtype=np.int64)
+        n = int(d.max()) + 1
+        key = d * 2 + p
+        sums = np.bincount(key, weights=np.asarray(val, dtype=np.float64),
+                           minlength=2 * n).reshape(n, 2)
+        cnts = np.bincount(key, minlength=2 * n).reshape(n, 2)
+        means = np.zeros_like(sums)
+        np.divide(sums, cnts, out=means, where=cnts > 0)
+        if dense:
+            idx = np.arange(n)
+        else:
+            idx = np.flatnonzero(cnts.sum(axis=1) > 0)
+            means = means[idx]
+        return idx.tolist(), {name: means[:, k].tolist()
+                              for k, name in enumerate(PATH_NAMES)}
+
+    acc = {}
+    for d, v, p in zip(dur, val, pth):
+        s = acc.get(d)
+        if s is None:
+            s = acc[d] = [0, 0, 0, 0]  # MO sum, MO cnt, RO sum, RO cnt
+        s[2 * p] += v
+        s[2 * p + 1] += 1
+    idx = list(range(max(acc) + 1)) if dense else sorted(acc)
+    out = {name: [] for name in PATH_NAMES}
+    for d in idx:
+        s = acc.get(d, (0, 0, 0, 0))
+        for k, name in enumerate(PATH_NAMES):
+            out[name].append(s[2 * k] / s[2 * k + 1] if s[2 * k + 1] else 0.0)
+    return idx, out
+
+
+def mix_paths(mo, ro, weights=MIX_WEIGHTS):
+    """Weighted MO + RO mix, normalised by the weight sum."""
+    w_mo, w_ro = weights
+    total = float(w_mo + w_ro)
+    return [(w_mo * a + w_ro * b) / total for a, b in zip(mo, ro)]
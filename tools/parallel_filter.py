@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+parallel_filter.py
+
+Multi-core filter + decimate for long ACC captures (requires NumPy).
+
+The input is placed once in a ``multiprocessing.shared_memory`` block and
+the output is written into a second one; worker processes only receive
+the block names and an output index range, so no sample array is ever
+pickled.  Each worker reads its range plus the preceding / surrounding
+filter span (overlap = filter length) straight from shared memory.
+
+Every output sample is computed by the same range function whether it is
+called once over the whole signal (jobs=1) or per chunk, and that
+function's arithmetic does not depend on where a chunk starts:
+
+- fir_decimate : causal FIR, accumulated tap by tap in the same order as
+                 the original per-sample loop in acc_decimate_to_wav.py
+                 (element-wise multiply-add, no BLAS / convolve)
+- box_decimate : centred moving average from int64 prefix sums of the
+                 raw integer ACC values (exact), same edges as box_filter
+
+so the stitched result is bit-identical to the single-process output.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from box_filter import _window_means
+
+# これより短い入力はプロセス起動のほうが高くつくので単一プロセスで処理する
+MIN_PARALLEL_SAMPLES = 1 << 20
+# ワーカー 1 つあたりのチャンク数（負荷の偏りをならす）
+CHUNKS_PER_WORKER = 4
+
+
+# ----------------------------------------------------------------------
+# Range kernels (shared by the single- and multi-process paths)
+# ----------------------------------------------------------------------
+def fir_decimate_range(x, h, decim, j0, j1):
+    """Outputs j0..j1-1 of y[j] = sum_k h[k] * x[j*decim - k] (x<0 := 0)."""
+    out = np.zeros(j1 - j0, dtype=np.float64)
+    if j1 <= j0:
+        return out
+    for k, hk in enumerate(h):
+        # j*decim - k >= 0 となる最初の j
+        jv = max(j0, -(-k // decim))
+        if jv >= j1:
+            continue
+        start = jv * decim - k
+        stop = (j1 - 1) * decim - k + 1
+        out[jv - j0:] += hk * x[start:stop:decim]
+    return out
+
+
+def box_decimate_range(x, window, decim, j0, j1):
+    """Outputs j0..j1-1 of moving_average(x, window)[::decim]."""
+    n = len(x)
+    if j1 <= j0:
+        return np.zeros(0, dtype=np.float64)
+    half = int(window) // 2 if window > 1 else 0
+    i0 = j0 * decim
+    i1 = (j1 - 1) * decim + 1
+    s0 = max(0, i0 - half)
+    e1 = min(n, i1 - 1 + half + 1)
+    return _window_means(x[s0:e1], s0, i0, i1, half, n, decim)
+
+
+_KERNELS = {
+    "fir": fir_decimate_range,
+    "box": box_decimate_range,
+}
+
+
+# ----------------------------------------------------------------------
+# Shared-memory plumbing
+# ----------------------------------------------------------------------
+def _attach(name):
+    """Attach to an existing block without letting this process own it.
+
+    Pool workers share the parent's resource tracker, so on Python < 3.13
+    the extra registration is a no-op and the parent's unlink() clears it.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13
+        return shared_memory.SharedMemory(name=name)
+
+
+def _worker(task):
+    (kind, param, decim, in_name, n_in, in_dtype,
+     out_name, n_out, j0, j1) = task
+    shm_in = _attach(in_name)
+    shm_out = _attach(out_name)
+    try:
+        x = np.ndarray((n_in,), dtype=in_dtype, buffer=shm_in.buf)
+        y = np.ndarray((n_out,), dtype=np.float64, buffer=shm_out.buf)
+        y[j0:j1] = _KERNELS[kind](x, param, decim, j0, j1)
+        del x, y
+    finally:
+        shm_in.close()
+        shm_out.close()
+    return j1 - j0
+
+
+def default_jobs():
+    return os.cpu_count() or 1
+
+
+def _run(kind, x, param, decim, jobs):
+    x = np.ascontiguousarray(x)
+    n_in = len(x)
+    n_out = -(-n_in // decim) if n_in else 0
+    if jobs is None or jobs <= 0:
+        jobs = default_jobs()
+
+    if jobs <= 1 or n_in < MIN_PARALLEL_SAMPLES:
+        return _KERNELS[kind](x, param, decim, 0, n_out)
+
+    n_chunks = min(n_out, jobs * CHUNKS_PER_WORKER)
+    bounds = np.linspace(0, n_out, n_chunks + 1).astype(np.int64)
+
+    shm_in = shared_memory.SharedMemory(create=True, size=max(1, x.nbytes))
+    shm_out = shared_memory.SharedMemory(create=True, size=max(1, 8 * n_out))
+    try:
+        np.ndarray(x.shape, dtype=x.dtype, buffer=shm_in.buf)[:] = x
+        tasks = [(kind, param, decim, shm_in.name, n_in, x.dtype.str,
+                  shm_out.name, n_out, int(j0), int(j1))
+                 for j0, j1 in zip(bounds[:-1], bounds[1:]) if j1 > j0]
+        with ProcessPoolExecutor(max_workers=jobs) as ex:
+            list(ex.map(_worker, tasks))
+        return np.ndarray((n_out,), dtype=np.float64, buffer=shm_out.buf).copy()
+    finally:
+        shm_in.close()
+        shm_in.unlink()
+        shm_out.close()
+        shm_out.unlink()
+
+
+# ----------------------------------------------------------------------
+# Public API
+# ----------------------------------------------------------------------
+def fir_decimate(samples, h, decim, jobs=None):
+    """Causal FIR ``h`` followed by ``[::decim]``, split over ``jobs`` processes.
+
+    Equivalent to ``fir_lowpass(samples, ...)[::decim]`` in
+    acc_decimate_to_wav.py, but only the kept samples are computed.
+    """
+    x = np.asarray(samples, dtype=np.float64)
+    return _run("fir", x, tuple(float(v) for v in h), int(decim), jobs)
+
+
+def box_decimate(samples, window, decim, jobs=None):
+    """``box_filter.moving_average(samples, window)[::decim]``, split over jobs.
+
+    Integer(-valued) input is kept as int64 so the prefix sums are exact and
+    the result does not depend on the chunking; other float input is
+    processed in a single process.
+    """
+    x = np.asarray(samples)
+    if x.dtype.kind != "f" or np.array_equal(x, np.rint(x)):
+        x = x.astype(np.int64)
+    else:
+        # 非整数の float は累積和の起点で丸めが変わるので分割しない
+        jobs = 1
+    return _run("box", x, int(window), int(decim), jobs)
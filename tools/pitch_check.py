@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+pitch_check.py
+
+Automatic pitch verification of rendered audio against the register
+timeline (e.g. ym2413_scale_chromatic, ym2413_scale_rom1,
+ym2413_block_boundary).
+
+Oracle: the stimulus (register CSV, .ymev or VGM) is replayed and every
+melodic key-on segment of every channel becomes a note.  A segment ends
+at the key-off or when F-number, block or instrument change; segments
+under 1 ms (intermediate states between two writes) are dropped.  The
+expected frequency is
+
+    f = fnum * 2^block * (EMUCLK / 72) / 2^19 * MULT(carrier)
+
+where MULT comes from the user patch (0x01) for instrument 0 and from the
+instrument ROM of IKAOPLL_reg.v otherwise.  Channels 6-8 are skipped
+while rhythm mode is on.
+
+Measurement: one STFT of the whole WAV (Hann window, zero padded),
+streamed in frame blocks.  A note covers a contiguous run of frames, so
+its power sum over a block is the difference of two rows of the block's
+prefix sum; only the notes sounding in the block (at most one per
+channel) hold a spectrum, and each is reduced to its peak once its last
+frame is seen.  Memory is bounded by the block size and the channel
+count, not by the song length or the number of notes.  The peak within
+±--search cents of the expected frequency is located with parabolic
+interpolation on log power.
+
+Reported per note: start time, channel, block/fnum, instrument,
+expected and measured frequency, deviation in cents and a status:
+
+  ok        |cents| <= --tol
+  FAIL      |cents| >  --tol
+  weak      peak less than --min-snr dB above the note's median power
+  overlap   another sounding note is expected within the search band
+  short     fewer than --min-frames STFT frames inside the note
+  low       fewer than 4 periods per STFT window (raise --win)
+
+Only FAIL counts as an error (exit code 1).  Unusable input (missing or
+unreadable stimulus / WAV, no melodic key-on) exits with 2, so callers
+such as stim_reduce.py --check can tell it from a failing check.  NumPy
+is required.
+
+Usage:
+  python3 pitch_check.py tests/ym2413_scale_chromatic.vgm.csv mo_ref_44k1.wav
+  python3 pitch_check.py tests/ym2413_block_boundary.vgm.csv mo_ref_44k1.wav \\
+      --tol 10 --report pitch.csv
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import sys
+
+import numpy as np
+
+import metrics
+from reg_coverage import stimulus_writes
+from wav_writer import read_wav
+
+VGM_RATE = 44_100
+EMUCLK_HZ = 3_579_545.0
+CHIP_FS = EMUCLK_HZ / 72                 # ≈ 49715.9 Hz（1 duration）
+N_CH = 9
+
+# 窓に入る周期数がこれ未満の音は DC / 負周波数側のローブと分離できない
+LOW_PERIODS = 4
+
+MULT_TABLE = (0.5, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 12, 12, 15, 15)
+
+# IKAOPLL_reg.v の YM2413 音色 ROM（1-15）のキャリア MUL
+ROM_CAR_MULT = (None, 1, 1, 1, 1, 1, 2, 1, 1, 1, 1, 1, 1, 0, 1, 1)
+
+
+def note_frequency(fnum, block, car_mult_code):
+    return fnum * (1 << block) * CHIP_FS / (1 << 19) * MULT_TABLE[car_mult_code]
+
+
+# ----------------------------------------------------------------------
+# Oracle
+# ----------------------------------------------------------------------
+def expected_notes(writes, min_len=VGM_RATE // 1000):
+    """Key-on segments: list of (t0_s, t1_s, ch, block, fnum, inst, f_hz).
+
+    Segments shorter than min_len VGM samples (F-number / block / key
+    written one after the other) are dropped.
+    """
+    regs = [0] * 0x40
+    t = 0
+    open_seg = [None] * N_CH          # (t0, block, fnum, inst, f)
+    notes = []
+
+    def close(ch, t_end):
+        seg = open_seg[ch]
+        if seg is not None and t_end - seg[0] >= max(min_len, 1):
+            t0, block, fnum, inst, f = seg
+            notes.append((t0 / VGM_RATE, t_end / VGM_RATE, ch, block, fnum, inst, f))
+        open_seg[ch] = None
+
+    def state(ch):
+        hi = regs[0x20 + ch]
+        fnum = ((hi & 1) << 8) | regs[0x10 + ch]
+        block = (hi >> 1) & 7
+        inst = regs[0x30 + ch] >> 4
+        mult = regs[0x01] & 0x0F if inst == 0 else ROM_CAR_MULT[inst]
+        return block, fnum, inst, note_frequency(fnum, block, mult)
+
+    for delta, reg, val in writes:
+        t += delta
+        reg &= 0x3F
+        regs[reg] = val
+        rhythm = bool(regs[0x0E] & 0x20)
+        if reg == 0x0E and rhythm:
+            for ch in range(6, N_CH):
+                close(ch, t)
+            continue
+        if 0x10 <= reg <= 0x38 and (reg & 0x0F) < N_CH or reg == 0x01:
+            chans = range(N_CH) if reg == 0x01 else (reg & 0x0F,)
+            for ch in chans:
+                key = bool(regs[0x20 + ch] & 0x10) and not (rhythm and ch >= 6)
+                if not key:
+                    close(ch, t)
+                    continue
+                st = state(ch)
+                seg = open_seg[ch]
+                if seg is None or seg[1:] != st:
+                    close(ch, t)
+                    if st[1] > 0:
+                        open_seg[ch] = (t,) + st
+    for ch in range(N_CH):
+        close(ch, t)
+    notes.sort()
+    return notes
+
+
+# ----------------------------------------------------------------------
+# Measurement
+# ----------------------------------------------------------------------
+def stft_power_blocks(x, win, hop, nfft, block_frames=256):
+    """Yield (first_frame, power[frames, bins]) of a Hann STFT, in blocks."""
+    w = np.hanning(win).astype(np.float32)
+    n_frames = max(0, (len(x) - win) // hop + 1)
+    frames = np.lib.stride_tricks.sliding_window_view(x.astype(np.float32), win)[::hop]
+    for i in range(0, n_frames, block_frames):
+        spec = np.fft.rfft(frames[i:i + block_frames] * w, n=nfft, axis=1)
+        yield i, (spec.real ** 2 + spec.imag ** 2).astype(np.float32)
+
+
+def note_frames(notes, n_frames, win, hop, fs, skip_attack_s, offset_s):
+    """[first, end) STFT frames whose window lies wholly inside each note."""
+    t0 = np.array([n[0] for n in notes]) + offset_s + skip_attack_s
+    t1 = np.array([n[1] for n in notes]) + offset_s
+    centers = (np.arange(n_frames) * hop + win / 2) / fs
+    half = win / 2 / fs
+    # 窓の左端・右端はどちらも単調増加なので、音符ごとのフレームは連続区間
+    first = np.searchsorted(centers - half, t0, side="left")
+    end = np.searchsorted(centers + half, t1, side="right")
+    return first, np.maximum(end, first)
+
+
+def _peaks(spec, lo, hi, bin_hz):
+    """Interpolated peak in [lo, hi] and its SNR over the median, per row."""
+    n = len(spec)
+    rows = np.arange(n)
+    width = int((hi - lo).max()) + 1
+    idx = np.minimum(lo[:, None] + np.arange(width)[None, :], hi[:, None])
+    band = spec[rows[:, None], idx]
+    k = idx[rows, band.argmax(axis=1)]
+
+    eps = 1e-30
+    a = np.log(spec[rows, k - 1] + eps)
+    b = np.log(spec[rows, k] + eps)
+    c = np.log(spec[rows, k + 1] + eps)
+    den = a - 2 * b + c
+    delta = np.where(den < 0, 0.5 * (a - c) / np.where(den < 0, den, -1), 0.0)
+    snr_db = 10 * np.log10((spec[rows, k] + eps) / (np.median(spec, axis=1) + eps))
+    return (k + delta) * bin_hz, snr_db
+
+
+def measure(x, fs, notes, win, hop, nfft, search_cents, skip_attack_s, offset_s):
+    """Mean spectrum per note and the interpolated peak near its expected f.
+
+    Every note covers a contiguous run of STFT frames, so its power sum
+    within a frame block is the difference of two rows of the block's
+    prefix sum.  Only notes sounding in the current block hold a spectrum
+    (at most one per channel); a note is reduced to its peak as soon as
+    its last frame has been seen.
+    """
+    n_notes = len(notes)
+    n_frames = max(0, (len(x) - win) // hop + 1)
+    n_bins = nfft // 2 + 1
+    first, end = note_frames(notes, n_frames, win, hop, fs, skip_attack_s, offset_s)
+    n_in = end - first
+    f_exp = np.array([n[6] for n in notes])
+
+    bin_hz = fs / nfft
+    ratio = 2.0 ** (search_cents / 1200.0)
+    lo = np.clip(np.floor(f_exp / ratio / bin_hz).astype(int), 1, n_bins - 2)
+    hi = np.clip(np.ceil(f_exp * ratio / bin_hz).astype(int), 1, n_bins - 2)
+
+    # フレームを持たない音符のスペクトルは 0: 帯域の先頭ビン、SNR 0 dB
+    f_meas = lo * bin_hz
+    snr_db = np.zeros(n_notes)
+
+    order = [n for n in np.argsort(first, kind="stable") if n_in[n] > 0]
+    pos = 0
+    sounding = {}                     # note -> power sum over its frames so far
+    for i, p in stft_power_blocks(x, win, hop, nfft) if order else ():
+        j = i + len(p)
+        while pos < len(order) and first[order[pos]] < j:
+            sounding[order[pos]] = np.zeros(n_bins)
+            pos += 1
+        if not sounding:
+            continue
+        csum = np.zeros((len(p) + 1, n_bins))
+        np.cumsum(p, axis=0, dtype=np.float64, out=csum[1:])
+        done = []
+        for n, acc in sounding.items():
+            acc += csum[min(end[n], j) - i] - csum[max(first[n], i) - i]
+            if end[n] <= j:
+                done.append(n)
+        if done:
+            done = np.array(done)
+            spec = np.stack([sounding.pop(n) for n in done]) / n_in[done][:, None]
+            # 無音区間では累積和の差に負の丸め誤差が残る
+            np.maximum(spec, 0.0, out=spec)
+            f_meas[done], snr_db[done] = _peaks(spec, lo[done], hi[done], bin_hz)
+
+    cents = 1200 * np.log2(np.maximum(f_meas, 1e-30) / f_exp)
+    return f_meas, cents, snr_db, n_in
+
+
+def overlap_flags(notes, search_cents):
+    """True if another note sounding at the same time lies in the search band."""
+    ratio = 2.0 ** (search_cents / 1200.0)
+    out = []
+    for i, (a0, a1, ch, _, _, _, f) in enumerate(notes):
+        hit = False
+        for j, (b0, b1, ch2, _, _, _, g) in enumerate(notes):
+            if j != i and ch2 != ch and b0 < a1 and a0 < b1 and f / ratio <= g <= f * ratio:
+                hit = True
+                break
+        out.append(hit)
+    return out
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Check the pitch of rendered audio against the register timeline."
+    )
+    ap.add_argument("stimulus", help="register CSV, .ymev or VGM")
+    ap.add_argument("wav", help="rendered audio (e.g. mo_ref_44k1.wav from make_ref_wav.py)")
+    ap.add_argument("--tol", type=float, default=15.0, help="allowed deviation in cents (default: 15)")
+    ap.add_argument("--search", type=float, default=100.0,
+                    help="peak search range in cents around the expected pitch (default: 100)")
+    ap.add_argument("--win", type=int, default=2048, help="STFT window in samples (default: 2048)")
+    ap.add_argument("--hop", type=int, default=512, help="STFT hop in samples (default: 512)")
+    ap.add_argument("--pad", type=int, default=8, help="zero-padding factor (default: 8)")
+    ap.add_argument("--skip-attack", type=float, default=0.02,
+                    help="ignore the first N seconds of every note (default: 0.02)")
+    ap.add_argument("--offset", type=float, default=0.0,
+                    help="WAV time of the first VGM sample in seconds (default: 0)")
+    ap.add_argument("--min-frames", type=int, default=1,
+                    help="STFT frames a note needs to be checked (default: 1)")
+    ap.add_argument("--min-snr", type=float, default=10.0,
+                    help="peak over median power in dB (default: 10)")
+    ap.add_argument("--report", default=None, help="write the per-note table as CSV")
+    ap.add_argument("-q", "--quiet", action="store_true", help="print failures and the summary only")
+    args = ap.parse_args(argv)
+
+    with metrics.stage("parse") as st:
+        try:
+            writes, _ = stimulus_writes(args.stimulus)
+            x, fs = read_wav(args.wav)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] {e}", file=sys.stderr)
+            return 2
+        notes = expected_notes(writes)
+        st.count(len(x), "samples")
+    if not notes:
+        print("[ERROR] no melodic key-on in the stimulus", file=sys.stderr)
+        return 2
+    print(f"[INFO] {len(notes)} notes, audio {len(x) / fs:.3f} s at {fs} Hz")
+
+    with metrics.stage("filter") as st:
+        f_meas, cents, snr, n_in = measure(
+            x, fs, notes, args.win, args.hop, args.win * args.pad,
+            args.search, args.skip_attack, args.offset)
+        st.count(len(x), "samples")
+        st.note(notes=len(notes), win=args.win, hop=args.hop, nfft=args.win * args.pad)
+    overlap = overlap_flags(notes, args.search)
+
+    rows = []
+    for i, (t0, t1, ch, block, fnum, inst, f) in enumerate(notes):
+        if n_in[i] < args.min_frames:
+            status = "short"
+        elif f < LOW_PERIODS * fs / args.win:
+            status = "low"
+        elif overlap[i]:
+            status = "overlap"
+        elif snr[i] < args.min_snr:
+            status = "weak"
+        elif abs(cents[i]) > args.tol:
+            status = "FAIL"
+        else:
+            status = "ok"
+        rows.append((t0, t1, ch, block, fnum, inst, f, f_meas[i], cents[i], snr[i], status))
+
+    checked = [r for r in rows if r[-1] in ("ok", "FAIL")]
+    skipped = {}
+    for r in rows:
+        if r[-1] not in ("ok", "FAIL"):
+            skipped[r[-1]] = skipped.get(r[-1], 0) + 1
+    fails = [r for r in rows if r[-1] == "FAIL"]
+    for r in rows:
+        if args.quiet and r[-1] != "FAIL":
+            continue
+        t0, t1, ch, block, fnum, inst, f, fm, c, s, status = r
+        print(f"{t0:9.3f}-{t1:<9.3f} ch{ch} blk{block} fnum{fnum:4d} inst{inst:2d} "
+              f"exp {f:9.2f} Hz  meas {fm:9.2f} Hz  {c:+7.1f} ct  {s:5.1f} dB  {status}")
+
+    if args.report:
+        with open(args.report, "w", newline="") as f_out:
+            w = csv.writer(f_out)
+            w.writerow(["t0_s", "t1_s", "ch", "block", "fnum", "inst",
+                        "f_expected", "f_measured", "cents", "snr_db", "status"])
+            for r in rows:
+                w.writerow([f"{r[0]:.6f}", f"{r[1]:.6f}", *r[2:6],
+                            f"{r[6]:.4f}", f"{r[7]:.4f}", f"{r[8]:.2f}", f"{r[9]:.1f}", r[10]])
+        metrics.add_output(args.report)
+        print(f"[INFO] Wrote report: {args.report}")
+
+    worst = max((abs(r[8]) for r in checked), default=0.0)
+    print(f"[INFO] checked {len(checked)} of {len(rows)} notes, "
+          f"max |deviation| {worst:.1f} cents, {len(fails)} over {args.tol:g} cents")
+    if skipped:
+        print("[INFO] not checked: " + ", ".join(f"{n} {k}" for k, n in sorted(skipped.items())))
+    return 1 if fails else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
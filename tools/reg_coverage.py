@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+reg_coverage.py
+
+Feature coverage of YM2413 stimuli and a minimal regression subset.
+
+Every stimulus (register CSV, .ymev or VGM) is replayed through a small
+register-state model.  Each register write adds the features it
+exercises to a set:
+
+  reg:XX                 register XX written
+  user.<op>.<field>=v    user patch (0x00-0x07) field value, op = mod/car
+  ch:n  patch:n  vol:v   channel / instrument / volume at a key-on
+  block:b  fnum:k        block and F-number range (k = fnum >> 6) at a key-on
+  sus:0/1                sustain bit at a key-on
+  key:on  key:off        key edges
+  key:retrigger_fast     key-on < 1 ms after the key-off (same channel)
+  key:retrigger          key-on < 100 ms after the key-off
+  key:reon_after_release key-on >= 100 ms after the key-off
+  key:short_pulse        key-off < 10 ms after the key-on
+  key:fnum_while_on      F-number / block change of a sounding channel
+  key:patch_while_on     instrument change of a sounding channel
+  key:vol_while_on       volume change of a sounding channel
+  write:redundant        register rewritten with its current value
+  rhythm:on  rhythm:off  rhythm mode toggles (0x0E bit 5)
+  rhythm:toggle_while_on rhythm mode switched while ch 6-8 sound
+  drum:BD .. drum:HH     rhythm instrument hit
+  drum:retrigger         drum hit again without a clear in between
+  test:XX                test register 0x0F value
+
+The selection is a greedy weighted set cover.  It repeatedly takes the
+stimulus with the most not-yet-covered features per second of simulated
+time (stimulus length + --tail-s), then drops picks that became
+redundant.  The union of all features of all inputs is the target.  The
+result is written as a list file for make_tb_suite.py -l.
+
+Usage:
+  python3 reg_coverage.py tests/*.vgm.csv -o tests/ci.list
+  python3 reg_coverage.py corpus/*.ymev --ignore user. --ignore fnum: -o ci.list
+  python3 reg_coverage.py tests/ym2413_retrigger.vgm.csv --features
+  python3 make_tb_suite.py tests/ci.suite.vh -l tests/ci.list
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+import metrics
+import reg_events
+
+VGM_RATE = 44_100
+N_CH = 9
+DRUMS = ("HH", "TCY", "TOM", "SD", "BD")      # 0x0E bit 0..4
+
+RETRIGGER_FAST = VGM_RATE // 1000             # 1 ms
+RETRIGGER = VGM_RATE // 10                    # 100 ms
+SHORT_PULSE = VGM_RATE // 100                 # 10 ms
+
+# ユーザー音色のビットフィールド: reg -> [(name, shift, width)]
+USER_FIELDS = {
+    0x00: [("mod.am", 7, 1), ("mod.vib", 6, 1), ("mod.egt", 5, 1), ("mod.ksr", 4, 1), ("mod.mult", 0, 4)],
+    0x01: [("car.am", 7, 1), ("car.vib", 6, 1), ("car.egt", 5, 1), ("car.ksr", 4, 1), ("car.mult", 0, 4)],
+    0x02: [("mod.ksl", 6, 2), ("mod.tl", 0, 6)],
+    0x03: [("car.ksl", 6, 2), ("car.dc", 4, 1), ("mod.dm", 3, 1), ("mod.fb", 0, 3)],
+    0x04: [("mod.ar", 4, 4), ("mod.dr", 0, 4)],
+    0x05: [("car.ar", 4, 4), ("car.dr", 0, 4)],
+    0x06: [("mod.sl", 4, 4), ("mod.rr", 0, 4)],
+    0x07: [("car.sl", 4, 4), ("car.rr", 0, 4)],
+}
+
+
+# ----------------------------------------------------------------------
+# Feature extraction
+# ----------------------------------------------------------------------
+def features_of_writes(writes):
+    """Feature set of a (delta, reg, val) register-write stream."""
+    f = set()
+    regs = [None] * 0x40
+    t = 0
+    key = [False] * N_CH
+    t_on = [None] * N_CH
+    t_off = [None] * N_CH
+    for delta, reg, val in writes:
+        t += delta
+        reg &= 0x3F
+        f.add(f"reg:{reg:02X}")
+        old = regs[reg]
+        if old == val:
+            f.add("write:redundant")
+        regs[reg] = val
+
+        if reg in USER_FIELDS:
+            for name, shift, width in USER_FIELDS[reg]:
+                f.add(f"user.{name}={(val >> shift) & ((1 << width) - 1)}")
+        elif reg == 0x0E:
+            was = bool(old is not None and old & 0x20)
+            now = bool(val & 0x20)
+            if now != was:
+                f.add("rhythm:on" if now else "rhythm:off")
+                if any(key[6:]):
+                    f.add("rhythm:toggle_while_on")
+            if now:
+                prev = (old or 0) & 0x1F if was else 0
+                for i, name in enumerate(DRUMS):
+                    if (val >> i) & 1:
+                        f.add(f"drum:{name}")
+                        if (prev >> i) & 1:
+                            f.add("drum:retrigger")
+        elif reg == 0x0F:
+            f.add(f"test:{val:02X}")
+        elif 0x10 <= reg <= 0x28:
+            ch = reg & 0x0F
+            if ch >= N_CH:
+                continue
+            if reg >= 0x20:
+                on = bool(val & 0x10)
+                if on and not key[ch]:
+                    _key_on(f, regs, ch, t, t_off[ch])
+                    t_on[ch] = t
+                elif not on and key[ch]:
+                    f.add("key:off")
+                    if t - t_on[ch] < SHORT_PULSE:
+                        f.add("key:short_pulse")
+                    t_off[ch] = t
+                if on and key[ch] and old is not None and (old ^ val) & 0x0F:
+                    f.add("key:fnum_while_on")
+                key[ch] = on
+            elif key[ch] and old != val:
+                f.add("key:fnum_while_on")
+        elif 0x30 <= reg <= 0x38:
+            ch = reg - 0x30
+            if key[ch] and old is not None:
+                if (old ^ val) & 0xF0:
+                    f.add("key:patch_while_on")
+                if (old ^ val) & 0x0F:
+                    f.add("key:vol_while_on")
+    return f
+
+
+def _key_on(f, regs, ch, t, t_off):
+    f.add("key:on")
+    f.add(f"ch:{ch}")
+    hi = regs[0x20 + ch] or 0
+    fnum = ((hi & 1) << 8) | (regs[0x10 + ch] or 0)
+    inst = regs[0x30 + ch] or 0
+    f.add(f"block:{(hi >> 1) & 7}")
+    f.add(f"fnum:{fnum >> 6}")
+    f.add(f"sus:{(hi >> 5) & 1}")
+    f.add(f"patch:{inst >> 4}")
+    f.add(f"vol:{inst & 0x0F}")
+    if t_off is not None:
+        gap = t - t_off
+        if gap < RETRIGGER_FAST:
+            f.add("key:retrigger_fast")
+        elif gap < RETRIGGER:
+            f.add("key:retrigger")
+        else:
+            f.add("key:reon_after_release")
+
+
+def stimulus_writes(path):
+    """(writes, length in VGM samples) of a CSV, .ymev or VGM file."""
+    ev = reg_events.load_stimulus_events(path)
+    # アドレス行の待ち + データ行の待ちの後にレジスタが書き換わる
+    writes = [(d + dd, reg, val) for d, dd, reg, val in ev]
+    return writes, ev.total_delay()
+
+
+def stimulus_features(path, ignore=()):
+    writes, length = stimulus_writes(path)
+    feats = features_of_writes(writes)
+    if ignore:
+        feats = {x for x in feats if not x.startswith(tuple(ignore))}
+    return feats, length / VGM_RATE
+
+
+# ----------------------------------------------------------------------
+# Selection
+# ----------------------------------------------------------------------
+def greedy_cover(feats, cost, must=()):
+    """Weighted greedy set cover.
+
+    feats: {name: set}, cost: {name: seconds}.  Returns the picks in
+    selection order; every feature of the union is covered.
+    """
+    universe = set().union(*feats.values()) if feats else set()
+    picked = list(must)
+    covered = set().union(*(feats[n] for n in picked)) if picked else set()
+    while covered != universe:
+        best = None
+        best_score = 0.0
+        for n in sorted(feats):
+            if n in picked:
+                continue
+            gain = len(feats[n] - covered)
+            score = gain / max(cost[n], 1e-6)
+            if score > best_score:
+                best, best_score = n, score
+        picked.append(best)
+        covered |= feats[best]
+
+    # 後から選んだテストで完全に覆われたものを外す（コストの大きい順）
+    for n in sorted(picked, key=lambda n: -cost[n]):
+        if n in must:
+            continue
+        rest = [m for m in picked if m != n]
+        if feats[n] <= set().union(set(), *(feats[m] for m in rest)):
+            picked = rest
+    return picked
+
+
+def write_list(out_path, picked, feats, cost):
+    base = Path(out_path).resolve().parent
+    with open(out_path, "w") as f:
+        f.write("# Minimal regression subset (reg_coverage.py)\n")
+        f.write(f"# {len(picked)} tests, {sum(cost[n] for n in picked):.3f} s of stimulus\n")
+        for n in picked:
+            f.write(f"{os.path.relpath(Path(n).resolve(), base)}\n")
+    metrics.add_output(out_path)
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Per-stimulus YM2413 feature coverage and a minimal covering subset."
+    )
+    ap.add_argument("inputs", nargs="+", help="register CSVs, .ymev or VGM files")
+    ap.add_argument("-o", "--output", default=None,
+                    help="write the subset as a list file (make_tb_suite.py -l)")
+    ap.add_argument("--tail-s", type=float, default=0.01,
+                    help="fixed per-test cost added to the stimulus length "
+                         "(reset, settle, tail; default: 0.01)")
+    ap.add_argument("--must", action="append", default=[],
+                    help="always include this input")
+    ap.add_argument("--ignore", action="append", default=[],
+                    help="drop features with this prefix (e.g. user. or fnum:)")
+    ap.add_argument("--features", action="store_true",
+                    help="print the features of every input and exit")
+    args = ap.parse_args(argv)
+
+    feats = {}
+    cost = {}
+    with metrics.stage("parse") as st:
+        for p in args.inputs:
+            try:
+                fs, length = stimulus_features(p, args.ignore)
+            except (OSError, ValueError) as e:
+                print(f"[ERROR] {p}: {e}", file=sys.stderr)
+                return 1
+            feats[p] = fs
+            cost[p] = length + args.tail_s
+        st.count(len(args.inputs), "files")
+
+    if args.features:
+        for p in args.inputs:
+            print(f"{p}: {len(feats[p])} features, {cost[p]:.3f} s")
+            for x in sorted(feats[p]):
+                print(f"  {x}")
+        return 0
+
+    unknown = [m for m in args.must if m not in feats]
+    if unknown:
+        print(f"[ERROR] --must not among the inputs: {', '.join(unknown)}", file=sys.stderr)
+        return 1
+
+    with metrics.stage("convert") as st:
+        picked = greedy_cover(feats, cost, args.must)
+        st.count(len(feats), "files")
+
+    universe = set().union(*feats.values())
+    total = sum(cost.values())
+    sel = sum(cost[n] for n in picked)
+    print(f"[INFO] {len(feats)} inputs, {len(universe)} features, {total:.3f} s in total")
+    covered = set()
+    for n in picked:
+        new = feats[n] - covered
+        covered |= feats[n]
+        print(f"[INFO]   {cost[n]:8.3f} s  +{len(new):4d}  {n}")
+    print(f"[INFO] subset: {len(picked)} tests, {sel:.3f} s "
+          f"({sel / max(total, 1e-9):.1%} of the simulated time)")
+    if args.output:
+        write_list(args.output, picked, feats, cost)
+        print(f"[INFO] Wrote list: {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
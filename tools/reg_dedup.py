@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+reg_dedup.py
+
+Find stimuli whose YM2413 register streams are identical, or share a long
+common opening, before anything is simulated.
+
+Every input (register CSV, .ymev or VGM) is decoded into its write
+stream and canonicalised:
+
+  - writes that cannot change the chip are dropped: unused registers
+    (0x08-0x0D, 0x19-0x1F, 0x29-0x2F, 0x39-0x3F) and rewrites of the
+    value a register already holds; their delay moves to the next write
+  - timing is made relative to the first remaining write (leading
+    silence dropped); trailing silence is not part of the stream
+  - with --quantum N, write times are rounded to multiples of N VGM
+    samples (e.g. 735 for 60 Hz drivers) to absorb rip jitter
+
+The canonical events (dt, reg, val) are fed one by one into a polynomial
+rolling hash (mod 2^61-1).  Its value after n events is the hash of the
+first n events, so it is recorded at checkpoints (powers of two from
+64 and every 4096 events) as prefix hashes, and a BLAKE2b digest of the
+whole stream identifies exact duplicates.
+
+Reported:
+  duplicates      identical canonical streams; all but the first (in
+                  argument order) are skipped in the --keep list
+  near-duplicates pairs whose longest shared checkpoint covers at least
+                  --min-prefix events; the exact common opening is then
+                  measured by replaying both streams, and pairs where it
+                  covers --min-ratio of the shorter stream are reported
+                  (loop-trimmed copies, re-rips with a new ending)
+
+Usage:
+  python3 reg_dedup.py corpus/*.vgm --keep unique.list
+  python3 reg_dedup.py tests/*.vgm.csv --quantum 735 --min-ratio 0.8
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import struct
+import sys
+from pathlib import Path
+
+import metrics
+from reg_coverage import stimulus_writes
+
+# 書き込んでもチップの状態が変わらないレジスタ
+_UNUSED = set(range(0x08, 0x0E)) | set(range(0x19, 0x20)) | set(range(0x29, 0x30)) | set(range(0x39, 0x40))
+
+HASH_MOD = (1 << 61) - 1
+HASH_BASE = 0x5BD1E995_3C6EF372 % HASH_MOD
+
+FIRST_CHECKPOINT = 64
+CHECKPOINT_STEP = 4096
+
+
+def is_checkpoint(n):
+    if n < FIRST_CHECKPOINT:
+        return False
+    return (n & (n - 1)) == 0 or n % CHECKPOINT_STEP == 0
+
+
+def canonical_events(writes, quantum=1):
+    """(dt, reg, val) of the canonical stream (see module docstring)."""
+    regs = [None] * 0x40
+    t = 0
+    t_last = None
+    for delta, reg, val in writes:
+        t += delta
+        reg &= 0x3F
+        if reg in _UNUSED or regs[reg] == val:
+            continue
+        regs[reg] = val
+        tq = (t + quantum // 2) // quantum if quantum > 1 else t
+        dt = 0 if t_last is None else tq - t_last
+        t_last = tq
+        yield dt, reg, val
+
+
+class StreamHash:
+    """Rolling prefix hash + BLAKE2b digest of a canonical stream."""
+
+    __slots__ = ("n", "h", "digest", "checkpoints")
+
+    def __init__(self):
+        self.n = 0
+        self.h = 0
+        self.digest = hashlib.blake2b(digest_size=16)
+        self.checkpoints = {}      # n_events -> prefix hash
+
+    def update(self, dt, reg, val):
+        tok = (dt << 16) | (reg << 8) | val
+        self.h = (self.h * HASH_BASE + tok + 1) % HASH_MOD
+        self.digest.update(struct.pack("<QBB", dt, reg, val))
+        self.n += 1
+        if is_checkpoint(self.n):
+            self.checkpoints[self.n] = self.h
+
+    def key(self):
+        return self.n, self.digest.hexdigest()
+
+
+def hash_stimulus(path, quantum=1):
+    writes, _ = stimulus_writes(path)
+    sh = StreamHash()
+    for ev in canonical_events(writes, quantum):
+        sh.update(*ev)
+    return sh, len(writes)
+
+
+def find_duplicates(hashes):
+    """{path: StreamHash} → (groups of identical paths, in input order)."""
+    by_key = {}
+    for p, sh in hashes.items():
+        by_key.setdefault(sh.key(), []).append(p)
+    return [g for g in by_key.values() if len(g) > 1]
+
+
+def common_prefix_len(a, b, quantum=1):
+    """Exact number of leading canonical events shared by two stimuli."""
+    ea = canonical_events(stimulus_writes(a)[0], quantum)
+    eb = canonical_events(stimulus_writes(b)[0], quantum)
+    n = 0
+    for x, y in zip(ea, eb):
+        if x != y:
+            break
+        n += 1
+    return n
+
+
+def find_near_duplicates(hashes, min_prefix, min_ratio, skip=(), quantum=1):
+    """[(a, b, shared_events, ratio)] of streams with a common opening."""
+    index = {}
+    for p, sh in hashes.items():
+        if p in skip:
+            continue
+        for n, h in sh.checkpoints.items():
+            index.setdefault((n, h), []).append(p)
+
+    best = {}
+    for (n, _), paths in index.items():
+        if n < min_prefix or len(paths) < 2:
+            continue
+        for i, a in enumerate(paths):
+            for b in paths[i + 1:]:
+                if best.get((a, b), 0) < n:
+                    best[(a, b)] = n
+
+    out = []
+    for (a, b), _ in best.items():
+        n = common_prefix_len(a, b, quantum)
+        shorter = min(hashes[a].n, hashes[b].n)
+        ratio = n / shorter if shorter else 0.0
+        if ratio >= min_ratio:
+            out.append((a, b, n, ratio))
+    out.sort(key=lambda x: (-x[3], -x[2], x[0], x[1]))
+    return out
+
+
+def write_keep_list(out_path, paths):
+    base = Path(out_path).resolve().parent
+    with open(out_path, "w") as f:
+        f.write("# Unique stimuli (reg_dedup.py)\n")
+        for p in paths:
+            f.write(f"{os.path.relpath(Path(p).resolve(), base)}\n")
+    metrics.add_output(out_path)
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Detect duplicate / near-duplicate YM2413 register streams."
+    )
+    ap.add_argument("inputs", nargs="+", help="register CSVs, .ymev or VGM files")
+    ap.add_argument("--quantum", type=int, default=1,
+                    help="round write times to N VGM samples (default: 1 = exact)")
+    ap.add_argument("--min-prefix", type=int, default=256,
+                    help="shortest common opening reported, in events (default: 256)")
+    ap.add_argument("--min-ratio", type=float, default=0.5,
+                    help="common opening / shorter stream to report (default: 0.5)")
+    ap.add_argument("--keep", default=None,
+                    help="write the inputs without duplicates as a list file")
+    args = ap.parse_args(argv)
+
+    hashes = {}
+    with metrics.stage("parse") as st:
+        n_writes = 0
+        for p in dict.fromkeys(args.inputs):
+            try:
+                sh, n = hash_stimulus(p, max(1, args.quantum))
+            except (OSError, ValueError) as e:
+                print(f"[ERROR] {p}: {e}", file=sys.stderr)
+                return 1
+            hashes[p] = sh
+            n_writes += n
+        st.count(n_writes, "writes")
+    n_events = sum(sh.n for sh in hashes.values())
+    print(f"[INFO] {len(hashes)} inputs, {n_writes} writes, "
+          f"{n_events} after canonicalisation")
+
+    groups = find_duplicates(hashes)
+    dup = set()
+    for g in groups:
+        print(f"[INFO] duplicate streams ({hashes[g[0]].n} events):")
+        print(f"         keep {g[0]}")
+        for p in g[1:]:
+            print(f"         skip {p}")
+            dup.add(p)
+
+    near = find_near_duplicates(hashes, args.min_prefix, args.min_ratio, skip=dup,
+                                quantum=max(1, args.quantum))
+    for a, b, n, ratio in near:
+        if ratio == 1.0:
+            short, long_ = (a, b) if hashes[a].n <= hashes[b].n else (b, a)
+            print(f"[INFO] {short} is a prefix of {long_} ({n} events; trimmed copy?)")
+        else:
+            print(f"[INFO] common opening of {n} events ({ratio:.0%} of the shorter): {a} ~ {b}")
+
+    keep = [p for p in hashes if p not in dup]
+    print(f"[INFO] {len(dup)} duplicates, {len(near)} near-duplicate pairs, "
+          f"{len(keep)} unique inputs")
+    if args.keep:
+        write_keep_list(args.keep, keep)
+        print(f"[INFO] Wrote list: {args.keep}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+reg_events.py
+
+Compact binary form of the YM2413 register stimulus (``.ymev``).
+
+The ``delay,reg,data`` CSV needs two text rows per register write and a
+hex parse per row.  A ``.ymev`` file holds one record per bus write
+(address + data) and is loaded with a few NumPy calls.
+
+Layout (little endian):
+
+    header (64 bytes)
+      magic        4s   b"YMEV"
+      version      u16  1
+      header_size  u16  64
+      sample_rate  u32  unit of the delays (44100 = VGM samples)
+      reserved     u32
+      n_events     u64
+      delay_bytes  u64  length of the delay section
+      source_hash  32s  SHA-256 of the source file (VGM or CSV), or zeros
+
+    delays   2 * n_events unsigned LEB128 varints, interleaved:
+             delay before the address row, delay before the data row
+    regs     n_events bytes (register address)
+    values   n_events bytes (register data)
+
+The two delays are the CSV's per-row delays, so CSV -> .ymev -> CSV is
+lossless for CSVs in the format vgm_to_ym2413_csv.py writes (address
+"%02X", data "0x%02X").  Other spellings of the same bytes ("0e",
+"0x0E" on an address row) come back in that canonical form.  Every
+address row must be followed by its data row.
+
+Usage:
+  python3 reg_events.py encode tests/song.vgm.csv tests/song.ymev
+  python3 reg_events.py decode tests/song.ymev song.vgm.csv
+  python3 reg_events.py info tests/song.ymev
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import hashlib
+import struct
+import sys
+from pathlib import Path
+
+import metrics
+
+try:
+    import numpy as np
+except ImportError:  # NumPy は任意。無ければ純 Python でデコードする
+    np = None
+
+MAGIC = b"YMEV"
+VERSION = 1
+SUFFIX = ".ymev"
+
+_HEADER = struct.Struct("<4sHHIIQQ32s")
+HEADER_SIZE = _HEADER.size  # 64
+
+# CSV の reg 列
+REG_ADDR = "01"
+REG_DATA = "00"
+
+
+class RegEvents:
+    """Decoded stimulus: parallel sequences, one entry per bus write.
+
+    delay      : VGM samples before the address write
+    data_delay : VGM samples between the address and the data write
+    reg, val   : register address and data
+    (NumPy arrays if NumPy is available, otherwise lists.)
+    """
+
+    __slots__ = ("delay", "data_delay", "reg", "val", "sample_rate", "source_hash")
+
+    def __init__(self, delay, data_delay, reg, val, sample_rate=44_100, source_hash=bytes(32)):
+        self.delay = delay
+        self.data_delay = data_delay
+        self.reg = reg
+        self.val = val
+        self.sample_rate = sample_rate
+        self.source_hash = source_hash
+
+    def __len__(self):
+        return len(self.reg)
+
+    def __iter__(self):
+        """(delay, data_delay, reg, val) as Python ints."""
+        cols = [c.tolist() if np is not None and hasattr(c, "tolist") else c
+                for c in (self.delay, self.data_delay, self.reg, self.val)]
+        return zip(*cols)
+
+    def total_delay(self):
+        return int(sum(self.delay)) + int(sum(self.data_delay))
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.digest()
+
+
+# ----------------------------------------------------------------------
+# Varint (unsigned LEB128)
+# ----------------------------------------------------------------------
+def _encode_varints_py(values):
+    out = bytearray()
+    for v in values:
+        v = int(v)
+        if v < 0:
+            raise ValueError(f"negative delay: {v}")
+        while v >= 0x80:
+            out.append((v & 0x7F) | 0x80)
+            v >>= 7
+        out.append(v)
+    return bytes(out)
+
+
+def _encode_varints_np(values):
+    v = np.asarray(values, dtype=np.int64)
+    if len(v) and v.min() < 0:
+        raise ValueError(f"negative delay: {int(v.min())}")
+    v = v.astype(np.uint64)
+    nb = np.ones(len(v), dtype=np.int64)
+    for k in range(1, 10):
+        nb += v >= np.uint64(1 << (7 * k))
+    start = np.concatenate(([0], np.cumsum(nb)[:-1]))
+    out = np.zeros(int(nb.sum()), dtype=np.uint8)
+    for k in range(int(nb.max()) if len(nb) else 0):
+        m = nb > k
+        byte = (v[m] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        cont = np.where(nb[m] > k + 1, 0x80, 0).astype(np.uint64)
+        out[start[m] + k] = (byte | cont).astype(np.uint8)
+    return out.tobytes()
+
+
+def encode_varints(values):
+    if np is not None:
+        return _encode_varints_np(values)
+    return _encode_varints_py(values)
+
+
+def _decode_varints_py(buf):
+    out = []
+    v = 0
+    shift = 0
+    for b in buf:
+        v |= (b & 0x7F) << shift
+        if b & 0x80:
+            shift += 7
+        else:
+            out.append(v)
+            v = 0
+            shift = 0
+    if shift:
+        raise ValueError("truncated varint")
+    return out
+
+
+def _decode_varints_np(buf):
+    b = np.frombuffer(buf, dtype=np.uint8)
+    if len(b) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if b[-1] & 0x80:
+        raise ValueError("truncated varint")
+    ends = np.flatnonzero((b & 0x80) == 0)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    # 各バイトが自分の varint の何バイト目か
+    pos = np.arange(len(b)) - np.repeat(starts, ends - starts + 1)
+    parts = (b & 0x7F).astype(np.uint64) << (7 * pos).astype(np.uint64)
+    return np.add.reduceat(parts, starts).astype(np.int64)
+
+
+def decode_varints(buf):
+    if np is not None:
+        return _decode_varints_np(buf)
+    return _decode_varints_py(buf)
+
+
+# ----------------------------------------------------------------------
+# .ymev I/O
+# ----------------------------------------------------------------------
+def write_events(path, events, sample_rate=44_100, source_hash=None):
+    """events: RegEvents or iterable of (delay, data_delay, reg, val)."""
+    if isinstance(events, RegEvents):
+        delay, data_delay, reg, val = events.delay, events.data_delay, events.reg, events.val
+        if source_hash is None:
+            source_hash = events.source_hash
+    else:
+        rows = list(events)
+        delay = [r[0] for r in rows]
+        data_delay = [r[1] for r in rows]
+        reg = [r[2] for r in rows]
+        val = [r[3] for r in rows]
+    n = len(reg)
+    inter = [0] * (2 * n)
+    inter[0::2] = [int(d) for d in delay]
+    inter[1::2] = [int(d) for d in data_delay]
+    delays = encode_varints(inter)
+    source_hash = (source_hash or b"").ljust(32, b"\0")[:32]
+
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, HEADER_SIZE, int(sample_rate), 0,
+                             n, len(delays), source_hash))
+        f.write(delays)
+        f.write(bytes(int(r) for r in reg))
+        f.write(bytes(int(v) for v in val))
+    metrics.add_output(path)
+    return n
+
+
+def read_header(buf):
+    if len(buf) < HEADER_SIZE:
+        raise ValueError("file too small for a .ymev header")
+    magic, version, hsize, rate, _, n, dbytes, src = _HEADER.unpack_from(buf, 0)
+    if magic != MAGIC:
+        raise ValueError("not a .ymev file (missing 'YMEV' magic)")
+    if version != VERSION:
+        raise ValueError(f"unsupported .ymev version {version}")
+    return {"header_size": hsize, "sample_rate": rate, "n_events": n,
+            "delay_bytes": dbytes, "source_hash": src}
+
+
+def read_events(path):
+    """Load a .ymev file → RegEvents."""
+    buf = Path(path).read_bytes()
+    h = read_header(buf)
+    n = h["n_events"]
+    p = h["header_size"]
+    q = p + h["delay_bytes"]
+    if len(buf) < q + 2 * n:
+        raise ValueError(f"{path}: truncated ({len(buf)} bytes, need {q + 2 * n})")
+    d = decode_varints(buf[p:q])
+    if len(d) != 2 * n:
+        raise ValueError(f"{path}: {len(d)} delays for {n} events")
+    if np is not None:
+        reg = np.frombuffer(buf, dtype=np.uint8, count=n, offset=q)
+        val = np.frombuffer(buf, dtype=np.uint8, count=n, offset=q + n)
+    else:
+        reg = list(buf[q:q + n])
+        val = list(buf[q + n:q + 2 * n])
+    return RegEvents(d[0::2], d[1::2], reg, val, h["sample_rate"], h["source_hash"])
+
+
+# ----------------------------------------------------------------------
+# CSV <-> events
+# ----------------------------------------------------------------------
+def _parse_delay(s, lineno):
+    s = s.strip()
+    if s == "":
+        return 0
+    v = int(s)
+    if v < 0:
+        raise ValueError(f"line {lineno}: negative delay {v}")
+    return v
+
+
+def events_from_csv(csv_path):
+    """Read a delay,reg,data CSV → RegEvents (address/data rows paired)."""
+    delay, data_delay, reg, val = [], [], [], []
+    pending = None  # (lineno, delay, reg)
+    with open(csv_path, newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None)  # header
+        for lineno, row in enumerate(reader, start=2):
+            if len(row) < 3:
+                print(f"[WARN] Line {lineno}: expected 3 columns, got {len(row)}", file=sys.stderr)
+                continue
+            d = _parse_delay(row[0], lineno)
+            b = int(row[2].strip(), 16)
+            if row[1].strip() == REG_ADDR:
+                if pending is not None:
+                    raise ValueError(f"line {lineno}: address row without data row "
+                                     f"(after line {pending[0]})")
+                pending = (lineno, d, b)
+            else:
+                if pending is None:
+                    raise ValueError(f"line {lineno}: data row without address row")
+                delay.append(pending[1])
+                reg.append(pending[2])
+                data_delay.append(d)
+                val.append(b)
+                pending = None
+    if pending is not None:
+        raise ValueError(f"line {pending[0]}: address row without data row at end of file")
+    return RegEvents(delay, data_delay, reg, val, source_hash=file_sha256(csv_path))
+
+
+def write_csv(csv_path, events):
+    """RegEvents → delay,reg,data CSV in vgm_to_ym2413_csv.py's format."""
+    with open(csv_path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["delay", "reg", "data"])
+        for d, dd, r, v in events:
+            w.writerow([d, REG_ADDR, f"{r:02X}"])
+            w.writerow([dd, REG_DATA, f"0x{v:02X}"])
+    metrics.add_output(csv_path)
+
+
+def load_stimulus(path):
+    """RegEvents from either a .ymev or a delay,reg,data CSV."""
+    if Path(path).suffix == SUFFIX:
+        return read_events(path)
+    return events_from_csv(path)
+
+
+def load_stimulus_events(path):
+    """RegEvents of a CSV, .ymev or VGM (.vgm / .vgz) stimulus.
+
+    VGM writes have no separate data row, so their data_delay is 0.
+    """
+    p = Path(path)
+    if p.suffix.lower() not in (".vgm", ".vgz"):
+        return load_stimulus(p)
+    import gzip
+    # vgm_to_ym2413_csv は reg_events を import するので、ここで読み込む
+    from vgm_to_ym2413_csv import iter_ym2413_writes
+    data = p.read_bytes()
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+    rows = list(iter_ym2413_writes(data))
+    return RegEvents([d for d, _, _ in rows], [0] * len(rows),
+                     [r for _, r, _ in rows], [v for _, _, v in rows],
+                     source_hash=file_sha256(p))
+
+
+# ----------------------------------------------------------------------
+# Main
+# ----------------------------------------------------------------------
+def print_info(path, ev):
+    size = Path(path).stat().st_size
+    total = ev.total_delay()
+    print(f"[INFO] {path}: {len(ev)} writes, {size} bytes "
+          f"({size / max(len(ev), 1):.2f} bytes/write)")
+    print(f"[INFO] sample_rate={ev.sample_rate}, total delay={total} "
+          f"(~{total / ev.sample_rate:.3f} s)")
+    print(f"[INFO] source sha256={ev.source_hash.hex()}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Convert register CSVs (delay,reg,data) to/from binary .ymev events."
+    )
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("encode", help="CSV -> .ymev")
+    p.add_argument("csv")
+    p.add_argument("output", nargs="?", help="default: <csv without .csv/.vgm.csv>.ymev")
+    p = sub.add_parser("decode", help=".ymev -> CSV")
+    p.add_argument("ymev")
+    p.add_argument("output")
+    p = sub.add_parser("info", help="print the header of a .ymev file")
+    p.add_argument("ymev")
+    args = ap.parse_args(argv)
+
+    try:
+        if args.cmd == "encode":
+            out = args.output
+            if out is None:
+                name = Path(args.csv).name
+                for suffix in (".vgm.csv", ".csv"):
+                    name = name.removesuffix(suffix)
+                out = str(Path(args.csv).with_name(name + SUFFIX))
+            with metrics.stage("parse") as st:
+                ev = events_from_csv(args.csv)
+                st.count(len(ev), "writes")
+            with metrics.stage("write") as st:
+                write_events(out, ev)
+                st.count(len(ev), "writes")
+            print_info(out, ev)
+        elif args.cmd == "decode":
+            with metrics.stage("parse") as st:
+                ev = read_events(args.ymev)
+                st.count(len(ev), "writes")
+            with metrics.stage("write") as st:
+                write_csv(args.output, ev)
+                st.count(len(ev), "writes")
+            print(f"[INFO] Wrote CSV: {args.output} ({len(ev)} writes)")
+        else:
+            print_info(args.ymev, read_events(args.ymev))
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
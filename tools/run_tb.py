@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+run_tb.py
+
+Run the VGM testbench and profile simulation throughput.
+
+IKAOPLL_vgm_tb.sv prints a progress record every +PROGRESS_SMP VGM
+samples (default 441 = 10 ms of song time):
+
+    [PROG] tick t_ps=.. vgm_smp=.. row=.. writes=.. waits=.. mo=.. ro=.. acc=.. dur=..
+
+This script runs vvp, stamps every record with the wall clock as it
+arrives on the pipe (the TB flushes after each record), and writes
+
+  - <name>.progress.tsv : wall_s + every record field, one line per record
+  - <name>.profile.json : per-interval simulated-us per wall-second, bus
+                          writes per interval, the slowest (typically
+                          write-dense) sections, and a per-test summary
+                          when a suite is run
+
+With --suite (an include from make_tb_suite.py) all tests of the suite
+run in one simulation; the per-test log directories are created first.
+
+Usage:
+  # build with a given stimulus, run, profile
+  python3 tools/run_tb.py --build --vh tests/ym2413_chords_mix.vh
+
+  # many short tests in one compile / one simulator process
+  python3 tools/make_tb_suite.py tests/regress.suite.vh tests/ym2413_*.vgm.csv
+  python3 tools/run_tb.py --build --suite tests/regress.suite.vh --quiet
+
+  # run an existing build; extra arguments go to vvp as plusargs
+  python3 tools/run_tb.py --vvp ikaopll_vgm_tb.vvp +PROGRESS_SMP=4410
+
+  # re-analyse a recorded progress file
+  python3 tools/run_tb.py --analyze ym2413_chords_mix.progress.tsv
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+TB_SOURCES = [
+    "src/IKAOPLL.v",
+    "src/IKAOPLL_modules/IKAOPLL_*.v",
+    "src/IKAOPLL_vgm_tb.sv",
+]
+
+PROG_TAG = "[PROG]"
+PROG_FIELDS = ("t_ps", "vgm_smp", "row", "writes", "waits", "mo", "ro", "acc", "dur", "test")
+
+# 中央値に対してこの比率を下回る区間を「遅い区間」とみなす
+SLOW_RATIO = 0.5
+
+
+# ---------------------------------------------------------------------------
+# Build / run
+# ---------------------------------------------------------------------------
+def tb_sources(root=REPO_ROOT):
+    out = []
+    for pat in TB_SOURCES:
+        out.extend(sorted(str(p) for p in Path(root).glob(pat)))
+    return out
+
+
+def build(vvp_path, vh=None, iverilog="iverilog", suite=None, root=REPO_ROOT, defines=None):
+    """Compile the TB; root: source tree (e.g. a worktree of another revision),
+    defines: {name: value} macros (e.g. IKAOPLL_FAST_RESET=0)."""
+    cmd = [iverilog, "-g2012", "-o", str(vvp_path), "-I", str(root)]
+    for k, v in (defines or {}).items():
+        cmd.append(f"-D{k}={v}")
+    if vh is not None:
+        cmd.append(f'-DVGM_VH="{vh}"')
+    if suite is not None:
+        cmd.append(f'-DVGM_SUITE_VH="{suite}"')
+    cmd += tb_sources(root)
+    print(f"[INFO] build: {' '.join(cmd)}")
+    return subprocess.call(cmd)
+
+
+def parse_prog_line(line):
+    """'[PROG] tag k=v ...' → dict (tag + int fields), or None."""
+    i = line.find(PROG_TAG)
+    if i < 0:
+        return None
+    parts = line[i + len(PROG_TAG):].split()
+    if not parts:
+        return None
+    rec = {"tag": parts[0]}
+    for kv in parts[1:]:
+        k, _, v = kv.partition("=")
+        try:
+            rec[k] = int(v)
+        except ValueError:
+            continue
+    return rec
+
+
+def run_and_record(cmd, log_path=None, quiet=False, cwd=None):
+    """Run the simulator; return (records with wall_s, exit code, wall time).
+
+    cwd: working directory of the simulator (where the TB writes its logs).
+    """
+    print(f"[INFO] run: {' '.join(cmd)}" + (f" (in {cwd})" if cwd else ""))
+    records = []
+    log = open(log_path, "w") if log_path else None
+    t0 = time.monotonic()
+    try:
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                text=True, bufsize=1, cwd=cwd)
+        for line in proc.stdout:
+            now = time.monotonic() - t0
+            rec = parse_prog_line(line)
+            if rec is not None:
+                rec["wall_s"] = now
+                records.append(rec)
+            if log:
+                log.write(line)
+            if not quiet:
+                sys.stdout.write(line)
+        rc = proc.wait()
+    finally:
+        if log:
+            log.close()
+    return records, rc, time.monotonic() - t0
+
+
+# ---------------------------------------------------------------------------
+# Progress file
+# ---------------------------------------------------------------------------
+def write_progress_tsv(path, records):
+    cols = ("wall_s", "tag") + PROG_FIELDS
+    with open(path, "w") as f:
+        f.write("\t".join(cols) + "\n")
+        for r in records:
+            f.write("\t".join(f"{r['wall_s']:.6f}" if c == "wall_s" else str(r.get(c, ""))
+                              for c in cols) + "\n")
+
+
+def read_progress_tsv(path):
+    records = []
+    with open(path) as f:
+        header = f.readline().split("\t")
+        header = [h.strip() for h in header]
+        for line in f:
+            vals = line.rstrip("\n").split("\t")
+            rec = {}
+            for k, v in zip(header, vals):
+                if k == "tag":
+                    rec[k] = v
+                elif k == "wall_s":
+                    rec[k] = float(v)
+                elif v != "":
+                    rec[k] = int(v)
+            records.append(rec)
+    return records
+
+
+# ---------------------------------------------------------------------------
+# Profile
+# ---------------------------------------------------------------------------
+def build_profile(records, top=10, names=None):
+    """Per-interval throughput between consecutive progress records."""
+    intervals = []
+    for a, b in zip(records, records[1:]):
+        dwall = b["wall_s"] - a["wall_s"]
+        dsim_us = (b["t_ps"] - a["t_ps"]) / 1e6
+        if dsim_us <= 0:
+            continue
+        writes = b.get("writes", 0) - a.get("writes", 0)
+        intervals.append({
+            "vgm_smp_start": a.get("vgm_smp"),
+            "vgm_smp_end": b.get("vgm_smp"),
+            "row_start": a.get("row"),
+            "row_end": b.get("row"),
+            "sim_us": dsim_us,
+            "wall_s": dwall,
+            "sim_us_per_wall_s": dsim_us / dwall if dwall > 0 else None,
+            "writes": writes,
+            "writes_per_sim_ms": writes / (dsim_us / 1e3),
+            "waits": b.get("waits", 0) - a.get("waits", 0),
+            "log_records": sum(b.get(k, 0) - a.get(k, 0) for k in ("mo", "ro", "acc", "dur")),
+        })
+
+    prof = {"records": len(records), "intervals": intervals}
+    if not intervals:
+        return prof
+
+    first, last = records[0], records[-1]
+    sim_us = (last["t_ps"] - first["t_ps"]) / 1e6
+    wall = last["wall_s"] - first["wall_s"]
+    rates = [iv["sim_us_per_wall_s"] for iv in intervals if iv["sim_us_per_wall_s"]]
+    med = statistics.median(rates) if rates else None
+
+    busy = [iv["sim_us_per_wall_s"] for iv in intervals
+            if iv["writes"] > 0 and iv["sim_us_per_wall_s"]]
+    idle = [iv["sim_us_per_wall_s"] for iv in intervals
+            if iv["writes"] == 0 and iv["sim_us_per_wall_s"]]
+
+    slow = [iv for iv in intervals
+            if med and iv["sim_us_per_wall_s"] is not None
+            and iv["sim_us_per_wall_s"] < SLOW_RATIO * med]
+    slow.sort(key=lambda iv: iv["sim_us_per_wall_s"])
+
+    prof["summary"] = {
+        "sim_us": sim_us,
+        "wall_s": wall,
+        "sim_us_per_wall_s": sim_us / wall if wall > 0 else None,
+        "median_sim_us_per_wall_s": med,
+        "median_with_writes": statistics.median(busy) if busy else None,
+        "median_without_writes": statistics.median(idle) if idle else None,
+        "total_writes": last.get("writes", 0) - first.get("writes", 0),
+        "slow_intervals": len(slow),
+        "slow_wall_s": sum(iv["wall_s"] for iv in slow),
+    }
+    prof["hotspots"] = slow[:top]
+    prof["tests"] = per_test_summary(records, names)
+    return prof
+
+
+def per_test_summary(records, names=None):
+    """Simulated / wall time of every test (records carry test=<idx>)."""
+    spans = {}
+    for r in records:
+        idx = r.get("test")
+        if idx is None or idx < 0:
+            continue
+        if idx not in spans or r["tag"] == "test_start":
+            spans[idx] = [r, r]
+        else:
+            spans[idx][1] = r
+    out = []
+    for idx in sorted(spans):
+        a, b = spans[idx]
+        sim_us = (b["t_ps"] - a["t_ps"]) / 1e6
+        wall = b["wall_s"] - a["wall_s"]
+        out.append({
+            "test": idx,
+            "name": names[idx] if names and idx < len(names) else None,
+            "sim_us": sim_us,
+            "wall_s": wall,
+            "sim_us_per_wall_s": sim_us / wall if wall > 0 else None,
+            "writes": b.get("writes", 0) - a.get("writes", 0),
+            "complete": b["tag"] == "test_end",
+        })
+    return out
+
+
+def print_profile(prof, name=""):
+    s = prof.get("summary")
+    if s is None:
+        print("[WARN] not enough progress records for a profile")
+        return
+    rate = s["sim_us_per_wall_s"] or 0.0
+    print(f"[INFO] {name}: {s['sim_us']:.0f} sim-us in {s['wall_s']:.2f} s wall "
+          f"= {rate:.1f} sim-us/s")
+    if s["median_with_writes"] and s["median_without_writes"]:
+        print(f"[INFO] median sim-us/s: with writes {s['median_with_writes']:.1f}, "
+              f"without {s['median_without_writes']:.1f}")
+    print(f"[INFO] slow intervals (< {SLOW_RATIO:.0%} of median): {s['slow_intervals']}, "
+          f"{s['slow_wall_s']:.2f} s wall")
+    for iv in prof["hotspots"]:
+        print(f"  vgm_smp {iv['vgm_smp_start']}..{iv['vgm_smp_end']} "
+              f"rows {iv['row_start']}..{iv['row_end']}: "
+              f"{iv['sim_us_per_wall_s']:.1f} sim-us/s, {iv['writes']} writes "
+              f"({iv['writes_per_sim_ms']:.2f}/ms), {iv['waits']} waits")
+    tests = prof.get("tests") or []
+    if len(tests) > 1 or (tests and tests[0]["name"]):
+        print(f"[INFO] tests: {len(tests)}")
+        for t in tests:
+            label = t["name"] or f"#{t['test']}"
+            flag = "" if t["complete"] else "  (incomplete)"
+            print(f"  {label:32s} {t['sim_us']:10.0f} sim-us  {t['wall_s']:8.2f} s wall  "
+                  f"{t['writes']:6d} writes{flag}")
+
+
+def write_profile(path, prof, **meta):
+    out = dict(meta)
+    out.update(prof)
+    Path(path).write_text(json.dumps(out, indent=2) + "\n")
+    print(f"[INFO] wrote {path}")
+
+
+# ---------------------------------------------------------------------------
+# Main
+# ---------------------------------------------------------------------------
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Run IKAOPLL_vgm_tb and profile simulated time per wall second."
+    )
+    ap.add_argument("plusargs", nargs="*",
+                    help="extra simulator arguments (e.g. +PROGRESS_SMP=4410)")
+    ap.add_argument("--vvp", default="ikaopll_vgm_tb.vvp",
+                    help="compiled testbench (default: ikaopll_vgm_tb.vvp)")
+    ap.add_argument("--build", action="store_true",
+                    help="compile the testbench with iverilog first")
+    stim = ap.add_mutually_exclusive_group()
+    stim.add_argument("--vh", default=None,
+                      help="stimulus include for --build (sets VGM_VH)")
+    stim.add_argument("--suite", default=None,
+                      help="multi-test include from make_tb_suite.py (sets VGM_SUITE_VH "
+                           "for --build, creates the per-test log directories)")
+    ap.add_argument("-D", "--define", action="append", default=[], metavar="NAME=VALUE",
+                    help="macro for --build (e.g. IKAOPLL_USE_PIPELINED_MULTIPLIER=1)")
+    ap.add_argument("--name", default=None,
+                    help="profile name (default: --vh / --suite stem, else --vvp stem)")
+    ap.add_argument("--out-dir", default=".",
+                    help="directory for .progress.tsv / .profile.json")
+    ap.add_argument("--fst", action="store_true",
+                    help="pass -fst to vvp (waveforms as FST, see +DUMP*)")
+    ap.add_argument("--log", default=None,
+                    help="also save the full simulator output here")
+    ap.add_argument("--quiet", action="store_true",
+                    help="do not echo simulator output")
+    ap.add_argument("--top", type=int, default=10,
+                    help="number of slow sections to report (default: 10)")
+    ap.add_argument("--analyze", metavar="PROGRESS_TSV", default=None,
+                    help="only re-analyse a recorded .progress.tsv")
+    args = ap.parse_args(argv)
+
+    tests = None
+    if args.suite:
+        from make_tb_suite import read_suite_tests
+        tests = read_suite_tests(args.suite)
+
+    if args.analyze:
+        name = Path(args.analyze).name.split(".")[0]
+        prof = build_profile(read_progress_tsv(args.analyze), args.top, tests)
+        print_profile(prof, name)
+        write_profile(Path(args.analyze).with_name(name + ".profile.json"), prof,
+                      test=name, source=args.analyze)
+        return 0
+
+    if args.name:
+        name = args.name
+    elif args.vh or args.suite:
+        name = Path(args.vh or args.suite).name.split(".")[0]
+    else:
+        name = Path(args.vvp).stem
+
+    if args.build:
+        defines = dict(d.partition("=")[::2] for d in args.define)
+        rc = build(args.vvp, args.vh, suite=args.suite, defines=defines)
+        if rc != 0:
+            print(f"[ERROR] build failed (exit {rc})", file=sys.stderr)
+            return rc
+    if not Path(args.vvp).exists():
+        print(f"[ERROR] No such file: {args.vvp} (use --build)", file=sys.stderr)
+        return 1
+
+    if tests:
+        # TB は <test>/samples_*.txt を開くだけなので、ディレクトリはここで作る
+        for t in tests:
+            Path(t).mkdir(parents=True, exist_ok=True)
+        print(f"[INFO] suite: {len(tests)} tests")
+
+    # -fst は vvp の拡張引数なので .vvp ファイルの後ろに置く
+    cmd = ["vvp", args.vvp] + (["-fst"] if args.fst else []) + args.plusargs
+    records, rc, wall = run_and_record(cmd, args.log, args.quiet)
+    print(f"[INFO] simulator exit {rc}, wall {wall:.2f} s, {len(records)} progress records")
+
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tsv = out_dir / f"{name}.progress.tsv"
+    write_progress_tsv(tsv, records)
+    print(f"[INFO] wrote {tsv}")
+
+    prof = build_profile(records, args.top, tests)
+    print_profile(prof, name)
+    write_profile(out_dir / f"{name}.profile.json", prof,
+                  test=name, command=cmd, exit_code=rc, wall_s_total=wall)
+    return rc
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+"""
+solo_render.py
+
+Per-channel solo renders of one stimulus, for channel-level triage of a
+mixed test (e.g. ym2413_chords_mix).
+
+1. Split: one solo variant per sounding channel (ch0-ch8) and rhythm
+   instrument (BD, SD, TOM, TCY, HH) is derived from the stimulus
+   (register CSV, .ymev or VGM) by masking the other voices:
+     - key-on bits (0x20-0x28 bit 4) of the other channels are cleared,
+       their volume (0x30-0x38 low nibble) is forced to 15 (mute)
+     - 0x0E keeps the rhythm mode bit; only a drum variant keeps its own
+       drum key bit, and drum variants keep 0x36-0x38 (drum volumes)
+   Timing and all other writes (user patch, F-numbers, ...) are kept, so
+   every variant replays the same register traffic as the mix.  With
+   --mix the unmodified stimulus is rendered as well (variant "mix").
+
+2. Simulate: the variants are dealt into -j suites (make_tb_suite.py,
+   longest first onto the least loaded job); each suite is compiled and
+   run in its own directory, all jobs concurrently.
+
+3. Render: every variant's samples_mo.txt is averaged per duration (MO
+   and RO mixed like the TB's ACC) and written as an unnormalised float32
+   WAV <out>/<test>.<variant>.wav (full scale = 10-bit DAC range), so
+   the solo levels stay comparable.  With --mix the sum of the solos is
+   compared with the mix (superposition residual).
+
+4. Compare (--golden DIR): each WAV against DIR/<same name>: length,
+   max |diff|, RMS of the difference relative to the golden RMS, level
+   change and the first sample off by more than 1 LSB.  A variant whose
+   difference exceeds --threshold dB is reported as DIFF (exit code 1).
+   --bless copies the new WAVs into DIR.
+
+Usage:
+  python3 solo_render.py tests/ym2413_chords_mix.vgm.csv -o solo -j 8 --golden golden/solo
+  python3 solo_render.py tests/ym2413_rhythm_mode_basic.vgm.csv -o solo --only BD,SD --no-sim
+  python3 solo_render.py tests/ym2413_chords_mix.vgm.csv -o solo --reuse --golden golden/solo --bless
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+import metrics
+import reg_events
+from make_ref_wav import load_avg_by_duration_from_samples_mo, resolve_mo_fs
+from make_tb_suite import test_name, write_suite
+from mo_ro_log import mix_paths
+from run_tb import REPO_ROOT, build, run_and_record
+from wav_writer import read_wav, write_wav
+
+N_CH = 9
+DRUMS = ("HH", "TCY", "TOM", "SD", "BD")      # 0x0E bit 0..4
+RHYTHM_EN = 0x20
+KEY_BIT = 0x10
+
+DAC_FULL_SCALE = 512.0                        # IMP_FLUC_MO/RO: signed 10 bit
+LSB = 1.0 / DAC_FULL_SCALE
+
+
+# ----------------------------------------------------------------------
+# Split
+# ----------------------------------------------------------------------
+def used_voices(events):
+    """Channels keyed on and drums hit anywhere in the stimulus."""
+    used = []
+    rhythm = 0
+    for _, _, reg, val in events:
+        reg &= 0x3F
+        if 0x20 <= reg < 0x20 + N_CH and val & KEY_BIT:
+            name = f"ch{reg - 0x20}"
+        elif reg == 0x0E and val & RHYTHM_EN:
+            rhythm |= val & 0x1F
+            continue
+        else:
+            continue
+        if name not in used:
+            used.append(name)
+    used.sort(key=lambda n: int(n[2:]))
+    used += [d for i, d in reversed(list(enumerate(DRUMS))) if rhythm >> i & 1]
+    return used
+
+
+def solo_events(events, voice):
+    """events with every voice except `voice` (chN or a drum name) muted."""
+    drum = voice in DRUMS
+    keep_ch = None if drum else int(voice[2:])
+    drum_mask = (1 << DRUMS.index(voice)) if drum else 0
+    out = []
+    for d, dd, reg, val in events:
+        r = reg & 0x3F
+        if 0x20 <= r < 0x20 + N_CH and r - 0x20 != keep_ch:
+            val &= ~KEY_BIT & 0xFF
+        elif 0x30 <= r < 0x30 + N_CH and r - 0x30 != keep_ch:
+            # リズムの音量（0x36-0x38）はドラム単独のときは残す
+            if not (drum and r >= 0x36):
+                val |= 0x0F
+        elif r == 0x0E:
+            val &= RHYTHM_EN | drum_mask
+        out.append((d, dd, reg, val))
+    return out
+
+
+def write_variants(stimulus, out_dir, voices, with_mix):
+    """Write one CSV per variant; returns [(variant, csv path, length)]."""
+    events = reg_events.load_stimulus_events(stimulus)
+    base = test_name(stimulus)
+    if base.endswith((".vgm", ".vgz")):
+        base = base[:-4]
+    var_dir = Path(out_dir) / "variants"
+    var_dir.mkdir(parents=True, exist_ok=True)
+    length = events.total_delay()
+    out = []
+    for v in voices + (["mix"] if with_mix else []):
+        rows = list(events) if v == "mix" else solo_events(events, v)
+        p = var_dir / f"{base}.{v}.csv"
+        reg_events.write_csv(p, reg_events.RegEvents(*zip(*rows)) if rows else events)
+        out.append((v, p, length))
+    return base, out
+
+
+def deal_jobs(variants, jobs):
+    """Longest first onto the least loaded job (LPT)."""
+    bins = [[] for _ in range(max(1, min(jobs, len(variants))))]
+    load = [0] * len(bins)
+    for v in sorted(variants, key=lambda x: -x[2]):
+        k = load.index(min(load))
+        bins[k].append(v)
+        load[k] += v[2]
+    return bins
+
+
+# ----------------------------------------------------------------------
+# Simulate
+# ----------------------------------------------------------------------
+def run_job(job_dir, csvs, iverilog, quiet=True, root=REPO_ROOT):
+    """Build and run one suite in job_dir; returns (job_dir, exit code, wall s)."""
+    job_dir = Path(job_dir).resolve()
+    job_dir.mkdir(parents=True, exist_ok=True)
+    suite = job_dir / "suite.vh"
+    names, _, _ = write_suite(suite, csvs)
+    vvp = job_dir / "ikaopll_vgm_tb.vvp"
+    rc = build(vvp, suite=suite, iverilog=iverilog, root=root)
+    if rc != 0:
+        return job_dir, rc, 0.0
+    for n in names:
+        (job_dir / n).mkdir(exist_ok=True)
+    _, rc, wall = run_and_record(["vvp", str(vvp)], job_dir / "sim.log", quiet, cwd=job_dir)
+    return job_dir, rc, wall
+
+
+# ----------------------------------------------------------------------
+# Render / compare
+# ----------------------------------------------------------------------
+def render_variant(log_dir, out_wav):
+    """samples_mo.txt → unnormalised float32 WAV; returns (path, n, fs) or None."""
+    mo = Path(log_dir) / "samples_mo.txt"
+    if not mo.is_file():
+        return None
+    avg, has_ro, cols = load_avg_by_duration_from_samples_mo(str(mo))
+    if not avg:
+        return None
+    fs, _ = resolve_mo_fs(None, cols, str(mo))
+    series = mix_paths(avg["MO"], avg["RO"]) if has_ro else avg["MO"]
+    x = np.asarray(series, dtype=np.float64) / DAC_FULL_SCALE
+    write_wav(str(out_wav), x, fs, "float32")
+    return str(out_wav), len(x), fs
+
+
+def _rms(x):
+    return float(np.sqrt(np.mean(np.square(x)))) if len(x) else 0.0
+
+
+def _db(a, b):
+    if a <= 0.0:
+        return -float("inf")
+    return 20.0 * np.log10(a / b) if b > 0.0 else float("inf")
+
+
+def compare(new, gold):
+    """Difference metrics of two sample arrays (golden = reference)."""
+    n = min(len(new), len(gold))
+    d = new[:n] - gold[:n]
+    over = np.flatnonzero(np.abs(d) > LSB)
+    g_rms = _rms(gold[:n])
+    return {
+        "len_new": len(new), "len_golden": len(gold),
+        "max_abs": float(np.max(np.abs(d))) if n else 0.0,
+        "diff_db": _db(_rms(d), g_rms),
+        "level_db": _db(_rms(new[:n]), g_rms) if g_rms > 0 else 0.0,
+        "first_diff": int(over[0]) if len(over) else None,
+        "identical": len(new) == len(gold) and not np.any(d),
+    }
+
+
+def superposition_residual(solo_wavs, mix_wav):
+    """RMS of (sum of solos - mix) relative to the mix, in dB."""
+    mix, _ = read_wav(mix_wav)
+    acc = np.zeros_like(mix)
+    for p in solo_wavs:
+        x, _ = read_wav(p)
+        n = min(len(x), len(acc))
+        acc[:n] += x[:n]
+    return _db(_rms(acc - mix), _rms(mix))
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Render per-channel / per-drum solo variants of a stimulus in parallel "
+                    "and compare them against golden WAVs."
+    )
+    ap.add_argument("stimulus", help="register CSV, .ymev or VGM")
+    ap.add_argument("-o", "--out-dir", default="solo", help="output directory (default: solo)")
+    ap.add_argument("-j", "--jobs", type=int, default=0,
+                    help="parallel simulations (0 = all cores; default: 0)")
+    ap.add_argument("--only", default=None,
+                    help="comma-separated voices (e.g. ch0,ch3,BD; default: all that sound)")
+    ap.add_argument("--all", action="store_true", help="all 9 channels and 5 drums")
+    ap.add_argument("--mix", action="store_true",
+                    help="also render the unmodified stimulus and check the superposition")
+    ap.add_argument("--no-sim", action="store_true",
+                    help="only write the variant CSVs and suites")
+    ap.add_argument("--reuse", action="store_true",
+                    help="skip build/run, render from the logs of a previous run")
+    ap.add_argument("--iverilog", default="iverilog", help="iverilog binary (default: iverilog)")
+    ap.add_argument("--golden", default=None, help="directory with golden solo WAVs")
+    ap.add_argument("--bless", action="store_true", help="copy the new WAVs into --golden")
+    ap.add_argument("--threshold", type=float, default=-60.0,
+                    help="difference RMS relative to golden that counts as DIFF (default: -60 dB)")
+    args = ap.parse_args(argv)
+
+    if args.bless and not args.golden:
+        print("[ERROR] --bless needs --golden", file=sys.stderr)
+        return 1
+    with metrics.stage("parse") as st:
+        try:
+            events = reg_events.load_stimulus_events(args.stimulus)
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] {args.stimulus}: {e}", file=sys.stderr)
+            return 1
+        st.count(len(events), "writes")
+    if args.all:
+        voices = [f"ch{c}" for c in range(N_CH)] + list(reversed(DRUMS))
+    elif args.only:
+        voices = [v.strip() for v in args.only.split(",") if v.strip()]
+    else:
+        voices = used_voices(events)
+    bad = [v for v in voices if v not in DRUMS and not (v[:2] == "ch" and v[2:].isdigit()
+                                                       and int(v[2:]) < N_CH)]
+    if bad:
+        print(f"[ERROR] unknown voice(s): {', '.join(bad)}", file=sys.stderr)
+        return 1
+    if not voices:
+        print("[ERROR] nothing sounds in the stimulus", file=sys.stderr)
+        return 1
+
+    out_dir = Path(args.out_dir)
+    base, variants = write_variants(args.stimulus, out_dir, voices, args.mix)
+    jobs = args.jobs or os.cpu_count() or 1
+    bins = deal_jobs(variants, jobs)
+    print(f"[INFO] {len(variants)} variants of {base}: {', '.join(v for v, _, _ in variants)}")
+    print(f"[INFO] {len(bins)} parallel suites, "
+          f"longest {max(sum(x[2] for x in b) for b in bins) / 44_100:.3f} s of stimulus")
+    job_dirs = [out_dir / "sim" / f"job{k}" for k in range(len(bins))]
+
+    if args.no_sim:
+        for jd, b in zip(job_dirs, bins):
+            jd.mkdir(parents=True, exist_ok=True)
+            write_suite(jd / "suite.vh", [p for _, p, _ in b])
+        print(f"[INFO] wrote variants to {out_dir / 'variants'} and suites to {out_dir / 'sim'}")
+        return 0
+
+    if not args.reuse:
+        with metrics.stage("simulate") as st:
+            with ThreadPoolExecutor(len(bins)) as ex:
+                futs = [ex.submit(run_job, jd, [p for _, p, _ in b], args.iverilog)
+                        for jd, b in zip(job_dirs, bins)]
+                results = [f.result() for f in futs]
+            st.count(len(variants), "variants")
+        failed = [(jd, rc) for jd, rc, _ in results if rc != 0]
+        for jd, rc in failed:
+            print(f"[ERROR] {jd}: simulation failed (exit {rc}, see sim.log)", file=sys.stderr)
+        if failed:
+            return 1
+        wall = max(w for _, _, w in results)
+        print(f"[INFO] simulated {len(variants)} variants in {wall:.1f} s wall")
+
+    wavs = {}
+    with metrics.stage("convert") as st:
+        tasks = []
+        for jd, b in zip(job_dirs, bins):
+            for v, p, _ in b:
+                tasks.append((v, jd / test_name(p), out_dir / f"{base}.{v}.wav"))
+        with ProcessPoolExecutor(min(jobs, len(tasks))) as ex:
+            futs = {v: ex.submit(render_variant, log, wav) for v, log, wav in tasks}
+            for v, f in futs.items():
+                r = f.result()
+                if r is None:
+                    print(f"[WARN] {v}: no samples_mo.txt in the simulation output")
+                    continue
+                wavs[v] = r[0]
+                metrics.add_output(r[0])
+        st.count(len(tasks), "variants")
+    if not wavs:
+        print("[ERROR] no variant produced any output", file=sys.stderr)
+        return 1
+    print(f"[INFO] wrote {len(wavs)} WAVs to {out_dir}")
+
+    if "mix" in wavs:
+        solos = [wavs[v] for v in voices if v in wavs]
+        print(f"[INFO] superposition: sum of {len(solos)} solos - mix = "
+              f"{superposition_residual(solos, wavs['mix']):.1f} dB re mix")
+
+    if not args.golden:
+        return 0
+    gdir = Path(args.golden)
+    n_diff = 0
+    print(f"[INFO] {'variant':8s} {'status':8s} {'diff dB':>8s} {'level dB':>9s} "
+          f"{'max |d|':>8s}  first diff")
+    for v in [x for x, _, _ in variants]:
+        if v not in wavs:
+            continue
+        g = gdir / Path(wavs[v]).name
+        if not g.is_file():
+            print(f"[INFO] {v:8s} {'missing':8s}")
+            continue
+        new, fs = read_wav(wavs[v])
+        gold, _ = read_wav(g)
+        m = compare(new, gold)
+        if m["identical"]:
+            status = "same"
+        elif m["diff_db"] > args.threshold or m["len_new"] != m["len_golden"]:
+            status = "DIFF"
+            n_diff += 1
+        else:
+            status = "ok"
+        first = "-" if m["first_diff"] is None else f"{m['first_diff'] / fs:.4f} s"
+        lens = "" if m["len_new"] == m["len_golden"] else \
+            f"  (length {m['len_new']} vs {m['len_golden']})"
+        print(f"[INFO] {v:8s} {status:8s} {m['diff_db']:8.1f} {m['level_db']:9.2f} "
+              f"{m['max_abs'] * DAC_FULL_SCALE:8.1f}  {first}{lens}")
+    if args.bless:
+        gdir.mkdir(parents=True, exist_ok=True)
+        for p in wavs.values():
+            shutil.copy2(p, gdir / Path(p).name)
+        print(f"[INFO] blessed {len(wavs)} WAVs into {gdir}")
+    print(f"[INFO] {n_diff} of {len(wavs)} variants differ from golden")
+    return 1 if n_diff and not args.bless else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,493 @@
+#!/usr/bin/env python3
+"""
+stim_reduce.py
+
+Reduce a failing stimulus to a small reproducer (delta debugging).
+
+The stimulus (register CSV, .ymev or VGM) is a list of register writes
+at absolute VGM-sample times.  Candidate reductions are simulated in
+parallel (-j, one build + vvp per candidate in its own directory) and a
+candidate is kept when it still fails.  "Fails" is one of:
+
+  --check CMD     a shell command run in the candidate's log directory
+                  exits with --fail-rc (default 1, the failure code of
+                  pitch_check.py / env_check.py; they exit 2 on unusable
+                  input).  A candidate that does not build, simulate or
+                  render counts as passing and is not checked.
+                  Placeholders:
+                    {csv} candidate CSV   {dir} log directory
+                    {wav} rendered WAV (unnormalised float32, MO+RO)
+                    {t0} {t1} --window mapped onto the candidate (s)
+  --ref-root DIR  the same candidate built from another source tree (e.g.
+                  a git worktree of the last good revision) differs from
+                  this tree by more than --tol LSB inside --window
+
+Reductions, repeated until a whole pass changes nothing:
+
+  trim-end    drop the writes after a cut point (parallel bisection)
+  trim-start  replace the writes before a cut point by one write per
+              register that holds their final state (user patch,
+              F-numbers, instruments, rhythm, key bits), then continue
+              with the original gap
+  ddmin       drop chunks of writes (complements, n = 2, 4, ...); the
+              timing of the remaining writes is unchanged
+  delays      cap all gaps between writes (geometric steps), then halve
+              the gaps chunk by chunk; skipped with --keep-timing
+
+Every write remembers its time in the original stimulus, so --window
+(given in original seconds) follows the reductions.  Identical
+candidates are simulated once.  The log directories of rejected
+candidates are deleted as soon as they are judged.
+
+Usage:
+  python3 stim_reduce.py song.vgm --ref-root ../ikaopll-good --window 12.30:12.45 -j 16
+  python3 stim_reduce.py tests/ym2413_chords_mix.vgm.csv -j 8 \\
+      --check "python3 $PWD/tools/pitch_check.py {csv} {wav} --offset 0.0123"
+"""
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+import metrics
+import reg_events
+from make_tb_suite import test_name
+from run_tb import REPO_ROOT
+from solo_render import LSB, render_variant, run_job
+from wav_writer import read_wav
+
+VGM_RATE = 44_100
+
+# 開始側を切るときに状態として書き直すレジスタ（この順に書く）
+STATE_REGS = ([0x0F] + list(range(0x00, 0x08)) + list(range(0x10, 0x19))
+              + list(range(0x30, 0x39)) + [0x0E] + list(range(0x20, 0x29)))
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+# ----------------------------------------------------------------------
+# Candidates
+# ----------------------------------------------------------------------
+# write = (t, dd, reg, val, t_orig): t = address write time (VGM samples),
+# dd = data delay, t_orig = time in the original stimulus (None = state write)
+def writes_from_events(events):
+    out = []
+    t = 0
+    for d, dd, reg, val in events:
+        t += d
+        out.append((t, dd, reg, val, t))
+        t += dd
+    return out
+
+
+def to_events(writes):
+    delay, data_delay, reg, val = [], [], [], []
+    t = 0
+    for w_t, dd, r, v, _ in writes:
+        delay.append(w_t - t)
+        data_delay.append(dd)
+        reg.append(r)
+        val.append(v)
+        t = w_t + dd
+    return reg_events.RegEvents(delay, data_delay, reg, val)
+
+
+def length(writes):
+    return writes[-1][0] + writes[-1][1] if writes else 0
+
+
+def size(writes):
+    return len(writes), length(writes)
+
+
+def key(writes):
+    h = hashlib.blake2b(digest_size=16)
+    for t, dd, r, v, _ in writes:
+        h.update(b"%d,%d,%d,%d;" % (t, dd, r, v))
+    return h.hexdigest()
+
+
+def gaps(writes):
+    """Idle time before every write (after the previous data write)."""
+    out = []
+    t = 0
+    for w_t, dd, _, _, _ in writes:
+        out.append(w_t - t)
+        t = w_t + dd
+    return out
+
+
+def with_gaps(writes, new_gaps):
+    out = []
+    t = 0
+    for (_, dd, r, v, o), g in zip(writes, new_gaps):
+        t += g
+        out.append((t, dd, r, v, o))
+        t += dd
+    return out
+
+
+def state_preamble(writes):
+    """One write per register holding the state after `writes`, all at t=0."""
+    regs = {}
+    for _, _, r, v, _ in writes:
+        regs[r & 0x3F] = v
+    return [(0, 0, r, regs[r], None) for r in STATE_REGS if r in regs]
+
+
+def cut_start(writes, i):
+    """State of writes[:i] + writes[i:] shifted to follow it."""
+    if i <= 0:
+        return list(writes)
+    pre = state_preamble(writes[:i])
+    gap = gaps(writes)[i]
+    shift = writes[i][0] - gap
+    return pre + [(t - shift, dd, r, v, o) for t, dd, r, v, o in writes[i:]]
+
+
+def to_candidate_time(writes, t_orig):
+    """Map a time of the original stimulus onto a candidate (VGM samples)."""
+    mapped = [(t, o) for t, _, _, _, o in writes if o is not None]
+    if not mapped:
+        return None
+    prev = None
+    for t, o in mapped:
+        if o > t_orig:
+            if prev is None:
+                return max(0, t - (o - t_orig))
+            pt, po = prev
+            return min(pt + (t_orig - po), t)
+        prev = (t, o)
+    pt, po = prev
+    return pt + (t_orig - po)
+
+
+# ----------------------------------------------------------------------
+# Evaluation
+# ----------------------------------------------------------------------
+class Oracle:
+    """Simulates candidates in parallel and caches the verdicts."""
+
+    def __init__(self, work_dir, args):
+        self.work_dir = Path(work_dir).resolve()
+        self.args = args
+        self.jobs = args.jobs or os.cpu_count() or 1
+        self.cache = {}
+        self.n_sims = 0
+        self.best = None             # smallest failing candidate so far
+        self.best_dir = None
+        self._lock = threading.Lock()
+
+    def _new_dir(self):
+        with self._lock:
+            if self.args.max_sims and self.n_sims >= self.args.max_sims:
+                raise BudgetExceeded()
+            self.n_sims += 1
+            n = self.n_sims
+        d = self.work_dir / f"c{n:05d}"
+        d.mkdir(parents=True, exist_ok=True)
+        return d
+
+    def _window(self, writes):
+        if self.args.window is None:
+            return 0.0, length(writes) / VGM_RATE
+        t0, t1 = (to_candidate_time(writes, x * VGM_RATE) for x in self.args.window)
+        if t0 is None:
+            return 0.0, length(writes) / VGM_RATE
+        return t0 / VGM_RATE, t1 / VGM_RATE
+
+    def _simulate(self, d, csv, root):
+        jd, rc, _ = run_job(d, [csv], self.args.iverilog, root=root)
+        log = jd / test_name(csv)
+        wav = d / f"{jd.name}.wav"
+        if rc != 0 or render_variant(log, wav) is None:
+            return None, log
+        return wav, log
+
+    def _run(self, writes):
+        d = self._new_dir()
+        csv = d / "stim.csv"
+        reg_events.write_csv(csv, to_events(writes))
+        t0, t1 = self._window(writes)
+        if self.args.check:
+            wav, log = self._simulate(d / "sim", csv, REPO_ROOT)
+            if wav is None:
+                print(f"[WARN] {d.name}: simulation failed, candidate counted as passing")
+                return d, False
+            cmd = self.args.check.format(csv=csv.resolve(), wav=wav, dir=log,
+                                         t0=f"{t0:.6f}", t1=f"{t1:.6f}")
+            with open(d / "check.log", "w") as f:
+                rc = subprocess.call(cmd, shell=True, cwd=log if log.is_dir() else d,
+                                     stdout=f, stderr=subprocess.STDOUT)
+            return d, rc == self.args.fail_rc
+        dut, _ = self._simulate(d / "dut", csv, REPO_ROOT)
+        ref, _ = self._simulate(d / "ref", csv, self.args.ref_root)
+        if dut is None or ref is None:
+            print(f"[WARN] {d.name}: simulation failed, candidate counted as passing")
+            return d, False
+        return d, differs(dut, ref, t0 + self.args.offset, t1 + self.args.offset,
+                          self.args.tol)
+
+    def _judge(self, writes, d, bad):
+        # 失敗した最小の候補のログだけを残す
+        drop = d
+        if bad and (self.best is None or size(writes) < size(self.best)):
+            drop = self.best_dir
+            self.best, self.best_dir = writes, d
+        if drop is not None and not self.args.keep_all:
+            shutil.rmtree(drop, ignore_errors=True)
+
+    def evaluate(self, cands, first=True):
+        """Verdicts of `cands`, in batches of -j.  With first=True the
+        batches stop at the first failing candidate (later ones are None)."""
+        out = [None] * len(cands)
+        keys = [key(c) for c in cands]
+        for b0 in range(0, len(cands), self.jobs):
+            todo = {}
+            for i in range(b0, min(b0 + self.jobs, len(cands))):
+                if keys[i] in self.cache:
+                    out[i] = self.cache[keys[i]]
+                elif keys[i] not in todo:
+                    todo[keys[i]] = i
+            if todo:
+                with ThreadPoolExecutor(len(todo)) as ex:
+                    futs = {k: ex.submit(self._run, cands[i]) for k, i in todo.items()}
+                    done = {k: f.result() for k, f in futs.items()}
+                # 最初に失敗した候補を採用するので、判定は入力順に行う
+                for i in range(b0, min(b0 + self.jobs, len(cands))):
+                    if keys[i] in done:
+                        d, bad = done.pop(keys[i])
+                        self.cache[keys[i]] = bad
+                        self._judge(cands[i], d, bad)
+                    out[i] = self.cache[keys[i]]
+            if first and any(out[b0:b0 + self.jobs]):
+                break
+        return out
+
+    def first_failing(self, cands):
+        for c, bad in zip(cands, self.evaluate(cands)):
+            if bad:
+                return c
+        return None
+
+
+def differs(dut_wav, ref_wav, t0, t1, tol):
+    """True if the two renders differ by more than tol LSB within [t0, t1] s."""
+    a, fs = read_wav(str(dut_wav))
+    b, _ = read_wav(str(ref_wav))
+    n = min(len(a), len(b))
+    i0 = max(0, int(t0 * fs))
+    i1 = min(n, int(np.ceil(t1 * fs)) + 1)
+    if i1 <= i0:
+        return False
+    return bool(np.max(np.abs(a[i0:i1] - b[i0:i1])) > tol * LSB)
+
+
+# ----------------------------------------------------------------------
+# Reductions
+# ----------------------------------------------------------------------
+def _points(lo, hi, n):
+    """Up to n distinct integers strictly between lo and hi, evenly spaced."""
+    return sorted({lo + (hi - lo) * k // (n + 1) for k in range(1, n + 1)} - {lo, hi})
+
+
+def trim_end(oracle, writes):
+    lo, hi = 0, len(writes)          # writes[:hi] fails
+    while hi - lo > 1:
+        pts = _points(lo, hi, oracle.jobs)
+        res = oracle.evaluate([writes[:k] for k in pts], first=False)
+        bad = [k for k, r in zip(pts, res) if r]
+        if bad:
+            hi = bad[0]
+        lo = max([k for k, r in zip(pts, res) if not r and k < hi], default=lo)
+    return writes[:hi]
+
+
+def trim_start(oracle, writes):
+    lo, hi = 0, len(writes)          # cut_start(writes, lo) fails
+    while hi - lo > 1:
+        pts = _points(lo, hi, oracle.jobs)
+        res = oracle.evaluate([cut_start(writes, k) for k in pts], first=False)
+        bad = [k for k, r in zip(pts, res) if r]
+        if bad:
+            lo = bad[-1]
+        hi = min([k for k, r in zip(pts, res) if not r and k > lo], default=hi)
+    return cut_start(writes, lo)
+
+
+def ddmin(oracle, writes):
+    n = 2
+    while len(writes) >= 2:
+        size = len(writes)
+        bounds = [size * k // n for k in range(n + 1)]
+        cands = [writes[:bounds[k]] + writes[bounds[k + 1]:] for k in range(n)]
+        found = oracle.first_failing([c for c in cands if len(c) < size])
+        if found is not None:
+            writes = found
+            n = max(n - 1, 2)
+        elif n >= size:
+            break
+        else:
+            n = min(2 * n, size)
+    return writes
+
+
+def compress_delays(oracle, writes):
+    g = gaps(writes)
+    # 1) 全体の上限を幾何級数で下げる
+    while True:
+        top = max(g[1:], default=0)
+        if top <= 1:
+            break
+        caps = sorted({top >> k for k in range(1, oracle.jobs + 1)} - {top}, reverse=True)
+        cands = [with_gaps(writes, [g[0]] + [min(x, c) for x in g[1:]]) for c in caps]
+        res = oracle.evaluate(cands, first=False)
+        bad = [c for c, r in zip(caps, res) if r]
+        if not bad:
+            break
+        writes = cands[caps.index(bad[-1])]
+        g = gaps(writes)
+    # 2) 残った長い間隔を部分ごとに半分にする
+    n = 2
+    while True:
+        idx = [i for i, x in enumerate(g) if x > 1]
+        if not idx:
+            break
+        n = min(n, len(idx))
+        bounds = [len(idx) * k // n for k in range(n + 1)]
+        cands = []
+        for k in range(n):
+            part = set(idx[bounds[k]:bounds[k + 1]])
+            cands.append(with_gaps(writes, [x // 2 if i in part else x for i, x in enumerate(g)]))
+        found = oracle.first_failing(cands)
+        if found is not None:
+            writes = found
+            g = gaps(writes)
+        elif n >= len(idx):
+            break
+        else:
+            n = min(2 * n, len(idx))
+    return writes
+
+
+def describe(writes):
+    return f"{len(writes)} writes, {length(writes) / VGM_RATE:.3f} s"
+
+
+def reduce(oracle, writes, keep_timing=False):
+    phases = [("trim-end", trim_end), ("trim-start", trim_start), ("ddmin", ddmin)]
+    if not keep_timing:
+        phases.append(("delays", compress_delays))
+    n_pass = 0
+    while True:
+        n_pass += 1
+        before = key(writes)
+        for name, fn in phases:
+            k0 = key(writes)
+            writes = fn(oracle, writes)
+            if key(writes) != k0:
+                print(f"[INFO] pass {n_pass} {name:10s} -> {describe(writes)} "
+                      f"({oracle.n_sims} sims)")
+        if key(writes) == before:
+            return writes
+
+
+def parse_window(s):
+    t0, sep, t1 = s.partition(":")
+    if not sep:
+        raise argparse.ArgumentTypeError("expected T0:T1 (seconds)")
+    t0, t1 = float(t0), float(t1)
+    if t1 < t0:
+        raise argparse.ArgumentTypeError("T1 must not be before T0")
+    return t0, t1
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Delta-debugging reduction of a failing YM2413 stimulus "
+                    "with parallel simulation batches."
+    )
+    ap.add_argument("stimulus", help="register CSV, .ymev or VGM")
+    pred = ap.add_mutually_exclusive_group(required=True)
+    pred.add_argument("--check", default=None,
+                      help="shell command that fails on the candidate "
+                           "({csv} {wav} {dir} {t0} {t1} are filled in)")
+    pred.add_argument("--ref-root", default=None,
+                      help="source tree of a reference build; fail = output differs")
+    ap.add_argument("--fail-rc", type=int, default=1,
+                    help="exit code of --check that means 'still fails' (default: 1)")
+    ap.add_argument("--window", type=parse_window, default=None,
+                    help="T0:T1 in seconds of the original stimulus (default: everything)")
+    ap.add_argument("--offset", type=float, default=0.0,
+                    help="time of the first VGM sample in the rendered WAV, s (default: 0)")
+    ap.add_argument("--tol", type=float, default=1.0,
+                    help="--ref-root: difference in LSB that counts (default: 1)")
+    ap.add_argument("-o", "--output", default=None,
+                    help="reduced CSV (default: <stimulus name>.min.csv)")
+    ap.add_argument("-w", "--work-dir", default="reduce",
+                    help="candidate directories (default: reduce)")
+    ap.add_argument("-j", "--jobs", type=int, default=0,
+                    help="parallel simulations (0 = all cores; default: 0)")
+    ap.add_argument("--max-sims", type=int, default=0,
+                    help="stop after this many simulations (0 = no limit)")
+    ap.add_argument("--keep-timing", action="store_true",
+                    help="do not shorten the gaps between writes")
+    ap.add_argument("--keep-all", action="store_true",
+                    help="keep the directories of all candidates")
+    ap.add_argument("--iverilog", default="iverilog", help="iverilog binary (default: iverilog)")
+    args = ap.parse_args(argv)
+
+    if args.ref_root and not Path(args.ref_root, "src", "IKAOPLL.v").is_file():
+        print(f"[ERROR] {args.ref_root}: no src/IKAOPLL.v", file=sys.stderr)
+        return 1
+    with metrics.stage("parse") as st:
+        try:
+            writes = writes_from_events(reg_events.load_stimulus_events(args.stimulus))
+        except (OSError, ValueError) as e:
+            print(f"[ERROR] {args.stimulus}: {e}", file=sys.stderr)
+            return 1
+        st.count(len(writes), "writes")
+    if not writes:
+        print(f"[ERROR] {args.stimulus}: no register writes", file=sys.stderr)
+        return 1
+    base = test_name(args.stimulus)
+    if base.endswith((".vgm", ".vgz")):
+        base = base[:-4]
+    out = Path(args.output or f"{base}.min.csv")
+
+    oracle = Oracle(args.work_dir, args)
+    print(f"[INFO] {args.stimulus}: {describe(writes)}, {oracle.jobs} parallel simulations")
+    with metrics.stage("simulate") as st:
+        try:
+            if not oracle.evaluate([writes])[0]:
+                print("[ERROR] the stimulus does not fail the predicate; nothing to reduce",
+                      file=sys.stderr)
+                return 1
+            best = reduce(oracle, writes, args.keep_timing)
+        except BudgetExceeded:
+            best = oracle.best
+            print(f"[WARN] --max-sims {args.max_sims} reached; writing the smallest failing "
+                  "candidate so far")
+        st.count(oracle.n_sims, "sims")
+    reg_events.write_csv(out, to_events(best))
+    print(f"[INFO] {describe(writes)} -> {describe(best)} in {oracle.n_sims} simulations")
+    if oracle.best is not None and key(oracle.best) == key(best):
+        print(f"[INFO] logs of the reduced stimulus: {oracle.best_dir}")
+    print(f"[INFO] Wrote {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
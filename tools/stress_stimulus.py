@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+stress_stimulus.py
+
+Synthetic worst-case YM2413 register traffic for benchmarking the RTL
+simulation and the conversion tools.
+
+Output is the usual ``delay,reg,data`` CSV (see vgm_csv_to_vh.py), so it
+feeds straight into vgm_csv_to_vh.py / IKAOPLL_vgm_tb.sv; optionally the
+same register stream is also written as a VGM file and as a ready-to-
+include .vh.
+
+Traffic model:
+  - all 9 melodic channels, with key-off / key-on retriggers, F-number and
+    block changes, sustain toggles
+  - rhythm mode (0x0E) on, with drum hits on all 5 instruments and
+    optional rhythm-mode toggles (channels 6-8 melodic <-> rhythm)
+  - patch churn: instrument / volume changes (0x30-0x38) and rewrites of
+    the user patch (0x00-0x07), with probability --patch-churn
+  - --density register writes per second (address + data pair), optionally
+    with --hold-every / --hold-seconds gaps (long sustained durations)
+
+Bus wait rules (same constants as IKAOPLL_vgm_tb.sv): after an address
+write 12 phiM cycles, after a data write 84 phiM cycles, phiM =
+EMUCLK / 4.  With VGM-sample (44.1 kHz, ~20.3 phiM) resolution that is
+a data row 1 sample after its address row, and the next address row at
+least 5 samples after the data row; the generator never schedules
+earlier, so the TB never has to insert waits and the simulated timeline
+matches the CSV exactly.  The maximum density is therefore one register
+write per 6 VGM samples (7350 writes/s); higher --density is clamped.
+
+Everything is derived from --seed with random.Random, so the output is
+reproducible.
+
+Usage:
+  python3 stress_stimulus.py tests/stress_max.vgm.csv --seconds 10 --density 7350
+  python3 stress_stimulus.py stress.csv --seconds 60 --density 2000 \\
+      --patch-churn 0.3 --hold-every 500 --hold-seconds 2 --vgm stress.vgm --vh stress.vh
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import math
+import random
+import sys
+from pathlib import Path
+
+VGM_RATE = 44_100
+EMUCLK_HZ = 3_579_545.0
+PHIM_HZ = EMUCLK_HZ / 4                  # TB: phiMref = EMUCLK / 4
+PHIM_PER_SAMPLE = PHIM_HZ / VGM_RATE     # ≈ 20.29
+
+# IKAOPLL_vgm_tb.sv と同じ最低ウェイト（phiM サイクル）
+MIN_WAIT_ADDR = 12
+MIN_WAIT_DATA = 84
+WRITE_PHIM = 4                           # IKAOPLL_write 1 回の所要サイクル
+
+# 上のルールを VGM サンプル単位に切り上げたもの
+ADDR_TO_DATA = math.ceil((MIN_WAIT_ADDR + WRITE_PHIM) / PHIM_PER_SAMPLE)   # 1
+DATA_TO_ADDR = math.ceil((MIN_WAIT_DATA + WRITE_PHIM) / PHIM_PER_SAMPLE)   # 5
+MIN_PAIR_SAMPLES = ADDR_TO_DATA + DATA_TO_ADDR
+MAX_DENSITY = VGM_RATE / MIN_PAIR_SAMPLES
+
+N_CH = 9
+RHYTHM_BITS = 0x1F                       # BD, SD, TOM, TCY, HH
+
+
+class StressProgram:
+    """Infinite stream of (reg, value) register writes."""
+
+    def __init__(self, rng, patch_churn=0.2, rhythm=True, rhythm_toggle=0.01):
+        self.rng = rng
+        self.patch_churn = patch_churn
+        self.rhythm = rhythm
+        self.rhythm_toggle = rhythm_toggle
+        self.rhythm_on = rhythm
+        self.key = [False] * N_CH
+        self.block_fnum = [0] * N_CH
+
+    def init_writes(self):
+        r = self.rng
+        for reg in range(8):                       # ユーザー音色
+            yield reg, r.randrange(256)
+        yield 0x0E, 0x20 if self.rhythm_on else 0x00
+        for ch in range(N_CH):
+            yield 0x30 + ch, (r.randrange(1, 16) << 4) | r.randrange(16)
+        # リズム用チャンネルの典型的な F-Number
+        for reg, val in ((0x16, 0x20), (0x17, 0x50), (0x18, 0xC0),
+                         (0x26, 0x05), (0x27, 0x05), (0x28, 0x01)):
+            yield reg, val
+
+    def _note(self, ch):
+        r = self.rng
+        fnum = r.randrange(0x80, 0x200)
+        block = r.randrange(8)
+        sus = r.random() < 0.3
+        self.block_fnum[ch] = (block << 9) | fnum
+        hi = (0x20 if sus else 0) | (block << 1) | (fnum >> 8)
+        if self.key[ch]:
+            yield 0x20 + ch, hi                    # key off（再トリガ）
+        yield 0x10 + ch, fnum & 0xFF
+        yield 0x20 + ch, 0x10 | hi
+        self.key[ch] = True
+
+    def _key_off(self, ch):
+        bf = self.block_fnum[ch]
+        yield 0x20 + ch, ((bf >> 9) << 1) | ((bf >> 8) & 1)
+        self.key[ch] = False
+
+    def _patch(self, ch):
+        r = self.rng
+        if r.random() < 0.25:
+            yield r.randrange(8), r.randrange(256)
+        else:
+            yield 0x30 + ch, (r.randrange(16) << 4) | r.randrange(16)
+
+    def _rhythm(self):
+        r = self.rng
+        if self.rhythm and r.random() < self.rhythm_toggle:
+            self.rhythm_on = not self.rhythm_on
+            yield 0x0E, 0x20 if self.rhythm_on else 0x00
+            return
+        if self.rhythm_on:
+            bits = r.randrange(1, RHYTHM_BITS + 1)
+            yield 0x0E, 0x20                       # いったん全 key off
+            yield 0x0E, 0x20 | bits
+
+    def __iter__(self):
+        yield from self.init_writes()
+        r = self.rng
+        while True:
+            x = r.random()
+            ch = r.randrange(N_CH)
+            if x < self.patch_churn:
+                yield from self._patch(ch)
+            elif self.rhythm and x < self.patch_churn + 0.15:
+                yield from self._rhythm()
+            elif self.key[ch] and r.random() < 0.2:
+                yield from self._key_off(ch)
+            else:
+                yield from self._note(ch)
+
+
+def schedule(writes, seconds, density, hold_every=0, hold_seconds=0.0):
+    """Place register writes on the VGM-sample grid.
+
+    Returns a list of (sample, reg, value) for the address rows; the data
+    row follows ADDR_TO_DATA samples later.
+    """
+    total = int(round(seconds * VGM_RATE))
+    if density > MAX_DENSITY:
+        print(f"[WARN] density {density:.0f}/s above the bus limit, "
+              f"clamped to {MAX_DENSITY:.0f}/s", file=sys.stderr)
+        density = MAX_DENSITY
+    step = VGM_RATE / density
+    hold = int(round(hold_seconds * VGM_RATE))
+
+    out = []
+    want = 0.0          # 希望時刻（サンプル、小数）
+    free = 0            # 次のアドレス書き込みが許される最初のサンプル
+    for n, (reg, val) in enumerate(writes):
+        t = max(int(math.ceil(want)), free)
+        if t + ADDR_TO_DATA >= total:
+            break
+        out.append((t, reg, val))
+        free = t + MIN_PAIR_SAMPLES
+        want += step
+        if hold_every and hold and (n + 1) % hold_every == 0:
+            want = max(want, free) + hold
+    return out, total
+
+
+def write_csv(path, placed):
+    """delay,reg,data rows (address "01" / data "00"), as vgm_to_ym2413_csv."""
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["delay", "reg", "data"])
+        last = 0
+        for t, reg, val in placed:
+            w.writerow([t - last, "01", f"{reg:02X}"])
+            w.writerow([ADDR_TO_DATA, "00", f"0x{val:02X}"])
+            last = t + ADDR_TO_DATA
+
+
+def vgm_events(placed):
+    last = 0
+    for t, reg, val in placed:
+        yield t - last, reg, val
+        last = t
+
+
+def summarize(placed, total):
+    n = len(placed)
+    dur_s = total / VGM_RATE
+    peak = 0
+    if placed:
+        # 10 ms 窓での最大書き込み数
+        win = VGM_RATE // 100
+        j = 0
+        for i in range(n):
+            while placed[i][0] - placed[j][0] >= win:
+                j += 1
+            peak = max(peak, i - j + 1)
+    print(f"[INFO] register writes : {n} ({2 * n} CSV rows) over {dur_s:.3f} s")
+    print(f"[INFO] mean density    : {n / dur_s if dur_s else 0:.1f} writes/s "
+          f"(bus limit {MAX_DENSITY:.0f}/s)")
+    print(f"[INFO] peak density    : {peak * 100} writes/s (10 ms window)")
+    print(f"[INFO] bus utilisation : {n * MIN_PAIR_SAMPLES / total if total else 0:.1%}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Generate worst-case YM2413 register traffic (CSV / VGM / .vh)."
+    )
+    ap.add_argument("output", help="output CSV (delay,reg,data)")
+    ap.add_argument("--seconds", type=float, default=10.0,
+                    help="stimulus length in seconds (default: 10)")
+    ap.add_argument("--density", type=float, default=MAX_DENSITY,
+                    help="register writes per second (default: bus maximum, "
+                         f"{MAX_DENSITY:.0f})")
+    ap.add_argument("--patch-churn", type=float, default=0.2,
+                    help="probability of an instrument / user-patch write (default: 0.2)")
+    ap.add_argument("--no-rhythm", action="store_true",
+                    help="melodic channels only (rhythm mode off)")
+    ap.add_argument("--rhythm-toggle", type=float, default=0.01,
+                    help="probability that a rhythm event toggles rhythm mode (default: 0.01)")
+    ap.add_argument("--hold-every", type=int, default=0,
+                    help="insert a hold after every N writes (default: off)")
+    ap.add_argument("--hold-seconds", type=float, default=0.0,
+                    help="hold length in seconds")
+    ap.add_argument("--seed", type=int, default=1, help="random seed (default: 1)")
+    ap.add_argument("--vgm", default=None, help="also write a VGM file")
+    ap.add_argument("--vh", default=None, help="also write the TB include (.vh)")
+    args = ap.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    prog = StressProgram(rng, args.patch_churn, rhythm=not args.no_rhythm,
+                         rhythm_toggle=args.rhythm_toggle)
+    placed, total = schedule(iter(prog), args.seconds, args.density,
+                             args.hold_every, args.hold_seconds)
+
+    out = Path(args.output)
+    write_csv(out, placed)
+    print(f"[INFO] wrote {out}")
+    summarize(placed, total)
+
+    if args.vgm:
+        from synth_logs import write_vgm
+        write_vgm(args.vgm, vgm_events(placed), total)
+        print(f"[INFO] wrote {args.vgm}")
+    if args.vh:
+        import vgm_csv_to_vh
+        rc = vgm_csv_to_vh.main(["vgm_csv_to_vh.py", str(out), args.vh])
+        if rc:
+            return rc
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
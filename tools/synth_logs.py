@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+synth_logs.py
+
+Deterministic synthetic testbench logs and VGM files, for benchmarking
+the tools/ pipeline without running the RTL simulation.
+
+Generated files (same formats as IKAOPLL_vgm_tb.sv / the VGM tools):
+  - samples_mo.txt  : "dur_idx value time_ps path" (9 MO + 5 RO per duration)
+  - samples_acc.txt : "value time_ps"              (a burst of 36 per
+                      duration, one EMUCLK apart from the duration start,
+                      like the TB logging every EMUCLK while ACC_STRB is
+                      high; the value is the same within a burst)
+  - durations.txt   : "dur_idx start_ps end_ps"
+  - song.vgm        : YM2413 VGM 1.50, 9 melodic channels + rhythm, a new
+                      note on every channel each NOTE_SAMPLES VGM samples
+                      and a 60 Hz F-number vibrato in between (typical
+                      register traffic of a real VGM rip)
+
+Timing follows the TB: one duration = 72 EMUCLK cycles of 279_360 ps
+(about 49.7 kHz).  The waveforms are integer-only (triangle oscillators
+with a linear decay, rhythm noise from a counter-based integer hash), so
+the output is byte identical on every machine and Python version.
+NumPy is required.
+
+Usage:
+  python3 synth_logs.py OUT_DIR --seconds 60 [--seed 1] [--no-vgm]
+"""
+
+from __future__ import annotations
+
+import argparse
+import struct
+import sys
+from pathlib import Path
+
+import numpy as np
+
+EMUCLK_PERIOD_PS = 2 * 13_968 * 10
+CYCLES_PER_DURATION = 72
+DURATION_PS = CYCLES_PER_DURATION * EMUCLK_PERIOD_PS
+FS_DURATION = 1e12 / DURATION_PS          # ≈ 49_715.9 Hz
+T0_PS = 100 * EMUCLK_PERIOD_PS            # TB のリセット解除後の待ちに相当
+
+N_MO = 9
+N_RO = 5
+MO_SLOT_CYCLES = 8                        # MO: 0, 8, ..., 64 サイクル目
+RO_SLOT_OFFSET = 4                        # RO: 4, 12, ..., 36 サイクル目
+MO_VOL = 2                                # TB の i_ACC_SIGNED_MOVOL / ROVOL
+RO_VOL = 3
+ACC_BURST = 36                            # ACC_STRB high: 9 phi1 サイクル = 36 EMUCLK
+
+VGM_RATE = 44_100
+NOTE_SAMPLES = 11_025                     # 0.25 s ごとに全チャンネルの音を替える
+FRAME_SAMPLES = 735                       # 1/60 s ごとにビブラート書き込み
+YM2413_CLOCK = 3_579_545
+
+# 1 回にまとめて書き出す duration 数
+CHUNK_DURATIONS = 1 << 16
+
+# 平均律の比 (Q16)。浮動小数点の pow を使わないための整数テーブル
+SEMITONE_Q16 = (65536, 69433, 73562, 77936, 82570, 87480,
+                92682, 98193, 104032, 110218, 116772, 123715)
+_M32 = np.uint64(0xFFFFFFFF)
+
+
+def _hash32(x):
+    """Counter-based 32-bit integer hash (lowbias32), vectorised."""
+    x = np.asarray(x, dtype=np.uint64) & _M32
+    x ^= x >> np.uint64(16)
+    x = (x * np.uint64(0x7FEB352D)) & _M32
+    x ^= x >> np.uint64(15)
+    x = (x * np.uint64(0x846CA68B)) & _M32
+    x ^= x >> np.uint64(16)
+    return x
+
+
+def _triangle(phase):
+    """32-bit phase → triangle in [-256, 255] (integer)."""
+    p = (phase >> np.uint64(22)) & np.uint64(0x3FF)  # 10 bit
+    p = p.astype(np.int64)
+    return np.where(p < 512, p, 1023 - p) - 256
+
+
+class _Voices:
+    """Integer oscillator bank; a new pitch per channel every note."""
+
+    def __init__(self, seed):
+        self.seed = int(seed)
+        self.phase = np.zeros(N_MO, dtype=np.uint64)
+
+    def note_incs(self, note_idx):
+        # 音符番号とチャンネル番号から決まる位相増分（~100 Hz..1.6 kHz）
+        k = (note_idx * 7 + np.arange(N_MO) * 5 + self.seed) % 48
+        base = 8_639_000                     # ≈ 100 Hz at FS_DURATION
+        ratio = np.asarray(SEMITONE_Q16, dtype=np.uint64)[k % 12]
+        return ((np.uint64(base) * ratio) >> np.uint64(16)) << (k // 12).astype(np.uint64)
+
+
+def generate_logs(out_dir, seconds, seed=1, with_ro=True):
+    """Write samples_mo.txt / samples_acc.txt / durations.txt; returns #durations."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    n_dur = int(round(seconds * FS_DURATION))
+    dur_per_note = int(round(NOTE_SAMPLES / VGM_RATE * FS_DURATION))
+    voices = _Voices(seed)
+    salt = (int(seed) * 2654435761) & 0xFFFFFFFF
+
+    mo_slots = np.arange(N_MO, dtype=np.int64) * MO_SLOT_CYCLES * EMUCLK_PERIOD_PS
+    ro_slots = (np.arange(N_RO, dtype=np.int64) * MO_SLOT_CYCLES + RO_SLOT_OFFSET) * EMUCLK_PERIOD_PS
+    acc_slots = np.arange(ACC_BURST, dtype=np.int64) * EMUCLK_PERIOD_PS
+
+    with open(out_dir / "samples_mo.txt", "w") as f_mo, \
+            open(out_dir / "samples_acc.txt", "w") as f_acc, \
+            open(out_dir / "durations.txt", "w") as f_dur:
+        for d0 in range(0, n_dur, CHUNK_DURATIONS):
+            d1 = min(n_dur, d0 + CHUNK_DURATIONS)
+            n = d1 - d0
+            idx = np.arange(d0, d1, dtype=np.int64)
+            start = T0_PS + idx * DURATION_PS
+
+            # --- MO: 9 channels, triangle with a linear decay per note ---
+            note = idx // dur_per_note
+            age = idx - note * dur_per_note
+            env = np.maximum(0, 256 - (age * 256) // dur_per_note)      # 256 → 0
+            incs = np.stack([voices.note_incs(int(k)) for k in range(int(note[0]), int(note[-1]) + 1)])
+            inc = incs[note - note[0]]                                  # (n, 9)
+            steps = np.cumsum(inc, axis=0, dtype=np.uint64)
+            phase = (voices.phase + steps) & np.uint64(0xFFFFFFFF)
+            voices.phase = phase[-1].copy()
+            mo = (_triangle(phase) * env[:, None]) >> 8                 # (n, 9)
+
+            # --- RO: 5 rhythm slots, noise bursts at note starts ---
+            if with_ro:
+                ctr = np.arange(d0 * N_RO, d1 * N_RO, dtype=np.uint64) ^ np.uint64(salt)
+                noise = (_hash32(ctr).reshape(n, N_RO) >> np.uint64(23)).astype(np.int64) - 256
+                burst = np.maximum(0, 64 - age)[:, None]                # 64 duration の減衰
+                ro = (noise * burst) >> 6
+            else:
+                ro = np.zeros((n, N_RO), dtype=np.int64)
+
+            acc = MO_VOL * mo.sum(axis=1) + RO_VOL * ro.sum(axis=1)
+
+            # --- samples_mo.txt: MO と RO を時刻順に並べる ---
+            t_mo = start[:, None] + mo_slots
+            recs = [np.stack([np.repeat(idx, N_MO), mo.ravel(), t_mo.ravel(),
+                              np.zeros(n * N_MO, dtype=np.int64)], axis=1)]
+            if with_ro:
+                t_ro = start[:, None] + ro_slots
+                recs.append(np.stack([np.repeat(idx, N_RO), ro.ravel(), t_ro.ravel(),
+                                      np.ones(n * N_RO, dtype=np.int64)], axis=1))
+            rows = np.concatenate(recs)
+            rows = rows[np.lexsort((rows[:, 3], rows[:, 2]))]
+            f_mo.write(("%d %d %d %d\n" * len(rows)) % tuple(rows.ravel().tolist()))
+
+            # duration 境界 = ACC_STRB の立ち上がりから 1 EMUCLK ごとに同じ値
+            t_acc = (start[:, None] + acc_slots).ravel()
+            f_acc.write(("%d %d\n" * len(t_acc)) %
+                        tuple(np.stack([np.repeat(acc, ACC_BURST), t_acc], axis=1).ravel().tolist()))
+            f_dur.write(("%d %d %d\n" * n) %
+                        tuple(np.stack([idx, start, start + DURATION_PS], axis=1).ravel().tolist()))
+    return n_dur
+
+
+# ---------------------------------------------------------------------------
+# VGM
+# ---------------------------------------------------------------------------
+def vgm_wait_bytes(samples):
+    """Encode a wait of `samples` VGM samples (0x61 / 0x7n)."""
+    out = bytearray()
+    while samples > 0:
+        if samples <= 16:
+            out.append(0x70 + samples - 1)
+            samples = 0
+        else:
+            w = min(samples, 0xFFFF)
+            out += bytes((0x61, w & 0xFF, w >> 8))
+            samples -= w
+    return bytes(out)
+
+
+def write_vgm(path, events, total_samples=None):
+    """Write a YM2413-only VGM 1.50 file.
+
+    events: iterable of (wait_before_samples, reg, value).
+    """
+    body = bytearray()
+    total = 0
+    for wait, reg, val in events:
+        if wait:
+            body += vgm_wait_bytes(wait)
+            total += wait
+        body += bytes((0x51, reg & 0xFF, val & 0xFF))
+    if total_samples is not None and total_samples > total:
+        body += vgm_wait_bytes(total_samples - total)
+        total = total_samples
+    body.append(0x66)
+
+    header = bytearray(0x40)
+    header[0:4] = b"Vgm "
+    struct.pack_into("<I", header, 0x04, 0x40 + len(body) - 4)   # EOF offset
+    struct.pack_into("<I", header, 0x08, 0x150)                  # version
+    struct.pack_into("<I", header, 0x10, YM2413_CLOCK)
+    struct.pack_into("<I", header, 0x18, total)                  # total samples
+    struct.pack_into("<I", header, 0x1C, 0xFFFFFFFF)             # no loop
+    struct.pack_into("<I", header, 0x34, 0x0C)                   # data at 0x40
+    Path(path).write_bytes(bytes(header) + bytes(body))
+    return total
+
+
+def _song_writes(seconds, seed):
+    """(absolute VGM sample, reg, value) of the synthetic song."""
+    total = int(round(seconds * VGM_RATE))
+    yield 0, 0x0E, 0x20                        # rhythm mode on
+    for ch in range(N_MO):
+        yield 0, 0x30 + ch, ((ch + seed) % 15 + 1) << 4
+    note = 0
+    for t0 in range(0, total, NOTE_SAMPLES):
+        fnums = []
+        for ch in range(N_MO):
+            k = (note * 7 + ch * 5 + seed) % 48
+            fnum = 172 + (k % 12) * 15
+            block = 2 + k // 12
+            fnums.append(fnum)
+            yield t0, 0x20 + ch, (block << 1) | (fnum >> 8)   # key off
+            yield t0, 0x10 + ch, fnum & 0xFF
+            yield t0, 0x20 + ch, 0x10 | (block << 1) | (fnum >> 8)
+        yield t0, 0x0E, 0x20 | (1 << (note % 5))             # rhythm hit
+
+        # 次の音符までフレームごとに F-Number 下位を揺らす (-1, 0, +1, 0)
+        end = min(total, t0 + NOTE_SAMPLES)
+        for frame, t in enumerate(range(t0 + FRAME_SAMPLES, end, FRAME_SAMPLES), 1):
+            dv = (0, -1, 0, 1)[frame % 4]
+            for ch in range(N_MO):
+                yield t, 0x10 + ch, (fnums[ch] + dv) & 0xFF
+        note += 1
+
+
+def song_events(seconds, seed=1):
+    """Register writes of the synthetic song as (wait_before, reg, value)."""
+    last = 0
+    for t, reg, val in _song_writes(seconds, seed):
+        yield t - last, reg, val
+        last = t
+
+
+def generate_vgm(path, seconds, seed=1):
+    return write_vgm(path, song_events(seconds, seed), int(round(seconds * VGM_RATE)))
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Generate deterministic synthetic TB logs and a VGM file."
+    )
+    ap.add_argument("out_dir", help="output directory")
+    ap.add_argument("--seconds", type=float, default=1.0,
+                    help="audio length in seconds (default: 1)")
+    ap.add_argument("--seed", type=int, default=1, help="pattern seed (default: 1)")
+    ap.add_argument("--no-ro", action="store_true", help="MO records only")
+    ap.add_argument("--no-vgm", action="store_true", help="skip song.vgm")
+    args = ap.parse_args(argv)
+
+    n = generate_logs(args.out_dir, args.seconds, args.seed, with_ro=not args.no_ro)
+    print(f"[INFO] wrote {n} durations ({args.seconds} s) to {args.out_dir}")
+    if not args.no_vgm:
+        vgm = Path(args.out_dir) / "song.vgm"
+        total = generate_vgm(vgm, args.seconds, args.seed)
+        print(f"[INFO] wrote {vgm} ({total} VGM samples)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
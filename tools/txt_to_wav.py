@@ -6,34 +6,51 @@ Convert samples_mo.txt (one integer per DAC output) into a 16-bit mono WAV.
   1 行に 1 サンプルずつ書かれている。
 - o_IMP_FLUC_SIGNED_MO はほぼ一定周期 (~20,113,920 ps) で更新されているので、
   およそ 49.7 kHz でサンプリングされた 1ch 音声信号とみなせる。
+- 行が "dur_idx value time_ps" 形式なら、time_ps から実際のサンプリング周期を
+  復元して (clock_recovery.py) その Fs で書き出す。時刻が無ければ OUT_RATE。
 - ここでは一切間引かず、「1 行 = 1 サンプル」のまま WAV に変換する。
+- --start/--end で窓を指定すると、log_index.py の索引でその範囲だけを読む。
 - DC 除去後の最大振幅から、「16bit でクリップしない最大ゲイン」を自動計算する。
 """
 
 import sys
-import wave
-import struct
-from typing import List
+from typing import List, Tuple
 
-# 推定サンプリングレート (~49.7 kHz 近辺で固定)
+import log_index
+import metrics
+from wav_writer import write_wav
+
+try:
+    import clock_recovery
+except ImportError:  # NumPy が無い環境では固定レートのまま
+    clock_recovery = None
+
+# 時刻列が無いときのサンプリングレート (~49.7 kHz 近辺で固定)
 OUT_RATE = 49_720
 MAX_I16 = 32767
 
 
-def load_samples(txt_path: str) -> List[int]:
+def load_samples(txt_path: str, window=None) -> Tuple[List[int], List[int]]:
+    """1 列 ("value") または 3/4 列 ("dur_idx value time_ps [path]") を読む。"""
     samples: List[int] = []
-    with open(txt_path, "r") as f:
-        for lineno, line in enumerate(f, start=1):
-            s = line.strip()
-            if not s:
-                continue
-            try:
-                val = int(s, 10)
-            except ValueError:
-                # Skip non-integer lines (e.g. 'x')
-                continue
-            samples.append(val)
-    return samples
+    times: List[int] = []
+    for lineno, line in log_index.iter_lines(txt_path, window):
+        parts = line.split()
+        if not parts:
+            continue
+        if len(parts) >= 4 and parts[3] != "0":
+            continue  # RO（リズム）レコードは MO の WAV に混ぜない
+        try:
+            if len(parts) >= 3:
+                val = int(parts[1], 10)
+                times.append(int(parts[2], 10))
+            else:
+                val = int(parts[0], 10)
+        except ValueError:
+            # Skip non-integer lines (e.g. 'x')
+            continue
+        samples.append(val)
+    return samples, times
 
 
 def center_dc(samples: List[int]) -> List[int]:
@@ -57,59 +74,72 @@ def scale_to_int16(samples: List[int], gain: int) -> List[int]:
     return out
 
 
-def write_wav(wav_path: str, samples_16: List[int], sample_rate: int) -> None:
-    with wave.open(wav_path, "w") as wf:
-        wf.setnchannels(1)       # mono
-        wf.setsampwidth(2)       # 16-bit
-        wf.setframerate(sample_rate)
-        for s in samples_16:
-            wf.writeframes(struct.pack("<h", s))
-
-
-def main(txt_path: str, wav_path: str) -> None:
+def txt_to_wav(txt_path: str, wav_path: str, window=None) -> None:
     print("[DEBUG] txt_to_wav.py: no-decimation, ~50kHz, auto-gain version")
 
-    samples = load_samples(txt_path)
+    with metrics.stage("parse") as st:
+        samples, times = load_samples(txt_path, window)
+        st.count(len(samples), "samples")
     if not samples:
         print(f"[ERROR] No valid integer samples found in {txt_path}", file=sys.stderr)
         sys.exit(1)
 
     print(f"[INFO] Loaded {len(samples)} samples from {txt_path}")
 
-    # 1) DC 除去
-    samples_dc = center_dc(samples)
-    if samples_dc:
-        min_dc = min(samples_dc)
-        max_dc = max(samples_dc)
-        print(f"[DEBUG] DC-centered min={min_dc} max={max_dc}")
-    else:
-        min_dc = max_dc = 0
-
-    # 2) 自動ゲイン計算（クリップしない最大値を狙う）
-    peak = max(abs(min_dc), abs(max_dc))
-    if peak == 0:
-        # すべて同じ値 (完全な DC) の場合はゲインを 1 にしておく
-        gain = 1
-        print("[WARN] Peak amplitude is 0 after DC removal; using gain=1")
-    else:
-        gain = MAX_I16 // peak  # floor(32767 / peak)
-    print(f"[INFO] Auto gain computed from peak={peak}: gain={gain}")
-
-    # 3) 16bit にスケーリング
-    samples_16 = scale_to_int16(samples_dc, gain=gain)
-    if samples_16:
-        print(f"[DEBUG] int16 min={min(samples_16)} max={max(samples_16)}")
+    clock = None
+    if clock_recovery is not None and len(times) == len(samples):
+        with metrics.stage("recover_clock"):
+            clock = clock_recovery.recover_clock(times, source=txt_path)
+        clock_recovery.print_clock(clock)
+    out_rate = int(round(clock["fs_hz"])) if clock else OUT_RATE
+
+    with metrics.stage("normalize"):
+        # 1) DC 除去
+        samples_dc = center_dc(samples)
+        if samples_dc:
+            min_dc = min(samples_dc)
+            max_dc = max(samples_dc)
+            print(f"[DEBUG] DC-centered min={min_dc} max={max_dc}")
+        else:
+            min_dc = max_dc = 0
+
+        # 2) 自動ゲイン計算（クリップしない最大値を狙う）
+        peak = max(abs(min_dc), abs(max_dc))
+        if peak == 0:
+            # すべて同じ値 (完全な DC) の場合はゲインを 1 にしておく
+            gain = 1
+            print("[WARN] Peak amplitude is 0 after DC removal; using gain=1")
+        else:
+            gain = MAX_I16 // peak  # floor(32767 / peak)
+        print(f"[INFO] Auto gain computed from peak={peak}: gain={gain}")
+
+        # 3) 16bit にスケーリング
+        samples_16 = scale_to_int16(samples_dc, gain=gain)
+        if samples_16:
+            print(f"[DEBUG] int16 min={min(samples_16)} max={max(samples_16)}")
 
     # 4) WAV 出力
-    write_wav(wav_path, samples_16, OUT_RATE)
+    write_wav(wav_path, samples_16, out_rate)
+    if clock:
+        clock_recovery.write_clock_metadata(wav_path, clock, wav_fs_hz=out_rate)
 
-    duration_sec = len(samples_16) / float(OUT_RATE)
+    duration_sec = len(samples_16) / float(out_rate)
     print(f"[INFO] Wrote WAV: {wav_path}")
-    print(f"[INFO] Duration ≈ {duration_sec:.3f} seconds at {OUT_RATE} Hz, gain={gain}")
+    print(f"[INFO] Duration ≈ {duration_sec:.3f} seconds at {out_rate} Hz, gain={gain}")
 
 
-if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        print(f"Usage: {sys.argv[0]} samples.txt out.wav", file=sys.stderr)
+def main(argv=None):
+    argv = sys.argv if argv is None else argv
+    try:
+        argv, window = log_index.pop_window_args(argv)
+    except ValueError as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
         sys.exit(1)
-    main(sys.argv[1], sys.argv[2])
\ No newline at end of file
+    if len(argv) != 3:
+        print(f"Usage: {argv[0]} samples.txt out.wav [--start T] [--end T]", file=sys.stderr)
+        sys.exit(1)
+    txt_to_wav(argv[1], argv[2], window)
+
+
+if __name__ == "__main__":
+    main()
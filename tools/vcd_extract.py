@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+vcd_extract.py
+
+Stream a VCD (e.g. ikaopll_vgm_tb.vcd) once and keep only the requested
+signals as compact per-signal change arrays.
+
+Output:
+  - <out>.npz               : for every signal "<name>.t" (int64 VCD time
+                              ticks) and "<name>.v" (uint64 value at that
+                              time); "<name>.xz" (uint8, 1 = value had x/z
+                              bits) is added only for signals that ever
+                              had x/z.  Signals wider than 64 bits are
+                              stored as bit strings ("<name>.v", dtype S).
+  - <out>.npz.index.json    : sidecar index (timescale, per-signal width,
+                              var type, VCD id, change count, first/last
+                              time, npz keys)
+
+Signal selection (-s, repeatable) uses shell-style patterns matched
+against the full hierarchical name, the name without the top module, and
+the bare signal name, case-insensitively (RTL instances are u_EG, u_OP,
+...), e.g.:
+
+    -s 'dut.u_EG.*'  -s ACC_SIGNED  -s IMP_FLUC_RO
+
+Usage:
+  python3 vcd_extract.py ikaopll_vgm_tb.vcd -s 'dut.u_EG.*' -s ACC_SIGNED \\
+      -o eg_state.npz
+  python3 vcd_extract.py ikaopll_vgm_tb.vcd --list -s 'dut.*'
+
+Reading back:
+
+    from vcd_extract import load_signal
+    t, v = load_signal("eg_state.npz", "IKAOPLL_vgm_tb.ACC_SIGNED", signed=True)
+"""
+
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import json
+import sys
+from array import array
+from pathlib import Path
+
+import numpy as np
+
+import metrics
+
+_TIMESCALE_PS = {
+    "s": 10**12, "ms": 10**9, "us": 10**6, "ns": 10**3, "ps": 1, "fs": 0.001,
+}
+
+
+# ---------------------------------------------------------------------------
+# Header
+# ---------------------------------------------------------------------------
+def _iter_header_statements(f):
+    """Yield header statements as token lists, up to $enddefinitions."""
+    stmt = []
+    for line in f:
+        for tok in line.split():
+            stmt.append(tok)
+            if tok == "$end":
+                yield stmt
+                if stmt[0] == "$enddefinitions":
+                    return
+                stmt = []
+
+
+def parse_header(f):
+    """Parse the VCD header; returns (vars, timescale_ps).
+
+    vars: list of dicts {name, id, width, type}
+    """
+    scope = []
+    vars_ = []
+    timescale_ps = None
+    for stmt in _iter_header_statements(f):
+        kw = stmt[0]
+        if kw == "$scope":
+            scope.append(stmt[2])
+        elif kw == "$upscope":
+            if scope:
+                scope.pop()
+        elif kw == "$var":
+            # $var <type> <width> <id> <name> [<range>] $end
+            vtype, width, vid, name = stmt[1], int(stmt[2]), stmt[3], stmt[4]
+            if len(stmt) > 6 and stmt[5] != "$end" and ":" not in stmt[5]:
+                name += stmt[5]  # bit-select: foo [3] → foo[3]
+            vars_.append({
+                "name": ".".join(scope + [name]),
+                "id": vid,
+                "width": width,
+                "type": vtype,
+            })
+        elif kw == "$timescale":
+            ts = "".join(stmt[1:-1])
+            num = "".join(c for c in ts if c.isdigit())
+            unit = ts[len(num):]
+            if unit in _TIMESCALE_PS:
+                timescale_ps = int(num or "1") * _TIMESCALE_PS[unit]
+    return vars_, timescale_ps
+
+
+def match_signals(vars_, patterns):
+    """Select vars whose name matches any pattern (see module docstring)."""
+    if not patterns:
+        return list(vars_)
+    patterns = [p.casefold() for p in patterns]
+    out = []
+    for v in vars_:
+        full = v["name"].casefold()
+        parts = full.split(".")
+        names = (full, ".".join(parts[1:]), parts[-1])
+        if any(fnmatch.fnmatchcase(n, p) for p in patterns for n in names):
+            out.append(v)
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Body
+# ---------------------------------------------------------------------------
+class _Track:
+    __slots__ = ("width", "times", "vals", "xz", "any_xz", "wide")
+
+    def __init__(self, width):
+        self.width = width
+        self.wide = width > 64
+        self.times = array("q")
+        self.vals = [] if self.wide else array("Q")
+        self.xz = array("B")
+        self.any_xz = False
+
+    def add(self, t, bits):
+        if len(self.times) and self.times[-1] == t:
+            # 同じ時刻の変化（窓の先頭に置いた直前値など）は後の値で置き換える
+            self.times.pop()
+            self.vals.pop()
+            self.xz.pop()
+        self.times.append(t)
+        if self.wide:
+            self.vals.append(bits.encode())
+            self.xz.append(0)
+            return
+        try:
+            self.vals.append(int(bits, 2))
+            self.xz.append(0)
+        except ValueError:
+            # x / z を含む → 0 として記録し、xz フラグを立てる
+            clean = bits.translate(_XZ_TO_0)
+            self.vals.append(int(clean, 2) if clean else 0)
+            self.xz.append(1)
+            self.any_xz = True
+
+    def add_real(self, t, val):
+        # real は float64 のビット列として保存する
+        self.add(t, format(int(np.float64(val).view(np.uint64)), "064b"))
+
+
+_XZ_TO_0 = str.maketrans({"x": "0", "X": "0", "z": "0", "Z": "0"})
+
+
+def extract(vcd_path, patterns, t_start=None, t_end=None, progress=True):
+    """Stream the VCD once; return (selected vars, {id: _Track}, timescale_ps).
+
+    With t_start, the last value of every signal before the window is
+    emitted at t_start, so each track starts with its value at the start
+    of the window even if it does not change inside it.
+    """
+    with open(vcd_path, "r", buffering=1 << 20) as f:
+        vars_, timescale_ps = parse_header(f)
+        selected = match_signals(vars_, patterns)
+        tracks = {}
+        for v in selected:
+            if v["id"] not in tracks:
+                tracks[v["id"]] = _Track(v["width"])
+        if not tracks:
+            return selected, tracks, timescale_ps
+
+        t = 0
+        in_window = t_start is None
+        # 窓の前は各信号の最後の値だけを覚える（id -> (種別, 値)）
+        before = {}
+        lines = 0
+        for line in f:
+            lines += 1
+            if progress and lines % 10_000_000 == 0:
+                print(f"[INFO] {lines} lines, t={t}", file=sys.stderr)
+            c = line[0:1]
+            if c == "#":
+                t = int(line[1:])
+                if t_end is not None and t > t_end:
+                    break
+                if not in_window and t >= t_start:
+                    in_window = True
+                    for vid, (kind, val) in before.items():
+                        if kind == "r":
+                            tracks[vid].add_real(t_start, val)
+                        else:
+                            tracks[vid].add(t_start, val)
+                    before = None
+                continue
+            if c in "01xzXZ":
+                kind, vid, val = "b", line[1:].rstrip(), c
+            elif c in "bB":
+                val, _, vid = line[1:].rstrip().partition(" ")
+                kind = "b"
+            elif c in "rR":
+                val, _, vid = line[1:].rstrip().partition(" ")
+                kind = "r"
+            else:
+                continue        # $dumpvars / $end / $comment 等は読み飛ばす
+            tr = tracks.get(vid)
+            if tr is None:
+                continue
+            if not in_window:
+                before[vid] = (kind, val)
+            elif kind == "r":
+                tr.add_real(t, val)
+            else:
+                tr.add(t, val)
+    return selected, tracks, timescale_ps
+
+
+def save_npz(out_path, selected, tracks, timescale_ps, vcd_path, compress=False):
+    out_path = Path(out_path)
+    arrays = {}
+    index = {
+        "source": str(vcd_path),
+        "timescale_ps": timescale_ps,
+        "signals": [],
+    }
+    for v in selected:
+        tr = tracks[v["id"]]
+        name = v["name"]
+        arrays[f"{name}.t"] = np.frombuffer(tr.times, dtype=np.int64) if len(tr.times) \
+            else np.zeros(0, dtype=np.int64)
+        if tr.wide:
+            arrays[f"{name}.v"] = np.array(tr.vals, dtype=f"S{tr.width}")
+        else:
+            arrays[f"{name}.v"] = np.frombuffer(tr.vals, dtype=np.uint64) if len(tr.vals) \
+                else np.zeros(0, dtype=np.uint64)
+        keys = [f"{name}.t", f"{name}.v"]
+        if tr.any_xz:
+            arrays[f"{name}.xz"] = np.frombuffer(tr.xz, dtype=np.uint8)
+            keys.append(f"{name}.xz")
+        n = len(tr.times)
+        index["signals"].append({
+            "name": name,
+            "id": v["id"],
+            "width": v["width"],
+            "type": v["type"],
+            "changes": n,
+            "first_time": int(tr.times[0]) if n else None,
+            "last_time": int(tr.times[-1]) if n else None,
+            "has_xz": tr.any_xz,
+            "keys": keys,
+        })
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    (np.savez_compressed if compress else np.savez)(out_path, **arrays)
+    idx_path = Path(str(out_path) + ".index.json")
+    idx_path.write_text(json.dumps(index, indent=2) + "\n")
+    return idx_path
+
+
+def load_signal(npz_path, name, signed=False):
+    """Return (times, values) for one signal of an extracted npz.
+
+    signed=True sign-extends using the width from the sidecar index.
+    """
+    with np.load(npz_path) as z:
+        t = z[f"{name}.t"]
+        v = z[f"{name}.v"]
+    if signed and v.dtype == np.uint64:
+        index = json.loads(Path(str(npz_path) + ".index.json").read_text())
+        width = next(s["width"] for s in index["signals"] if s["name"] == name)
+        v = v.astype(np.int64)
+        if width < 64:
+            sign = np.int64(1) << (width - 1)
+            v = (v ^ sign) - sign
+    return t, v
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="Extract selected signals from a VCD into NumPy change arrays."
+    )
+    ap.add_argument("vcd", help="Input VCD (e.g. ikaopll_vgm_tb.vcd)")
+    ap.add_argument("-s", "--signal", action="append", default=[],
+                    help="signal pattern (fnmatch, case-insensitive, repeatable; "
+                         "default: all)")
+    ap.add_argument("-o", "--output",
+                    help="output .npz (default: <vcd>.npz)")
+    ap.add_argument("--start", type=int, default=None,
+                    help="first VCD time (ticks) to keep; every signal starts "
+                         "with its value at that time")
+    ap.add_argument("--end", type=int, default=None,
+                    help="stop reading after this VCD time (ticks)")
+    ap.add_argument("--compress", action="store_true",
+                    help="use np.savez_compressed")
+    ap.add_argument("--list", action="store_true",
+                    help="only list matching signals (reads the header only)")
+    args = ap.parse_args(argv)
+
+    vcd_path = Path(args.vcd)
+    if not vcd_path.exists():
+        print(f"[ERROR] No such file: {vcd_path}", file=sys.stderr)
+        return 1
+
+    if args.list:
+        with vcd_path.open() as f:
+            vars_, timescale_ps = parse_header(f)
+        for v in match_signals(vars_, args.signal):
+            print(f"{v['name']}\t{v['width']}\t{v['type']}\t{v['id']}")
+        return 0
+
+    with metrics.stage("parse") as st:
+        selected, tracks, timescale_ps = extract(vcd_path, args.signal,
+                                                 args.start, args.end)
+        st.count(vcd_path.stat().st_size, "bytes")
+    if not selected:
+        print("[ERROR] no signal matched", file=sys.stderr)
+        return 1
+
+    out_path = Path(args.output) if args.output else vcd_path.with_suffix(vcd_path.suffix + ".npz")
+    metrics.add_output(out_path)
+    with metrics.stage("write") as st:
+        idx_path = save_npz(out_path, selected, tracks, timescale_ps, vcd_path,
+                            compress=args.compress)
+        st.count(len(selected), "signals")
+    total = sum(len(tr.times) for tr in tracks.values())
+    print(f"[INFO] signals: {len(selected)}, value changes: {total}")
+    print(f"[INFO] timescale: {timescale_ps} ps/tick")
+    print(f"[INFO] wrote {out_path} and {idx_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
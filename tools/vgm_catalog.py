@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+vgm_catalog.py
+
+SQLite catalogue of a YM2413 VGM corpus, for picking regression subsets
+by feature instead of by hand.
+
+scan walks one or more directories for *.vgm / *.vgz, parses each file
+in a worker process (mmap'd; header via parse_vgm_header(), YM2413
+writes via iter_ym2413_writes(), i.e. exactly the stream the CSV
+converter sees) and stores one row per file:
+
+  duration_s, loop_start_s, loop_s   from the header sample counts
+  n_writes                           YM2413 register writes (first loop only)
+  max_writes_per_s                   peak write rate in a 10 ms window
+  channels_mask                      bit n: channel n had a key-on
+  rhythm, rhythm_mask                rhythm mode used; BD/SD/TOM/TCY/HH hit
+                                     (bits 4..0 of 0x0E)
+  patches_mask                       bit n: instrument n keyed on (0 = custom)
+  custom_patch_writes                writes to the user patch (0x00-0x07)
+
+The scan is incremental: files whose size and mtime are unchanged are
+skipped; if only the mtime changed the SHA-256 decides whether the file
+is parsed again.  --prune removes rows of files that disappeared from
+the scanned directories.
+
+Usage:
+  python3 vgm_catalog.py scan ~/vgm/ym2413 -j 8
+  python3 vgm_catalog.py query --rhythm --custom-patch
+  python3 vgm_catalog.py query --channel 8 --patch 0 --max-duration 30 --long
+  python3 vgm_catalog.py query --where "max_writes_per_s > 3000" --order n_writes --desc
+  python3 vgm_catalog.py stats
+
+The database defaults to vgm_catalog.sqlite in the current directory
+(--db to change).
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import mmap
+import os
+import sqlite3
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import metrics
+from vgm_to_ym2413_csv import iter_ym2413_writes, parse_vgm_header
+
+DEFAULT_DB = "vgm_catalog.sqlite"
+VGM_RATE = 44_100
+SUFFIXES = (".vgm", ".vgz")
+DENSITY_WINDOW = VGM_RATE // 100          # 10 ms
+SCHEMA_VERSION = 1
+
+N_CH = 9
+RHYTHM_NAMES = ("HH", "TCY", "TOM", "SD", "BD")   # 0x0E bit 0..4
+
+_COLUMNS = (
+    ("path", "TEXT PRIMARY KEY"),
+    ("size", "INTEGER"),
+    ("mtime_ns", "INTEGER"),
+    ("sha256", "TEXT"),
+    ("version", "INTEGER"),
+    ("ym2413_clock", "INTEGER"),
+    ("total_samples", "INTEGER"),
+    ("duration_s", "REAL"),
+    ("loop_samples", "INTEGER"),
+    ("loop_start_s", "REAL"),
+    ("loop_s", "REAL"),
+    ("n_writes", "INTEGER"),
+    ("max_writes_per_s", "REAL"),
+    ("channels_mask", "INTEGER"),
+    ("n_channels", "INTEGER"),
+    ("rhythm", "INTEGER"),
+    ("rhythm_mask", "INTEGER"),
+    ("patches_mask", "INTEGER"),
+    ("custom_patch_writes", "INTEGER"),
+    ("error", "TEXT"),
+    ("scanned_at", "REAL"),
+)
+_INDEXES = ("rhythm", "custom_patch_writes", "duration_s", "n_writes",
+            "max_writes_per_s", "sha256")
+
+
+# ----------------------------------------------------------------------
+# Per-file analysis (runs in worker processes)
+# ----------------------------------------------------------------------
+def summarize_writes(writes):
+    """Feature summary of a YM2413 (delta, reg, val) stream."""
+    n = 0
+    t = 0
+    times = []
+    inst = [0] * N_CH
+    key = [False] * N_CH
+    rhythm_on = False
+    ch_mask = 0
+    rhy_used = False
+    rhy_mask = 0
+    patches = 0
+    custom = 0
+    for delta, reg, val in writes:
+        t += delta
+        times.append(t)
+        n += 1
+        if reg <= 0x07:
+            custom += 1
+        elif reg == 0x0E:
+            rhythm_on = bool(val & 0x20)
+            if rhythm_on:
+                rhy_used = True
+                rhy_mask |= val & 0x1F
+        elif 0x20 <= reg <= 0x28:
+            ch = reg - 0x20
+            on = bool(val & 0x10)
+            # リズムモード中の 6-8ch は 0x0E で鳴らすので数えない
+            if on and not key[ch] and not (rhythm_on and ch >= 6):
+                ch_mask |= 1 << ch
+                patches |= 1 << inst[ch]
+            key[ch] = on
+        elif 0x30 <= reg <= 0x38:
+            inst[reg - 0x30] = val >> 4
+
+    peak = 0
+    j = 0
+    for i in range(len(times)):
+        while times[i] - times[j] >= DENSITY_WINDOW:
+            j += 1
+        peak = max(peak, i - j + 1)
+
+    return {
+        "n_writes": n,
+        "max_writes_per_s": peak * VGM_RATE / DENSITY_WINDOW,
+        "channels_mask": ch_mask,
+        "n_channels": bin(ch_mask).count("1"),
+        "rhythm": int(rhy_used),
+        "rhythm_mask": rhy_mask,
+        "patches_mask": patches,
+        "custom_patch_writes": custom,
+    }
+
+
+def _open_data(f):
+    """mmap of the file, or the decompressed bytes of a .vgz."""
+    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if mm[:2] == b"\x1f\x8b":
+        data = gzip.decompress(mm)
+        mm.close()
+        return data, None
+    return mm, mm
+
+
+def analyze_file(path):
+    """One catalogue row for path (the error column is set on failure)."""
+    st = os.stat(path)
+    row = {"path": str(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+           "scanned_at": time.time(), "error": None}
+    if st.st_size == 0:
+        row["error"] = "empty file"
+        return row
+    mm = None
+    try:
+        with open(path, "rb") as f:
+            data, mm = _open_data(f)
+            row["sha256"] = hashlib.sha256(data).hexdigest()
+            parse_vgm_header(data)
+            version = struct.unpack_from("<I", data, 0x08)[0]
+            clock = struct.unpack_from("<I", data, 0x10)[0]
+            total, _, loop = struct.unpack_from("<III", data, 0x18)  # 0x18 / 0x1C / 0x20
+            row.update(version=version, ym2413_clock=clock, total_samples=total,
+                       duration_s=total / VGM_RATE, loop_samples=loop,
+                       loop_start_s=(total - loop) / VGM_RATE if loop else None,
+                       loop_s=loop / VGM_RATE if loop else None)
+            row.update(summarize_writes(iter_ym2413_writes(data)))
+    except (ValueError, OSError, struct.error, EOFError) as e:
+        row["error"] = str(e)
+    finally:
+        if mm is not None:
+            mm.close()
+    return row
+
+
+def file_sha256(path):
+    with open(path, "rb") as f:
+        data, mm = _open_data(f)
+        try:
+            return hashlib.sha256(data).hexdigest()
+        finally:
+            if mm is not None:
+                mm.close()
+
+
+# ----------------------------------------------------------------------
+# Database
+# ----------------------------------------------------------------------
+def open_db(path):
+    con = sqlite3.connect(path)
+    cols = ", ".join(f"{name} {kind}" for name, kind in _COLUMNS)
+    con.execute(f"CREATE TABLE IF NOT EXISTS files ({cols})")
+    for c in _INDEXES:
+        con.execute(f"CREATE INDEX IF NOT EXISTS idx_files_{c} ON files({c})")
+    con.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    return con
+
+
+def _upsert(con, row):
+    names = [c for c, _ in _COLUMNS]
+    con.execute(
+        f"INSERT OR REPLACE INTO files ({', '.join(names)}) "
+        f"VALUES ({', '.join('?' * len(names))})",
+        [row.get(c) for c in names])
+
+
+def find_vgms(roots):
+    for root in roots:
+        root = Path(root)
+        if root.is_file():
+            yield root.resolve()
+            continue
+        for dirpath, _, files in os.walk(root):
+            for name in sorted(files):
+                if name.lower().endswith(SUFFIXES):
+                    yield (Path(dirpath) / name).resolve()
+
+
+def plan_scan(con, paths, rehash=False):
+    """Split paths into (to_parse, touched) using the stored size/mtime/hash.
+
+    touched: [(path, mtime_ns)] whose content is unchanged.
+    """
+    known = {p: (s, m, h) for p, s, m, h in
+             con.execute("SELECT path, size, mtime_ns, sha256 FROM files")}
+    todo = []
+    touched = []
+    for p in paths:
+        st = p.stat()
+        old = known.get(str(p))
+        if old is None or old[0] != st.st_size:
+            todo.append(p)
+        elif old[1] == st.st_mtime_ns and not rehash:
+            continue
+        elif old[2] is not None and file_sha256(p) == old[2]:
+            touched.append((str(p), st.st_mtime_ns))
+        else:
+            todo.append(p)
+    return todo, touched
+
+
+def scan(db, roots, jobs=1, prune=False, rehash=False):
+    con = open_db(db)
+    with metrics.stage("parse") as st:
+        paths = list(find_vgms(roots))
+        todo, touched = plan_scan(con, paths, rehash)
+        st.count(len(paths), "files")
+    print(f"[INFO] {len(paths)} VGM files, {len(todo)} to parse, "
+          f"{len(paths) - len(todo)} unchanged")
+
+    n_err = 0
+    with metrics.stage("convert") as st:
+        if jobs != 1 and len(todo) > 1:
+            with ProcessPoolExecutor(max_workers=jobs or None) as ex:
+                rows = ex.map(analyze_file, todo, chunksize=8)
+                for row in rows:
+                    _upsert(con, row)
+                    n_err += row["error"] is not None
+        else:
+            for p in todo:
+                row = analyze_file(p)
+                _upsert(con, row)
+                n_err += row["error"] is not None
+        con.executemany("UPDATE files SET mtime_ns = ? WHERE path = ?",
+                        [(m, p) for p, m in touched])
+        st.count(len(todo), "files")
+        st.note(jobs=jobs)
+
+    if prune:
+        # 走査したディレクトリの下にあって、もう存在しない行だけを消す
+        seen = {str(p) for p in paths}
+        prefixes = [str(Path(r).resolve()) for r in roots]
+        stale = [p for (p,) in con.execute("SELECT path FROM files")
+                 if p not in seen and any(p == r or p.startswith(r + os.sep) for r in prefixes)]
+        con.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in stale])
+        print(f"[INFO] pruned {len(stale)} removed files")
+    con.commit()
+    con.close()
+    if n_err:
+        print(f"[WARN] {n_err} files could not be parsed (see the error column)",
+              file=sys.stderr)
+    print(f"[INFO] catalogue: {db}")
+    return 0
+
+
+# ----------------------------------------------------------------------
+# Queries
+# ----------------------------------------------------------------------
+def build_query(args):
+    where = ["error IS NULL"]
+    params = []
+    if args.rhythm:
+        where.append("rhythm = 1")
+    if args.no_rhythm:
+        where.append("rhythm = 0")
+    if args.custom_patch:
+        where.append("custom_patch_writes > 0")
+    for ch in args.channel or ():
+        where.append("(channels_mask >> ?) & 1")
+        params.append(ch)
+    for p in args.patch or ():
+        where.append("(patches_mask >> ?) & 1")
+        params.append(p)
+    for name in args.drum or ():
+        where.append("(rhythm_mask >> ?) & 1")
+        params.append(RHYTHM_NAMES.index(name.upper()))
+    if args.min_duration is not None:
+        where.append("duration_s >= ?")
+        params.append(args.min_duration)
+    if args.max_duration is not None:
+        where.append("duration_s <= ?")
+        params.append(args.max_duration)
+    if args.min_writes is not None:
+        where.append("n_writes >= ?")
+        params.append(args.min_writes)
+    if args.looped:
+        where.append("loop_samples > 0")
+    if args.where:
+        where.append(f"({args.where})")
+
+    if args.order not in {c for c, _ in _COLUMNS}:
+        raise ValueError(f"unknown column for --order: {args.order}")
+    sql = (f"SELECT * FROM files WHERE {' AND '.join(where)} "
+           f"ORDER BY {args.order} {'DESC' if args.desc else 'ASC'}")
+    if args.limit:
+        sql += f" LIMIT {int(args.limit)}"
+    return sql, params
+
+
+def _mask_str(mask, names):
+    return ",".join(str(n) for i, n in enumerate(names) if (mask >> i) & 1) or "-"
+
+
+def print_rows(rows, long=False):
+    if not long:
+        for r in rows:
+            print(r["path"])
+        return
+    print(f"{'dur_s':>8} {'writes':>8} {'peak/s':>7} {'ch':<17} {'rhythm':<18} "
+          f"{'patches':<20} {'user':>5}  path")
+    for r in rows:
+        print(f"{r['duration_s']:8.2f} {r['n_writes']:8d} {r['max_writes_per_s']:7.0f} "
+              f"{_mask_str(r['channels_mask'], range(N_CH)):<17} "
+              f"{_mask_str(r['rhythm_mask'], RHYTHM_NAMES) if r['rhythm'] else '-':<18} "
+              f"{_mask_str(r['patches_mask'], range(16)):<20} "
+              f"{r['custom_patch_writes']:5d}  {r['path']}")
+
+
+def query(db, args):
+    if not Path(db).is_file():
+        print(f"[ERROR] No such catalogue: {db} (run 'scan' first)", file=sys.stderr)
+        return 1
+    con = sqlite3.connect(db)
+    con.row_factory = sqlite3.Row
+    try:
+        sql, params = build_query(args)
+        rows = con.execute(sql, params).fetchall()
+    except (ValueError, sqlite3.Error) as e:
+        print(f"[ERROR] {e}", file=sys.stderr)
+        return 1
+    finally:
+        con.close()
+    print_rows(rows, args.long)
+    print(f"[INFO] {len(rows)} files", file=sys.stderr)
+    return 0
+
+
+def stats(db):
+    if not Path(db).is_file():
+        print(f"[ERROR] No such catalogue: {db} (run 'scan' first)", file=sys.stderr)
+        return 1
+    con = sqlite3.connect(db)
+    n, n_err, dur, writes, rhy, custom = con.execute(
+        "SELECT COUNT(*), SUM(error IS NOT NULL), SUM(duration_s), SUM(n_writes), "
+        "SUM(rhythm), SUM(custom_patch_writes > 0) FROM files").fetchone()
+    con.close()
+    print(f"[INFO] files          : {n} ({n_err or 0} with errors)")
+    print(f"[INFO] total duration : {(dur or 0) / 3600:.2f} h")
+    print(f"[INFO] YM2413 writes  : {writes or 0}")
+    print(f"[INFO] rhythm mode    : {rhy or 0} files")
+    print(f"[INFO] custom patch   : {custom or 0} files")
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    ap = argparse.ArgumentParser(
+        description="SQLite catalogue of a YM2413 VGM corpus (scan / query / stats)."
+    )
+    ap.add_argument("--db", default=DEFAULT_DB, help=f"catalogue file (default: {DEFAULT_DB})")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    p = sub.add_parser("scan", help="add / update files")
+    p.add_argument("roots", nargs="+", help="directories or VGM files")
+    p.add_argument("-j", "--jobs", type=int, default=1,
+                   help="worker processes (0 = all CPUs, default: 1)")
+    p.add_argument("--prune", action="store_true",
+                   help="drop rows of files no longer under the scanned roots")
+    p.add_argument("--rehash", action="store_true",
+                   help="hash files even if size and mtime are unchanged")
+
+    p = sub.add_parser("query", help="list matching files")
+    p.add_argument("--rhythm", action="store_true", help="rhythm mode used")
+    p.add_argument("--no-rhythm", action="store_true", help="rhythm mode never used")
+    p.add_argument("--custom-patch", action="store_true", help="writes to the user patch")
+    p.add_argument("--channel", type=int, action="append", help="channel keyed on (0-8)")
+    p.add_argument("--patch", type=int, action="append", help="instrument keyed on (0-15)")
+    p.add_argument("--drum", action="append", choices=RHYTHM_NAMES + tuple(n.lower() for n in RHYTHM_NAMES),
+                   help="rhythm instrument hit")
+    p.add_argument("--min-duration", type=float, default=None, help="seconds")
+    p.add_argument("--max-duration", type=float, default=None, help="seconds")
+    p.add_argument("--min-writes", type=int, default=None)
+    p.add_argument("--looped", action="store_true", help="files with a loop point")
+    p.add_argument("--where", default=None, help="extra SQL condition on the files table")
+    p.add_argument("--order", default="path", help="sort column (default: path)")
+    p.add_argument("--desc", action="store_true", help="sort in descending order")
+    p.add_argument("--limit", type=int, default=0)
+    p.add_argument("--long", action="store_true", help="print the metadata columns too")
+
+    sub.add_parser("stats", help="corpus summary")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "scan":
+        missing = [r for r in args.roots if not Path(r).exists()]
+        if missing:
+            print(f"[ERROR] No such file or directory: {', '.join(missing)}", file=sys.stderr)
+            return 1
+        metrics.add_output(args.db)
+        return scan(args.db, args.roots, args.jobs, args.prune, args.rehash)
+    if args.cmd == "query":
+        return query(args.db, args)
+    return stats(args.db)
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
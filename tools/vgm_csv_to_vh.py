@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Convert YM2413 VGM CSV (delay,reg,data) into a Verilog include file (.vh)
-containing a sequence of IKAOPLL_write(...) calls with appropriate #delays.
+containing a sequence of IKAOPLL_write(...) calls with appropriate delays.
 
 Assumptions about the CSV:
 
@@ -30,15 +30,22 @@ Conversion policy:
 
   and then emit:
 
-    #<ticks> IKAOPLL_write(1'bX, 8'hYY, phiMref, CS_n, WR_n, A0, DIN);
+    vgm_wait(<ticks>); IKAOPLL_write(1'bX, 8'hYY, phiMref, CS_n, WR_n, A0, DIN);
 
   where 1'bX is 0 for address (reg=="01"), 1 for data (reg=="00").
+  vgm_wait() is a plain #<ticks> unless the TB runs with +SKIP_GAPS, in
+  which case long waits that start in silence are shortened (see
+  IKAOPLL_vgm_tb.sv and gap_log.py).  Older includes with "#<ticks>"
+  lines still work, just without gap skipping.
 
 - Note:
   - We NO LONGER use the accumulated absolute VGM time for #.
-  - Verilog の `#` は「相対待ち」なので、CSV の差分 delay をそのまま使うのが正しい。
+  - Verilog の `#`（vgm_wait）は「相対待ち」なので、CSV の差分 delay をそのまま使うのが正しい。
   - 結果として、テストベンチ上の時間 = Σ(delay) / 44100 秒 ＋ バス書き込みに要する数 µs/コマンド となる。
 
+The input may also be a binary .ymev event file (reg_events.py); the
+output is the same as for the CSV it was made from.
+
 Timing model (must match IKAOPLL_vgm_tb.sv):
 
 - `timescale 10ps/10ps`
@@ -57,6 +64,9 @@ import sys
 import csv
 from pathlib import Path
 
+import metrics
+import reg_events
+
 # ---------------------------------------------------------------------------
 # Clock / time parameters (must match IKAOPLL_vgm_tb.sv)
 # ---------------------------------------------------------------------------
@@ -97,76 +107,128 @@ def reg_is_addr(reg_field: str) -> bool:
     return reg_field.strip() == "01"
 
 
-def main(argv):
-    if len(argv) != 3:
-        print(f"Usage: {argv[0]} <input.csv> <output.vh>", file=sys.stderr)
-        return 1
+def write_pattern(reader, f_out, indent=""):
+    """Convert csv.reader rows (header already consumed) into #delay lines.
 
-    in_path = Path(argv[1])
-    out_path = Path(argv[2])
+    Returns (rows written, total VGM delay [samples], total ticks).
+    """
+    total_vgm_delay = 0      # accumulated delay in VGM samples (for info only)
+    total_ticks     = 0      # accumulated ticks (for info only)
+    n_rows          = 0
+
+    for lineno, row in enumerate(reader, start=2):
+        if len(row) < 3:
+            print(f"[WARN] Line {lineno}: expected 3 columns, got {len(row)}", file=sys.stderr)
+            continue
+
+        delay_str, reg_str, data_str = row[0].strip(), row[1].strip(), row[2].strip()
+        if delay_str == "":
+            delay = 0
+        else:
+            try:
+                delay = int(delay_str)
+            except ValueError:
+                print(f"[WARN] Line {lineno}: invalid delay '{delay_str}', treating as 0", file=sys.stderr)
+                delay = 0
 
-    if not in_path.exists():
-        print(f"[ERROR] Input CSV not found: {in_path}", file=sys.stderr)
-        return 1
+        # VGM 累積サンプル数（参考情報用）
+        total_vgm_delay += delay
 
-    # Open files
-    with in_path.open(newline="") as f_in, out_path.open("w") as f_out:
-        reader = csv.reader(f_in)
+        try:
+            data_val = parse_hex_byte(data_str)
+        except ValueError:
+            print(f"[WARN] Line {lineno}: invalid data '{data_str}', skipping", file=sys.stderr)
+            continue
 
-        # Header skip (expects first line like: delay,reg,data)
-        header = next(reader, None)
-        if header is None:
-            print("[ERROR] Empty CSV.", file=sys.stderr)
-            return 1
+        is_addr = reg_is_addr(reg_str)
+        a0_bit = "1'b0" if is_addr else "1'b1"
 
-        f_out.write("// Auto-generated from %s\n" % in_path.name)
-        f_out.write("// timescale: 10ps; EMUCLK ~= 3.579545MHz\n")
-        f_out.write("// Each # delay is a VGM *delta* (per-row delay) converted to 10ps ticks.\n\n")
+        # この行の delay（サンプル差分） → 10ps tick に変換
+        ticks = delay * TICKS_PER_SAMPLE
+        total_ticks += ticks
 
-        total_vgm_delay = 0      # accumulated delay in VGM samples (for info only)
-        total_ticks     = 0      # accumulated ticks (for info only)
+        # Emit Verilog line
+        # 例: vgm_wait(2262816); IKAOPLL_write(1'b0, 8'h0E, phiMref, CS_n, WR_n, A0, DIN);
+        f_out.write(
+            f"{indent}vgm_wait({ticks}); IKAOPLL_write({a0_bit}, 8'h{data_val:02X}, phiMref, CS_n, WR_n, A0, DIN);\n"
+        )
+        n_rows += 1
 
-        for lineno, row in enumerate(reader, start=2):
-            if len(row) < 3:
-                print(f"[WARN] Line {lineno}: expected 3 columns, got {len(row)}", file=sys.stderr)
-                continue
+    return n_rows, total_vgm_delay, total_ticks
 
-            delay_str, reg_str, data_str = row[0].strip(), row[1].strip(), row[2].strip()
-            if delay_str == "":
-                delay = 0
-            else:
-                try:
-                    delay = int(delay_str)
-                except ValueError:
-                    print(f"[WARN] Line {lineno}: invalid delay '{delay_str}', treating as 0", file=sys.stderr)
-                    delay = 0
 
-            # VGM 累積サンプル数（参考情報用）
-            total_vgm_delay += delay
+def write_event_pattern(events, f_out, indent=""):
+    """write_pattern() for a reg_events.RegEvents (.ymev input).
 
-            try:
-                data_val = parse_hex_byte(data_str)
-            except ValueError:
-                print(f"[WARN] Line {lineno}: invalid data '{data_str}', skipping", file=sys.stderr)
-                continue
+    Returns (rows written, total VGM delay [samples], total ticks).
+    """
+    lines = []
+    for delay, data_delay, reg, val in events:
+        lines.append(f"{indent}vgm_wait({delay * TICKS_PER_SAMPLE}); "
+                     f"IKAOPLL_write(1'b0, 8'h{reg:02X}, phiMref, CS_n, WR_n, A0, DIN);\n")
+        lines.append(f"{indent}vgm_wait({data_delay * TICKS_PER_SAMPLE}); "
+                     f"IKAOPLL_write(1'b1, 8'h{val:02X}, phiMref, CS_n, WR_n, A0, DIN);\n")
+    f_out.writelines(lines)
+    total_vgm_delay = events.total_delay()
+    return len(lines), total_vgm_delay, total_vgm_delay * TICKS_PER_SAMPLE
+
+
+def print_totals(total_vgm_delay, total_ticks):
+    print(f"[INFO] VGM total delay  = {total_vgm_delay} samples (~{total_vgm_delay / VGM_RATE:.3f} s)")
+    print(f"[INFO] Sum of #ticks    = {total_ticks} ticks (~{total_ticks * TIMESCALE_PS * 1e-12:.3f} s at 10ps/tick)")
+    print(f"[INFO] TICKS_PER_SAMPLE = {TICKS_PER_SAMPLE} (EMUCLK_TICKS={EMUCLK_TICKS}, EMU_PER_SAMPLE={EMU_PER_SAMPLE:.4f})")
 
-            is_addr = reg_is_addr(reg_str)
-            a0_bit = "1'b0" if is_addr else "1'b1"
 
-            # この行の delay（サンプル差分） → 10ps tick に変換
-            ticks = delay * TICKS_PER_SAMPLE
-            total_ticks += ticks
+def main(argv):
+    if len(argv) != 3:
+        print(f"Usage: {argv[0]} <input.csv|input.ymev> <output.vh>", file=sys.stderr)
+        return 1
 
-            # Emit Verilog line
-            # 例: #2262816 IKAOPLL_write(1'b0, 8'h0E, phiMref, CS_n, WR_n, A0, DIN);
-            f_out.write(
-                f"#{ticks} IKAOPLL_write({a0_bit}, 8'h{data_val:02X}, phiMref, CS_n, WR_n, A0, DIN);\n"
-            )
+    in_path = Path(argv[1])
+    out_path = Path(argv[2])
+
+    if not in_path.exists():
+        print(f"[ERROR] Input CSV not found: {in_path}", file=sys.stderr)
+        return 1
+
+    metrics.add_output(out_path)
+    if in_path.suffix == reg_events.SUFFIX:
+        with metrics.stage("convert") as st:
+            try:
+                events = reg_events.read_events(in_path)
+            except ValueError as e:
+                print(f"[ERROR] {e}", file=sys.stderr)
+                return 1
+            with out_path.open("w") as f_out:
+                f_out.write("// Auto-generated from %s\n" % in_path.name)
+                f_out.write("// timescale: 10ps; EMUCLK ~= 3.579545MHz\n")
+                f_out.write("// Each vgm_wait() is a VGM *delta* (per-row delay) converted to 10ps ticks.\n\n")
+                n_rows, total_vgm_delay, total_ticks = write_event_pattern(events, f_out)
+            st.count(n_rows, "rows")
+        print(f"[INFO] Wrote Verilog pattern: {out_path}")
+        print_totals(total_vgm_delay, total_ticks)
+        return 0
+
+    with metrics.stage("convert") as st:
+        # Open files
+        with in_path.open(newline="") as f_in, out_path.open("w") as f_out:
+            reader = csv.reader(f_in)
+
+            # Header skip (expects first line like: delay,reg,data)
+            header = next(reader, None)
+            if header is None:
+                print("[ERROR] Empty CSV.", file=sys.stderr)
+                return 1
+
+            f_out.write("// Auto-generated from %s\n" % in_path.name)
+            f_out.write("// timescale: 10ps; EMUCLK ~= 3.579545MHz\n")
+            f_out.write("// Each vgm_wait() is a VGM *delta* (per-row delay) converted to 10ps ticks.\n\n")
+
+            n_rows, total_vgm_delay, total_ticks = write_pattern(reader, f_out)
+        st.count(n_rows, "rows")
 
     print(f"[INFO] Wrote Verilog pattern: {out_path}")
-    print(f"[INFO] VGM total delay  = {total_vgm_delay} samples (~{total_vgm_delay / VGM_RATE:.3f} s)")
-    print(f"[INFO] Sum of #ticks    = {total_ticks} ticks (~{total_ticks * TIMESCALE_PS * 1e-12:.3f} s at 10ps/tick)")
-    print(f"[INFO] TICKS_PER_SAMPLE = {TICKS_PER_SAMPLE} (EMUCLK_TICKS={EMUCLK_TICKS}, EMU_PER_SAMPLE={EMU_PER_SAMPLE:.4f})")
+    print_totals(total_vgm_delay, total_ticks)
     return 0
 
 
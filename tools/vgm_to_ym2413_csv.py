@@ -12,16 +12,22 @@ YM2413(0x51) コマンド列を CSV (delay,reg,data) に落とします。
     timestamp は更新しない（C 実装と同じ）。
   - AY8910(0xA0), K051649(0xD2) は固定長テーブルでスキップ。
   - ループは 1 周目のみを対象とし、展開はしない。
+
+-f ymev で同じレジスタ列をバイナリ形式 (.ymev, reg_events.py) で出力する。
 """
 
 from __future__ import annotations
 
 import argparse
+import hashlib
 import struct
 from pathlib import Path
 import csv
 import sys
 
+import metrics
+import reg_events
+
 
 def read_le_u32(buf: bytes, offset: int) -> int:
     return struct.unpack_from("<I", buf, offset)[0]
@@ -58,8 +64,8 @@ def parse_vgm_header(data: bytes) -> tuple[int, int | None]:
     return data_start, loop_addr
 
 
-def vgm_to_ym2413_csv(vgm_path: Path, csv_path: Path) -> None:
-    data = vgm_path.read_bytes()
+def iter_ym2413_writes(data: bytes):
+    """VGM の中身から (delta, reg, val) を書き込み順に返す。"""
     data_start, loop_addr = parse_vgm_header(data)
     end = len(data)
 
@@ -75,96 +81,109 @@ def vgm_to_ym2413_csv(vgm_path: Path, csv_path: Path) -> None:
         0xD2: 4,  # K051649
     }
 
-    with csv_path.open("w", newline="") as f_out:
-        writer = csv.writer(f_out)
-        writer.writerow(["delay", "reg", "data"])
+    while pc < end:
+        cmd = data[pc]
+
+        # --- YM2413 write 0x51 rr vv ---
+        if cmd == 0x51:
+            if pc + 2 >= end:
+                print(f"[WARN] Truncated YM2413 at 0x{pc:X}, stop.", file=sys.stderr)
+                break
+            reg = data[pc + 1]
+            val = data[pc + 2]
+            pc += 3
+
+            # record_csv と同じロジック
+            if csv_last_sample == 0:
+                delta = current_sample
+            else:
+                delta = current_sample - csv_last_sample
+            csv_last_sample = current_sample
+
+            yield delta, reg, val
+            continue
+
+        # --- YM3812 / YM3526 / Y8950 書き込み(3バイト) ---
+        if cmd in (0x5A, 0x5B, 0x5C):
+            if pc + 2 >= end:
+                print(f"[WARN] Truncated OPL cmd 0x{cmd:02X} at 0x{pc:X}, stop.", file=sys.stderr)
+                break
+            pc += 3
+            continue
+
+        # --- OPN-family passthrough: 0x52/0x54/0x55/0x56/0x57 (3バイト) ---
+        if cmd in (0x52, 0x54, 0x55, 0x56, 0x57):
+            if pc + 2 >= end:
+                print(f"[WARN] Truncated OPN cmd 0x{cmd:02X} at 0x{pc:X}, stop.", file=sys.stderr)
+                break
+            pc += 3
+            continue
 
-        while pc < end:
-            cmd = data[pc]
-
-            # --- YM2413 write 0x51 rr vv ---
-            if cmd == 0x51:
-                if pc + 2 >= end:
-                    print(f"[WARN] Truncated YM2413 at 0x{pc:X}, stop.", file=sys.stderr)
-                    break
-                reg = data[pc + 1]
-                val = data[pc + 2]
-                pc += 3
-
-                # record_csv と同じロジック
-                if csv_last_sample == 0:
-                    delta = current_sample
-                else:
-                    delta = current_sample - csv_last_sample
-                csv_last_sample = current_sample
-
-                writer.writerow([delta, "01", f"{reg:02X}"])
-                writer.writerow([0, "00", f"0x{val:02X}"])
-                continue
-
-            # --- YM3812 / YM3526 / Y8950 書き込み(3バイト) ---
-            if cmd in (0x5A, 0x5B, 0x5C):
-                if pc + 2 >= end:
-                    print(f"[WARN] Truncated OPL cmd 0x{cmd:02X} at 0x{pc:X}, stop.", file=sys.stderr)
-                    break
-                pc += 3
-                continue
-
-            # --- OPN-family passthrough: 0x52/0x54/0x55/0x56/0x57 (3バイト) ---
-            if cmd in (0x52, 0x54, 0x55, 0x56, 0x57):
-                if pc + 2 >= end:
-                    print(f"[WARN] Truncated OPN cmd 0x{cmd:02X} at 0x{pc:X}, stop.", file=sys.stderr)
-                    break
-                pc += 3
-                continue
-
-            # --- short wait: 0x70–0x7F ---
-            if 0x70 <= cmd <= 0x7F:
-                wait_samples = (cmd & 0x0F) + 1
-                current_sample += wait_samples
-                pc += 1
-                continue
-
-            # --- wait n samples: 0x61 ll hh ---
-            if cmd == 0x61:
-                if pc + 2 >= end:
-                    print(f"[WARN] Truncated 0x61 at 0x{pc:X}, stop.", file=sys.stderr)
-                    break
-                lo = data[pc + 1]
-                hi = data[pc + 2]
-                ws = lo | (hi << 8)
-                current_sample += ws
-                pc += 3
-                continue
-
-            # --- wait 1/60s: 0x62 ---
-            if cmd == 0x62:
-                current_sample += 735
-                pc += 1
-                continue
-
-            # --- wait 1/50s: 0x63 ---
-            if cmd == 0x63:
-                current_sample += 882
-                pc += 1
-                continue
-
-            # --- End: 0x66 ---
-            if cmd == 0x66:
-                pc += 1
+        # --- short wait: 0x70–0x7F ---
+        if 0x70 <= cmd <= 0x7F:
+            wait_samples = (cmd & 0x0F) + 1
+            current_sample += wait_samples
+            pc += 1
+            continue
+
+        # --- wait n samples: 0x61 ll hh ---
+        if cmd == 0x61:
+            if pc + 2 >= end:
+                print(f"[WARN] Truncated 0x61 at 0x{pc:X}, stop.", file=sys.stderr)
                 break
+            lo = data[pc + 1]
+            hi = data[pc + 2]
+            ws = lo | (hi << 8)
+            current_sample += ws
+            pc += 3
+            continue
+
+        # --- wait 1/60s: 0x62 ---
+        if cmd == 0x62:
+            current_sample += 735
+            pc += 1
+            continue
 
-            # --- AY8910 / K051649 (固定長テーブル) ---
-            if cmd in fixed_cmd_lengths:
-                length = fixed_cmd_lengths[cmd]
-                if pc + (length - 1) >= end:
-                    print(f"[WARN] Truncated fixed cmd 0x{cmd:02X} at 0x{pc:X}, stop.", file=sys.stderr)
-                    break
-                pc += length
-                continue
+        # --- wait 1/50s: 0x63 ---
+        if cmd == 0x63:
+            current_sample += 882
+            pc += 1
+            continue
 
-            # --- その他 unknown: 1バイトだけ forward ---
+        # --- End: 0x66 ---
+        if cmd == 0x66:
             pc += 1
+            break
+
+        # --- AY8910 / K051649 (固定長テーブル) ---
+        if cmd in fixed_cmd_lengths:
+            length = fixed_cmd_lengths[cmd]
+            if pc + (length - 1) >= end:
+                print(f"[WARN] Truncated fixed cmd 0x{cmd:02X} at 0x{pc:X}, stop.", file=sys.stderr)
+                break
+            pc += length
+            continue
+
+        # --- その他 unknown: 1バイトだけ forward ---
+        pc += 1
+
+
+def vgm_to_ym2413_csv(vgm_path: Path, csv_path: Path) -> None:
+    data = vgm_path.read_bytes()
+    with csv_path.open("w", newline="") as f_out:
+        writer = csv.writer(f_out)
+        writer.writerow(["delay", "reg", "data"])
+        for delta, reg, val in iter_ym2413_writes(data):
+            writer.writerow([delta, "01", f"{reg:02X}"])
+            writer.writerow([0, "00", f"0x{val:02X}"])
+
+
+def vgm_to_ym2413_events(vgm_path: Path, out_path: Path) -> int:
+    """Same register stream as vgm_to_ym2413_csv(), written as .ymev."""
+    data = vgm_path.read_bytes()
+    events = [(delta, 0, reg, val) for delta, reg, val in iter_ym2413_writes(data)]
+    return reg_events.write_events(out_path, events,
+                                   source_hash=hashlib.sha256(data).digest())
 
 
 def main(argv: list[str] | None = None) -> int:
@@ -174,7 +193,11 @@ def main(argv: list[str] | None = None) -> int:
     ap.add_argument("vgm", help="Input .vgm file")
     ap.add_argument(
         "-o", "--output",
-        help="Output CSV path (default: <input>.vgm.csv)"
+        help="Output path (default: <input>.vgm.csv, or <input stem>.ymev with -f ymev)"
+    )
+    ap.add_argument(
+        "-f", "--format", choices=("csv", "ymev"), default="csv",
+        help="csv: delay,reg,data text (default); ymev: binary events (reg_events.py)"
     )
     args = ap.parse_args(argv)
 
@@ -184,18 +207,30 @@ def main(argv: list[str] | None = None) -> int:
         return 1
 
     if args.output:
-        csv_path = Path(args.output)
+        out_path = Path(args.output)
+    elif args.format == "ymev":
+        out_path = vgm_path.with_suffix(reg_events.SUFFIX)
     else:
         # 期待されている ym2413_scale_chromatic.vgm.csv 形式に合わせる
-        csv_path = vgm_path.with_suffix(vgm_path.suffix + ".csv")
+        out_path = vgm_path.with_suffix(vgm_path.suffix + ".csv")
 
+    if args.format == "csv":
+        metrics.add_output(out_path)  # .ymev は write_events() が登録する
     try:
-        vgm_to_ym2413_csv(vgm_path, csv_path)
+        with metrics.stage("convert") as st:
+            if args.format == "ymev":
+                n = vgm_to_ym2413_events(vgm_path, out_path)
+            else:
+                vgm_to_ym2413_csv(vgm_path, out_path)
+            st.count(vgm_path.stat().st_size, "bytes")
     except Exception as e:
         print(f"[ERROR] {e}", file=sys.stderr)
         return 1
 
-    print(f"[INFO] Wrote CSV: {csv_path}")
+    if args.format == "ymev":
+        print(f"[INFO] Wrote events: {out_path} ({n} writes)")
+    else:
+        print(f"[INFO] Wrote CSV: {out_path}")
     return 0
 
 
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+wav_writer.py
+
+Shared mono WAV writer for the tools/ scripts.
+
+- Samples are converted to PCM in bulk (NumPy if available, otherwise the
+  stdlib ``array`` module) instead of one ``struct.pack`` per sample.
+- ``WavWriter`` appends block by block and fixes up the header sizes on
+  close, so arbitrarily long captures can be written without holding the
+  whole PCM image in memory.
+- Output formats: ``int16``, ``int24`` (PCM) and ``float32`` (IEEE float).
+- Files that would exceed the 4 GiB RIFF limit are written as RF64
+  (EBU Tech 3306): a 28-byte ``JUNK`` chunk is reserved after ``WAVE`` and
+  is turned into the ``ds64`` chunk when the sizes no longer fit in 32 bits.
+
+``read_wav()`` reads the files back (mono or first channel, PCM 16/24/32
+or float32, RIFF or RF64) as a float NumPy array; it needs NumPy.
+
+Usage:
+
+    from wav_writer import WavWriter, write_wav
+
+    write_wav("out.wav", normalize_to_int16(vals), 44100)  # int16, one shot
+
+    with WavWriter("big.wav", 1_600_000, "float32") as w:
+        for block in blocks:
+            w.write(block)
+"""
+
+import struct
+import sys
+from array import array
+from pathlib import Path
+
+import metrics
+
+try:
+    import numpy as np
+except ImportError:  # NumPy は任意。無ければ array モジュールで変換する
+    np = None
+
+
+# sample_format -> (wFormatTag, bytes per sample)
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+
+SAMPLE_FORMATS = {
+    "int16":   (WAVE_FORMAT_PCM, 2),
+    "int24":   (WAVE_FORMAT_PCM, 3),
+    "float32": (WAVE_FORMAT_IEEE_FLOAT, 4),
+}
+
+# 各フォーマットのフルスケール値（正規化の目標値）
+FULL_SCALE = {
+    "int16":   32767.0,
+    "int24":   8388607.0,
+    "float32": 1.0,
+}
+
+_INT_RANGE = {
+    "int16": (-32768, 32767),
+    "int24": (-8388608, 8388607),
+}
+
+U32_MAX = 0xFFFFFFFF
+
+# 1 回の変換で扱う最大サンプル数（メモリ使用量の上限を抑える）
+DEFAULT_BLOCK = 1 << 20
+
+_JUNK_SIZE = 28  # = sizeof(ds64) without table
+
+
+def full_scale(sample_format):
+    """Peak value that corresponds to 0 dBFS for ``sample_format``."""
+    try:
+        return FULL_SCALE[sample_format]
+    except KeyError:
+        raise ValueError(f"unknown sample format: {sample_format!r}") from None
+
+
+def normalize_to_format(samples, sample_format="int16"):
+    """Scale so that the peak lands at 90 % of full scale (-0.9 dBFS).
+
+    Integer formats are rounded to int; float32 stays float.
+    """
+    if len(samples) == 0:
+        return []
+    peak = max(abs(float(v)) for v in samples)
+    if peak == 0:
+        return [0] * len(samples)
+    scale = 0.9 * full_scale(sample_format) / peak
+    print(f"[INFO] peak={peak}, scale={scale}")
+    if sample_format == "float32":
+        return [v * scale for v in samples]
+    return [int(round(v * scale)) for v in samples]
+
+
+def normalize_to_int16(samples):
+    return normalize_to_format(samples, "int16")
+
+
+# ----------------------------------------------------------------------
+# Bulk PCM conversion
+# ----------------------------------------------------------------------
+def _pcm_bytes_numpy(samples, sample_format):
+    x = np.asarray(samples)
+    if sample_format == "float32":
+        return x.astype("<f4", copy=False).tobytes()
+
+    lo, hi = _INT_RANGE[sample_format]
+    if x.dtype.kind == "f":
+        x = np.rint(x)
+    x = np.clip(x, lo, hi)
+    if sample_format == "int16":
+        return x.astype("<i2").tobytes()
+
+    # int24: 下位 3 バイトだけを取り出す
+    b = x.astype("<i4").view(np.uint8).reshape(-1, 4)
+    return b[:, :3].tobytes()
+
+
+def _pcm_bytes_array(samples, sample_format):
+    if sample_format == "float32":
+        a = array("f", (float(v) for v in samples))
+    else:
+        lo, hi = _INT_RANGE[sample_format]
+        a = array("h" if sample_format == "int16" else "i",
+                  (max(lo, min(hi, int(round(v)))) for v in samples))
+    if sys.byteorder != "little":
+        a.byteswap()
+    raw = a.tobytes()
+    if sample_format != "int24":
+        return raw
+
+    # int32 (little endian) → int24: 4 バイトおきに 3 バイトを詰め直す
+    n = len(a)
+    out = bytearray(3 * n)
+    out[0::3] = raw[0::4]
+    out[1::3] = raw[1::4]
+    out[2::3] = raw[2::4]
+    return bytes(out)
+
+
+def to_pcm_bytes(samples, sample_format="int16"):
+    """Convert a block of samples to little-endian PCM bytes.
+
+    Integer formats are rounded and clipped to their range; ``float32``
+    values are written as-is (callers normalise to +-1.0).
+    """
+    if sample_format not in SAMPLE_FORMATS:
+        raise ValueError(f"unknown sample format: {sample_format!r}")
+    if np is not None:
+        return _pcm_bytes_numpy(samples, sample_format)
+    return _pcm_bytes_array(samples, sample_format)
+
+
+# ----------------------------------------------------------------------
+# Streaming writer
+# ----------------------------------------------------------------------
+class WavWriter:
+    """Chunked mono WAV writer with header fix-up and RF64 support.
+
+    rf64:
+      - "auto" : reserve space for ds64 and switch to RF64 only if needed
+      - True   : always write RF64
+      - False  : plain RIFF; raise if the data exceeds 4 GiB
+    """
+
+    def __init__(self, path, fs, sample_format="int16", rf64="auto",
+                 block_size=DEFAULT_BLOCK):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f"unknown sample format: {sample_format!r}")
+        if rf64 not in ("auto", True, False):
+            raise ValueError(f"rf64 must be 'auto', True or False: {rf64!r}")
+
+        self.path = Path(path)
+        self.fs = int(fs)
+        self.sample_format = sample_format
+        self.rf64 = rf64
+        self.block_size = int(block_size)
+        self.format_tag, self.sampwidth = SAMPLE_FORMATS[sample_format]
+
+        self.nframes = 0
+        self.data_bytes = 0
+        self._closed = False
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._f = self.path.open("wb")
+        self._write_header()
+        metrics.add_output(self.path)
+
+    # -- header ---------------------------------------------------------
+    def _fmt_chunk(self):
+        block_align = self.sampwidth  # mono
+        body = struct.pack("<HHIIHH",
+                           self.format_tag, 1, self.fs,
+                           self.fs * block_align, block_align,
+                           8 * self.sampwidth)
+        if self.format_tag != WAVE_FORMAT_PCM:
+            body += struct.pack("<H", 0)  # cbSize
+        return b"fmt " + struct.pack("<I", len(body)) + body
+
+    def _write_header(self):
+        f = self._f
+        f.write(b"RIFF\x00\x00\x00\x00WAVE")
+        if self.rf64 is not False:
+            f.write(b"JUNK" + struct.pack("<I", _JUNK_SIZE) + bytes(_JUNK_SIZE))
+            self._ds64_pos = 12
+        else:
+            self._ds64_pos = None
+        f.write(self._fmt_chunk())
+        if self.format_tag != WAVE_FORMAT_PCM:
+            # 非 PCM では fact チャンク（サンプル数）が必須
+            f.write(b"fact" + struct.pack("<I", 4))
+            self._fact_pos = f.tell()
+            f.write(b"\x00\x00\x00\x00")
+        else:
+            self._fact_pos = None
+        f.write(b"data")
+        self._data_size_pos = f.tell()
+        f.write(b"\x00\x00\x00\x00")
+        self._data_start = f.tell()
+
+    def _fixup_header(self):
+        f = self._f
+        pad = self.data_bytes & 1
+        riff_size = self._data_start + self.data_bytes + pad - 8
+        use_rf64 = (self.rf64 is True
+                    or riff_size > U32_MAX or self.data_bytes > U32_MAX)
+
+        if use_rf64:
+            if self._ds64_pos is None:
+                raise ValueError(
+                    f"{self.path}: data exceeds 4 GiB; open with rf64='auto'")
+            f.seek(0)
+            f.write(b"RF64" + struct.pack("<I", U32_MAX))
+            f.seek(self._ds64_pos)
+            f.write(b"ds64" + struct.pack("<IQQQI", _JUNK_SIZE, riff_size,
+                                          self.data_bytes, self.nframes, 0))
+            data32 = frames32 = U32_MAX
+        else:
+            f.seek(4)
+            f.write(struct.pack("<I", riff_size))
+            data32 = self.data_bytes
+            frames32 = self.nframes
+
+        if self._fact_pos is not None:
+            f.seek(self._fact_pos)
+            f.write(struct.pack("<I", frames32))
+        f.seek(self._data_size_pos)
+        f.write(struct.pack("<I", data32))
+
+    # -- data -----------------------------------------------------------
+    def write(self, samples):
+        """Append a block of samples (list, array.array or NumPy array)."""
+        if self._closed:
+            raise ValueError("write to closed WavWriter")
+        n = len(samples)
+        for start in range(0, n, self.block_size):
+            raw = to_pcm_bytes(samples[start:start + self.block_size],
+                               self.sample_format)
+            self._f.write(raw)
+            self.data_bytes += len(raw)
+        self.nframes += n
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self.data_bytes & 1:
+                self._f.write(b"\x00")  # RIFF チャンクは偶数長
+            self._fixup_header()
+        finally:
+            self._f.close()
+
+    @property
+    def duration_s(self):
+        return self.nframes / float(self.fs) if self.fs else 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def read_wav(path):
+    """(samples, fs): first channel as float64, full scale = +-1.0."""
+    if np is None:
+        raise RuntimeError("read_wav() needs NumPy")
+    buf = Path(path).read_bytes()
+    if buf[0:4] not in (b"RIFF", b"RF64") or buf[8:12] != b"WAVE":
+        raise ValueError(f"{path}: not a RIFF/RF64 WAVE file")
+    fmt = None
+    data_size64 = None
+    pos = 12
+    while pos + 8 <= len(buf):
+        cid = buf[pos:pos + 4]
+        size = struct.unpack_from("<I", buf, pos + 4)[0]
+        body = pos + 8
+        if cid == b"ds64":
+            data_size64 = struct.unpack_from("<Q", buf, body + 8)[0]
+        elif cid == b"fmt ":
+            fmt = struct.unpack_from("<HHIIHH", buf, body)
+            fmt_pos = body
+        elif cid == b"data":
+            if size == U32_MAX and data_size64 is not None:
+                size = data_size64
+            break
+        pos = body + size + (size & 1)
+    else:
+        raise ValueError(f"{path}: no data chunk")
+    if fmt is None:
+        raise ValueError(f"{path}: no fmt chunk")
+
+    tag, channels, fs, _, block_align, bits = fmt
+    if tag == 0xFFFE:  # WAVE_FORMAT_EXTENSIBLE: サブフォーマットの先頭 2 バイト
+        tag = struct.unpack_from("<H", buf, fmt_pos + 24)[0]
+    raw = np.frombuffer(buf, dtype=np.uint8, count=min(size, len(buf) - body), offset=body)
+    n = len(raw) // block_align
+    frames = raw[:n * block_align].reshape(n, block_align)
+    width = bits // 8
+    ch0 = frames[:, :width]
+    if tag == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+        x = ch0.copy().view("<f4")[:, 0].astype(np.float64)
+    elif tag == WAVE_FORMAT_PCM and bits in (16, 24, 32):
+        if bits == 24:
+            ch0 = np.concatenate([np.zeros((n, 1), np.uint8), ch0], axis=1)  # 上位に詰めて符号を保つ
+            bits = 32
+        x = ch0.copy().view(f"<i{bits // 8}")[:, 0].astype(np.float64) / float(1 << (bits - 1))
+    else:
+        raise ValueError(f"{path}: unsupported WAV format tag={tag} bits={bits}")
+    return x, fs
+
+
+def write_wav(path, samples, fs, sample_format="int16"):
+    """Write ``samples`` as a mono WAV in one call.
+
+    The length is known up front, so the ds64 reservation is only made when
+    the result actually needs RF64.
+    """
+    _, sampwidth = SAMPLE_FORMATS.get(sample_format, (None, 0))
+    if sampwidth == 0:
+        raise ValueError(f"unknown sample format: {sample_format!r}")
+    rf64 = "auto" if len(samples) * sampwidth > U32_MAX - 64 else False
+    with metrics.stage("write") as st:
+        with WavWriter(path, fs, sample_format, rf64=rf64) as w:
+            w.write(samples)
+        st.count(len(samples), "samples")
+    return w